@@ -1,42 +1,56 @@
 import json
 import logging
 import sys
-from threading import Lock, Thread
-import urllib2
 import time
 from autobahn.twisted.websocket import WebSocketServerProtocol, WebSocketServerFactory, listenWS
-from twisted.web.client import Agent
-from twisted.internet import reactor
+from twisted.web.client import getPage
+from twisted.internet import reactor, task
 from twisted.python import log
 from twisted.web.server import Site
 from twisted.web.static import File
 
+import jsondelta
+
 
 PORT = 8010
 POLL_INTERVAL = 5
 MAX_POLL_INTERVAL = 30
 POLL_INTERVAL_STEP = 5
 MAX_ERRORS = 5
-updateLock = Lock()
+LATENCY_REPORT_INTERVAL = 60
 
 #Server Messages
 KRT_JSON_DATA = "krtJSONData"
 KRT_URL_DROPPED = "krtURLDropped"
 KRT_REGISTER_URL = "krtRegisterURL"
 KRT_PUSH_DATA = "krtPushData"
+KRT_JSON_PATCH = "krtJSONPatch"
+KRT_RESYNC = "krtResync"
+
+
+class FanoutLatency():
+    """
+    Measures the time from the master sending a push to the affected
+    clients being sent the new data
+    """
+    def __init__(self):
+        self.reset()
 
-agent = Agent(reactor)
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
 
+    def add(self, latency):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
 
-def dict_compare(d1, d2):
-    d1_keys = set(d1.keys())
-    d2_keys = set(d2.keys())
-    intersect_keys = d1_keys.intersection(d2_keys)
-    added = d1_keys - d2_keys
-    removed = d2_keys - d1_keys
-    modified = {o : (d1[o], d2[o]) for o in intersect_keys if d1[o] != d2[o]}
-    same = set(o for o in intersect_keys if d1[o] == d2[o])
-    return added, removed, modified, same
+    def report(self):
+        if self.count:
+            logging.info("Fan-out latency: {0} broadcasts, {1:.3f}s average, {2:.3f}s max".format(
+                self.count, self.total / self.count, self.max))
+        self.reset()
 
 
 class CachedURL():
@@ -46,7 +60,13 @@ class CachedURL():
     def __init__(self, url):
         self.url = url
         self.cachedJSON = None
+        # incremented each time cachedJSON changes; patches are sent
+        # against the previous version, so clients can detect a gap
+        self.version = 0
         self.clients = []
+        # the clients that declared, when registering, that they can apply
+        # krtJSONPatch; the others are always sent the whole document
+        self.patchClients = set()
         self.lastChecked = 0
         self.errorCount = 0
         self.pollInterval = POLL_INTERVAL
@@ -54,22 +74,34 @@ class CachedURL():
         self.locked = False
         self.waitForPush = False
         self.pushFilters = {}
+        # set when a push arrives while the URL is being fetched, so that it
+        # is fetched again once that fetch is done
         self.newData = False
+        # when the master sent the oldest push not yet broadcast
+        self.pushedAt = None
+        # the delayed fetch of a push that came too soon after the last one
+        self.pushedCall = None
 
     def pollNeeded(self):
-        past_interval = (time.time() - self.lastChecked) > self.currentPollInterval
+        # URLs waiting for push are only fetched when a push affects them
         if self.waitForPush:
-            if self.newData:
-                return past_interval
             return False
+        return (time.time() - self.lastChecked) > self.currentPollInterval
+
+    def pushed(self, sent):
+        if self.pushedAt is None or sent < self.pushedAt:
+            self.pushedAt = sent
+        self.newData = True
 
-        return past_interval
+    def pushDelay(self):
+        # pushes decide whether the URL is fetched, the poll interval how
+        # often: it is fetched at most once per interval
+        return max(0, self.lastChecked + self.currentPollInterval - time.time())
 
     def pollSuccess(self):
         self.lastChecked = time.time()
         self.locked = False
         self.errorCount = 0
-        self.newData = False
 
         if self.currentPollInterval > self.pollInterval:
             self.currentPollInterval -= POLL_INTERVAL_STEP
@@ -106,7 +138,10 @@ class BroadcastServerProtocol(WebSocketServerProtocol):
 class BroadcastServerFactory(WebSocketServerFactory):
     """
     Checks given JSON URLs by clients and broadcasts back to them
-    if the JSON has changed
+    if the JSON has changed.
+
+    URLs registered with waitForPush are fetched only when the master
+    pushes events matching their filters; the others are polled.
     """
 
     def __init__(self, url, debug=False, debugCodePaths=False):
@@ -114,11 +149,11 @@ class BroadcastServerFactory(WebSocketServerFactory):
         self.urlCacheDict = {}
         self.clients = []
         self.clients_urls = {}
-        self.tick()
-
-    def tick(self):
-        self.checkURLs()
-        reactor.callLater(0.1, self.tick)
+        self.latency = FanoutLatency()
+        self.poller = task.LoopingCall(self.checkURLs)
+        self.poller.start(POLL_INTERVAL_STEP, now=False)
+        self.latencyReporter = task.LoopingCall(self.latency.report)
+        self.latencyReporter.start(LATENCY_REPORT_INTERVAL, now=False)
 
     def sendClientCommand(self, clients, command, data):
         msg = {"cmd": command, "data": data}
@@ -127,66 +162,105 @@ class BroadcastServerFactory(WebSocketServerFactory):
         for client in clients:
             client.sendMessage(msg)
 
-    def jsonChanged(self, json, cachedJSON):
-        if cachedJSON is None:
-            return True
-        else:
-            if isinstance(cachedJSON, dict):
-                added, removed, modified, same = dict_compare(json, cachedJSON)
-                if len(added) > 0 or len(removed) > 0 or len(modified) > 0:
-                    return True
-            else:
-                return cachedJSON != json
-
-        return False
-
     def checkURLs(self):
         for urlCache in self.urlCacheDict.values():
-            #Thread each of these
-            try:
-                if urlCache.locked is False and urlCache.pollNeeded():
-                    urlCache.locked = True
-
-                    p = Thread(target=self.checkURL, args=(urlCache, ))
-                    p.start()
-            except Exception as e:
-                logging.error("{0}".format(e))
+            if urlCache.pollNeeded():
+                self.checkURL(urlCache)
 
     def checkURL(self, urlCache):
+        """
+        Fetch the URL and broadcast it to its clients if it has changed; if
+        it is already being fetched, fetch it again once that is done
+        """
+        if urlCache.locked:
+            urlCache.newData = True
+            return
         url = urlCache.url
-        cachedURL = self.urlCacheDict[url]
-        if cachedURL.errorCount > MAX_ERRORS:
+        if urlCache.errorCount > MAX_ERRORS:
             logging.info("Removing cached URL as it has too many errors {0}".format(url))
-            self.sendClientCommand(cachedURL.clients, KRT_URL_DROPPED, url)
-            updateLock.acquire()
-            del self.urlCacheDict[url]
-            updateLock.release()
+            self.sendClientCommand(urlCache.clients, KRT_URL_DROPPED, url)
+            if self.urlCacheDict.get(url) is urlCache:
+                del self.urlCacheDict[url]
             return
-        if urlCache.pollNeeded():
-            try:
-                #logging.info("Polling: {0}".format(url))
-                response = urllib2.urlopen(url, timeout=MAX_POLL_INTERVAL)
-                updateLock.acquire()
-                cachedURL.pollSuccess()
-                jsonObj = json.load(response)
-                if self.jsonChanged(jsonObj, cachedURL.cachedJSON):
-                    cachedURL.cachedJSON = jsonObj
-                    clients = cachedURL.clients
-                    logging.info("JSON at {1} Changed, informing {0} client(s)".format(len(clients), url))
-                    data = {"url": url, "data": jsonObj}
-                    self.sendClientCommand(clients, KRT_JSON_DATA, data)
-
-                #Reset error count to reduce cutting of many users
-                #in busy times
-                cachedURL.errorCount = 0
-            except Exception as e:
-                logging.error("{0}: {1}".format(e, url))
-                cachedURL.pollFailure()
-            finally:
-                cachedURL.locked = False
-
-                if updateLock.locked():
-                    updateLock.release()
+
+        urlCache.locked = True
+        urlCache.newData = False
+        pushedAt = urlCache.pushedAt
+        urlCache.pushedAt = None
+
+        d = getPage(url, timeout=MAX_POLL_INTERVAL)
+
+        def success(page):
+            urlCache.pollSuccess()
+            jsonObj = json.loads(page)
+            if jsonObj != urlCache.cachedJSON:
+                self.broadcastChange(urlCache, jsonObj)
+            if pushedAt is not None:
+                self.latency.add(time.time() - pushedAt)
+
+        def failure(f):
+            logging.error("{0}: {1}".format(f.getErrorMessage(), url))
+            urlCache.pollFailure()
+
+        def done(_):
+            urlCache.locked = False
+            if urlCache.newData and self.urlCacheDict.get(url) is urlCache:
+                self.checkPushedURL(urlCache)
+
+        d.addCallbacks(success, failure)
+        d.addErrback(failure)
+        d.addBoth(done)
+        return d
+
+    def checkPushedURL(self, urlCache):
+        """
+        Fetch a URL affected by a push now, or once its poll interval has
+        passed since it was last fetched; the pushes received meanwhile are
+        coalesced into that fetch
+        """
+        urlCache.newData = True
+        if urlCache.locked or urlCache.pushedCall is not None:
+            return
+        delay = urlCache.pushDelay()
+        if delay <= 0:
+            self.checkURL(urlCache)
+            return
+
+        def fetch():
+            urlCache.pushedCall = None
+            if self.urlCacheDict.get(urlCache.url) is urlCache:
+                self.checkURL(urlCache)
+        urlCache.pushedCall = reactor.callLater(delay, fetch)
+
+    def sendFullData(self, clients, urlCache):
+        data = {"url": urlCache.url, "data": urlCache.cachedJSON,
+                "version": urlCache.version}
+        self.sendClientCommand(clients, KRT_JSON_DATA, data)
+
+    def broadcastChange(self, urlCache, jsonObj):
+        """
+        Send the clients of the URL that can apply patches a patch from the
+        version they have to jsonObj, unless the document is new or smaller
+        than the patch; send the other clients the whole document
+        """
+        previous = urlCache.cachedJSON
+        urlCache.cachedJSON = jsonObj
+        urlCache.version += 1
+        clients = urlCache.clients
+        logging.info("JSON at {1} Changed, informing {0} client(s)".format(len(clients), urlCache.url))
+        patchClients = [c for c in clients if c in urlCache.patchClients]
+        if previous is not None and patchClients:
+            patch = jsondelta.diff(previous, jsonObj)
+            msg = json.dumps({"cmd": KRT_JSON_PATCH,
+                              "data": {"url": urlCache.url,
+                                       "version": urlCache.version,
+                                       "base": urlCache.version - 1,
+                                       "patch": patch}})
+            if len(msg) < len(json.dumps(jsonObj)):
+                for client in patchClients:
+                    client.sendMessage(msg)
+                clients = [c for c in clients if c not in urlCache.patchClients]
+        self.sendFullData(clients, urlCache)
 
     def register(self, client):
         if not client in self.clients:
@@ -202,6 +276,7 @@ class BroadcastServerFactory(WebSocketServerFactory):
                 urlCache = items[1]
                 if client in urlCache.clients:
                     urlCache.clients.remove(client)
+                urlCache.patchClients.discard(client)
 
                 if len(urlCache.clients) == 0:
                     del self.urlCacheDict[url]
@@ -220,9 +295,17 @@ class BroadcastServerFactory(WebSocketServerFactory):
                     logging.info("Created new url {0} for {1}".format(url, client.peer))
                     self.urlCacheDict[url] = CachedURL(url)
                     self.urlCacheDict[url].clients = [client, ]
+                    reactor.callLater(0, self.checkURL, self.urlCacheDict[url])
                 else:
                     logging.info("Added {1} to url {0}".format(url, client.peer))
-                    self.urlCacheDict[url].clients.append(client)
+                    urlCache = self.urlCacheDict[url]
+                    urlCache.clients.append(client)
+                    if urlCache.cachedJSON is not None:
+                        self.sendFullData([client], urlCache)
+
+                if not isinstance(data["data"], basestring) \
+                        and data["data"].get("patches") in (True, "true"):
+                    self.urlCacheDict[url].patchClients.add(client)
 
                 if not isinstance(data["data"], basestring) and "waitForPush" in data["data"] \
                         and data["data"]["waitForPush"] == "true":
@@ -236,6 +319,11 @@ class BroadcastServerFactory(WebSocketServerFactory):
                     logging.info("URL {0} is waiting for push data with these filters {1}".format(url, self.urlCacheDict[url].pushFilters))
             elif data["cmd"] == KRT_PUSH_DATA:
                 self.update_push_urls(data)
+            elif data["cmd"] == KRT_RESYNC:
+                # the client missed a patch, send it the whole document
+                urlCache = self.urlCacheDict.get(data["data"])
+                if urlCache is not None and urlCache.cachedJSON is not None:
+                    self.sendFullData([client], urlCache)
 
         except AttributeError as e:
             pass
@@ -290,11 +378,14 @@ class BroadcastServerFactory(WebSocketServerFactory):
             event_str += "{0}, ".format(e["event"])
         logging.info("Data pushed from server {0} with events {1}".format(data["server"], event_str))
 
-        for url, obj in self.urlCacheDict.iteritems():
+        # older masters do not say when they sent the push
+        sent = data.get("sent", time.time())
+        for url, obj in self.urlCacheDict.items():
             if obj.waitForPush:
                 if "server" in data and data["server"] in url:
                     if matches_filter(obj, events):
-                        obj.newData = True
+                        obj.pushed(sent)
+                        self.checkPushedURL(obj)
 
 def createDeamon():
     import os, sys
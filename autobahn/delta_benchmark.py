@@ -0,0 +1,147 @@
+"""
+Estimate the bytes the realtime server sends per hour to the clients of a
+builders and a build queue URL, as whole documents (krtJSONData) and as
+patches (krtJSONPatch), under a synthetic stream of build events.
+
+Each event changes both documents: a build request is submitted, a build
+starts from the queue, a build finishes or a slave connects or disconnects.
+
+    python delta_benchmark.py [--events-per-hour 3600] [--builders 50] \\
+        [--queue 200] [--clients 100]
+"""
+
+import json
+import random
+import sys
+from optparse import OptionParser
+
+import jsondelta
+
+PADDING = "x" * 60
+
+
+def message(cmd, data):
+    return json.dumps({"cmd": cmd, "data": data})
+
+
+class SyntheticMaster(object):
+
+    def __init__(self, rnd, builders, queue):
+        self.rnd = rnd
+        self.nextBrid = 1
+        self.nextNumber = {}
+        self.builders = []
+        for i in range(builders):
+            name = "builder-%d" % i
+            self.nextNumber[name] = 1
+            self.builders.append({
+                "name": name,
+                "project": "project-%d" % (i % 5),
+                "slaves": [{"name": "slave-%d-%d" % (i, j), "connected": True}
+                           for j in range(3)],
+                "currentBuilds": [],
+                "latestBuild": None,
+                "description": PADDING,
+            })
+        self.queue = []
+        for i in range(queue):
+            self.submit()
+
+    def submit(self):
+        builder = self.rnd.choice(self.builders)
+        self.queue.append({
+            "brid": self.nextBrid,
+            "builderName": builder["name"],
+            "sources": {"codebase": {"branch": "trunk",
+                                     "revision": "%040x" % self.nextBrid}},
+            "reason": PADDING,
+        })
+        self.nextBrid += 1
+
+    def start(self):
+        if not self.queue:
+            return self.submit()
+        request = self.queue.pop(self.rnd.randrange(len(self.queue)))
+        builder = [b for b in self.builders
+                   if b["name"] == request["builderName"]][0]
+        number = self.nextNumber[builder["name"]]
+        self.nextNumber[builder["name"]] += 1
+        builder["currentBuilds"].append({
+            "number": number,
+            "brid": request["brid"],
+            "sources": request["sources"],
+            "eta": self.rnd.randint(60, 3600),
+            "text": [],
+        })
+
+    def finish(self):
+        running = [b for b in self.builders if b["currentBuilds"]]
+        if not running:
+            return self.start()
+        builder = self.rnd.choice(running)
+        build = builder["currentBuilds"].pop(0)
+        build["results"] = self.rnd.choice([0, 0, 0, 1, 2])
+        build["text"] = ["build", "successful"]
+        builder["latestBuild"] = build
+
+    def toggleSlave(self):
+        slave = self.rnd.choice(self.rnd.choice(self.builders)["slaves"])
+        slave["connected"] = not slave["connected"]
+
+    def event(self):
+        self.rnd.choice([self.submit, self.submit, self.start, self.finish,
+                         self.toggleSlave])()
+
+    def documents(self):
+        # what the server fetches: fresh objects, as json.load would return
+        return {"builders": json.loads(json.dumps(self.builders)),
+                "queue": json.loads(json.dumps(self.queue))}
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--events-per-hour', type='int', default=3600,
+                      help='build events in the simulated hour')
+    parser.add_option('--builders', type='int', default=50)
+    parser.add_option('--queue', type='int', default=200,
+                      help='build requests queued at the start')
+    parser.add_option('--clients', type='int', default=100,
+                      help='clients subscribed to each URL')
+    parser.add_option('--seed', type='int', default=0)
+    opts, args = parser.parse_args()
+
+    master = SyntheticMaster(random.Random(opts.seed), opts.builders,
+                             opts.queue)
+    documents = master.documents()
+    version = 0
+    full = patched = 0
+    for i in range(opts.events_per_hour):
+        master.event()
+        new = master.documents()
+        version += 1
+        for url, doc in new.iteritems():
+            if doc == documents[url]:
+                continue
+            fullMsg = message("krtJSONData",
+                              {"url": url, "data": doc, "version": version})
+            patchMsg = message("krtJSONPatch",
+                               {"url": url, "version": version,
+                                "base": version - 1,
+                                "patch": jsondelta.diff(documents[url], doc)})
+            full += len(fullMsg)
+            # the server sends the whole document when it is smaller
+            patched += min(len(fullMsg), len(patchMsg))
+        documents = new
+
+    mb = 1024.0 * 1024
+    print '%d events/hour, %d builders, %d clients per URL' % (
+            opts.events_per_hour, opts.builders, opts.clients)
+    print 'final document sizes: builders %d bytes, queue %d bytes' % (
+            len(json.dumps(documents["builders"])),
+            len(json.dumps(documents["queue"])))
+    print '%-16s %10.1f MiB/hour' % ('whole documents',
+                                     full * opts.clients / mb)
+    print '%-16s %10.1f MiB/hour' % ('patches', patched * opts.clients / mb)
+
+if __name__ == '__main__':
+    sys.exit(main())
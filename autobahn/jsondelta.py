@@ -0,0 +1,139 @@
+"""
+Structural diffs between two versions of a JSON document, sent to the
+realtime clients instead of the whole document.
+
+A patch is a list of operations, applied in order:
+
+    {"op": "set", "path": [...], "value": v}
+        set the value at path, adding it if it is missing
+    {"op": "remove", "path": [...]}
+        remove the value at path
+    {"op": "order", "path": [...], "key": k, "ids": [...]}
+        reorder the keyed list at path so that its items' k values are ids
+
+A path is a list of segments: a string is a dictionary key, a number a list
+index and {"key": k, "id": i} the item of a keyed list whose k value is i.
+Lists of objects that all carry a unique stable id (a build request's brid,
+a build's number, a slave's name) are keyed, so that a new build or a
+finished request costs one operation rather than shifting every item.
+"""
+
+import json
+
+# the stable ids of the items of the status JSON lists, in order of preference
+ID_KEYS = ("brid", "number", "name", "id")
+
+
+def _listKey(old, new):
+    items = old + new
+    if not items or not all(isinstance(i, dict) for i in items):
+        return None
+    for key in ID_KEYS:
+        if not all(key in i for i in items):
+            continue
+        if len(set(_id(i[key]) for i in old)) == len(old) and \
+                len(set(_id(i[key]) for i in new)) == len(new):
+            return key
+    return None
+
+
+def _id(value):
+    # ids are compared as their JSON encoding, so that 1 and "1" differ
+    return json.dumps(value)
+
+
+def _diff(old, new, path, ops):
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k in old:
+            if k not in new:
+                ops.append({"op": "remove", "path": path + [k]})
+        for k, v in new.iteritems():
+            if k not in old:
+                ops.append({"op": "set", "path": path + [k], "value": v})
+            else:
+                _diff(old[k], v, path + [k], ops)
+        return
+    if isinstance(old, list) and isinstance(new, list):
+        key = _listKey(old, new)
+        if key is not None:
+            _diffKeyed(old, new, key, path, ops)
+            return
+    ops.append({"op": "set", "path": path, "value": new})
+
+
+def _diffKeyed(old, new, key, path, ops):
+    oldItems = dict((_id(i[key]), i) for i in old)
+    newIds = set(_id(i[key]) for i in new)
+    order = []
+    for item in old:
+        if _id(item[key]) not in newIds:
+            ops.append({"op": "remove",
+                        "path": path + [{"key": key, "id": item[key]}]})
+        else:
+            order.append(item[key])
+    for item in new:
+        segment = {"key": key, "id": item[key]}
+        if _id(item[key]) in oldItems:
+            _diff(oldItems[_id(item[key])], item, path + [segment], ops)
+        else:
+            ops.append({"op": "set", "path": path + [segment], "value": item})
+            order.append(item[key])
+    ids = [i[key] for i in new]
+    if order != ids:
+        ops.append({"op": "order", "path": path, "key": key, "ids": ids})
+
+
+def diff(old, new):
+    """
+    Return the patch turning the document old into new
+    """
+    ops = []
+    _diff(old, new, [], ops)
+    return ops
+
+
+def _find(container, segment):
+    if isinstance(segment, dict):
+        for i, item in enumerate(container):
+            if item.get(segment["key"]) == segment["id"]:
+                return i
+        return None
+    if isinstance(container, list):
+        return segment if segment < len(container) else None
+    return segment if segment in container else None
+
+
+def _resolve(doc, path):
+    for segment in path:
+        doc = doc[_find(doc, segment)]
+    return doc
+
+
+def apply(doc, patch):
+    """
+    Apply patch to doc, in place where possible, and return the result
+    """
+    for op in patch:
+        path = op["path"]
+        if op["op"] == "order":
+            target = _resolve(doc, path)
+            items = dict((_id(i[op["key"]]), i) for i in target)
+            target[:] = [items[_id(i)] for i in op["ids"]]
+            continue
+        if not path:
+            if op["op"] == "set":
+                doc = op["value"]
+            continue
+        parent = _resolve(doc, path[:-1])
+        last = path[-1]
+        index = _find(parent, last)
+        if op["op"] == "remove":
+            if index is not None:
+                del parent[index]
+        elif index is None and isinstance(last, dict):
+            parent.append(op["value"])
+        else:
+            parent[last if index is None else index] = op["value"]
+    return doc
@@ -75,6 +75,18 @@ class ChangeFilter(ComparableMixin):
                 return False
         return True
 
+    def getExactMatchChecks(self):
+        """
+        Get the conditions of this filter that require a change attribute to
+        be one of a list of values, for use with
+        L{buildbot.changes.router.ChangeRouter}.
+
+        @returns: list of (attribute, values) tuples
+        """
+        return [ (chg_attr, filt_list)
+                 for (filt_list, _, _, chg_attr) in self.checks
+                 if filt_list is not None ]
+
     def __repr__(self):
         checks = []
         for (filt_list, filt_re, filt_fn, chg_attr) in self.checks:
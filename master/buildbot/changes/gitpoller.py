@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 import os
+import itertools
 import urllib
 from twisted.python import log
 from twisted.internet import defer, utils
@@ -23,6 +24,12 @@ from buildbot.util import epoch2datetime
 from buildbot.util.state import StateMixin
 from buildbot import config
 
+# separators for the fields of each commit in the output of _get_commits; git
+# expands %x1e and %x1f in the format to these bytes
+RECORD_SEPARATOR = '\x1e'
+FIELD_SEPARATOR = '\x1f'
+COMMITS_FORMAT = '%x1e%H%x1f%ct%x1f%aN <%aE>%x1f%s%n%b%x1f'
+
 class GitPoller(base.PollingChangeSource, StateMixin):
     """This source will poll a remote git repo for changes and submit
     them to the change master."""
@@ -31,6 +38,9 @@ class GitPoller(base.PollingChangeSource, StateMixin):
                      "pollInterval", "gitbin", "usetimestamps",
                      "category", "project"]
 
+    # number of commits parsed and submitted to the master at a time
+    changeBatchSize = 100
+
     def __init__(self, repourl, branches=None, branch=None,
                  workdir=None, pollInterval=10*60, 
                  gitbin='git', usetimestamps=True,
@@ -169,14 +179,64 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         d.addCallback(process)
         return d
 
+    def _get_commits(self, revRange):
+        """
+        Get the details of every commit in C{revRange}, oldest first, from a
+        single C{git log}.
+
+        @returns: Deferred firing with an iterator of (rev, timestamp, author,
+        files, comments) tuples.  The output is parsed as the iterator is
+        consumed.
+        """
+        args = ['--reverse', '--name-only', '--format=' + COMMITS_FORMAT,
+                revRange, '--']
+        d = self._dovccmd('log', args, path=self.workdir)
+        d.addCallback(self._parse_commits)
+        return d
+
+    def _parse_commits(self, git_output):
+        start = git_output.find(RECORD_SEPARATOR)
+        while start != -1:
+            end = git_output.find(RECORD_SEPARATOR, start + 1)
+            if end == -1:
+                record = git_output[start + 1:]
+            else:
+                record = git_output[start + 1:end]
+            start = end
+
+            fields = record.split(FIELD_SEPARATOR)
+            if len(fields) != 5:
+                raise EnvironmentError('could not parse git log output: %r'
+                                       % (record[:200],))
+            rev, timestamp, author, comments, files = fields
+
+            if self.usetimestamps:
+                try:
+                    timestamp = float(timestamp)
+                except Exception:
+                    log.msg('gitpoller: caught exception converting output '
+                            '\'%s\' to timestamp' % timestamp)
+                    raise
+            else:
+                timestamp = None
+
+            author = author.decode(self.encoding)
+            if len(author) == 0:
+                raise EnvironmentError('could not get commit author for rev')
+            comments = comments.strip().decode(self.encoding)
+            if len(comments) == 0:
+                raise EnvironmentError('could not get commit comment for rev')
+            files = [ f for f in files.split('\n') if f ]
+
+            yield rev, timestamp, author, files, comments
+
     @defer.inlineCallbacks
     def _process_changes(self, newRev, branch):
         """
         Read changes since last change.
 
-        - Read list of commit hashes.
-        - Extract details from each commit.
-        - Add changes to database.
+        - Read the details of all new commits with a single git log.
+        - Add changes to database, a batch per transaction.
         """
 
         lastRev = self.lastRev.get(branch)
@@ -184,48 +244,38 @@ class GitPoller(base.PollingChangeSource, StateMixin):
         if not lastRev:
             return
 
-        # get the change list
-        revListArgs = [r'--format=%H', '%s..%s' % (lastRev, newRev), '--']
+        revRange = '%s..%s' % (lastRev, newRev)
         self.changeCount = 0
-        results = yield self._dovccmd('log', revListArgs, path=self.workdir)
-
-
-        # process oldest change first
-        revList = results.split()
-        revList.reverse()
-        self.changeCount = len(revList)
-            
-        log.msg('gitpoller: processing %d changes: %s from "%s"'
-                % (self.changeCount, revList, self.repourl) )
-
-        for rev in revList:
-            dl = defer.DeferredList([
-                self._get_commit_timestamp(rev),
-                self._get_commit_author(rev),
-                self._get_commit_files(rev),
-                self._get_commit_comments(rev),
-            ], consumeErrors=True)
-
-            results = yield dl
-
-            # check for failures
-            failures = [ r[1] for r in results if not r[0] ]
-            if failures:
-                # just fail on the first error; they're probably all related!
-                raise failures[0]
-
-            timestamp, author, files, comments = [ r[1] for r in results ]
-            yield self.master.addChange(
-                   author=author,
-                   revision=rev,
-                   files=files,
-                   comments=comments,
-                   when_timestamp=epoch2datetime(timestamp),
-                   branch=branch,
-                   category=self.category,
-                   project=self.project,
-                   repository=self.repourl,
-                   src='git')
+        commits = yield self._get_commits(revRange)
+
+        while True:
+            # parse a batch before submitting it, so that a malformed commit
+            # is found before any of the batch is added
+            batch = list(itertools.islice(commits, self.changeBatchSize))
+            if not batch:
+                break
+
+            if not self.changeCount:
+                log.msg('gitpoller: processing changes %s from "%s"'
+                        % (revRange, self.repourl))
+            self.changeCount += len(batch)
+
+            yield self.master.addChanges([
+                    dict(author=author,
+                         revision=rev,
+                         files=files,
+                         comments=comments,
+                         when_timestamp=epoch2datetime(timestamp),
+                         branch=branch,
+                         category=self.category,
+                         project=self.project,
+                         repository=self.repourl,
+                         src='git')
+                    for rev, timestamp, author, files, comments in batch ])
+
+        if self.changeCount:
+            log.msg('gitpoller: processed %d changes from "%s"'
+                    % (self.changeCount, self.repourl))
 
     def _dovccmd(self, command, args, path=None):
         d = utils.getProcessOutputAndValue(self.gitbin,
@@ -31,6 +31,9 @@ class HgPoller(base.PollingChangeSource):
                      "pollInterval", "hgpoller", "usetimestamps",
                      "category", "project"]
 
+    # number of changes added to the master in each transaction
+    changeBatchSize = 100
+
     db_class_name = 'HgPoller'
 
     def __init__(self, repourl, branch='default',
@@ -262,23 +265,27 @@ class HgPoller(base.PollingChangeSource):
 
         log.msg('hgpoller: processing %d changes: %r in %r'
                 % (len(revNodeList), revNodeList, self._absWorkdir()))
-        for rev, node in revNodeList:
-            timestamp, author, files, comments = yield self._getRevDetails(
-                node)
-            yield self.master.addChange(
-                   author=author,
-                   revision=node,
-                   files=files,
-                   comments=comments,
-                   when_timestamp=epoch2datetime(timestamp),
-                   branch=self.branch,
-                   category=self.category,
-                   project=self.project,
-                   repository=self.repourl,
-                   src='hg')
-            # writing after addChange so that a rev is never missed,
+        for i in range(0, len(revNodeList), self.changeBatchSize):
+            batch = revNodeList[i:i+self.changeBatchSize]
+            changes = []
+            for rev, node in batch:
+                timestamp, author, files, comments = \
+                        yield self._getRevDetails(node)
+                changes.append(dict(
+                       author=author,
+                       revision=node,
+                       files=files,
+                       comments=comments,
+                       when_timestamp=epoch2datetime(timestamp),
+                       branch=self.branch,
+                       category=self.category,
+                       project=self.project,
+                       repository=self.repourl,
+                       src='hg'))
+            yield self.master.addChanges(changes)
+            # writing after addChanges so that a rev is never missed,
             # but at once to avoid impact from later errors
-            yield self._setCurrentRev(rev, oid=oid)
+            yield self._setCurrentRev(batch[-1][0], oid=oid)
 
     def _processChangesFailure(self, f):
         log.msg('hgpoller: repo poll failed')
@@ -0,0 +1,134 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from twisted.python import failure, log
+from buildbot.process import metrics
+
+class ChangeRoute(object):
+    """
+    A callback registered with a L{ChangeRouter}.
+
+    @ivar key: tuple (attribute, frozenset of values) the route is indexed
+    under, or None if it is offered every change
+    """
+
+    def __init__(self, router, callback, key):
+        self.router = router
+        self.callback = callback
+        self.key = key
+
+    def unsubscribe(self):
+        self.router._unsubscribe(self)
+
+class ChangeRouter(object):
+    """
+    Deliver each new change only to the callbacks that might accept it.
+
+    Each callback is registered with a list of exact-match conditions, as
+    (attribute, values) pairs, that a change must meet for the callback to
+    accept it: the change's C{attribute} must be one of C{values}.  The route
+    is indexed under the condition with the fewest values, so a change is
+    only offered to the routes indexed under its own value of that attribute,
+    and to the routes without any usable condition.  A C{codebase} condition
+    is only used when there is no other: every scheduler has one, and most
+    share the default codebase C{''}, so it rarely narrows anything down.
+
+    The conditions only narrow down the candidates; each callback must still
+    check the change completely, and should return true if it accepted it.
+    The candidate and match counts are reported as the
+    C{ChangeRouter.candidates} and C{ChangeRouter.matches} metrics.
+    """
+
+    indexedAttributes = ('project', 'repository', 'branch', 'codebase')
+
+    def __init__(self):
+        self.unindexed = set()
+        self.index = dict((attr, {}) for attr in self.indexedAttributes)
+        self.routes = set()
+
+    def subscribe(self, callback, conditions=()):
+        """
+        Call C{callback} with each change that meets all of C{conditions}.
+
+        @returns: L{ChangeRoute}, with an C{unsubscribe} method
+        """
+        route = ChangeRoute(self, callback, self._chooseKey(conditions))
+        if route.key is None:
+            self.unindexed.add(route)
+        else:
+            attr, values = route.key
+            for value in values:
+                self.index[attr].setdefault(value, set()).add(route)
+        self.routes.add(route)
+        return route
+
+    def _chooseKey(self, conditions):
+        key = keyRank = None
+        for attr, values in conditions:
+            if attr not in self.index or values is None:
+                continue
+            try:
+                values = frozenset(values)
+            except TypeError:
+                # unhashable values can only be checked by the callback
+                continue
+            rank = (attr == 'codebase', len(values))
+            if key is None or rank < keyRank:
+                key, keyRank = (attr, values), rank
+        return key
+
+    def _unsubscribe(self, route):
+        if route not in self.routes:
+            return
+        self.routes.remove(route)
+        if route.key is None:
+            self.unindexed.remove(route)
+        else:
+            attr, values = route.key
+            byValue = self.index[attr]
+            for value in values:
+                byValue[value].remove(route)
+                if not byValue[value]:
+                    del byValue[value]
+
+    def getCandidates(self, change):
+        candidates = set(self.unindexed)
+        for attr, byValue in self.index.iteritems():
+            if not byValue:
+                continue
+            try:
+                routes = byValue.get(getattr(change, attr, ''))
+            except TypeError:
+                continue
+            if routes:
+                candidates.update(routes)
+        return candidates
+
+    def deliver(self, change):
+        candidates = self.getCandidates(change)
+        matches = 0
+        for route in candidates:
+            try:
+                if route.callback(change):
+                    matches += 1
+            except:
+                log.err(failure.Failure(),
+                        'while routing change to %s' % (route.callback,))
+
+        metrics.MetricCountEvent.log('ChangeRouter.candidates',
+                                     len(candidates))
+        metrics.MetricCountEvent.log('ChangeRouter.matches', matches)
+        metrics.MetricCountEvent.log('ChangeRouter.skipped',
+                                     len(self.routes) - len(candidates))
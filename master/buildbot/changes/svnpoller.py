@@ -394,10 +394,9 @@ class SVNPoller(base.PollingChangeSource, util.ComparableMixin):
 
         return changes
 
-    @defer.inlineCallbacks
     def submit_changes(self, changes):
-        for chdict in changes:
-            yield self.master.addChange(src='svn', **chdict)
+        return self.master.addChanges([ dict(src='svn', **chdict)
+                                        for chdict in changes ])
 
     def finished_ok(self, res):
         if self.cachepath:
@@ -74,10 +74,15 @@ class MasterConfig(object):
         self.logCompressionMethod = 'bz2'
         self.logMaxTailSize = None
         self.logMaxSize = None
+        self.logWriterBufferSize = None
+        self.buildHistoryBackend = 'pickle'
+        self.buildHistoryMaxAge = None
+        self.buildHistoryMaxSize = None
         self.properties = properties.Properties()
         self.mergeRequests = None
         self.codebaseGenerator = None
         self.prioritizeBuilders = None
+        self.builderDispatchConcurrency = 1
         self.slavePortnum = None
         self.multiMaster = False
         self.debugPassword = None
@@ -122,7 +127,10 @@ class MasterConfig(object):
         "multiMaster", "prioritizeBuilders", "projects", "projectName", "projectURL",
         "properties", "revlink", "schedulers", "slavePortnum", "slaves",
         "status", "title", "titleURL", "user_managers", "validation", "realTimeServer", "analytics_code", "gzip",
-        "autobahn_push", "lastBuildCacheDays", "requireLogin"
+        "autobahn_push", "lastBuildCacheDays", "requireLogin",
+        "buildHistoryBackend", "buildHistoryMaxAge", "buildHistoryMaxSize",
+        "builderDispatchConcurrency",
+        "logWriterBufferSize",
     ])
 
     @classmethod
@@ -268,14 +276,34 @@ class MasterConfig(object):
 
         if 'logCompressionMethod' in config_dict:
             logCompressionMethod = config_dict.get('logCompressionMethod')
-            if logCompressionMethod not in ('bz2', 'gz'):
-                errors.addError(
-                        "c['logCompressionMethod'] must be 'bz2' or 'gz'")
+            if logCompressionMethod not in ('bz2', 'gz', 'blocks'):
+                errors.addError("c['logCompressionMethod'] must be 'bz2', "
+                                "'gz' or 'blocks'")
             self.logCompressionMethod = logCompressionMethod
 
         copy_int_param('logMaxSize')
         copy_int_param('logMaxTailSize')
 
+        if 'logWriterBufferSize' in config_dict:
+            logWriterBufferSize = config_dict.get('logWriterBufferSize')
+            if logWriterBufferSize is not None and (
+                    not isinstance(logWriterBufferSize, int)
+                    or logWriterBufferSize < 1):
+                errors.addError("c['logWriterBufferSize'] must be None or "
+                                "a positive int")
+            else:
+                self.logWriterBufferSize = logWriterBufferSize
+
+        if 'buildHistoryBackend' in config_dict:
+            buildHistoryBackend = config_dict.get('buildHistoryBackend')
+            if buildHistoryBackend not in ('pickle', 'sqlite'):
+                errors.addError(
+                        "c['buildHistoryBackend'] must be 'pickle' or 'sqlite'")
+            self.buildHistoryBackend = buildHistoryBackend
+
+        copy_int_param('buildHistoryMaxAge')
+        copy_int_param('buildHistoryMaxSize')
+
         properties = config_dict.get('properties', {})
         if not isinstance(properties, dict):
             errors.addError("c['properties'] must be a dictionary")
@@ -305,6 +333,14 @@ class MasterConfig(object):
         else:
             self.prioritizeBuilders = prioritizeBuilders
 
+        if 'builderDispatchConcurrency' in config_dict:
+            concurrency = config_dict.get('builderDispatchConcurrency')
+            if not isinstance(concurrency, int) or concurrency < 1:
+                errors.addError(
+                    "c['builderDispatchConcurrency'] must be a positive int")
+            else:
+                self.builderDispatchConcurrency = concurrency
+
         if 'slavePortnum' in config_dict:
             slavePortnum = config_dict.get('slavePortnum')
             if isinstance(slavePortnum, int):
@@ -18,6 +18,7 @@ import sqlalchemy as sa
 from twisted.internet import reactor
 from twisted.python import log
 from buildbot.db import base
+from buildbot.db import sourcestamps as sourcestamps_db
 from buildbot.util import epoch2datetime, datetime2epoch
 
 class AlreadyClaimedError(Exception):
@@ -68,7 +69,7 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
 
     @with_master_objectid
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-            bsid=None, _master_objectid=None, brids=None):
+            bsid=None, _master_objectid=None, brids=None, after_brid=None):
         def thd(conn):
             reqs_tbl = self.db.model.buildrequests
             claims_tbl = self.db.model.buildrequest_claims
@@ -96,6 +97,8 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
                 q = q.where(reqs_tbl.c.buildsetid == bsid)
             if brids is not None:
                 q = q.where(reqs_tbl.c.id.in_(brids))
+            if after_brid is not None:
+                q = q.where(reqs_tbl.c.id > after_brid)
             res = conn.execute(q)
 
             return [ self._brdictFromRow(row, _master_objectid)
@@ -131,34 +134,32 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
 
         return self.db.pool.do(thd)
 
+    def countUnclaimedBuildRequests(self):
+        def thd(conn):
+            reqs_tbl = self.db.model.buildrequests
+            claims_tbl = self.db.model.buildrequest_claims
+
+            q = sa.select([sa.func.count(reqs_tbl.c.id)],
+                          from_obj=reqs_tbl.outerjoin(claims_tbl, (reqs_tbl.c.id == claims_tbl.c.brid)),
+                          whereclause=((claims_tbl.c.claimed_at == None) &
+                                       (reqs_tbl.c.complete == 0)))
+            return conn.execute(q).scalar()
+
+        return self.db.pool.do(thd)
+
     def getBuildRequestBySourcestamps(self, buildername=None, sourcestamps=None):
         def thd(conn):
             sourcestampsets_tbl = self.db.model.sourcestampsets
-            sourcestamps_tbl = self.db.model.sourcestamps
             buildrequests_tbl = self.db.model.buildrequests
             buildsets_tbl = self.db .model.buildsets
-            clauses = []
-
-            # check sourcestampset has same number of row in the sourcestamps table
-            stmt = sa.select([sourcestamps_tbl.c.sourcestampsetid]) \
-                .where(sourcestamps_tbl.c.sourcestampsetid == sourcestampsets_tbl.c.id) \
-                .group_by(sourcestamps_tbl.c.sourcestampsetid) \
-                .having(sa.func.count(sourcestamps_tbl.c.id) == len(sourcestamps))
-
-            clauses.append(sourcestampsets_tbl.c.id == stmt)
-            clauses.append(sourcestampsets_tbl.c.id != sourcestamps[0]['b_sourcestampsetid'])
-
-            # check that sourcestampset match all revisions x codebases
-            for ss in sourcestamps:
-                stmt_temp = sa.select([sourcestamps_tbl.c.sourcestampsetid]) \
-                    .where(sourcestamps_tbl.c.sourcestampsetid ==  sourcestampsets_tbl.c.id ) \
-                    .where(sourcestamps_tbl.c.codebase == ss['b_codebase']) \
-                    .where(sourcestamps_tbl.c.revision == ss['b_revision'])\
-                    .where(sourcestamps_tbl.c.branch == ss['b_branch'])
-                clauses.append(sourcestampsets_tbl.c.id == stmt_temp)
+
+            # find the other sourcestampsets with exactly these revisions x codebases
+            fingerprint = sourcestamps_db.sourceStampSetFingerprint(
+                (ss['b_codebase'], ss['b_branch'], ss['b_revision']) for ss in sourcestamps)
 
             stmt2 = sa.select(columns=[sourcestampsets_tbl.c.id]) \
-                .where(sa.and_(*clauses))
+                .where(sourcestampsets_tbl.c.fingerprint == fingerprint) \
+                .where(sourcestampsets_tbl.c.id != sourcestamps[0]['b_sourcestampsetid'])
 
             stmt3 = sa.select(columns=[buildsets_tbl.c.id])\
                         .where(buildsets_tbl.c.sourcestampsetid.in_(stmt2))
@@ -607,6 +608,8 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
                         "but only completed %d" % (len(batch), res.rowcount))
                     transaction.rollback()
                     raise NotClaimedError
+
+                self.db.builds._updateLatestBuilds(conn, batch)
             transaction.commit()
         return self.db.pool.do(thd)
 
@@ -628,6 +631,7 @@ class BuildRequestsConnectorComponent(base.DBConnectorComponent):
             if count != 0:
                 log.msg("unclaimed %d expired buildrequests (over %d seconds "
                         "old)" % (count, old))
+            return count
         d.addCallback(log_nonzero_count)
         return d
 
@@ -13,11 +13,28 @@
 #
 # Copyright Buildbot Team Members
 
+import hashlib
 from twisted.internet import reactor
 from buildbot.db import base
 from buildbot.util import epoch2datetime
 import sqlalchemy as sa
 
+def latestBuildKey(codebases):
+    """
+    Return the key under which the latest builds for the branches in
+    C{codebases}, a dictionary mapping codebase to branch, are recorded.  This
+    is the same format as L{BuilderStatus.getLatestBuildKey}.
+    """
+    return u"".join(u"%s=%s;" % (cb, codebases[cb]) for cb in sorted(codebases))
+
+def latestBuildKeyHash(key):
+    """
+    Return the hash of C{key} stored in the C{latestbuilds} table.
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
 class BuildsConnectorComponent(base.DBConnectorComponent):
     # Documentation is in developer/database.rst
 
@@ -79,6 +96,9 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
                 q = tbl.update(whereclause=(tbl.c.id.in_(batch)))
                 conn.execute(q, finish_time=now)
 
+                res = conn.execute(sa.select([tbl.c.brid], whereclause=(tbl.c.id.in_(batch))))
+                self._updateLatestBuilds(conn, [row.brid for row in res.fetchall()])
+
             transaction.commit()
         return self.db.pool.do(thd)
 
@@ -105,6 +125,112 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
 
         return self.db.pool.do(thd)
 
+    def _updateLatestBuilds(self, conn, brids):
+        # record the builds of the given build requests in the latestbuilds
+        # table, once the build is finished and the request complete; this is
+        # called from finishBuilds and completeBuildRequests, in their
+        # transactions, so whichever happens last sees both
+        buildrequests_tbl = self.db.model.buildrequests
+        buildsets_tbl = self.db.model.buildsets
+        sourcestamps_tbl = self.db.model.sourcestamps
+        builds_tbl = self.db.model.builds
+        latest_tbl = self.db.model.latestbuilds
+
+        if not brids:
+            return
+
+        q = sa.select([buildrequests_tbl.c.buildername, buildrequests_tbl.c.results,
+                       buildsets_tbl.c.sourcestampsetid,
+                       sa.func.max(builds_tbl.c.number).label("number")],
+                      from_obj=buildrequests_tbl.join(builds_tbl,
+                                                      (buildrequests_tbl.c.id == builds_tbl.c.brid)
+                                                      & (builds_tbl.c.finish_time != None))
+                                                .join(buildsets_tbl,
+                                                      buildrequests_tbl.c.buildsetid == buildsets_tbl.c.id))\
+            .where(buildrequests_tbl.c.id.in_(brids))\
+            .where(buildrequests_tbl.c.complete == 1)\
+            .where(buildrequests_tbl.c.results != None)\
+            .where(buildrequests_tbl.c.mergebrid == None)\
+            .group_by(buildrequests_tbl.c.buildername, buildrequests_tbl.c.results,
+                      buildsets_tbl.c.sourcestampsetid)
+        finished = conn.execute(q).fetchall()
+        if not finished:
+            return
+
+        codebases = {}
+        q = sa.select([sourcestamps_tbl.c.sourcestampsetid, sourcestamps_tbl.c.codebase,
+                       sourcestamps_tbl.c.branch])\
+            .where(sourcestamps_tbl.c.sourcestampsetid.in_(
+                        set(row.sourcestampsetid for row in finished)))
+        for row in conn.execute(q).fetchall():
+            if row.codebase and row.branch:
+                codebases.setdefault(row.sourcestampsetid, {})[row.codebase] = row.branch
+
+        for row in finished:
+            if row.sourcestampsetid not in codebases:
+                continue
+            keyhash = latestBuildKeyHash(latestBuildKey(codebases[row.sourcestampsetid]))
+            wc = ((latest_tbl.c.buildername == row.buildername)
+                  & (latest_tbl.c.sourcekeyhash == keyhash)
+                  & (latest_tbl.c.results == row.results))
+
+            res = conn.execute(sa.select([latest_tbl.c.number], whereclause=wc))
+            current = res.fetchone()
+            res.close()
+            if current is not None:
+                if current.number < row.number:
+                    conn.execute(latest_tbl.update(whereclause=wc
+                                                   & (latest_tbl.c.number < row.number)),
+                                 number=row.number)
+                continue
+
+            # a failed insert aborts the whole transaction on some databases
+            # (e.g. PostgreSQL), so insert in a savepoint.  SQLite only fails
+            # the statement, and pysqlite cannot mix savepoints with the
+            # transactions it opens itself.
+            savepoint = None
+            if conn.dialect.name != 'sqlite':
+                savepoint = conn.begin_nested()
+            try:
+                conn.execute(latest_tbl.insert(),
+                             buildername=row.buildername, sourcekeyhash=keyhash,
+                             results=row.results, number=row.number)
+                if savepoint:
+                    savepoint.commit()
+            except sa.exc.IntegrityError:
+                # another master beat us to it; update its row instead
+                if savepoint:
+                    savepoint.rollback()
+                conn.execute(latest_tbl.update(whereclause=wc
+                                               & (latest_tbl.c.number < row.number)),
+                             number=row.number)
+
+    def getLatestBuildNumbers(self, buildernames, key, results=None):
+        def thd(conn):
+            latest_tbl = self.db.model.latestbuilds
+            keyhash = latestBuildKeyHash(key)
+
+            latest = {}
+            names = list(buildernames)
+            while names:
+                batch, names = names[:100], names[100:]
+                q = sa.select([latest_tbl.c.buildername,
+                               sa.func.max(latest_tbl.c.number).label("number")])\
+                    .where(latest_tbl.c.buildername.in_(batch))\
+                    .where(latest_tbl.c.sourcekeyhash == keyhash)\
+                    .group_by(latest_tbl.c.buildername)
+                if results:
+                    q = q.where(latest_tbl.c.results.in_(results))
+
+                res = conn.execute(q)
+                for row in res.fetchall():
+                    latest[row.buildername] = row.number
+                res.close()
+
+            return latest
+
+        return self.db.pool.do(thd)
+
     def getLastsBuildsNumbersBySlave(self, slavename, results=None, num_builds=15):
         def thd(conn):
             buildrequests_tbl = self.db.model.buildrequests
@@ -152,90 +278,184 @@ class BuildsConnectorComponent(base.DBConnectorComponent):
 
         return self.db.pool.do(thd)
 
-    def getLastBuildsNumbers(self, buildername=None, sourcestamps=None, results=None, num_builds=1):
+    def getRecentBuildsBySlave(self, slavename, num_builds=15):
         def thd(conn):
             buildrequests_tbl = self.db.model.buildrequests
-            buildsets_tbl = self.db .model.buildsets
-            sourcestampsets_tbl = self.db.model.sourcestampsets
-            sourcestamps_tbl = self.db.model.sourcestamps
             builds_tbl = self.db.model.builds
 
-            lastBuilds = []
-            maxSearch = num_builds if num_builds < 200 else 200
-
-            q = sa.select(columns=[builds_tbl.c.number],
+            q = sa.select(columns=[buildrequests_tbl.c.buildername, builds_tbl.c.number,
+                                   buildrequests_tbl.c.results, builds_tbl.c.finish_time],
                           from_obj=buildrequests_tbl.join(builds_tbl,
-                                                          (buildrequests_tbl.c.id == builds_tbl.c.brid)
-                                                          & (builds_tbl.c.finish_time != None))).\
-                where(buildrequests_tbl.c.mergebrid == None)\
-                .where(buildrequests_tbl.c.buildername == buildername)
+                                                          (buildrequests_tbl.c.id == builds_tbl.c.brid)))\
+                .where(builds_tbl.c.slavename == slavename)\
+                .where(builds_tbl.c.finish_time != None)\
+                .where(buildrequests_tbl.c.mergebrid == None)\
+                .order_by(sa.desc(builds_tbl.c.finish_time), sa.desc(builds_tbl.c.id))\
+                .limit(num_builds)
 
-            #TODO: support filter by RETRY result
-            if results:
-                q = sa.select(columns=[buildrequests_tbl.c.id, buildrequests_tbl.c.results,
-                                       sa.func.max(builds_tbl.c.number).label("number")],
-                          from_obj=buildrequests_tbl.join(builds_tbl,
-                                                          (buildrequests_tbl.c.id == builds_tbl.c.brid)
-                                                          & (builds_tbl.c.finish_time != None))).\
-                    where(buildrequests_tbl.c.mergebrid == None)\
-                    .where(buildrequests_tbl.c.buildername == buildername)\
-                    .where(buildrequests_tbl.c.results.in_(results))\
-                    .group_by(buildrequests_tbl.c.id, buildrequests_tbl.c.results)
+            res = conn.execute(q)
+            rv = [dict(buildername=row.buildername, number=row.number,
+                       results=row.results, finish_time=row.finish_time)
+                  for row in res.fetchall()]
+            res.close()
+            return rv
+
+        return self.db.pool.do(thd)
 
-            if sourcestamps and len(sourcestamps) > 0:
-                # check that sourcestampset match all branches x codebases
-                clauses = []
-                exclude_clauses = []
-                codebases_filter = sourcestamps is not None and len(sourcestamps) > 1 \
-                                   and 'b_codebase' in sourcestamps[0]
+    def _lastBuildsQuery(self, buildernames, sourcestamps=None, results=None):
+        # select (buildername, brid, number) of the finished, unmerged builds
+        # of the given builders that match the sourcestamps and results
+        buildrequests_tbl = self.db.model.buildrequests
+        buildsets_tbl = self.db.model.buildsets
+        sourcestampsets_tbl = self.db.model.sourcestampsets
+        sourcestamps_tbl = self.db.model.sourcestamps
+        builds_tbl = self.db.model.builds
+
+        from_obj = buildrequests_tbl.join(builds_tbl,
+                                          (buildrequests_tbl.c.id == builds_tbl.c.brid)
+                                          & (builds_tbl.c.finish_time != None))
+
+        q = sa.select(columns=[buildrequests_tbl.c.buildername,
+                               buildrequests_tbl.c.id.label("brid"),
+                               builds_tbl.c.number],
+                      from_obj=from_obj)
+
+        #TODO: support filter by RETRY result
+        if results:
+            q = sa.select(columns=[buildrequests_tbl.c.buildername,
+                                   buildrequests_tbl.c.id.label("brid"),
+                                   buildrequests_tbl.c.results,
+                                   sa.func.max(builds_tbl.c.number).label("number")],
+                          from_obj=from_obj)\
+                .where(buildrequests_tbl.c.results.in_(results))\
+                .group_by(buildrequests_tbl.c.buildername, buildrequests_tbl.c.id,
+                          buildrequests_tbl.c.results)
+
+        q = q.where(buildrequests_tbl.c.mergebrid == None)
+        if len(buildernames) == 1:
+            q = q.where(buildrequests_tbl.c.buildername == buildernames[0])
+        else:
+            q = q.where(buildrequests_tbl.c.buildername.in_(buildernames))
+
+        if sourcestamps and len(sourcestamps) > 0:
+            # check that sourcestampset match all branches x codebases
+            clauses = []
+            exclude_clauses = []
+            codebases_filter = sourcestamps is not None and len(sourcestamps) > 1 \
+                               and 'b_codebase' in sourcestamps[0]
+
+            for ss in sourcestamps:
+                stmt_include = sa.select([sourcestamps_tbl.c.sourcestampsetid]) \
+                    .where(sourcestamps_tbl.c.sourcestampsetid ==  sourcestampsets_tbl.c.id ) \
+                    .where(sourcestamps_tbl.c.branch == ss['b_branch'])
+                if 'b_codebase' in ss:
+                    stmt_include = stmt_include.where(sourcestamps_tbl.c.codebase == ss['b_codebase'])
+
+                clauses.append(sourcestampsets_tbl.c.id == stmt_include)
 
-                for ss in sourcestamps:
-                    stmt_include = sa.select([sourcestamps_tbl.c.sourcestampsetid]) \
-                        .where(sourcestamps_tbl.c.sourcestampsetid ==  sourcestampsets_tbl.c.id ) \
-                        .where(sourcestamps_tbl.c.branch == ss['b_branch'])
-                    if 'b_codebase' in ss:
-                        stmt_include = stmt_include.where(sourcestamps_tbl.c.codebase == ss['b_codebase'])
+                if codebases_filter:
+                    stmt_exclude = sa.select([sourcestamps_tbl.c.sourcestampsetid]) \
+                        .where(sourcestamps_tbl.c.sourcestampsetid ==  sourcestampsets_tbl.c.id) \
+                        .where(sourcestamps_tbl.c.codebase == ss['b_codebase'])\
+                        .where(sourcestamps_tbl.c.branch != ss['b_branch'])
+                    exclude_clauses.append(sourcestampsets_tbl.c.id == stmt_exclude)
 
-                    clauses.append(sourcestampsets_tbl.c.id == stmt_include)
+            stmt2 = sa.select(columns=[sourcestampsets_tbl.c.id]) \
+                .where(sa.or_(*clauses))
 
-                    if codebases_filter:
-                        stmt_exclude = sa.select([sourcestamps_tbl.c.sourcestampsetid]) \
-                            .where(sourcestamps_tbl.c.sourcestampsetid ==  sourcestampsets_tbl.c.id) \
-                            .where(sourcestamps_tbl.c.codebase == ss['b_codebase'])\
-                            .where(sourcestamps_tbl.c.branch != ss['b_branch'])
-                        exclude_clauses.append(sourcestampsets_tbl.c.id == stmt_exclude)
+            stmt3 = sa.select(columns=[buildsets_tbl.c.id])\
+                    .where(buildsets_tbl.c.sourcestampsetid.in_(stmt2))
 
-                stmt2 = sa.select(columns=[sourcestampsets_tbl.c.id]) \
-                    .where(sa.or_(*clauses))
+            q = q.where(buildrequests_tbl.c.buildsetid.in_(stmt3))
 
-                stmt3 = sa.select(columns=[buildsets_tbl.c.id])\
-                        .where(buildsets_tbl.c.sourcestampsetid.in_(stmt2))
+            if codebases_filter:
+                stmt4 = sa.select(columns=[sourcestampsets_tbl.c.id])\
+                    .where(sa.or_(*exclude_clauses))
 
-                q = q.where(buildrequests_tbl.c.buildsetid.in_(stmt3))
+                stmt5 = sa.select(columns=[buildsets_tbl.c.id])\
+                    .where(buildsets_tbl.c.sourcestampsetid.in_(stmt4))
 
-                if codebases_filter:
-                    stmt4 = sa.select(columns=[sourcestampsets_tbl.c.id])\
-                        .where(sa.or_(*exclude_clauses))
+                q = q.where(~buildrequests_tbl.c.buildsetid.in_(stmt5))
 
-                    stmt5 = sa.select(columns=[buildsets_tbl.c.id])\
-                        .where(buildsets_tbl.c.sourcestampsetid.in_(stmt4))
+        return q
 
-                    q = q.where(~buildrequests_tbl.c.buildsetid.in_(stmt5))
+    def _hasWindowFunctions(self, conn):
+        dialect = conn.dialect
+        version = dialect.server_version_info or ()
+        if dialect.name == 'sqlite':
+            return version >= (3, 25)
+        if dialect.name == 'postgresql':
+            return True
+        if dialect.name == 'mysql':
+            return version >= (8, 0)
+        return False
 
-            q = q.distinct(builds_tbl.c.number)\
-                .order_by(sa.desc(buildrequests_tbl.c.id)).limit(maxSearch)
+    def _lastBuildsNumbersThd(self, conn, buildername, sourcestamps, results, maxSearch):
+        buildrequests_tbl = self.db.model.buildrequests
+        builds_tbl = self.db.model.builds
 
-            res = conn.execute(q)
+        lastBuilds = []
 
-            rows = res.fetchall()
-            if rows:
-                for row in rows:
-                    if row.number not in lastBuilds:
-                        lastBuilds.append(row.number)
+        q = self._lastBuildsQuery([buildername], sourcestamps, results)
+        q = q.distinct(builds_tbl.c.number)\
+            .order_by(sa.desc(buildrequests_tbl.c.id)).limit(maxSearch)
 
-            res.close()
+        res = conn.execute(q)
+
+        rows = res.fetchall()
+        if rows:
+            for row in rows:
+                if row.number not in lastBuilds:
+                    lastBuilds.append(row.number)
 
-            return sorted(lastBuilds, reverse=True)
+        res.close()
+
+        return sorted(lastBuilds, reverse=True)
+
+    def getLastBuildsNumbers(self, buildername=None, sourcestamps=None, results=None, num_builds=1):
+        def thd(conn):
+            maxSearch = num_builds if num_builds < 200 else 200
+            return self._lastBuildsNumbersThd(conn, buildername, sourcestamps, results, maxSearch)
+
+        return self.db.pool.do(thd)
+
+    def getLastBuildsNumbersForBuilders(self, buildernames, sourcestamps=None, results=None, num_builds=1):
+        def thd(conn):
+            maxSearch = num_builds if num_builds < 200 else 200
+            lastBuilds = dict((name, []) for name in buildernames)
+
+            if not self._hasWindowFunctions(conn):
+                # one limited query per builder, but still a single trip
+                # to the database thread
+                for name in buildernames:
+                    lastBuilds[name] = self._lastBuildsNumbersThd(conn, name, sourcestamps,
+                                                                  results, maxSearch)
+                return lastBuilds
+
+            names = list(buildernames)
+            while names:
+                batch, names = names[:100], names[100:]
+
+                builds = self._lastBuildsQuery(batch, sourcestamps, results).alias('lastbuilds')
+                rank = sa.func.row_number().over(partition_by=builds.c.buildername,
+                                                 order_by=[sa.desc(builds.c.brid),
+                                                           sa.desc(builds.c.number)])
+                ranked = sa.select([builds.c.buildername, builds.c.number,
+                                    rank.label('rank')]).alias('ranked')
+                q = sa.select([ranked.c.buildername, ranked.c.number])\
+                    .where(ranked.c.rank <= maxSearch)
+
+                res = conn.execute(q)
+                for row in res.fetchall():
+                    numbers = lastBuilds[row.buildername]
+                    if row.number not in numbers:
+                        numbers.append(row.number)
+                res.close()
+
+            for numbers in lastBuilds.itervalues():
+                numbers.sort(reverse=True)
+
+            return lastBuilds
 
         return self.db.pool.do(thd)
 
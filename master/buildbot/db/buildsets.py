@@ -17,6 +17,7 @@
 Support for buildsets in the database
 """
 
+import itertools
 import sqlalchemy as sa
 from twisted.internet import reactor
 from buildbot.util import json
@@ -166,6 +167,60 @@ class BuildsetsConnectorComponent(base.DBConnectorComponent):
             return [ self._row2dict(row) for row in res.fetchall() ]
         return self.db.pool.do(thd)
 
+    def getBuildsetsByIds(self, bsids):
+        """
+        Fetch several buildsets at once.
+
+        @param bsids: buildset IDs
+
+        @returns: dictionary mapping bsid to buildset dictionary, via Deferred;
+        nonexistent buildsets are omitted
+        """
+        def thd(conn):
+            bs_tbl = self.db.model.buildsets
+            rv = {}
+            # we'll need to batch the bsids into groups of 100, so that the
+            # parameter lists supported by the DBAPI aren't exhausted
+            iterator = iter(bsids)
+            batch = list(itertools.islice(iterator, 100))
+            while len(batch) > 0:
+                q = bs_tbl.select(whereclause=(bs_tbl.c.id.in_(batch)))
+                for row in conn.execute(q).fetchall():
+                    rv[row.id] = self._row2dict(row)
+                batch = list(itertools.islice(iterator, 100))
+            return rv
+        return self.db.pool.do(thd)
+
+    def getBuildsetsProperties(self, bsids):
+        """
+        Like L{getBuildsetProperties}, but for several buildsets at once.
+
+        @param bsids: buildset IDs
+
+        @returns: dictionary mapping bsid to a properties dictionary, via
+        Deferred; every requested bsid is present
+        """
+        def thd(conn):
+            bsp_tbl = self.db.model.buildset_properties
+            rv = dict((bsid, {}) for bsid in bsids)
+            iterator = iter(bsids)
+            batch = list(itertools.islice(iterator, 100))
+            while len(batch) > 0:
+                q = sa.select(
+                    [ bsp_tbl.c.buildsetid, bsp_tbl.c.property_name,
+                      bsp_tbl.c.property_value ],
+                    whereclause=(bsp_tbl.c.buildsetid.in_(batch)))
+                for row in conn.execute(q):
+                    try:
+                        properties = json.loads(row.property_value)
+                        rv[row.buildsetid][row.property_name] = \
+                                tuple(properties)
+                    except ValueError:
+                        pass
+                batch = list(itertools.islice(iterator, 100))
+            return rv
+        return self.db.pool.do(thd)
+
     def getBuildsetProperties(self, buildsetid):
         """
         Return the properties for a buildset, in the same format they were
@@ -33,16 +33,53 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
             revision=None, when_timestamp=None, branch=None,
             category=None, revlink='', properties={}, repository='', codebase='',
             project='', uid=None, _reactor=reactor):
-        assert project is not None, "project must be a string, not None"
-        assert repository is not None, "repository must be a string, not None"
+        d = self.addChanges([dict(author=author, files=files,
+                comments=comments, is_dir=is_dir, revision=revision,
+                when_timestamp=when_timestamp, branch=branch,
+                category=category, revlink=revlink, properties=properties,
+                repository=repository, codebase=codebase, project=project,
+                uid=uid)], _reactor=_reactor)
+        d.addCallback(lambda changeids : changeids[0])
+        return d
+
+    def addChanges(self, changes, _reactor=reactor):
+        if not changes:
+            return defer.succeed([])
+
+        now = None
+        rows = []
+        for change in changes:
+            assert change.get('project', '') is not None, \
+                    "project must be a string, not None"
+            assert change.get('repository', '') is not None, \
+                    "repository must be a string, not None"
+
+            when_timestamp = change.get('when_timestamp')
+            if when_timestamp is None:
+                if now is None:
+                    now = epoch2datetime(_reactor.seconds())
+                when_timestamp = now
 
-        if when_timestamp is None:
-            when_timestamp = epoch2datetime(_reactor.seconds())
+            properties = change.get('properties') or {}
+            # verify that source is 'Change' for each property
+            for pv in properties.values():
+                assert pv[1] == 'Change', ("properties must be qualified with"
+                                           "source 'Change'")
 
-        # verify that source is 'Change' for each property
-        for pv in properties.values():
-            assert pv[1] == 'Change', ("properties must be qualified with"
-                                       "source 'Change'")
+            row = dict(
+                author=change.get('author'),
+                comments=change.get('comments'),
+                is_dir=change.get('is_dir', 0),
+                branch=change.get('branch'),
+                revision=change.get('revision'),
+                revlink=change.get('revlink', ''),
+                when_timestamp=datetime2epoch(when_timestamp),
+                category=change.get('category'),
+                repository=change.get('repository', ''),
+                codebase=change.get('codebase', ''),
+                project=change.get('project', ''))
+            rows.append((row, change.get('files'), properties,
+                         change.get('uid')))
 
         def thd(conn):
             # note that in a read-uncommitted database like SQLite this
@@ -54,60 +91,52 @@ class ChangesConnectorComponent(base.DBConnectorComponent):
             transaction = conn.begin()
 
             ch_tbl = self.db.model.changes
+            files_tbl = self.db.model.change_files
+            props_tbl = self.db.model.change_properties
 
-            comments_val = self.truncateColumn(ch_tbl.c.comments, comments)
-            self.check_length(ch_tbl.c.author, author)
-            self.check_length(ch_tbl.c.comments, comments_val)
-            self.check_length(ch_tbl.c.branch, branch)
-            self.check_length(ch_tbl.c.revision, revision)
-            self.check_length(ch_tbl.c.revlink, revlink)
-            self.check_length(ch_tbl.c.category, category)
-            self.check_length(ch_tbl.c.repository, repository)
-            self.check_length(ch_tbl.c.project, project)
-
-            r = conn.execute(ch_tbl.insert(), dict(
-                author=author,
-                comments=comments_val,
-                is_dir=is_dir,
-                branch=branch,
-                revision=revision,
-                revlink=revlink,
-                when_timestamp=datetime2epoch(when_timestamp),
-                category=category,
-                repository=repository,
-                codebase=codebase,
-                project=project))
-            changeid = r.inserted_primary_key[0]
-            if files:
-                tbl = self.db.model.change_files
-                for f in files:
-                    self.check_length(tbl.c.filename, f)
-                conn.execute(tbl.insert(), [
-                    dict(changeid=changeid, filename=f)
-                        for f in files
-                    ])
-            if properties:
-                tbl = self.db.model.change_properties
-                inserts = [
-                    dict(changeid=changeid,
-                        property_name=k,
-                        property_value=json.dumps(v))
-                    for k,v in properties.iteritems()
-                ]
-                for i in inserts:
-                    self.check_length(tbl.c.property_name,
+            changeids = []
+            file_rows = []
+            prop_rows = []
+            user_rows = []
+            for row, files, properties, uid in rows:
+                row['comments'] = self.truncateColumn(ch_tbl.c.comments,
+                                                      row['comments'])
+                for col in ('author', 'comments', 'branch', 'revision',
+                            'revlink', 'category', 'repository', 'project'):
+                    self.check_length(ch_tbl.c[col], row[col])
+
+                # each change is inserted on its own to learn its changeid;
+                # the ancillary rows are inserted together below
+                r = conn.execute(ch_tbl.insert(), row)
+                changeid = r.inserted_primary_key[0]
+                changeids.append(changeid)
+
+                if files:
+                    for f in files:
+                        self.check_length(files_tbl.c.filename, f)
+                        file_rows.append(dict(changeid=changeid, filename=f))
+                for k, v in properties.iteritems():
+                    i = dict(changeid=changeid,
+                             property_name=k,
+                             property_value=json.dumps(v))
+                    self.check_length(props_tbl.c.property_name,
                             i['property_name'])
-                    self.check_length(tbl.c.property_value,
+                    self.check_length(props_tbl.c.property_value,
                             i['property_value'])
+                    prop_rows.append(i)
+                if uid:
+                    user_rows.append(dict(changeid=changeid, uid=uid))
 
-                conn.execute(tbl.insert(), inserts)
-            if uid:
-                ins = self.db.model.change_users.insert()
-                conn.execute(ins, dict(changeid=changeid, uid=uid))
+            if file_rows:
+                conn.execute(files_tbl.insert(), file_rows)
+            if prop_rows:
+                conn.execute(props_tbl.insert(), prop_rows)
+            if user_rows:
+                conn.execute(self.db.model.change_users.insert(), user_rows)
 
             transaction.commit()
 
-            return changeid
+            return changeids
         d = self.db.pool.do(thd)
         return d
 
@@ -0,0 +1,13 @@
+import sqlalchemy as sa
+
+def upgrade(migrate_engine):
+
+    metadata = sa.MetaData()
+    metadata.bind = migrate_engine
+
+    # masters poll for new, incomplete build requests by id; see
+    # BuildMaster.pollDatabaseBuildRequests
+    buildrequests_tbl = sa.Table('buildrequests', metadata, autoload=True)
+    idx = sa.Index('buildrequests_complete_id',
+            buildrequests_tbl.c.complete, buildrequests_tbl.c.id)
+    idx.create()
@@ -0,0 +1,84 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import hashlib
+import sqlalchemy as sa
+
+def upgrade(migrate_engine):
+
+    metadata = sa.MetaData()
+    metadata.bind = migrate_engine
+
+    latestbuilds = sa.Table('latestbuilds', metadata,
+        sa.Column('id', sa.Integer,  primary_key=True),
+        sa.Column('buildername', sa.String(length=255), nullable=False),
+        sa.Column('sourcekeyhash', sa.String(40), nullable=False),
+        sa.Column('results', sa.SmallInteger, nullable=False),
+        sa.Column('number', sa.Integer, nullable=False),
+    )
+    latestbuilds.create()
+
+    idx = sa.Index('latestbuilds_identity', latestbuilds.c.buildername,
+            latestbuilds.c.sourcekeyhash, latestbuilds.c.results, unique=True)
+    idx.create()
+
+    # fill the table from the existing builds
+    buildrequests = sa.Table('buildrequests', metadata, autoload=True)
+    buildsets = sa.Table('buildsets', metadata, autoload=True)
+    sourcestamps = sa.Table('sourcestamps', metadata, autoload=True)
+    builds = sa.Table('builds', metadata, autoload=True)
+
+    q = sa.select([buildrequests.c.buildername, buildrequests.c.results,
+                   buildsets.c.sourcestampsetid,
+                   sa.func.max(builds.c.number).label('number')],
+            from_obj=buildrequests.join(builds,
+                        (buildrequests.c.id == builds.c.brid)
+                        & (builds.c.finish_time != None))
+                    .join(buildsets,
+                        buildrequests.c.buildsetid == buildsets.c.id))\
+        .where(buildrequests.c.complete == 1)\
+        .where(buildrequests.c.results != None)\
+        .where(buildrequests.c.mergebrid == None)\
+        .group_by(buildrequests.c.buildername, buildrequests.c.results,
+                  buildsets.c.sourcestampsetid)
+    latest = {}
+    for row in migrate_engine.execute(q).fetchall():
+        latest.setdefault(row.sourcestampsetid, []).append(
+                (row.buildername, row.results, row.number))
+
+    branches = {}
+    q = sa.select([sourcestamps.c.sourcestampsetid, sourcestamps.c.codebase,
+                   sourcestamps.c.branch])
+    for row in migrate_engine.execute(q):
+        if row.sourcestampsetid in latest and row.codebase and row.branch:
+            branches.setdefault(row.sourcestampsetid, []).append(
+                    (row.codebase, row.branch))
+
+    numbers = {}
+    for setid, pairs in branches.iteritems():
+        key = u"".join(u"%s=%s;" % pair for pair in sorted(pairs))
+        keyhash = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        for buildername, results, number in latest[setid]:
+            ident = (buildername, keyhash, results)
+            if number > numbers.get(ident, -1):
+                numbers[ident] = number
+
+    rows = []
+    for (buildername, keyhash, results), number in numbers.iteritems():
+        rows.append(dict(buildername=buildername, sourcekeyhash=keyhash,
+                         results=results, number=number))
+    while rows:
+        batch, rows = rows[:100], rows[100:]
+        migrate_engine.execute(latestbuilds.insert(), batch)
@@ -0,0 +1,65 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import hashlib
+import sqlalchemy as sa
+from buildbot.util import json
+
+def upgrade(migrate_engine):
+
+    metadata = sa.MetaData()
+    metadata.bind = migrate_engine
+
+    sourcestampsets = sa.Table('sourcestampsets', metadata, autoload=True)
+    fingerprint = sa.Column('fingerprint', sa.String(40))
+    fingerprint.create(sourcestampsets)
+    idx = sa.Index('sourcestampsets_fingerprint',
+            sourcestampsets.c.fingerprint)
+    idx.create()
+
+    # artifact reuse looks buildsets up by sourcestampset
+    buildsets = sa.Table('buildsets', metadata, autoload=True)
+    idx = sa.Index('buildsets_sourcestampsetid', buildsets.c.sourcestampsetid)
+    idx.create()
+
+    # fill in the fingerprints of the existing sets; this must match
+    # buildbot.db.sourcestamps.sourceStampSetFingerprint
+    sourcestamps = sa.Table('sourcestamps', metadata, autoload=True)
+
+    def fingerprintOf(ss):
+        key = json.dumps(sorted(ss))
+        return hashlib.sha1(key).hexdigest()
+
+    stmt = sourcestampsets.update()\
+        .where(sourcestampsets.c.id == sa.bindparam('b_id'))\
+        .values(fingerprint=sa.bindparam('b_fingerprint'))
+
+    # work through the sets a range of ids at a time, to bound memory use
+    maxid = migrate_engine.execute(
+            sa.select([sa.func.max(sourcestampsets.c.id)])).scalar() or 0
+    for start in xrange(0, maxid + 1, 10000):
+        q = sa.select([sourcestamps.c.sourcestampsetid, sourcestamps.c.codebase,
+                       sourcestamps.c.branch, sourcestamps.c.revision])\
+            .where(sourcestamps.c.sourcestampsetid >= start)\
+            .where(sourcestamps.c.sourcestampsetid < start + 10000)
+        sets = {}
+        for row in migrate_engine.execute(q).fetchall():
+            sets.setdefault(row.sourcestampsetid, []).append(
+                    [row.codebase, row.branch, row.revision])
+
+        if sets:
+            migrate_engine.execute(stmt, [
+                dict(b_id=setid, b_fingerprint=fingerprintOf(ss))
+                for setid, ss in sets.iteritems() ])
@@ -102,6 +102,19 @@ class Model(base.DBConnectorComponent):
         sa.Column('finish_time', sa.Integer),
     )
 
+    # This table records the number of the latest finished build of each
+    # builder, for each combination of codebase branches and each result, so
+    # that the latest build can be found without searching the builds table.
+    # It is kept up to date by finishBuilds and completeBuildRequests.
+    latestbuilds = sa.Table('latestbuilds', metadata,
+        sa.Column('id', sa.Integer,  primary_key=True),
+        sa.Column('buildername', sa.String(length=255), nullable=False),
+        # sha1 of the build's 'codebase=branch;' pairs, sorted by codebase
+        sa.Column('sourcekeyhash', sa.String(40), nullable=False),
+        sa.Column('results', sa.SmallInteger, nullable=False),
+        sa.Column('number', sa.Integer, nullable=False),
+    )
+
     # buildsets
 
     # This table contains input properties for buildsets
@@ -249,6 +262,9 @@ class Model(base.DBConnectorComponent):
     # to a particular set if the sourcestamp has the same setid
     sourcestampsets = sa.Table('sourcestampsets', metadata,
         sa.Column('id', sa.Integer,  primary_key=True),
+        # sha1 over the sorted (codebase, branch, revision) of the set's
+        # sourcestamps; see buildbot.db.sourcestamps.sourceStampSetFingerprint
+        sa.Column('fingerprint', sa.String(40)),
     )
 
     # A sourcestamp identifies a particular instance of the source code.
@@ -386,10 +402,15 @@ class Model(base.DBConnectorComponent):
     sa.Index('buildrequests_buildsetid', buildrequests.c.buildsetid)
     sa.Index('buildrequests_buildername', buildrequests.c.buildername)
     sa.Index('buildrequests_complete', buildrequests.c.complete)
+    sa.Index('buildrequests_complete_id', buildrequests.c.complete,
+            buildrequests.c.id)
     sa.Index('builds_number', builds.c.number)
     sa.Index('builds_brid', builds.c.brid)
+    sa.Index('latestbuilds_identity', latestbuilds.c.buildername,
+            latestbuilds.c.sourcekeyhash, latestbuilds.c.results, unique=True)
     sa.Index('buildsets_complete', buildsets.c.complete)
     sa.Index('buildsets_submitted_at', buildsets.c.submitted_at)
+    sa.Index('buildsets_sourcestampsetid', buildsets.c.sourcestampsetid)
     sa.Index('buildset_properties_buildsetid',
             buildset_properties.c.buildsetid)
     sa.Index('changes_branch', changes.c.branch)
@@ -407,6 +428,7 @@ class Model(base.DBConnectorComponent):
             sourcestamp_changes.c.sourcestampid)
     sa.Index('sourcestamps_sourcestampsetid', sourcestamps.c.sourcestampsetid,
             unique=False)
+    sa.Index('sourcestampsets_fingerprint', sourcestampsets.c.fingerprint)
     sa.Index('users_identifier', users.c.identifier, unique=True)
     sa.Index('users_info_uid', users_info.c.uid)
     sa.Index('users_info_uid_attr_type', users_info.c.uid,
@@ -14,11 +14,23 @@
 # Copyright Buildbot Team Members
 
 import base64
+import hashlib
+import itertools
 import sqlalchemy as sa
 from twisted.internet import defer
 from twisted.python import log
 from buildbot.db import base
 from buildbot.status.results import SUCCESS, FAILURE
+from buildbot.util import json
+
+def sourceStampSetFingerprint(sourcestamps):
+    """
+    Return the fingerprint of a sourcestamp set, given the (codebase, branch,
+    revision) of each of its sourcestamps.  Two sets have the same fingerprint
+    exactly when they contain the same sourcestamps, in any order.
+    """
+    key = json.dumps(sorted(list(ss) for ss in sourcestamps))
+    return hashlib.sha1(key).hexdigest()
 
 class SsDict(dict):
     pass
@@ -72,6 +84,8 @@ class SourceStampsConnectorComponent(base.DBConnectorComponent):
                     dict(sourcestampid=ssid, changeid=changeid)
                     for changeid in changeids ])
 
+            self._updateFingerprints(conn, [sourcestampsetid])
+
             transaction.commit()
 
             # and return the new ssid
@@ -89,9 +103,38 @@ class SourceStampsConnectorComponent(base.DBConnectorComponent):
                     .values(revision=sa.bindparam('b_revision'))
                 res = conn.execute(stmt, sourcestamps)
 
+                self._updateFingerprints(conn,
+                        set(ss['b_sourcestampsetid'] for ss in sourcestamps))
+
                 return  res.rowcount
         return self.db.pool.do(thd)
 
+    def _updateFingerprints(self, conn, sourcestampsetids):
+        # recompute the fingerprints of the given sets from their sourcestamps
+        sourcestamps_tbl = self.db.model.sourcestamps
+        sourcestampsets_tbl = self.db.model.sourcestampsets
+
+        iterator = iter(sourcestampsetids)
+        while 1:
+            batch = list(itertools.islice(iterator, 100))
+            if not batch:
+                break
+
+            sets = dict((setid, []) for setid in batch)
+            q = sa.select([sourcestamps_tbl.c.sourcestampsetid, sourcestamps_tbl.c.codebase,
+                           sourcestamps_tbl.c.branch, sourcestamps_tbl.c.revision])\
+                .where(sourcestamps_tbl.c.sourcestampsetid.in_(batch))
+            for row in conn.execute(q).fetchall():
+                sets[row.sourcestampsetid].append((row.codebase, row.branch, row.revision))
+
+            stmt = sourcestampsets_tbl.update()\
+                .where(sourcestampsets_tbl.c.id == sa.bindparam('b_sourcestampsetid'))\
+                .values(fingerprint=sa.bindparam('b_fingerprint'))
+            conn.execute(stmt, [
+                dict(b_sourcestampsetid=setid,
+                     b_fingerprint=sourceStampSetFingerprint(sourcestamps))
+                for setid, sourcestamps in sets.iteritems() ])
+
     @base.cached("sssetdicts")
     @defer.inlineCallbacks
     def getSourceStamps(self,sourcestampsetid):
@@ -120,12 +163,7 @@ class SourceStampsConnectorComponent(base.DBConnectorComponent):
             row = res.fetchone()
             if not row:
                 return None
-            ssdict = SsDict(ssid=ssid, branch=row.branch, sourcestampsetid=row.sourcestampsetid,
-                    revision=row.revision, patch_body=None, patch_level=None,
-                    patch_author=None, patch_comment=None, patch_subdir=None,
-                    repository=row.repository, codebase=row.codebase,
-                    project=row.project,
-                    changeids=set([]))
+            ssdict = self._rowToSsdict(row)
             patchid = row.patchid
             res.close()
 
@@ -159,6 +197,70 @@ class SourceStampsConnectorComponent(base.DBConnectorComponent):
             return ssdict
         return self.db.pool.do(thd)
 
+    def getSourceStampsForSets(self, sourcestampsetids):
+        """
+        Like L{getSourceStamps}, but for several sourcestamp sets at once,
+        using a fixed number of queries regardless of the number of
+        sourcestamps.
+
+        @param sourcestampsetids: sourcestamp set IDs
+
+        @returns: dictionary mapping sourcestampsetid to a list of ssdicts, via
+        Deferred; every requested set is present
+        """
+        def thd(conn):
+            ss_tbl = self.db.model.sourcestamps
+            patches_tbl = self.db.model.patches
+            ssch_tbl = self.db.model.sourcestamp_changes
+            rv = dict((setid, SsList()) for setid in sourcestampsetids)
+            ssdicts = {}
+
+            # we'll need to batch the ids into groups of 100, so that the
+            # parameter lists supported by the DBAPI aren't exhausted
+            iterator = iter(sourcestampsetids)
+            batch = list(itertools.islice(iterator, 100))
+            while len(batch) > 0:
+                q = sa.select([ ss_tbl, patches_tbl.c.patchlevel,
+                                patches_tbl.c.patch_base64,
+                                patches_tbl.c.patch_author,
+                                patches_tbl.c.patch_comment,
+                                patches_tbl.c.subdir ],
+                        from_obj=ss_tbl.outerjoin(patches_tbl,
+                                    ss_tbl.c.patchid == patches_tbl.c.id),
+                        whereclause=ss_tbl.c.sourcestampsetid.in_(batch))
+                for row in conn.execute(q).fetchall():
+                    ssdict = self._rowToSsdict(row)
+                    if row.patch_base64 is not None:
+                        ssdict['patch_level'] = row.patchlevel
+                        ssdict['patch_subdir'] = row.subdir
+                        ssdict['patch_author'] = row.patch_author
+                        ssdict['patch_comment'] = row.patch_comment
+                        ssdict['patch_body'] = base64.b64decode(row.patch_base64)
+                    ssdicts[row.id] = ssdict
+                    rv[row.sourcestampsetid].append(ssdict)
+                batch = list(itertools.islice(iterator, 100))
+
+            iterator = iter(ssdicts.keys())
+            batch = list(itertools.islice(iterator, 100))
+            while len(batch) > 0:
+                q = sa.select([ ssch_tbl.c.sourcestampid, ssch_tbl.c.changeid ],
+                        whereclause=ssch_tbl.c.sourcestampid.in_(batch))
+                for row in conn.execute(q):
+                    ssdicts[row.sourcestampid]['changeids'].add(row.changeid)
+                batch = list(itertools.islice(iterator, 100))
+
+            return rv
+        return self.db.pool.do(thd)
+
+    def _rowToSsdict(self, row):
+        return SsDict(ssid=row.id, branch=row.branch,
+                sourcestampsetid=row.sourcestampsetid,
+                revision=row.revision, patch_body=None, patch_level=None,
+                patch_author=None, patch_comment=None, patch_subdir=None,
+                repository=row.repository, codebase=row.codebase,
+                project=row.project,
+                changeids=set([]))
+
     def findLastBuildRev(self, buildername, brid, codebase, repository, branch):
         def thd(conn):
             sourcestamps_tbl = self.db.model.sourcestamps
@@ -184,6 +184,16 @@ class IStatus(Interface):
                            Builder.
         """
 
+    def iterFinishedBuildsAsync(builders=[], branches=[], codebases={},
+                                num_builds=None, finished_before=None,
+                                max_search=200):
+        """Like generateFinishedBuilds, but return an object whose .next()
+        method returns a Deferred that fires with the next IBuildStatus, or
+        with None when there are no more. The builds are loaded in a thread
+        rather than on the reactor. Call .next() again only after the
+        previous Deferred has fired.
+        """
+
     def subscribe(receiver):
         """Register an IStatusReceiver to receive new status events. The
         receiver will immediately be sent a set of 'builderAdded' messages
@@ -391,6 +401,18 @@ class IBuilderStatus(Interface):
                            of builds that will be examined.
         """
 
+    def iterFinishedBuildsAsync(branches=[], codebases={},
+                                finished_before=None, max_search=200,
+                                prefetch=4):
+        """Like generateFinishedBuilds, but return an object whose .next()
+        method returns a Deferred that fires with the next IBuildStatus, or
+        with None when there are no more. The builds are loaded in a thread
+        rather than on the reactor, up to C{prefetch} of them ahead of the
+        caller. Call .next() again only after the previous Deferred has
+        fired. As with generateFinishedBuilds, a non-empty C{codebases}
+        dictionary ({codebase: branch}) is used instead of C{branches}.
+        """
+
     def subscribe(receiver):
         """Register an IStatusReceiver to receive new status events. The
         receiver will be given builderChangedState, buildStarted, and
@@ -807,7 +829,9 @@ class IStatusLog(Interface):
     def getChunks():
         """Generate a list of (channel, text) tuples. 'channel' is a number,
         0 for stdout, 1 for stderr, 2 for header. (note that stderr is merged
-        into stdout if PTYs are in use)."""
+        into stdout if PTYs are in use). The optional 'startLine' and
+        'endLine' arguments limit this to a range of lines, counted from zero
+        across all channels; 'endLine' is exclusive."""
 
 class IStatusLogConsumer(Interface):
     """I am an object which can be passed to IStatusLog.subscribeConsumer().
@@ -27,7 +27,7 @@ import buildbot
 import buildbot.pbmanager
 from buildbot.util import subscription, epoch2datetime
 from buildbot.status.master import Status
-from buildbot.changes import changes
+from buildbot.changes import changes, router
 from buildbot.changes.manager import ChangeManager
 from buildbot import interfaces
 from buildbot.process.builder import BuilderControl
@@ -37,6 +37,7 @@ from buildbot.process.botmaster import BotMaster
 from buildbot.process import debug
 from buildbot.process import metrics
 from buildbot.process import cache
+from buildbot.process import logwriter
 from buildbot.process.users import users
 from buildbot.process.users.manager import UserManagerManager
 from buildbot.status.results import SUCCESS, WARNINGS, FAILURE, NOT_REBUILT
@@ -65,6 +66,12 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
     # database poll operation.
     WARNING_UNCLAIMED_COUNT = 10000
 
+    # number of database polls between re-reads of the full set of incomplete
+    # build requests; between these sweeps, only requests newer than the
+    # newest one seen so far, and claimed requests that have been seen, are
+    # fetched
+    UNCLAIMED_SWEEP_POLLS = 5
+
     def __init__(self, basedir, configFileName="master.cfg", umask=None):
         service.MultiService.__init__(self)
         self.setName("buildmaster")
@@ -99,6 +106,8 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         # subscription points
         self._change_subs = \
                 subscription.SubscriptionPoint("changes")
+        self._change_router = router.ChangeRouter()
+        self._change_subs.subscribe(self._change_router.deliver)
         self._new_buildrequest_subs = \
                 subscription.SubscriptionPoint("buildrequest_additions")
         self._cancelled_buildrequest_subs = \
@@ -122,6 +131,9 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         self.caches = cache.CacheManager()
         self.caches.setServiceParent(self)
 
+        self.logwriter = logwriter.LogWriter()
+        self.logwriter.setServiceParent(self)
+
         self.pbmanager = buildbot.pbmanager.PBManager()
         self.pbmanager.setServiceParent(self)
 
@@ -438,6 +450,76 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         """
         metrics.MetricCountEvent.log("added_changes", 1)
 
+        change = self._prepareChange(who=who, files=files, comments=comments,
+                author=author, isdir=isdir, is_dir=is_dir, revision=revision,
+                when=when, when_timestamp=when_timestamp, branch=branch,
+                category=category, revlink=revlink, properties=properties,
+                repository=repository, codebase=codebase, project=project)
+
+        d = defer.succeed(None)
+        if src:
+            # create user object, returning a corresponding uid
+            d.addCallback(lambda _ : users.createUserObject(self,
+                                                    change['author'], src))
+         
+        # add the Change to the database
+        d.addCallback(lambda uid :
+                          self.db.changes.addChange(uid=uid, **change))
+
+        # convert the changeid to a Change instance
+        d.addCallback(lambda changeid :
+            self.db.changes.getChange(changeid))
+        d.addCallback(lambda chdict :
+            changes.Change.fromChdict(self, chdict))
+
+        d.addCallback(self._notifyChange)
+        return d
+
+    @defer.inlineCallbacks
+    def addChanges(self, changelist):
+        """
+        Add several changes to the buildmaster at once, in a single database
+        transaction, and act on them in order.
+
+        @param changelist: dictionaries of keyword arguments to L{addChange},
+        oldest change first
+        @type changelist: list of dictionaries
+
+        @returns: list of L{Change} instances via Deferred
+        """
+        metrics.MetricCountEvent.log("added_changes", len(changelist))
+
+        dbchanges = []
+        for kwargs in changelist:
+            kwargs = kwargs.copy()
+            src = kwargs.pop('src', None)
+            change = self._prepareChange(**kwargs)
+            change['uid'] = None
+            if src:
+                change['uid'] = yield users.createUserObject(self,
+                                                    change['author'], src)
+            dbchanges.append(change)
+
+        changeids = yield self.db.changes.addChanges(dbchanges)
+
+        chdicts = yield defer.gatherResults([
+                self.db.changes.getChange(changeid)
+                for changeid in changeids ])
+        added = yield defer.gatherResults([
+                changes.Change.fromChdict(self, chdict)
+                for chdict in chdicts ])
+
+        for change in added:
+            self._notifyChange(change)
+        defer.returnValue(added)
+
+    def _prepareChange(self, who=None, files=None, comments=None, author=None,
+            isdir=None, is_dir=None, revision=None, when=None,
+            when_timestamp=None, branch=None, category=None, revlink='',
+            properties={}, repository='', codebase=None, project=''):
+        # turn the arguments of addChange into those of db.changes.addChange,
+        # less the uid
+
         # handle translating deprecated names into new names for db.changes
         def handle_deprec(oldname, old, newname, new, default=None,
                           converter = lambda x:x):
@@ -483,46 +565,36 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
                 codebase = self.config.codebaseGenerator(chdict)
             else:
                 codebase = ''
-            
-        d = defer.succeed(None)
-        if src:
-            # create user object, returning a corresponding uid
-            d.addCallback(lambda _ : users.createUserObject(self, author, src))
-         
-        # add the Change to the database
-        d.addCallback(lambda uid :
-                          self.db.changes.addChange(author=author, files=files,
-                                          comments=comments, is_dir=is_dir,
-                                          revision=revision,
-                                          when_timestamp=when_timestamp,
-                                          branch=branch, category=category,
-                                          revlink=revlink, properties=properties,
-                                          repository=repository, codebase=codebase,
-                                          project=project, uid=uid))
 
-        # convert the changeid to a Change instance
-        d.addCallback(lambda changeid :
-            self.db.changes.getChange(changeid))
-        d.addCallback(lambda chdict :
-            changes.Change.fromChdict(self, chdict))
-
-        def notify(change):
-            msg = u"added change %s to database" % change
-            log.msg(msg.encode('utf-8', 'replace'))
-            # only deliver messages immediately if we're not polling
-            if not self.config.db['db_poll_interval']:
-                self._change_subs.deliver(change)
-            return change
-        d.addCallback(notify)
-        return d
+        return dict(author=author, files=files, comments=comments,
+                    is_dir=is_dir, revision=revision,
+                    when_timestamp=when_timestamp, branch=branch,
+                    category=category, revlink=revlink, properties=properties,
+                    repository=repository, codebase=codebase,
+                    project=project)
+
+    def _notifyChange(self, change):
+        msg = u"added change %s to database" % change
+        log.msg(msg.encode('utf-8', 'replace'))
+        # only deliver messages immediately if we're not polling
+        if not self.config.db['db_poll_interval']:
+            self._change_subs.deliver(change)
+        return change
 
-    def subscribeToChanges(self, callback):
+    def subscribeToChanges(self, callback, conditions=None):
         """
         Request that C{callback} be called with each Change object added to the
         cluster.
 
+        If C{conditions} is given, C{callback} is only called with the changes
+        that meet them, as a list of (attribute, values) tuples; see
+        L{buildbot.changes.router.ChangeRouter}.  It should then return true
+        when it accepts a change.
+
         Note: this method will go away in 0.9.x
         """
+        if conditions is not None:
+            return self._change_router.subscribe(callback, conditions)
         return self._change_subs.subscribe(callback)
 
     def addBuildset(self, **kwargs):
@@ -731,6 +803,9 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
 
     _last_unclaimed_brids_set = None
     _last_claim_cleanup = 0
+    _polls_since_sweep = 0
+    _max_seen_brid = None
+    _claimed_brids_set = None
     @defer.inlineCallbacks
     def pollDatabaseBuildRequests(self):
         # deal with cleaning up unclaimed requests, and (if necessary)
@@ -738,12 +813,22 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         timer = metrics.Timer("BuildMaster.pollDatabaseBuildRequests()")
         timer.start()
 
+        # a full sweep is needed to notice requests that were unclaimed when
+        # seen and have been claimed since, and requests committed after a
+        # request with a higher brid
+        self._polls_since_sweep += 1
+        full_sweep = (self._max_seen_brid is None or
+                self._polls_since_sweep >= self.UNCLAIMED_SWEEP_POLLS)
+
         # cleanup unclaimed builds
         since_last_cleanup = reactor.seconds() - self._last_claim_cleanup 
         if since_last_cleanup < self.RECLAIM_BUILD_INTERVAL:
             unclaimed_age = (self.RECLAIM_BUILD_INTERVAL
                            * self.UNCLAIMED_BUILD_FACTOR)
-            yield self.db.buildrequests.unclaimExpiredRequests(unclaimed_age)
+            count = yield self.db.buildrequests.unclaimExpiredRequests(
+                                                            unclaimed_age)
+            if count:
+                full_sweep = True
 
             self._last_claim_cleanup = reactor.seconds()
 
@@ -752,25 +837,64 @@ class BuildMaster(config.ReconfigurableServiceMixin, service.MultiService):
         # the last poll, it notifies the subscribers.  It only tracks that
         # state within the master instance, though; on startup, it notifies for
         # all unclaimed requests in the database.
+        #
+        # Between full sweeps, only incomplete requests with a brid above
+        # _max_seen_brid are fetched, along with the requests in
+        # _claimed_brids_set, which were claimed when last seen, so that a
+        # request released for a retry is noticed on the next poll.  Requests
+        # that are claimed after they were seen unclaimed stay in the set
+        # until the next sweep.
 
         last_unclaimed = self._last_unclaimed_brids_set or set()
-        if len(last_unclaimed) > self.WARNING_UNCLAIMED_COUNT:
-            log.msg("WARNING: %d unclaimed buildrequests - is a scheduler "
-                    "producing builds for which no builder is running?"
-                    % len(last_unclaimed))
-
-        # get the current set of unclaimed buildrequests
-        now_unclaimed_brdicts = \
-            yield self.db.buildrequests.getBuildRequests(claimed=False)
-        now_unclaimed = set([ brd['brid'] for brd in now_unclaimed_brdicts ])
+        last_claimed = self._claimed_brids_set or set()
+
+        if full_sweep:
+            if len(last_unclaimed) > self.WARNING_UNCLAIMED_COUNT:
+                log.msg("WARNING: %d unclaimed buildrequests - is a scheduler "
+                        "producing builds for which no builder is running?"
+                        % len(last_unclaimed))
+
+            # get the current set of incomplete buildrequests
+            brdicts = \
+                yield self.db.buildrequests.getBuildRequests(complete=False)
+            self._max_seen_brid = max([ self._max_seen_brid or 0 ] +
+                                      [ brd['brid'] for brd in brdicts ])
+            self._polls_since_sweep = 0
+            now_claimed = set([ brd['brid'] for brd in brdicts
+                                if brd['claimed'] ])
+            brdicts = [ brd for brd in brdicts if not brd['claimed'] ]
+            now_unclaimed = set([ brd['brid'] for brd in brdicts ])
+
+            # a request that was claimed and unclaimed again since the last
+            # sweep cannot be told apart from one that stayed unclaimed, so
+            # rather than announcing it again, give its builder another
+            # chance to start it
+            for buildername in set([ brd['buildername'] for brd in brdicts
+                                     if brd['brid'] in last_unclaimed ]):
+                self.botmaster.maybeStartBuildsForBuilder(buildername)
+        else:
+            brdicts = yield self.db.buildrequests.getBuildRequests(
+                    complete=False, after_brid=self._max_seen_brid)
+            if brdicts:
+                self._max_seen_brid = max(brd['brid'] for brd in brdicts)
+            if last_claimed:
+                # completed requests drop out here
+                brdicts.extend((yield self.db.buildrequests.getBuildRequests(
+                        complete=False, brids=sorted(last_claimed))))
+            now_claimed = set([ brd['brid'] for brd in brdicts
+                                if brd['claimed'] ])
+            brdicts = [ brd for brd in brdicts if not brd['claimed'] ]
+            now_unclaimed = last_unclaimed | \
+                    set([ brd['brid'] for brd in brdicts ])
 
         # and store that for next time
         self._last_unclaimed_brids_set = now_unclaimed
+        self._claimed_brids_set = now_claimed
 
         # see what's new, and notify if anything is
         new_unclaimed = now_unclaimed - last_unclaimed
         if new_unclaimed:
-            brdicts = dict((brd['brid'], brd) for brd in now_unclaimed_brdicts)
+            brdicts = dict((brd['brid'], brd) for brd in brdicts)
             for brid in new_unclaimed:
                 brd = brdicts[brid]
                 self.buildRequestAdded(brd['buildsetid'], brd['brid'],
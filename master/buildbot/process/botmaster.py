@@ -351,6 +351,11 @@ class BuildRequestDistributor(service.Service):
     are still working on the previous build request, then this class will
     correctly re-prioritize invocations of builders' C{maybeStartBuild}
     methods.
+
+    Up to C{builderDispatchConcurrency} builders are dispatched at once.
+    Builders that share a slave or a builder lock with one that is already
+    being dispatched wait for it to finish; the next highest-priority builder
+    that does not is dispatched instead.
     """
 
     def __init__(self, botmaster):
@@ -363,15 +368,26 @@ class BuildRequestDistributor(service.Service):
         # sorted list of names of builders that need their maybeStartBuild
         # method invoked.
         self._pending_builders = []
+        # time at which each pending builder was queued, for the
+        # dispatch-latency metrics
+        self._pending_since = {}
         self.activity_lock = defer.DeferredLock()
         self.active = False
 
+        # builders whose maybeStartBuild is currently running, mapped to the
+        # set of slaves and locks they may contend for
+        self._dispatching = {}
+        # Deferreds to fire when one of those calls finishes
+        self._dispatch_waiters = []
+
     def stopService(self):
         # let the parent stopService succeed between activity; then the loop
-        # will stop calling itself, since self.running is false
+        # will stop calling itself, since self.running is false.  Builders
+        # that have already been dispatched are allowed to finish.
         d = self.activity_lock.acquire()
         d.addCallback(lambda _ : service.Service.stopService(self))
         d.addBoth(lambda _ : self.activity_lock.release())
+        d.addCallback(lambda _ : self._waitForAllDispatches())
         return d
 
     @defer.inlineCallbacks
@@ -400,10 +416,19 @@ class BuildRequestDistributor(service.Service):
             # the lock
             existing_pending = set(self._pending_builders)
 
+            now = util.now()
+            for bldr_name in new_builders - existing_pending:
+                self._pending_since.setdefault(bldr_name, now)
+
             # then sort the new, expanded set of builders
             self._pending_builders = \
                 yield self._sortBuilders(list(existing_pending | new_builders))
 
+            # forget about any builders the sort dropped
+            for bldr_name in set(self._pending_since) - \
+                    set(self._pending_builders):
+                del self._pending_since[bldr_name]
+
             # start the activity loop, if we aren't already working on that.
             if not self.active:
                 self._activityLoop()
@@ -472,6 +497,46 @@ class BuildRequestDistributor(service.Service):
         timer.stop()
         defer.returnValue(rv)
 
+    def _getConcurrency(self):
+        return self.master.config.builderDispatchConcurrency
+
+    def _contentionKeys(self, bldr_name):
+        # builders that share a slave or a lock must not run maybeStartBuild
+        # at the same time, as both could pick the same slave or lock
+        keys = set([ ('builder', bldr_name) ])
+        bldr = self.botmaster.builders.get(bldr_name)
+        if bldr and bldr.config:
+            keys.update(('slave', sn) for sn in bldr.config.slavenames)
+            for l in bldr.config.locks:
+                keys.add(('lock', getattr(l, 'lockid', l)))
+        return keys
+
+    def _popNextBuilder(self):
+        """
+        Remove and return the highest-priority pending builder that can be
+        dispatched alongside the builders already being dispatched, as a tuple
+        (name, contention keys, time queued); or None if every pending builder
+        has to wait.  The caller must hold pending_builders_lock.
+        """
+        concurrency = self._getConcurrency()
+        if len(self._dispatching) >= concurrency:
+            return None
+
+        if concurrency == 1:
+            # nothing is being dispatched, so there is nothing to contend with
+            bldr_name = self._pending_builders.pop(0)
+            return (bldr_name, set(), self._pending_since.pop(bldr_name, None))
+
+        busy = set()
+        for keys in self._dispatching.itervalues():
+            busy.update(keys)
+        for i, bldr_name in enumerate(self._pending_builders):
+            keys = self._contentionKeys(bldr_name)
+            if not keys & busy:
+                del self._pending_builders[i]
+                return (bldr_name, keys, self._pending_since.pop(bldr_name, None))
+        return None
+
     @defer.inlineCallbacks
     def _activityLoop(self):
         self.active = True
@@ -482,31 +547,74 @@ class BuildRequestDistributor(service.Service):
         while 1:
             yield self.activity_lock.acquire()
 
-            # lock pending_builders, pop an element from it, and release
+            # lock pending_builders, pick the next builder that can be
+            # dispatched, and release
             yield self.pending_builders_lock.acquire()
 
-            # bail out if we shouldn't keep looping
+            # bail out if we shouldn't keep looping, once the builders already
+            # dispatched are done; they may have queued more builders
             if not self.running or not self._pending_builders:
                 self.pending_builders_lock.release()
                 self.activity_lock.release()
+                if self._dispatching:
+                    yield self._waitForDispatch()
+                    continue
                 break
 
-            bldr_name = self._pending_builders.pop(0)
+            next_builder = self._popNextBuilder()
             self.pending_builders_lock.release()
+            self.activity_lock.release()
 
-            try:
-                yield self._callABuilder(bldr_name)
-            except Exception:
-                log.err(Failure(),
-                        "from maybeStartBuild for builder '%s'" % (bldr_name,))
+            if next_builder is None:
+                # the concurrency bound is reached, or every pending builder
+                # contends with one that is being dispatched
+                yield self._waitForDispatch()
+                continue
 
-            self.activity_lock.release()
+            self._dispatch(*next_builder)
 
         timer.stop()
 
         self.active = False
         self._quiet()
 
+    def _dispatch(self, bldr_name, keys, queued_at):
+        self._dispatching[bldr_name] = keys
+        metrics.MetricCountEvent.log("BuildRequestDistributor.dispatching",
+                len(self._dispatching), absolute=True)
+        if queued_at is not None:
+            metrics.MetricTimeEvent.log(
+                "BuildRequestDistributor.dispatch_latency(%s)" % bldr_name,
+                util.now() - queued_at)
+
+        timer = metrics.Timer(
+                "BuildRequestDistributor.maybeStartBuild(%s)" % bldr_name)
+        timer.start()
+
+        d = defer.maybeDeferred(self._callABuilder, bldr_name)
+        d.addErrback(log.err,
+                "from maybeStartBuild for builder '%s'" % (bldr_name,))
+        def done(_):
+            timer.stop()
+            del self._dispatching[bldr_name]
+            metrics.MetricCountEvent.log("BuildRequestDistributor.dispatching",
+                    len(self._dispatching), absolute=True)
+            waiters, self._dispatch_waiters = self._dispatch_waiters, []
+            for waiter in waiters:
+                waiter.callback(None)
+        d.addCallback(done)
+
+    def _waitForDispatch(self):
+        # fires when the next in-flight maybeStartBuild call finishes
+        d = defer.Deferred()
+        self._dispatch_waiters.append(d)
+        return d
+
+    @defer.inlineCallbacks
+    def _waitForAllDispatches(self):
+        while self._dispatching:
+            yield self._waitForDispatch()
+
     def _callABuilder(self, bldr_name):
         # get the actual builder object
         bldr = self.botmaster.builders.get(bldr_name)
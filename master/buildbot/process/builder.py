@@ -109,6 +109,11 @@ class Builder(config.ReconfigurableServiceMixin,
             # the builder is quiescent at that time.
             return self.maybeStartBuild()
         d.addCallback(flushMaybeStartBuilds)
+        def closeBuildHistory(_):
+            # the builder is being removed, or the master is stopping
+            if self.builder_status is not None:
+                return self.builder_status.closeBuildHistory()
+        d.addCallback(closeBuildHistory)
         return d
 
     def __repr__(self):
@@ -431,6 +436,8 @@ class Builder(config.ReconfigurableServiceMixin,
         else:
             db = self.master.db
             d = db.buildrequests.completeBuildRequests(brids, results)
+            d.addCallback(lambda _ :
+                    buildrequest.BuildRequest.invalidate(self.master, brids))
             d.addCallback(
                 lambda _ : self._maybeBuildsetsComplete(build.requests))
             # nothing in particular to do with this deferred, so just log it if
@@ -490,6 +497,8 @@ class Builder(config.ReconfigurableServiceMixin,
                     b.requests = building
                     raise
 
+                buildrequest.BuildRequest.invalidate(self.master, brids)
+
                 log.msg("merge brids %s with building request %s " % (brids, b.requests[0].id))
                 self.notifyRequestsRemoved(breqs)
                 defer.returnValue(True)
@@ -509,6 +518,7 @@ class Builder(config.ReconfigurableServiceMixin,
         unclaimed_requests = \
             yield self.master.db.buildrequests.getBuildRequests(
                 buildername=self.name, claimed=False)
+        yield self._brdictsToBuildRequests(unclaimed_requests)
         defer.returnValue(unclaimed_requests)
         return
 
@@ -567,6 +577,11 @@ class Builder(config.ReconfigurableServiceMixin,
         # get the mergeRequests function for later
         mergeRequests_fn = self._getMergeRequestsFn()
 
+        # materialise the whole queue at once, rather than one request at a
+        # time as they are considered below
+        if available_slavebuilders or self.building:
+            yield self._brdictsToBuildRequests(unclaimed_requests)
+
         # match them up until we're out of options
         while (available_slavebuilders or self.building) and unclaimed_requests:
             # then choose a request (using nextBuild)
@@ -592,9 +607,7 @@ class Builder(config.ReconfigurableServiceMixin,
 
             # try to claim the build requests
             brids = [ brdict['brid'] for brdict in brdicts ]
-            breqs = yield defer.gatherResults(
-                [ self._brdictToBuildRequest(brdict)
-                  for brdict in brdicts ])
+            breqs = yield self._brdictsToBuildRequests(brdicts)
 
             # merge current brdicts with currently running builds
             try:
@@ -624,6 +637,7 @@ class Builder(config.ReconfigurableServiceMixin,
                     try:
                         log.msg("merge finished buildresquest %s with %s" % (finished_br, merged_brids))
                         yield self.master.db.buildrequests.mergeFinishedBuildRequest(finished_br, merged_brids)
+                        buildrequest.BuildRequest.invalidate(self.master, merged_brids)
                         yield self._maybeBuildsetsComplete(merged_breqs, requestRemoved=True)
                         self.removeFromUnclaimRequestsList(merged_brdicts, unclaimed_requests)
                     except:
@@ -653,6 +667,7 @@ class Builder(config.ReconfigurableServiceMixin,
 
             try:
                 yield self.master.db.buildrequests.mergePendingBuildRequests(brids)
+                buildrequest.BuildRequest.invalidate(self.master, brids)
                 if len (brids) > 1:
                     log.msg("merge pending buildrequest %s with %s " % (brids[0], brids[1:]))
 
@@ -721,9 +736,8 @@ class Builder(config.ReconfigurableServiceMixin,
         @returns: a build request dictionary or None via Deferred
         """
         sorted_requests = sorted(buildrequests, key=lambda br: (-br["priority"], br["submitted_at"]))
-        for b in sorted_requests:
-            d = yield defer.gatherResults([self._brdictToBuildRequest(b)])
-            brdict = d[0].brdict
+        yield self._brdictsToBuildRequests(sorted_requests)
+        for brdict in sorted_requests:
             if self.buildRequestHasSelectedSlave(brdict):
                 selected_slave = self.getSelectedSlaveFromBuildRequest(brdict)
                 if selected_slave is not None and selected_slave.isAvailable():
@@ -736,9 +750,7 @@ class Builder(config.ReconfigurableServiceMixin,
     def _chooseNextBuild(self, buildrequests):
         # nextBuild expects BuildRequest objects, so instantiate them here
         # and cache them in the dictionaries
-        d = defer.gatherResults([ self._brdictToBuildRequest(brdict)
-                                  for brdict in buildrequests ],
-                                consumeErrors=True)
+        d = self._brdictsToBuildRequests(buildrequests)
         d.addCallback(lambda requestobjects :
         self.config.nextBuild(self, requestobjects))
         def to_brdict(brobj):
@@ -798,9 +810,8 @@ class Builder(config.ReconfigurableServiceMixin,
             return
 
         # we'll need BuildRequest objects, so get those first
-        unclaimed_request_objects = yield defer.gatherResults(
-                [ self._brdictToBuildRequest(brdict)
-                  for brdict in unclaimed_requests ])
+        unclaimed_request_objects = \
+                yield self._brdictsToBuildRequests(unclaimed_requests)
 
         breq_object = unclaimed_request_objects[unclaimed_requests.index(breq)]
 
@@ -842,6 +853,26 @@ class Builder(config.ReconfigurableServiceMixin,
         d.addCallback(keep)
         return d
 
+    @defer.inlineCallbacks
+    def _brdictsToBuildRequests(self, brdicts):
+        """
+        Like L{_brdictToBuildRequest}, but for a list of dictionaries; the
+        requests not yet converted are loaded together with
+        L{buildrequest.BuildRequest.fromBrdicts}.
+
+        @param brdicts: list of dictionaries to convert
+
+        @returns: list of L{buildrequest.BuildRequest} via Deferred
+        """
+        missing = [ brdict for brdict in brdicts if 'brobj' not in brdict ]
+        if missing:
+            brobjs = yield buildrequest.BuildRequest.fromBrdicts(self.master,
+                                                                 missing)
+            for brdict, brobj in zip(missing, brobjs):
+                brdict['brobj'] = brobj
+                brobj.brdict = brdict
+        defer.returnValue([ brdict['brobj'] for brdict in brdicts ])
+
     def _breakBrdictRefloops(self, requests):
         """Break the reference loops created by L{_brdictToBuildRequest}"""
         for brdict in requests:
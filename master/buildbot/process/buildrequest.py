@@ -92,7 +92,63 @@ class BuildRequest(object):
 
     @classmethod
     @defer.inlineCallbacks
-    def _make_br(cls, brid, brdict, master):
+    def fromBrdicts(cls, master, brdicts):
+        """
+        Like L{fromBrdict}, but for many requests at once.  The buildsets,
+        properties and sourcestamps of the requests that are not already
+        cached are fetched with a few bulk queries, rather than several
+        queries per request.
+
+        @param master: current build master
+        @param brdicts: list of build request dictionaries
+
+        @returns: list of L{BuildRequest}, in the order of C{brdicts}, via
+        Deferred
+        """
+        cache = master.caches.get_cache("BuildRequests", cls._make_br)
+        missing = [ brdict for brdict in brdicts
+                    if brdict['brid'] not in cache ]
+        prefetched = None
+        if missing:
+            prefetched = yield cls._prefetch(master, missing)
+
+        brs = yield defer.gatherResults([
+            cache.get(brdict['brid'], brdict=brdict, master=master,
+                      prefetched=prefetched)
+            for brdict in brdicts ])
+        defer.returnValue(brs)
+
+    @classmethod
+    @defer.inlineCallbacks
+    def _prefetch(cls, master, brdicts):
+        """Fetch what L{_make_br} needs for C{brdicts}, keyed by buildset"""
+        bsids = list(set([ brdict['buildsetid'] for brdict in brdicts ]))
+        buildsets = yield master.db.buildsets.getBuildsetsByIds(bsids)
+        bsprops = yield master.db.buildsets.getBuildsetsProperties(bsids)
+        sssets = yield master.db.sourcestamps.getSourceStampsForSets(
+                list(set([ bs['sourcestampsetid']
+                           for bs in buildsets.itervalues() ])))
+
+        prefetched = {}
+        for bsid, buildset in buildsets.iteritems():
+            prefetched[bsid] = (buildset, bsprops[bsid],
+                                sssets[buildset['sourcestampsetid']])
+        defer.returnValue(prefetched)
+
+    @classmethod
+    def invalidate(cls, master, brids):
+        """
+        Drop the given requests from the cache.  Claimed and completed
+        requests are never materialised again by the distributor, so this
+        leaves the cache to the requests that are still in the queue.
+        """
+        cache = master.caches.get_cache("BuildRequests", cls._make_br)
+        for brid in brids:
+            cache.remove(brid)
+
+    @classmethod
+    @defer.inlineCallbacks
+    def _make_br(cls, brid, brdict, master, prefetched=None):
         buildrequest = cls()
         buildrequest.id = brid
         buildrequest.bsid = brdict['buildsetid']
@@ -109,18 +165,22 @@ class BuildRequest(object):
 
         buildrequest.buildChainID = getBuilChainID()
 
-        # fetch the buildset to get the reason
-        buildset = yield master.db.buildsets.getBuildset(brdict['buildsetid'])
-        assert buildset # schema should guarantee this
-        buildrequest.reason = buildset['reason']
+        if prefetched and brdict['buildsetid'] in prefetched:
+            buildset, buildset_properties, sslist = \
+                    prefetched[brdict['buildsetid']]
+        else:
+            # fetch the buildset to get the reason
+            buildset = yield master.db.buildsets.getBuildset(brdict['buildsetid'])
+            assert buildset # schema should guarantee this
 
-        # fetch the buildset properties, and convert to Properties
-        buildset_properties = yield master.db.buildsets.getBuildsetProperties(brdict['buildsetid'])
+            # fetch the buildset properties
+            buildset_properties = yield master.db.buildsets.getBuildsetProperties(brdict['buildsetid'])
 
-        buildrequest.properties = properties.Properties.fromDict(buildset_properties)
+            # fetch the sourcestamp dictionary
+            sslist = yield  master.db.sourcestamps.getSourceStamps(buildset['sourcestampsetid'])
 
-        # fetch the sourcestamp dictionary
-        sslist = yield  master.db.sourcestamps.getSourceStamps(buildset['sourcestampsetid'])
+        buildrequest.reason = buildset['reason']
+        buildrequest.properties = properties.Properties.fromDict(buildset_properties)
         assert len(sslist) > 0, "Empty sourcestampset: db schema enforces set to exist but cannot enforce a non empty set"
 
         # and turn it into a SourceStamps
@@ -237,6 +297,7 @@ class BuildRequest(object):
         # references.
         yield self.master.db.buildrequests.completeBuildRequests([self.id],
                                                                 CANCELED)
+        BuildRequest.invalidate(self.master, [self.id])
 
         # and let the master know that the enclosing buildset may be complete
         yield self.master.maybeBuildsetComplete(self.bsid)
@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 import re
+from collections import deque
 
 from zope.interface import implements
 from twisted.internet import reactor, defer, error
@@ -33,6 +34,58 @@ from buildbot.process import metrics, properties
 class BuildStepFailed(Exception):
     pass
 
+class OutputBuffer(object):
+    """
+    Collect the stdout of a remote command as a list of chunks, joined only
+    when the text is asked for.  If C{head} or C{tail} is given, only that
+    many bytes from the start and from the end of the output are kept, and
+    the bytes in between are dropped as they arrive.
+    """
+
+    def __init__(self, head=None, tail=None):
+        self.windowed = head is not None or tail is not None
+        self.head = head or 0
+        self.tail = tail or 0
+        self.size = 0
+        self.chunks = []
+        self.kept = 0
+        self.tailChunks = deque()
+        self.tailKept = 0
+
+    def append(self, data):
+        self.size += len(data)
+        if not self.windowed:
+            self.chunks.append(data)
+            self.kept += len(data)
+            return
+        if self.kept < self.head:
+            taken = data[:self.head - self.kept]
+            self.chunks.append(taken)
+            self.kept += len(taken)
+            data = data[len(taken):]
+        if data and self.tail:
+            self.tailChunks.append(data)
+            self.tailKept += len(data)
+            # drop whole chunks that are no longer part of the tail
+            while self.tailKept - len(self.tailChunks[0]) >= self.tail:
+                self.tailKept -= len(self.tailChunks.popleft())
+
+    def getvalue(self):
+        text = ''.join(self.chunks)
+        if not self.windowed:
+            # keep the joined text, so that it is only joined once
+            self.chunks = [text]
+            return text
+        if self.tailChunks:
+            text += ''.join(self.tailChunks)[-self.tail:]
+        return text
+
+    def getTruncated(self):
+        """Return the number of bytes dropped between the head and tail"""
+        if not self.windowed:
+            return 0
+        return self.size - self.kept - min(self.tailKept, self.tail)
+
 class RemoteCommand(pb.Referenceable):
 
     # class-level unique identifier generator for command ids
@@ -43,12 +96,13 @@ class RemoteCommand(pb.Referenceable):
     debug = False
 
     def __init__(self, remote_command, args, ignore_updates=False,
-            collectStdout=False, decodeRC={0:SUCCESS}):
+            collectStdout=False, decodeRC={0:SUCCESS}, collectHead=None,
+            collectTail=None):
         self.logs = {}
         self.delayedLogs = {}
         self._closeWhenFinished = {}
         self.collectStdout = collectStdout
-        self.stdout = ''
+        self.stdoutBuffer = OutputBuffer(head=collectHead, tail=collectTail)
 
         self._startTime = None
         self._remoteElapsed = None
@@ -60,6 +114,12 @@ class RemoteCommand(pb.Referenceable):
     def __repr__(self):
         return "<RemoteCommand '%s' at %d>" % (self.remote_command, id(self))
 
+    @property
+    def stdout(self):
+        """The collected stdout, if collectStdout was given; only its head
+        and tail if collectHead or collectTail was given, too"""
+        return self.stdoutBuffer.getvalue()
+
     def run(self, step, remote):
         self.active = True
         self.step = step
@@ -201,7 +261,7 @@ class RemoteCommand(pb.Referenceable):
         if 'stdio' in self.logs:
             self.logs['stdio'].addStdout(data)
         if self.collectStdout:
-            self.stdout += data
+            self.stdoutBuffer.append(data)
 
     def addStderr(self, data):
         if 'stdio' in self.logs:
@@ -355,7 +415,8 @@ class RemoteShellCommand(RemoteCommand):
                  timeout=20*60, maxTime=None, logfiles={},
                  usePTY="slave-config", logEnviron=True,
                  collectStdout=False, interruptSignal=None,
-                 initialStdin=None, decodeRC={0:SUCCESS}):
+                 initialStdin=None, decodeRC={0:SUCCESS},
+                 collectHead=None, collectTail=None):
 
         self.command = command # stash .command, set it later
         if env is not None:
@@ -377,7 +438,8 @@ class RemoteShellCommand(RemoteCommand):
         if interruptSignal is not None:
             args['interruptSignal'] = interruptSignal
         RemoteCommand.__init__(self, "shell", args, collectStdout=collectStdout,
-                decodeRC=decodeRC)
+                decodeRC=decodeRC, collectHead=collectHead,
+                collectTail=collectTail)
 
     def _start(self):
         self.args['command'] = self.command
@@ -738,7 +800,7 @@ class BuildStep(object, properties.PropertiesMixin):
         sv = self.build.getSlaveCommandVersion(command, None)
         if sv is None:
             return True
-        if map(int, sv.split(".")) < map(int, minversion.split(".")):
+        if map(int, str(sv).split(".")) < map(int, minversion.split(".")):
             return True
         return False
 
@@ -0,0 +1,194 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import threading
+import time
+
+from twisted.application import service
+from twisted.internet import reactor, threads
+from twisted.python import failure, log
+from buildbot import config
+from buildbot.process import metrics
+
+class LogWriter(config.ReconfigurableServiceMixin, service.Service):
+    """
+    A write-behind sink for logfile data.  When c['logWriterBufferSize'] is
+    set, L{LogFile} hands its encoded chunks to this service instead of
+    writing them on the reactor thread; a dedicated thread writes them out in
+    batches, one write per logfile per batch.
+
+    At most C{maxQueuedBytes} may be waiting to be written.  A write that
+    would exceed that blocks the reactor until the writer thread catches up,
+    so a slow disk degrades to the old synchronous behavior rather than
+    growing without bound.
+
+    Completion is reported back on the reactor thread through
+    C{logfile._flushed(nbytes, nitems)}; until then the logfile keeps the data
+    in memory, so readers never miss it.
+
+    There is generally only one instance of this class, available at
+    C{master.logwriter}.
+    """
+
+    maxQueuedBytes = None
+    thread = None
+
+    def __init__(self):
+        self.setName('logwriter')
+        self.cond = threading.Condition()
+        self.queue = []
+        self.queuedBytes = 0
+        self.stopping = False
+        self.exited = False
+
+    def reconfigService(self, new_config):
+        # once started, the thread keeps serving the logfiles that use it
+        # even if write-behind is turned off again
+        if new_config.logWriterBufferSize:
+            self.maxQueuedBytes = new_config.logWriterBufferSize
+            if self.running and self.thread is None:
+                self._startThread()
+        return config.ReconfigurableServiceMixin.reconfigService(self,
+                                                            new_config)
+
+    def startService(self):
+        service.Service.startService(self)
+        if self.maxQueuedBytes:
+            self._startThread()
+
+    def stopService(self):
+        service.Service.stopService(self)
+        if self.thread is None:
+            return
+        with self.cond:
+            self.stopping = True
+            self.cond.notifyAll()
+        # the thread drains the queue before it exits
+        d = threads.deferToThread(self.thread.join)
+        @d.addCallback
+        def stopped(_):
+            self.thread = None
+        return d
+
+    def _startThread(self):
+        self.stopping = False
+        self.exited = False
+        self.thread = threading.Thread(target=self._run,
+                                       name='buildbot log writer')
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    # reactor-thread interface
+
+    def write(self, logfile, fd, data):
+        """
+        Queue C{data} to be appended to C{fd}, the open file of C{logfile}.
+        """
+        if not self._enqueue((logfile, fd, data, time.time()), len(data)):
+            # no thread to hand it to; write it out now.  Completion is
+            # still reported through the reactor, so that it is ordered
+            # after any the thread has already reported.
+            fd.seek(0, 2)
+            fd.write(data)
+            fd.flush()
+            reactor.callFromThread(logfile._flushed, len(data), 1)
+
+    def close(self, logfile, fd):
+        """
+        Close C{fd} once everything queued for it has been written.
+        """
+        if not self._enqueue((logfile, fd, None, time.time()), 0):
+            fd.close()
+
+    def _enqueue(self, item, size):
+        if self.thread is None:
+            return False
+        with self.cond:
+            if self.exited:
+                return False
+            if (self.queuedBytes and
+                    self.queuedBytes + size > self.maxQueuedBytes):
+                metrics.MetricCountEvent.log('LogWriter.stalls', 1)
+                while (self.queuedBytes and
+                        self.queuedBytes + size > self.maxQueuedBytes):
+                    self.cond.wait()
+            self.queue.append(item)
+            self.queuedBytes += size
+            self.cond.notifyAll()
+        return True
+
+    def _batchWritten(self, written, latency, depth, queuedBytes):
+        for logfile, nbytes, nitems in written:
+            logfile._flushed(nbytes, nitems)
+        metrics.MetricTimeEvent.log('LogWriter.flush_latency', latency)
+        metrics.MetricCountEvent.log('LogWriter.queue_depth', depth,
+                                     absolute=True)
+        metrics.MetricCountEvent.log('LogWriter.queued_bytes', queuedBytes,
+                                     absolute=True)
+
+    # writer thread
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.stopping:
+                    self.cond.wait()
+                if not self.queue:
+                    self.exited = True
+                    return
+                batch, self.queue = self.queue, []
+
+            # group the batch by file, keeping each file's data in order
+            files = []
+            byFile = {}
+            for logfile, fd, data, queued_at in batch:
+                if fd not in byFile:
+                    byFile[fd] = [logfile, [], False]
+                    files.append(fd)
+                if data is None:
+                    byFile[fd][2] = True
+                else:
+                    byFile[fd][1].append(data)
+
+            written = []
+            batchBytes = 0
+            for fd in files:
+                logfile, datas, close = byFile[fd]
+                data = "".join(datas)
+                try:
+                    if data:
+                        fd.seek(0, 2)
+                        fd.write(data)
+                    if close:
+                        fd.close()
+                    else:
+                        fd.flush()
+                except Exception:
+                    reactor.callFromThread(log.err, failure.Failure(),
+                            "while writing logfile %r" % (logfile.filename,))
+                batchBytes += len(data)
+                if datas:
+                    written.append((logfile, len(data), len(datas)))
+
+            latency = time.time() - batch[0][3]
+            with self.cond:
+                self.queuedBytes -= batchBytes
+                depth = len(self.queue)
+                queuedBytes = self.queuedBytes
+                self.cond.notifyAll()
+            reactor.callFromThread(self._batchWritten, written, latency,
+                                   depth, queuedBytes)
@@ -23,6 +23,7 @@ from buildbot.process.properties import Properties
 from buildbot.util import ComparableMixin
 from buildbot import config, interfaces
 from buildbot.util.state import StateMixin
+from buildbot.changes.filter import ChangeFilter
 
 
 class ScheduleOnMultipleSlavesMixin(object):
@@ -226,24 +227,24 @@ class BaseScheduler(service.MultiService, ComparableMixin, StateMixin, ScheduleO
         def changeCallback(change):
             # ignore changes delivered while we're not running
             if not self._change_subscription:
-                return
+                return False
 
             if change_filter and not change_filter.filter_change(change):
-                return
+                return False
             if change.codebase not in self.codebases:
                 log.msg('change contains codebase %s that is not processed by'
                     ' scheduler %s' % (change.codebase, self.name),
                     logLevel=logging.DEBUG)
-                return
+                return False
             if fileIsImportant:
                 try:
                     important = fileIsImportant(change)
                     if not important and onlyImportant:
-                        return
+                        return False
                 except:
                     log.err(failure.Failure(),
                             'in fileIsImportant check for %s' % change)
-                    return
+                    return False
             else:
                 important = True
 
@@ -255,7 +256,15 @@ class BaseScheduler(service.MultiService, ComparableMixin, StateMixin, ScheduleO
                 self._change_consumption_lock.release()
             d.addBoth(release)
             d.addErrback(log.err, 'while processing change')
-        self._change_subscription = self.master.subscribeToChanges(changeCallback)
+            return True
+
+        # only the changes that meet the exact-match parts of the filter, and
+        # are for one of our codebases, are even offered to changeCallback
+        conditions = [ ('codebase', self.codebases.keys()) ]
+        if isinstance(change_filter, ChangeFilter):
+            conditions.extend(change_filter.getExactMatchChecks())
+        self._change_subscription = self.master.subscribeToChanges(
+                changeCallback, conditions)
 
         return defer.succeed(None)
 
@@ -15,10 +15,9 @@
 
 from __future__ import with_statement
 
-import os, shutil, re
-from cPickle import dump
+import re
 from zope.interface import implements
-from twisted.python import log, runtime, components
+from twisted.python import log, components
 from twisted.persisted import styles
 from twisted.internet import reactor, defer
 from buildbot import interfaces, util, sourcestamp
@@ -469,24 +468,8 @@ class BuildStatus(styles.Versioned, properties.PropertiesMixin):
             s.checkLogfiles()
 
     def saveYourself(self):
-        filename = os.path.join(self.builder.basedir, "%d" % self.number)
-        if os.path.isdir(filename):
-            # leftover from 0.5.0, which stored builds in directories
-            shutil.rmtree(filename, ignore_errors=True)
-        tmpfilename = filename + ".tmp"
-
         try:
-            with open(tmpfilename, "wb") as f:
-                dump(self, f, -1)
-            if runtime.platformType  == 'win32':
-                # windows cannot rename a file on top of an existing one, so
-                # fall back to delete-first. There are ways this can fail and
-                # lose the builder's history, so we avoid using it in the
-                # general (non-windows) case
-                if os.path.exists(filename):
-                    os.unlink(filename)
-
-            os.rename(tmpfilename, filename)
+            self.builder.getBuildHistory().saveBuild(self)
         except:
             log.msg("unable to save build %s-#%d" % (self.builder.name,
                                                      self.number))
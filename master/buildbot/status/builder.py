@@ -16,8 +16,9 @@
 from __future__ import with_statement
 
 
-import os, re, itertools
-from cPickle import load, dump
+import os, itertools
+from collections import deque
+from cPickle import dump
 import datetime
 from buildbot.interfaces import IStatusReceiver
 from twisted.internet import defer, threads
@@ -30,6 +31,8 @@ from buildbot.util.lru import LRUCache
 from buildbot.status.event import Event
 from buildbot.status.build import BuildStatus
 from buildbot.status.buildrequest import BuildRequestStatus
+from buildbot.status.buildhistory import createBuildHistory
+from buildbot.status.retention import RetentionPolicy
 
 # user modules expect these symbols to be present here
 from buildbot.status.results import SUCCESS, WARNINGS, FAILURE, SKIPPED
@@ -39,6 +42,93 @@ _hush_pyflakes = [ SUCCESS, WARNINGS, FAILURE, SKIPPED,
 
 LATEST_BUILD_FORMAT = "{0}={1};"
 
+def lastBuildsFilter(codebases={}, branches=[], results=None):
+    """
+    Translate branch, codebase and result filters into the C{sourcestamps}
+    and C{results} arguments of C{db.builds.getLastBuildsNumbers}.
+    """
+    sourcestamps = [{'b_branch': b} for b in branches if b is not None] if branches else []
+    #TODO: support filter by RETRY result
+    results_filter = [r for r in results if r is not None and r != RETRY] if results else []
+
+    if codebases and not branches:
+        for key, value in codebases.iteritems():
+            sourcestamps.append({'b_codebase': key, 'b_branch': value})
+
+    return sourcestamps, results_filter
+
+def lastBuildsSearchSize(num_builds):
+    # Handles the condition where the last build status couldn't be saved into pickles,
+    # in that case we need to search more builds and use the previous one
+    if num_builds == 1:
+        return num_builds + 9
+    return num_builds
+
+class FinishedBuildsIterator(object):
+    """
+    Walk backwards through the finished builds of a builder, like
+    L{BuilderStatus.generateFinishedBuilds}, but load each build with
+    L{BuilderStatus.deferToThread} so that unpickling happens off the reactor.
+
+    C{next()} returns a Deferred that fires with the next matching build, or
+    with None once there are no more; call it again only after that Deferred
+    has fired.  Once a build has been asked for, up to C{prefetch} builds are
+    kept loading ahead of the caller.  As in C{generateFinishedBuilds},
+    C{codebases} takes precedence over C{branches} when both are given.
+    """
+
+    def __init__(self, builder_status, branches=[], codebases={},
+                 finished_before=None, max_search=200, prefetch=4):
+        self.builder_status = builder_status
+        self.branches = set(branches)
+        self.codebases = codebases
+        self.finished_before = finished_before
+        self.prefetch = prefetch
+        # only the first build is loaded until the caller takes one
+        self.window = 1
+        top = builder_status.nextBuildNumber
+        self.numbers = iter(xrange(top - 1, max(top - max_search, 0) - 1, -1))
+        # Deferreds for the builds being loaded, newest first
+        self.pending = deque()
+
+    def _fill(self):
+        while len(self.pending) < self.window:
+            for number in self.numbers:
+                self.pending.append(self.builder_status.deferToThread(number))
+                break
+            else:
+                return
+
+    def _matches(self, build):
+        if build is None or not build.isFinished():
+            return False
+        if self.finished_before is not None:
+            start, end = build.getTimes()
+            if end >= self.finished_before:
+                return False
+        if self.codebases:
+            if not self.builder_status.foundCodebasesInBuild(build,
+                                                             self.codebases):
+                return False
+        elif self.branches and \
+                not self.branches & self.builder_status._getBuildBranches(build):
+            return False
+        return True
+
+    @defer.inlineCallbacks
+    def next(self):
+        while True:
+            self._fill()
+            if not self.pending:
+                defer.returnValue(None)
+                return
+            build = yield self.pending.popleft()
+            self.window = self.prefetch
+            if self._matches(build):
+                self._fill()
+                defer.returnValue(build)
+                return
+
 class BuilderStatus(styles.Versioned):
     """I handle status information for a single process.build.Builder object.
     That object sends status changes to me (frequently as Events), and I
@@ -68,6 +158,7 @@ class BuilderStatus(styles.Versioned):
     basedir = None # filled in by our parent
     unavailable_build_numbers = set()
     status = None
+    buildHistory = None
 
     def __init__(self, buildername, category, master, friendly_name=None):
         self.name = buildername
@@ -127,6 +218,7 @@ class BuilderStatus(styles.Versioned):
         self.deleteKey('nextBuildNumber', d)
         del d['master']
         self.deleteKey('loadingBuilds', d)
+        self.deleteKey('buildHistory', d)
 
         if 'pendingBuildCache' in d:
             del d['pendingBuildCache']
@@ -160,23 +252,35 @@ class BuilderStatus(styles.Versioned):
             del self.latestBuildCache
         self.wasUpgraded = True
 
+    def getBuildHistory(self):
+        """Return the backend holding our finished builds, creating it with
+        c['buildHistoryBackend'] on first use."""
+        if self.buildHistory is None:
+            self.buildHistory = createBuildHistory(
+                    self.master.config.buildHistoryBackend, self.basedir)
+        return self.buildHistory
+
+    def closeBuildHistory(self):
+        """Close our build history, once any prune of it has finished.
+
+        @returns: Deferred"""
+        history, self.buildHistory = self.buildHistory, None
+        if history is None:
+            return defer.succeed(None)
+        if self.status is not None:
+            d = self.status.retention.wait(self.name)
+        else:
+            d = defer.succeed(None)
+        d.addCallback(lambda _ : history.close())
+        return d
+
     def determineNextBuildNumber(self):
-        """Scan our directory of saved BuildStatus instances to determine
-        what our self.nextBuildNumber should be. Set it one larger than the
-        highest-numbered build we discover. This is called by the top-level
-        Status object shortly after we are created or loaded from disk.
+        """Ask our build history what our self.nextBuildNumber should be:
+        one larger than the highest-numbered build it knows about. This is
+        called by the top-level Status object shortly after we are created or
+        loaded from disk.
         """
-        existing_builds = []
-        for f in os.listdir(self.basedir):
-            r = re.search("^(\d+).*$", f)
-
-            if r is not None and len(r.groups()) > 0:
-                existing_builds.append(int(r.groups()[0]))
-
-        if len(existing_builds):
-            self.nextBuildNumber = max(existing_builds) + 1
-        else:
-            self.nextBuildNumber = 0
+        self.nextBuildNumber = self.getBuildHistory().getNextBuildNumber()
 
     def saveYourself(self, skipBuilds=False):
         if skipBuilds is False:
@@ -217,16 +321,14 @@ class BuilderStatus(styles.Versioned):
         if number in self.unavailable_build_numbers:
             return None
 
-        filename = self.makeBuildFilename(number)
         try:
-            if not os.path.exists(filename):
+            build = self.getBuildHistory().loadBuild(number)
+            if build is None:
                 if number < self.nextBuildNumber:
                     self.unavailable_build_numbers.add(number)
                 return None
 
-            log.msg("Loading builder %s's build %d from on-disk pickle" % (self.name, number))
-            with open(filename, "rb") as f:
-                build = load(f)
+            log.msg("Loaded builder %s's build %d from build history" % (self.name, number))
             build.setProcessObjects(self, self.master)
 
             # (bug #1068) if we need to upgrade, we probably need to rewrite
@@ -286,36 +388,16 @@ class BuilderStatus(styles.Versioned):
         if earliest_log < earliest_build:
             earliest_log = earliest_build
 
-        if earliest_build == 0:
+        policy = RetentionPolicy(earliest_build, earliest_log,
+                                 keep=self.buildCache.cache.keys(),
+                                 maxAge=self.master.config.buildHistoryMaxAge,
+                                 maxSize=self.master.config.buildHistoryMaxSize)
+        if policy.isEmpty():
             return
 
-        # skim the directory and delete anything that shouldn't be there anymore
-        build_re = re.compile(r"^([0-9]+)$")
-        build_log_re = re.compile(r"^([0-9]+)-.*$")
-        # if the directory doesn't exist, bail out here
-        if not os.path.exists(self.basedir):
-            return
-
-        for filename in os.listdir(self.basedir):
-            num = None
-            mo = build_re.match(filename)
-            is_logfile = False
-            if mo:
-                num = int(mo.group(1))
-            else:
-                mo = build_log_re.match(filename)
-                if mo:
-                    num = int(mo.group(1))
-                    is_logfile = True
-
-            if num is None: continue
-            if num in self.buildCache.cache: continue
-
-            if (is_logfile and num < earliest_log) or num < earliest_build:
-                pathname = os.path.join(self.basedir, filename)
-                log.msg("pruning '%s'" % pathname)
-                try: os.unlink(pathname)
-                except OSError: pass
+        # the filesystem work is done off the reactor thread
+        return self.status.retention.prune(self.name, self.getBuildHistory(),
+                                           policy)
 
     # IBuilderStatus methods
     def getName(self):
@@ -431,24 +513,12 @@ class BuilderStatus(styles.Versioned):
 
     @defer.inlineCallbacks
     def generateBuildNumbers(self, codebases={}, branches=[], results=None, num_builds=1):
-        sourcestamps = [{'b_branch': b} for b in branches if b is not None] if branches else []
-        #TODO: support filter by RETRY result
-        results_filter = [r for r in results if r is not None and r != RETRY] if results else []
-
-        if codebases and not branches:
-            for key, value in codebases.iteritems():
-                sourcestamps.append({'b_codebase': key, 'b_branch': value})
-
-        # Handles the condition where the last build status couldn't be saved into pickles,
-        # in that case we need to search more builds and use the previous one 
-        retries = num_builds
-        if num_builds == 1:
-            retries = num_builds + 9
+        sourcestamps, results_filter = lastBuildsFilter(codebases, branches, results)
 
         lastBuildsNumbers = yield self.master.db.builds.getLastBuildsNumbers(buildername=self.name,
                                                                              sourcestamps=sourcestamps,
                                                                              results=results_filter,
-                                                                             num_builds=retries)
+                                                                             num_builds=lastBuildsSearchSize(num_builds))
 
         defer.returnValue(lastBuildsNumbers)
         return
@@ -477,6 +547,9 @@ class BuilderStatus(styles.Versioned):
     def shouldUseLatestBuildCache(self, useCache, num_builds, key):
         return key and useCache and num_builds == 1 and key in self.latestBuildCache
 
+    def shouldUseLatestBuildTable(self, useCache, num_builds, key):
+        return key and useCache and num_builds == 1
+
     def buildLoaded(self, build, buildnumber):
         if build and not self.loadingBuilds[buildnumber]['build']:
             self.loadingBuilds[buildnumber]['build'] = build
@@ -530,7 +603,17 @@ class BuilderStatus(styles.Versioned):
     def generateFinishedBuildsAsync(self, branches=[], codebases={},
                                num_builds=None,
                                results=None,
-                               useCache=False):
+                               useCache=False,
+                               buildNumbers=None,
+                               latestBuildNumber=None):
+        """
+        Return the last C{num_builds} finished builds matching the given
+        branches, codebases and results.  Callers that have already looked
+        up the candidate build numbers (see
+        L{Status.generateLatestBuildsAsync}) pass them in C{buildNumbers}, or
+        the number recorded in the latest builds table in
+        C{latestBuildNumber}.
+        """
 
         build = None
         finishedBuilds = []
@@ -546,7 +629,25 @@ class BuilderStatus(styles.Versioned):
             defer.returnValue(finishedBuilds)
             return
 
-        buildNumbers = yield self.generateBuildNumbers(codebases, branches, results, num_builds)
+        if buildNumbers is None and latestBuildNumber is None \
+                and self.shouldUseLatestBuildTable(useCache, num_builds, key):
+            _, results_filter = lastBuildsFilter(results=results)
+            latest = yield self.master.db.builds.getLatestBuildNumbers([self.name], key,
+                                                                       results=results_filter)
+            latestBuildNumber = latest.get(self.name)
+
+        if latestBuildNumber is not None:
+            build = yield self.deferToThread(latestBuildNumber)
+            if build is not None and (results is None or build.getResults() in results):
+                finishedBuilds.append(build)
+                self.saveLatestBuild(build, key)
+                defer.returnValue(finishedBuilds)
+                return
+
+        # the table can be missing a build (e.g. if its pickle was lost);
+        # fall back to searching the builds
+        if buildNumbers is None:
+            buildNumbers = yield self.generateBuildNumbers(codebases, branches, results, num_builds)
 
         for bn in buildNumbers:
             build = yield self.deferToThread(bn)
@@ -570,6 +671,14 @@ class BuilderStatus(styles.Versioned):
         return
 
 
+    def iterFinishedBuildsAsync(self, branches=[], codebases={},
+                                finished_before=None, max_search=200,
+                                prefetch=4):
+        return FinishedBuildsIterator(self, branches, codebases=codebases,
+                                      finished_before=finished_before,
+                                      max_search=max_search,
+                                      prefetch=prefetch)
+
     def generateFinishedBuilds(self, branches=[], codebases={},
                                num_builds=None,
                                max_buildnum=None,
@@ -698,6 +807,8 @@ class BuilderStatus(styles.Versioned):
 
     def setSlavenames(self, names):
         self.slavenames = names
+        if self.status is not None:
+            self.status.slavenamesChanged()
 
     def addEvent(self, text=[]):
         # this adds a duration event. When it is done, the user should call
@@ -746,6 +857,7 @@ class BuilderStatus(styles.Versioned):
         Steps). Create a BuildStatus object that it can use."""
         number = self.nextBuildNumber
         self.nextBuildNumber += 1
+        self.getBuildHistory().buildNumberAllocated(number)
         # TODO: self.saveYourself(), to make sure we don't forget about the
         # build number we've just allocated. This is not quite as important
         # as it was before we switch to determineNextBuildNumber, but I think
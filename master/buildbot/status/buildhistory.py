@@ -0,0 +1,480 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Build history backends.  A L{BuilderStatus} keeps its finished
+L{BuildStatus} objects in one of these; the backend is selected with
+c['buildHistoryBackend'].
+"""
+
+from __future__ import with_statement
+
+import os, re, shutil, threading
+import sqlite3
+from cPickle import loads, dumps
+from twisted.python import log, runtime
+
+BUILD_RE = re.compile(r"^([0-9]+)$")
+BUILD_LOG_RE = re.compile(r"^([0-9]+)-.*$")
+
+# suffixes a logfile may acquire after LogFile.compressLog, and those of the
+# test results index written next to it
+LOGFILE_SUFFIXES = ('', '.bz2', '.gz', '.blk', '.blk.idx', '.results',
+                    '.results.dat')
+
+def _unlink(pathname):
+    """
+    Remove C{pathname} if it exists.
+
+    @returns: the number of bytes reclaimed
+    """
+    try:
+        size = os.stat(pathname).st_size
+    except OSError:
+        return 0
+    log.msg("pruning '%s'" % pathname)
+    try:
+        os.unlink(pathname)
+    except OSError:
+        return 0
+    return size
+
+def _logfileName(filename):
+    """Return the name a logfile was created with, without the suffixes it
+    may have acquired since"""
+    for suffix in LOGFILE_SUFFIXES[1:]:
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+    return filename
+
+def _unlinkLogfile(basedir, filename):
+    reclaimed = 0
+    for suffix in LOGFILE_SUFFIXES:
+        reclaimed += _unlink(os.path.join(basedir, filename + suffix))
+    return reclaimed
+
+def _measure(basedir, filenames):
+    """Return the bytes used by C{filenames}, with all of their suffixes"""
+    size = 0
+    for filename in filenames:
+        for suffix in LOGFILE_SUFFIXES:
+            try:
+                size += os.stat(os.path.join(basedir, filename + suffix)).st_size
+            except OSError:
+                pass
+    return size
+
+class PickleBuildHistory(object):
+    """
+    I store each build as a pickle named after its number in the builder's
+    directory, next to its logfiles.  This is the traditional layout.
+
+    The directory is scanned once, when the next build number is first
+    needed; after that, an index of build numbers to the files of each build
+    is kept up to date as builds are saved and pruned, so pruning does not
+    have to scan the directory again.  The sizes and ages needed by the
+    retention quotas are measured once per build and cached.
+    """
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        # build number -> set of the names of the build's pickle and its
+        # logfiles, without suffixes; None until the directory is scanned
+        self.index = None
+        # build number -> (finished, bytes)
+        self.usage = {}
+        # builds are saved from the reactor thread and pruned from the
+        # retention engine's threads; access to the index is serialized
+        # with self.lock
+        self.lock = threading.Lock()
+
+    def close(self):
+        pass
+
+    def makeBuildFilename(self, number):
+        return os.path.join(self.basedir, "%d" % number)
+
+    def _getIndex(self):
+        if self.index is None:
+            index = {}
+            for filename in os.listdir(self.basedir):
+                mo = BUILD_RE.match(filename)
+                if not mo:
+                    mo = BUILD_LOG_RE.match(filename)
+                    if not mo:
+                        continue
+                    filename = _logfileName(filename)
+                index.setdefault(int(mo.group(1)), set()).add(filename)
+            self.index = index
+        return self.index
+
+    def getNextBuildNumber(self):
+        with self.lock:
+            index = self._getIndex()
+            if index:
+                return max(index) + 1
+        return 0
+
+    def buildNumberAllocated(self, number):
+        pass
+
+    def hasBuild(self, number):
+        return os.path.exists(self.makeBuildFilename(number))
+
+    def loadBuild(self, number):
+        """Return the unpickled build, or None if it does not exist"""
+        filename = self.makeBuildFilename(number)
+        if not os.path.exists(filename):
+            return None
+        with open(filename, "rb") as f:
+            return loads(f.read())
+
+    def saveBuild(self, build):
+        filename = self.makeBuildFilename(build.number)
+        if os.path.isdir(filename):
+            # leftover from 0.5.0, which stored builds in directories
+            shutil.rmtree(filename, ignore_errors=True)
+        tmpfilename = filename + ".tmp"
+
+        with open(tmpfilename, "wb") as f:
+            f.write(dumps(build, -1))
+        if runtime.platformType  == 'win32':
+            # windows cannot rename a file on top of an existing one, so
+            # fall back to delete-first. There are ways this can fail and
+            # lose the builder's history, so we avoid using it in the
+            # general (non-windows) case
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+        os.rename(tmpfilename, filename)
+
+        filenames = set([ os.path.basename(l.filename)
+                          for step in build.getSteps()
+                          for l in step.getLogs()
+                          if getattr(l, 'filename', None) ])
+        filenames.add(os.path.basename(filename))
+        with self.lock:
+            if self.index is not None:
+                self.index.setdefault(build.number, set()).update(filenames)
+            self.usage.pop(build.number, None)
+
+    def getUsage(self):
+        """
+        Return a list of tuples (number, finished, bytes) for each stored
+        build, in order of build number.  C{finished} is the time the build's
+        pickle was written, and C{bytes} includes its logfiles.  This is a
+        blocking method.
+        """
+        with self.lock:
+            index = self._getIndex()
+            builds = [ (number, set(filenames), self.usage.get(number))
+                       for number, filenames in index.iteritems()
+                       if str(number) in filenames ]
+        builds.sort()
+
+        usage = []
+        for number, filenames, cached in builds:
+            if cached is None:
+                try:
+                    finished = os.stat(self.makeBuildFilename(number)).st_mtime
+                except OSError:
+                    continue
+                cached = (finished, _measure(self.basedir, filenames))
+                with self.lock:
+                    if number in self.index:
+                        self.usage[number] = cached
+            usage.append((number,) + cached)
+        return usage
+
+    def prune(self, earliest_build, earliest_log, keep=()):
+        """
+        Remove the builds numbered below C{earliest_build} and the logfiles
+        of those below C{earliest_log}, except for the builds in C{keep}.
+        This is a blocking method.
+
+        @returns: the number of bytes reclaimed
+        """
+        if not os.path.exists(self.basedir):
+            return 0
+
+        keep = set(keep)
+        horizon = max(earliest_build, earliest_log)
+        remove = []
+        with self.lock:
+            index = self._getIndex()
+            for number in [ n for n in index if n < horizon ]:
+                if number in keep:
+                    continue
+                filenames = index[number]
+                if number < earliest_build:
+                    del index[number]
+                    remove.extend(filenames)
+                else:
+                    build = str(number)
+                    remove.extend(f for f in filenames if f != build)
+                    index[number] = filenames & set([build])
+                self.usage.pop(number, None)
+
+        reclaimed = 0
+        for filename in remove:
+            if BUILD_RE.match(filename):
+                reclaimed += _unlink(os.path.join(self.basedir, filename))
+            else:
+                reclaimed += _unlinkLogfile(self.basedir, filename)
+        return reclaimed
+
+class SqliteBuildHistory(object):
+    """
+    I store a builder's finished builds in a single indexed SQLite file,
+    C{builds.sqlite} in the builder's directory.  Lookups by number, the next
+    build number and pruning ranges are all index operations, so no directory
+    scan is ever needed.
+
+    Each row carries the C{persistenceVersion} of the L{BuildStatus} that
+    wrote it, along with its results and finish time; the build itself is
+    still a L{styles.Versioned} pickle, so the usual upgrade path applies
+    when old rows are loaded.  The store's own layout is versioned with
+    C{PRAGMA user_version}.
+
+    The first time the store is opened in a directory that still contains
+    per-build pickles, they are imported and removed (see L{migrate}).
+    """
+
+    schema_version = 1
+    filename = "builds.sqlite"
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        # builds are loaded from deferToThread as well as the reactor thread;
+        # all access is serialized with self.lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(basedir, self.filename),
+                                    check_same_thread=False)
+        self.conn.text_factory = str
+        # build number -> bytes used by the build's logfiles
+        self.logUsage = {}
+        self._upgradeSchema()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _upgradeSchema(self):
+        with self.lock:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > self.schema_version:
+            raise RuntimeError("build history %s has schema version %d, "
+                               "newer than this buildbot supports (%d)" %
+                               (self.basedir, version, self.schema_version))
+        if version >= 1:
+            return
+
+        with self.lock:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS builds (
+                    number INTEGER PRIMARY KEY,
+                    version INTEGER,
+                    results INTEGER,
+                    finished REAL,
+                    data BLOB NOT NULL)""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS logs (
+                    number INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    PRIMARY KEY (number, filename))""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS allocated (
+                    id INTEGER PRIMARY KEY,
+                    number INTEGER NOT NULL)""")
+        imported = self.migrate()
+        with self.lock:
+            self.conn.execute("PRAGMA user_version = %d" % self.schema_version)
+        for pathname in imported:
+            try:
+                os.unlink(pathname)
+            except OSError:
+                pass
+
+    def migrate(self):
+        """
+        One-shot import of the pickle files in this directory, run when the
+        store is created.  Pickles are stored verbatim and only removed once
+        the store is marked as migrated, so an interrupted migration simply
+        runs again on the next start.  Returns the imported pathnames.
+        """
+        builds = []
+        logs = []
+        for filename in os.listdir(self.basedir):
+            mo = BUILD_RE.match(filename)
+            if mo:
+                builds.append((int(mo.group(1)), filename))
+                continue
+            mo = BUILD_LOG_RE.match(filename)
+            if mo:
+                logs.append((int(mo.group(1)), _logfileName(filename)))
+
+        if not builds and not logs:
+            return []
+
+        log.msg("migrating %d build pickles in %s to %s" %
+                (len(builds), self.basedir, self.filename))
+        imported = []
+        with self.lock:
+            with self.conn:
+                for number, filename in builds:
+                    pathname = os.path.join(self.basedir, filename)
+                    try:
+                        with open(pathname, "rb") as f:
+                            data = f.read()
+                    except IOError:
+                        log.msg("unable to migrate build pickle %s" % pathname)
+                        log.err()
+                        continue
+                    # the pickle is stored as-is; it is upgraded like any
+                    # other when it is first loaded
+                    self._insertRow(number, None, None, None, data)
+                    imported.append(pathname)
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO logs (number, filename) "
+                    "VALUES (?, ?)", logs)
+                # logfiles without a pickle belong to interrupted builds, whose
+                # numbers must not be reused
+                if logs:
+                    self._allocate(max(number for number, _ in logs))
+        return imported
+
+    def _allocate(self, number):
+        self.conn.execute("INSERT OR REPLACE INTO allocated (id, number) "
+                          "VALUES (0, max(?, coalesce((SELECT number FROM "
+                          "allocated WHERE id = 0), -1)))", (number,))
+
+    def _insertRow(self, number, version, results, finished, data):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO builds "
+            "(number, version, results, finished, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (number, version, results, finished, sqlite3.Binary(data)))
+
+    def getNextBuildNumber(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT max(coalesce((SELECT max(number) FROM builds), -1), "
+                "coalesce((SELECT number FROM allocated WHERE id = 0), -1))"
+                ).fetchone()
+        return row[0] + 1
+
+    def buildNumberAllocated(self, number):
+        with self.lock:
+            with self.conn:
+                self._allocate(number)
+
+    def hasBuild(self, number):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM builds WHERE number = ?",
+                                    (number,)).fetchone()
+        return row is not None
+
+    def loadBuild(self, number):
+        """Return the unpickled build, or None if it does not exist"""
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM builds WHERE number = ?",
+                                    (number,)).fetchone()
+        if row is None:
+            return None
+        return loads(str(row[0]))
+
+    def saveBuild(self, build):
+        data = dumps(build, -1)
+        logfiles = [ (build.number, os.path.basename(l.filename))
+                     for step in build.getSteps()
+                     for l in step.getLogs()
+                     if getattr(l, 'filename', None) ]
+        with self.lock:
+            with self.conn:
+                self._insertRow(build.number, build.persistenceVersion,
+                                build.results, build.finished, data)
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO logs (number, filename) "
+                    "VALUES (?, ?)", logfiles)
+            self.logUsage.pop(build.number, None)
+
+    def getUsage(self):
+        """
+        Return a list of tuples (number, finished, bytes) for each stored
+        build, in order of build number.  C{finished} is None for builds
+        imported from pickles, and C{bytes} includes the build's logfiles.
+        This is a blocking method.
+        """
+        with self.lock:
+            builds = self.conn.execute(
+                "SELECT number, finished, length(data) FROM builds "
+                "ORDER BY number").fetchall()
+            logfiles = self.conn.execute(
+                "SELECT number, filename FROM logs").fetchall()
+            logUsage = dict(self.logUsage)
+
+        byNumber = {}
+        for number, filename in logfiles:
+            if number not in logUsage:
+                byNumber.setdefault(number, []).append(filename)
+        for number, filenames in byNumber.iteritems():
+            logUsage[number] = _measure(self.basedir, filenames)
+        with self.lock:
+            self.logUsage.update((number, logUsage[number])
+                                 for number in byNumber)
+
+        return [ (number, finished, size + logUsage.get(number, 0))
+                 for number, finished, size in builds ]
+
+    def prune(self, earliest_build, earliest_log, keep=()):
+        """
+        Remove the builds numbered below C{earliest_build} and the logfiles
+        of those below C{earliest_log}, except for the builds in C{keep}.
+        This is a blocking method.
+
+        @returns: the number of bytes reclaimed
+        """
+        keep = list(keep)
+        keep_clause = ""
+        if keep:
+            keep_clause = " AND number NOT IN (%s)" % ",".join("?" * len(keep))
+
+        with self.lock:
+            logfiles = self.conn.execute(
+                "SELECT number, filename FROM logs WHERE number < ?"
+                + keep_clause, [earliest_log] + keep).fetchall()
+            reclaimed = self.conn.execute(
+                "SELECT coalesce(sum(length(data)), 0) FROM builds "
+                "WHERE number < ?" + keep_clause,
+                [earliest_build] + keep).fetchone()[0]
+            with self.conn:
+                self.conn.execute("DELETE FROM logs WHERE number < ?"
+                                  + keep_clause, [earliest_log] + keep)
+                self.conn.execute("DELETE FROM builds WHERE number < ?"
+                                  + keep_clause, [earliest_build] + keep)
+            for number, filename in logfiles:
+                self.logUsage.pop(number, None)
+
+        for number, filename in logfiles:
+            reclaimed += _unlinkLogfile(self.basedir, filename)
+        return reclaimed
+
+BACKENDS = {
+    'pickle' : PickleBuildHistory,
+    'sqlite' : SqliteBuildHistory,
+}
+
+def createBuildHistory(backend, basedir):
+    return BACKENDS[backend](basedir)
@@ -14,13 +14,14 @@
 # Copyright Buildbot Team Members
 import copy
 
-import os
 from zope.interface import implements
 from twisted.persisted import styles
 from twisted.python import log
+from twisted.python import log as twlog
 from twisted.internet import reactor, defer
 from buildbot import interfaces, util
 from buildbot.status.logfile import LogFile, HTMLLogFile
+from buildbot.status import testresults
 
 class BuildStepStatus(styles.Versioned):
     """
@@ -253,6 +254,11 @@ class BuildStepStatus(styles.Versioned):
         logfilename = self.build.generateLogfileName(self.name, name)
         log = HTMLLogFile(self, name, logfilename, html)
         self.logs.append(log)
+        if testresults.isTestResults(html):
+            # summarise test reports now, rather than on every page view
+            d = testresults.indexLog(log, html)
+            d.addErrback(twlog.err, "while indexing test results of %s"
+                         % (logfilename,))
         for w in self.watchers:
             w.logStarted(self.build, self, log)
             w.logFinished(self.build, self, log)
@@ -296,7 +302,7 @@ class BuildStepStatus(styles.Versioned):
             # HTMLLogFiles aren't files
             if logCompressionLimit is not False and \
                     isinstance(loog, LogFile):
-                if os.path.getsize(loog.getFilename()) > logCompressionLimit:
+                if loog.getEncodedSize() > logCompressionLimit:
                     loog_deferred = loog.compressLog()
                     if loog_deferred:
                         cld.append(loog_deferred)
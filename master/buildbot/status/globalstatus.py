@@ -0,0 +1,121 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+The counters shown in the header of every web page, kept up to date from
+status events so that reading them costs nothing.
+"""
+
+from twisted.internet import reactor
+from twisted.python import log
+
+from buildbot.status.base import StatusReceiverBase
+
+class GlobalStatus(StatusReceiverBase):
+    """
+    The connected slaves, the busy slaves, the running builds and the
+    unclaimed build requests of the master.
+
+    The slaves and builds are tracked from the slave and build events.  The
+    number of unclaimed build requests is counted in the database after any
+    event that can change it, and again if it is read more than
+    C{maxQueueAge} seconds after the last count, since requests can also be
+    claimed and unclaimed by other masters; either way the count is made in
+    the background, and readers get the last one.
+    """
+
+    maxQueueAge = 60
+
+    def __init__(self, status, _reactor=reactor):
+        self.status = status
+        self._reactor = _reactor
+        self.connectedSlaves = set()
+        # slavename -> set of the BuildStatus running on it
+        self.slaveBuilds = {}
+        self.runningBuilds = set()
+        self.unclaimedRequests = 0
+        self.queueCounted = None
+        self._counting = False
+        self._countAgain = False
+
+    def asDict(self):
+        now = self._reactor.seconds()
+        if self.queueCounted is None or \
+                now - self.queueCounted > self.maxQueueAge:
+            self.countQueue()
+        return {"slaves_count": len(self.connectedSlaves),
+                "slaves_busy": len(self.slaveBuilds),
+                "running_builds": len(self.runningBuilds),
+                "build_load": self.unclaimedRequests + len(self.runningBuilds)}
+
+    def countQueue(self):
+        if self._counting:
+            self._countAgain = True
+            return
+        self._counting = True
+        self._countAgain = False
+
+        d = self.status.master.db.buildrequests.countUnclaimedBuildRequests()
+        def counted(count):
+            self.unclaimedRequests = count
+            self.queueCounted = self._reactor.seconds()
+        d.addCallback(counted)
+        d.addErrback(log.err, 'while counting the unclaimed build requests')
+        def done(_):
+            self._counting = False
+            if self._countAgain:
+                self.countQueue()
+        d.addCallback(done)
+
+    def _addBuild(self, build):
+        self.runningBuilds.add(build)
+        self.slaveBuilds.setdefault(build.getSlavename(), set()).add(build)
+
+    def _removeBuild(self, build):
+        self.runningBuilds.discard(build)
+        slavename = build.getSlavename()
+        builds = self.slaveBuilds.get(slavename, set())
+        builds.discard(build)
+        if not builds:
+            self.slaveBuilds.pop(slavename, None)
+
+    # status events
+
+    def builderAdded(self, builderName, builder, friendly_name=None):
+        for build in builder.getCurrentBuilds():
+            self._addBuild(build)
+        return self
+
+    def buildStarted(self, builderName, build):
+        self._addBuild(build)
+        # its requests have been claimed
+        self.countQueue()
+
+    def buildFinished(self, builderName, build, results):
+        self._removeBuild(build)
+        # its requests may have been unclaimed, to be retried
+        self.countQueue()
+
+    def requestSubmitted(self, request):
+        self.countQueue()
+
+    def requestCancelled(self, builder, request):
+        self.countQueue()
+
+    def slaveConnected(self, slaveName):
+        self.connectedSlaves.add(slaveName)
+
+    def slaveDisconnected(self, slaveName):
+        self.connectedSlaves.discard(slaveName)
@@ -22,6 +22,7 @@ from zope.interface import implements
 from twisted.python import log, runtime
 from twisted.internet import defer, threads, reactor
 from buildbot.util import netstrings
+from buildbot.util.blockfile import BlockFile, BlockFileWriter, INDEX_SUFFIX
 from buildbot.util.eventual import eventually
 from buildbot import interfaces
 from twisted.persisted import styles
@@ -205,6 +206,11 @@ class LogFile:
     BUFFERSIZE = 2048
     filename = None # relative to the Builder's basedir
     openfile = None
+    # write-behind state, see LogWriter
+    writer = None
+    unflushed = []
+    unflushedSize = 0
+    flushedSize = 0
 
     def __init__(self, parent, name, logfilename):
         """
@@ -236,6 +242,12 @@ class LogFile:
         self.watchers = []
         self.finishedWatchers = []
         self.tailBuffer = []
+        if self.master.config.logWriterBufferSize:
+            # merged chunks are written by the master's LogWriter thread;
+            # until it reports them written they stay in self.unflushed
+            self.writer = self.master.logwriter
+            self.unflushed = []
+            self.flushWaiters = []
 
     def setTimestampsMode(self, prepend_timestamps):
         """
@@ -264,7 +276,8 @@ class LogFile:
 
         @returns: boolean
         """
-        return os.path.exists(self.getFilename() + '.bz2') or \
+        return os.path.exists(self.getFilename() + '.blk') or \
+            os.path.exists(self.getFilename() + '.bz2') or \
             os.path.exists(self.getFilename() + '.gz') or \
             os.path.exists(self.getFilename())
 
@@ -315,12 +328,20 @@ class LogFile:
 
         @returns: file object
         """
+        if self.writer:
+            # the writer thread owns self.openfile; read what it has written,
+            # followed by what it has yet to write
+            return _WriteBehindFile(self)
         if self.openfile:
             # this is the filehandle we're using to write to the log, so
             # don't close it!
             return self.openfile
         # otherwise they get their own read-only handle
         # try a compressed log first
+        try:
+            return BlockFile(self.getFilename() + ".blk")
+        except IOError:
+            pass
         try:
             return BZ2File(self.getFilename() + ".bz2", "r")
         except IOError:
@@ -338,7 +359,8 @@ class LogFile:
     def getTextWithHeaders(self):
         return "".join(self.getChunks(onlyText=True))
 
-    def getChunks(self, channels=[], onlyText=False):
+    def getChunks(self, channels=[], onlyText=False, startLine=0,
+                  endLine=None):
         # generate chunks for everything that was logged at the time we were
         # first called, so remember how long the file was when we started.
         # Don't read beyond that point. The current contents of
@@ -351,26 +373,82 @@ class LogFile:
         # data, you must insure that nothing will be added to the log during
         # yield() calls.
 
+        # startLine and endLine (exclusive) select a range of lines, counted
+        # across all channels; block-compressed logs seek straight to the
+        # frame holding startLine, anything else is read from the start
+        ranged = startLine or endLine is not None
+
         f = self.getFile()
+        offset = 0
+        line = 0
+        if startLine and hasattr(f, 'findLine'):
+            offset, line = f.findLine(startLine)
         if not self.finished:
-            offset = 0
             f.seek(0, 2)
-            remaining = f.tell()
+            remaining = f.tell() - offset
         else:
-            offset = 0
             remaining = None
 
         leftover = None
-        if self.runEntries and (not channels or
+        if self.runEntries and (ranged or not channels or
                                 (self.runEntries[0][0] in channels)):
             leftover = (self.runEntries[0][0],
                         "".join([c[1] for c in self.runEntries]))
 
         # freeze the state of the LogFile by passing a lot of parameters into
         # a generator
+        if ranged:
+            chunks = self._generateChunks(f, offset, remaining, leftover,
+                                          [], False)
+            return self._generateLines(chunks, line, startLine, endLine,
+                                       channels, onlyText)
         return self._generateChunks(f, offset, remaining, leftover,
                                     channels, onlyText)
 
+    def _generateLines(self, chunks, line, startLine, endLine,
+                       channels, onlyText):
+        # 'line' is the number of the line in progress at the first chunk
+        for channel, text in chunks:
+            if endLine is not None and line >= endLine:
+                break
+            first = line
+            line += text.count("\n")
+            if line < startLine:
+                continue
+            if first < startLine:
+                text = text[_afterNewlines(text, startLine - first):]
+                first = startLine
+            if endLine is not None and line >= endLine:
+                text = text[:_afterNewlines(text, endLine - first)]
+            if not text or (channels and channel not in channels):
+                continue
+            if onlyText:
+                yield text
+            else:
+                yield (channel, text)
+
+    def getLineCount(self):
+        """
+        Return the number of newlines in this logfile, across all channels.
+        This is read from the index of a block-compressed log, and counted
+        otherwise.
+
+        @returns: integer
+        """
+        f = self.getFile()
+        if self.finished and hasattr(f, 'lineCount'):
+            return f.lineCount
+        return sum(text.count("\n")
+                   for text in self.getChunks(onlyText=True))
+
+    def getTail(self, lines, channels=[], onlyText=False):
+        """
+        Like L{getChunks}, but only generate the last C{lines} lines of the
+        log (plus any unterminated line following them).
+        """
+        startLine = max(0, self.getLineCount() - lines)
+        return self.getChunks(channels, onlyText, startLine=startLine)
+
     def _generateChunks(self, f, offset, remaining, leftover,
                         channels, onlyText):
         chunks = []
@@ -441,6 +519,22 @@ class LogFile:
         channel = self.runEntries[0][0]
         text = "".join([c[1] for c in self.runEntries])
         assert channel < 10, "channel number must be a single decimal digit"
+        if self.writer:
+            self.runEntries = []
+            self.runLength = 0
+            data = []
+            offset = 0
+            while offset < len(text):
+                size = min(len(text)-offset, self.chunkSize)
+                data.append("%d:%d" % (1 + size, channel))
+                data.append(text[offset:offset+size])
+                data.append(",")
+                offset += size
+            data = "".join(data)
+            self.unflushed.append(data)
+            self.unflushedSize += len(data)
+            self.writer.write(self, self.openfile, data)
+            return
         f = self.openfile
         f.seek(0, 2)
         offset = 0
@@ -453,6 +547,40 @@ class LogFile:
         self.runEntries = []
         self.runLength = 0
 
+    def _flushed(self, nbytes, nitems):
+        # called by the LogWriter when the oldest nitems merged chunks are
+        # on disk
+        del self.unflushed[:nitems]
+        self.unflushedSize -= nbytes
+        self.flushedSize += nbytes
+        if not self.unflushed:
+            waiters, self.flushWaiters = self.flushWaiters, []
+            if self.finished:
+                # everything is on disk; read it like any other log
+                self.writer = None
+            for d in waiters:
+                d.callback(self)
+
+    def waitUntilFlushed(self):
+        """
+        Return a Deferred that fires when everything added to this logfile
+        so far has been written to disk.
+        """
+        if not self.writer or not self.unflushed:
+            return defer.succeed(self)
+        d = defer.Deferred()
+        self.flushWaiters.append(d)
+        return d
+
+    def getEncodedSize(self):
+        """
+        Return the size of this logfile's on-disk encoding, counting data
+        that is still waiting to be written.
+        """
+        if self.writer:
+            return self.flushedSize + self.unflushedSize
+        return os.path.getsize(self.getFilename())
+
     def addEntry(self, channel, text, _no_watchers=False):
         """
         Add an entry to the logfile.  The C{channel} is one of L{STDOUT},
@@ -573,12 +701,19 @@ class LogFile:
             self.tailBuffer = []
 
         if self.openfile:
-            # we don't do an explicit close, because there might be readers
-            # shareing the filehandle. As soon as they stop reading, the
-            # filehandle will be released and automatically closed.
-            self.openfile.flush()
+            if self.writer:
+                # nobody else reads from the writer's filehandle
+                self.writer.close(self, self.openfile)
+            else:
+                # we don't do an explicit close, because there might be
+                # readers shareing the filehandle. As soon as they stop
+                # reading, the filehandle will be released and automatically
+                # closed.
+                self.openfile.flush()
             self.openfile = None
         self.finished = True
+        if self.writer and not self.unflushed:
+            self.writer = None
         watchers = self.finishedWatchers
         self.finishedWatchers = []
         for w in watchers:
@@ -593,11 +728,22 @@ class LogFile:
             compressed = self.getFilename() + ".bz2.tmp"
         elif logCompressionMethod == "gz":
             compressed = self.getFilename() + ".gz.tmp"
+        elif logCompressionMethod == "blocks":
+            compressed = self.getFilename() + ".blk.tmp"
         else:
             return defer.succeed(None)
+        compressedIndex = self.getFilename() + ".blk" + INDEX_SUFFIX + ".tmp"
 
         def _compressLog():
             infile = self.getFile()
+            if logCompressionMethod == "blocks":
+                # frames only ever end between netstrings, so readers can
+                # start parsing at any frame
+                cf = BlockFileWriter(compressed, compressedIndex)
+                for record in _splitNetstrings(infile):
+                    cf.write(record)
+                cf.close()
+                return
             if logCompressionMethod == "bz2":
                 cf = BZ2File(compressed, 'w')
             elif logCompressionMethod == "gz":
@@ -609,29 +755,39 @@ class LogFile:
                 if len(buf) < bufsize:
                     break
             cf.close()
-        d = threads.deferToThread(_compressLog)
+        # the plain file is only complete once the writer is done with it
+        d = self.waitUntilFlushed()
+        d.addCallback(lambda _ : threads.deferToThread(_compressLog))
 
         def _renameCompressedLog(rv):
             if logCompressionMethod == "bz2":
                 filename = self.getFilename() + '.bz2'
-            else:
+            elif logCompressionMethod == "gz":
                 filename = self.getFilename() + '.gz'
-            if runtime.platformType  == 'win32':
-                # windows cannot rename a file on top of an existing one, so
-                # fall back to delete-first. There are ways this can fail and
-                # lose the builder's history, so we avoid using it in the
-                # general (non-windows) case
-                if os.path.exists(filename):
-                    os.unlink(filename)
-            if not os.path.exists(filename):
-                os.rename(compressed, filename)
+            else:
+                filename = self.getFilename() + '.blk'
+            renames = [(compressed, filename)]
+            if logCompressionMethod == "blocks":
+                # move the index first, so that a visible .blk always has one
+                renames.insert(0, (compressedIndex, filename + INDEX_SUFFIX))
+            for src, dst in renames:
+                if runtime.platformType  == 'win32':
+                    # windows cannot rename a file on top of an existing one,
+                    # so fall back to delete-first. There are ways this can
+                    # fail and lose the builder's history, so we avoid using
+                    # it in the general (non-windows) case
+                    if os.path.exists(dst):
+                        os.unlink(dst)
+                if not os.path.exists(dst):
+                    os.rename(src, dst)
             _tryremove(self.getFilename(), 1, 5)
         d.addCallback(_renameCompressedLog)
 
         def _cleanupFailedCompress(failure):
             log.msg("failed to compress %s" % self.getFilename())
-            if os.path.exists(compressed):
-                _tryremove(compressed, 1, 5)
+            for tmp in (compressed, compressedIndex):
+                if os.path.exists(tmp):
+                    _tryremove(tmp, 1, 5)
             failure.trap() # reraise the failure
         d.addErrback(_cleanupFailedCompress)
         return d
@@ -650,6 +806,10 @@ class LogFile:
         d['entries'] = []  # let 0.6.4 tolerate the saved log. TODO: really?
         self.deleteKey('finished', d)
         self.deleteKey('openfile', d)
+        # anything not yet flushed will be on disk when this is loaded
+        for key in ('writer', 'unflushed', 'unflushedSize', 'flushedSize',
+                    'flushWaiters'):
+            self.deleteKey(key, d)
 
     def __getstate__(self):
         d = self.__dict__.copy()
@@ -698,6 +858,110 @@ class HTMLLogFile(styles.Versioned, LogFile):
                 self.wasUpgraded = True
 
 
+class _WriteBehindFile(object):
+    """
+    A read-only file object over a logfile whose writes are being queued by
+    a L{LogWriter}: the bytes the writer has reported as written, followed by
+    those it has not.  Only use this from the reactor thread.
+    """
+
+    def __init__(self, logfile):
+        self.logfile = logfile
+        self.f = open(logfile.getFilename(), "r")
+        self.pos = 0
+
+    def close(self):
+        self.f.close()
+
+    def tell(self):
+        return self.pos
+
+    def _size(self):
+        return self.logfile.flushedSize + self.logfile.unflushedSize
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self._size()
+        self.pos = max(0, offset)
+
+    def read(self, size=-1):
+        logfile = self.logfile
+        if size is None or size < 0:
+            size = self._size() - self.pos
+        result = []
+        if size > 0 and self.pos < logfile.flushedSize:
+            # the file may hold more than this, but only this much is
+            # known to be complete
+            self.f.seek(self.pos)
+            data = self.f.read(min(size, logfile.flushedSize - self.pos))
+            result.append(data)
+            self.pos += len(data)
+            size -= len(data)
+        start = logfile.flushedSize
+        for data in logfile.unflushed:
+            if size <= 0:
+                break
+            end = start + len(data)
+            if self.pos < end:
+                piece = data[self.pos-start:self.pos-start+size]
+                result.append(piece)
+                self.pos += len(piece)
+                size -= len(piece)
+            start = end
+        return "".join(result)
+
+
+def _afterNewlines(text, count):
+    """Return the index just past the C{count}th newline in C{text}"""
+    pos = 0
+    for _ in xrange(count):
+        pos = text.index("\n", pos) + 1
+    return pos
+
+
+def _splitNetstrings(f, bufsize=1024*1024):
+    """Read C{f} and generate its netstrings, still encoded.  Anything that
+    does not parse as a netstring is passed through as-is."""
+    buf = ""
+    malformed = False
+    while True:
+        data = f.read(bufsize)
+        if malformed:
+            if not data:
+                return
+            yield data
+            continue
+        buf += data
+        pos = 0
+        while True:
+            colon = buf.find(":", pos, pos + 21)
+            if colon < 0 and len(buf) - pos <= 20:
+                break
+            try:
+                if colon < 0:
+                    raise ValueError
+                size = int(buf[pos:colon])
+                if size < 0:
+                    raise ValueError
+            except ValueError:
+                malformed = True
+                break
+            end = colon + size + 2
+            if end > len(buf):
+                break
+            yield buf[pos:end]
+            pos = end
+        buf = buf[pos:]
+        if malformed or not data:
+            if buf:
+                yield buf
+            buf = ""
+            if not data:
+                return
+
+
 def _tryremove(filename, timeout, retries):
     """Try to remove a file, and if failed, try again in timeout.
     Increases the timeout by a factor of 4, and only keeps trying for
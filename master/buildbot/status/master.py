@@ -15,7 +15,7 @@
 
 from __future__ import with_statement
 
-import os, urllib
+import os, urllib, heapq
 from cPickle import load
 from twisted.python import log
 from twisted.persisted import styles
@@ -27,9 +27,59 @@ from buildbot.status.web.base import getCodebasesArg, _revlinkcfg
 from buildbot.util import bbcollections
 from buildbot.util.eventual import eventually
 from buildbot.changes import changes
-from buildbot.status import buildset, builder, buildrequest
+from buildbot.status import buildset, builder, buildrequest, retention, \
+        globalstatus
 from buildbot.status.results import RETRY
 
+class FinishedBuildsMerge(object):
+    """
+    Merge the finished builds of several builders, latest finished first.
+
+    C{sources} are L{buildbot.status.builder.FinishedBuildsIterator}s, or
+    anything else with a C{next()} method returning a Deferred that fires
+    with the next build or None.  Like them, C{next()} returns a Deferred
+    that fires with the next build or None, and must not be called again
+    before it has fired.  A source is only advanced when its build has been
+    produced.
+    """
+
+    def __init__(self, sources, num_builds=None):
+        self.sources = sources
+        self.num_builds = num_builds
+        self.got = 0
+        self.heap = None
+        # the source whose build was produced last
+        self.taken = None
+
+    def _push(self, i, build):
+        if build is not None:
+            heapq.heappush(self.heap, (-build.getTimes()[1], -i, build))
+
+    @defer.inlineCallbacks
+    def next(self):
+        if self.num_builds is not None and self.got >= self.num_builds:
+            defer.returnValue(None)
+            return
+
+        if self.heap is None:
+            self.heap = []
+            builds = yield defer.gatherResults(
+                    [s.next() for s in self.sources], consumeErrors=True)
+            for i, build in enumerate(builds):
+                self._push(i, build)
+        elif self.taken is not None:
+            build = yield self.sources[self.taken].next()
+            self._push(self.taken, build)
+        self.taken = None
+
+        if not self.heap:
+            defer.returnValue(None)
+            return
+        finished, i, build = heapq.heappop(self.heap)
+        self.taken = -i
+        self.got += 1
+        defer.returnValue(build)
+
 class Status(config.ReconfigurableServiceMixin, service.MultiService):
     implements(interfaces.IStatus)
 
@@ -46,6 +96,15 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         self._buildreq_observers = bbcollections.KeyedSets()
         self._buildset_finished_waiters = bbcollections.KeyedSets()
         self.rev_url_func = None
+        self.retention = retention.RetentionEngine()
+        # the header counters of the web pages; no builders have been added
+        # yet, so there is nothing to announce to it
+        self.globalStatus = globalstatus.GlobalStatus(self)
+        self.watchers.append(self.globalStatus)
+        # slavename -> names of the builders it is attached to, and the
+        # botmaster's list of builder names it was built from
+        self._slaveBuilders = None
+        self._slaveBuildersKey = None
 
     # service management
 
@@ -99,7 +158,9 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         self._build_request_sub.unsubscribe()
         self._change_sub.unsubscribe()
 
-        return service.MultiService.stopService(self)
+        d = self.retention.stop()
+        d.addCallback(lambda _ : service.MultiService.stopService(self))
+        return d
 
     # clean shutdown
 
@@ -282,6 +343,21 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
                 l.append(name)
         return util.naturalSort(l)
 
+    def getBuilderNamesForSlave(self, slavename):
+        # the botmaster replaces its list of builder names on reconfig
+        if self._slaveBuilders is None or \
+                self._slaveBuildersKey is not self.botmaster.builderNames:
+            self._slaveBuildersKey = self.botmaster.builderNames
+            index = {}
+            for bname in self.getBuilderNames():
+                for sname in self.getBuilder(bname).slavenames:
+                    index.setdefault(sname, []).append(bname)
+            self._slaveBuilders = index
+        return self._slaveBuilders.get(slavename, [])
+
+    def slavenamesChanged(self):
+        self._slaveBuilders = None
+
     def getBuilder(self, name):
         """
         @rtype: L{BuilderStatus}
@@ -340,59 +416,105 @@ class Status(config.ReconfigurableServiceMixin, service.MultiService):
         sorted_builds = sorted(all_builds, key=lambda build: build.started, reverse=True)
         defer.returnValue(sorted_builds)
 
+    @defer.inlineCallbacks
+    def generateLatestBuildsAsync(self, builders, branches=[], codebases={},
+                                  num_builds=1, results=None, useCache=False):
+        """
+        Like calling L{BuilderStatus.generateFinishedBuildsAsync} on each of
+        C{builders}, but the build numbers of all builders that can't be
+        served from their latest build cache are looked up together: first
+        in the latest builds table, then, for the builders it doesn't know
+        about, in a single query over the builds.
+
+        @returns: dictionary mapping builder name to list of builds, via
+        Deferred
+        """
+        sourcestamps, results_filter = builder.lastBuildsFilter(codebases, branches, results)
+
+        # builders the latest builds table can answer for, grouped by key
+        keys = {}
+        uncached = []
+        for bs in builders:
+            key = bs.getLatestBuildKey(codebases)
+            if bs.shouldUseLatestBuildCache(useCache, num_builds, key):
+                continue
+            if bs.shouldUseLatestBuildTable(useCache, num_builds, key):
+                keys.setdefault(key, []).append(bs.getName())
+            else:
+                uncached.append(bs.getName())
+
+        latestNumbers = {}
+        for key, names in keys.iteritems():
+            numbers = yield self.master.db.builds.getLatestBuildNumbers(names, key,
+                                                                        results=results_filter)
+            latestNumbers.update(numbers)
+            uncached.extend(n for n in names if n not in numbers)
+
+        lastBuilds = {}
+        if uncached:
+            lastBuilds = yield self.master.db.builds.getLastBuildsNumbersForBuilders(
+                buildernames=uncached,
+                sourcestamps=sourcestamps,
+                results=results_filter,
+                num_builds=builder.lastBuildsSearchSize(num_builds))
+
+        defers = []
+        for bs in builders:
+            d = bs.generateFinishedBuildsAsync(branches=branches, codebases=codebases,
+                                               num_builds=num_builds, results=results,
+                                               useCache=useCache,
+                                               buildNumbers=lastBuilds.get(bs.getName()),
+                                               latestBuildNumber=latestNumbers.get(bs.getName()))
+            defers.append((bs.getName(), d))
+
+        latestBuilds = {}
+        for name, d in defers:
+            latestBuilds[name] = yield d
+
+        defer.returnValue(latestBuilds)
+
     def generateFinishedBuilds(self, builders=[], branches=[],
                                num_builds=None, finished_before=None,
                                max_search=200):
 
         builder_names = self.getBuildersConfigured(builders)
 
-        # 'sources' is a list of generators, one for each Builder we're
-        # using. When the generator is exhausted, it is replaced in this list
-        # with None.
-        sources = []
-        for bn in builder_names:
+        # 'heap' holds the next build of each Builder we're using, latest
+        # finished first, with the generator it came from. A generator is
+        # only advanced when its build has been produced, so each step costs
+        # O(log B) for B builders, and is dropped once it is exhausted.
+        heap = []
+        def push(i, g):
+            for build in g:
+                heapq.heappush(heap, (-build.getTimes()[1], -i, build, g))
+                return
+
+        for i, bn in enumerate(builder_names):
             b = self.getBuilder(bn)
-            g = b.generateFinishedBuilds(branches,
-                                         finished_before=finished_before,
-                                         max_search=max_search)
-            sources.append(g)
-
-        # next_build the next build from each source
-        next_build = [None] * len(sources)
-
-        def refill():
-            for i,g in enumerate(sources):
-                if next_build[i]:
-                    # already filled
-                    continue
-                if not g:
-                    # already exhausted
-                    continue
-                try:
-                    next_build[i] = g.next()
-                except StopIteration:
-                    next_build[i] = None
-                    sources[i] = None
+            push(i, b.generateFinishedBuilds(branches,
+                                             finished_before=finished_before,
+                                             max_search=max_search))
 
         got = 0
-        while True:
-            refill()
-            # find the latest build among all the candidates
-            candidates = [(i, b, b.getTimes()[1])
-                          for i,b in enumerate(next_build)
-                          if b is not None]
-            candidates.sort(lambda x,y: cmp(x[2], y[2]))
-            if not candidates:
-                return
-
-            # and remove it from the list
-            i, build, finshed_time = candidates[-1]
-            next_build[i] = None
+        while heap:
+            finished, i, build, g = heapq.heappop(heap)
             got += 1
             yield build
             if num_builds is not None:
                 if got >= num_builds:
                     return
+            push(-i, g)
+
+    def iterFinishedBuildsAsync(self, builders=[], branches=[],
+                                codebases={}, num_builds=None,
+                                finished_before=None, max_search=200):
+        builder_names = self.getBuildersConfigured(builders)
+        sources = [self.getBuilder(bn).iterFinishedBuildsAsync(branches,
+                                codebases=codebases,
+                                finished_before=finished_before,
+                                max_search=max_search)
+                   for bn in builder_names]
+        return FinishedBuildsMerge(sources, num_builds=num_builds)
 
     def subscribe(self, target):
         self.watchers.append(target)
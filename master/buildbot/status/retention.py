@@ -0,0 +1,208 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Pruning of old builds and logfiles from the builders' build histories,
+away from the reactor thread.
+"""
+
+import time
+
+from twisted.internet import defer, reactor, threads
+from twisted.python import log, threadpool
+
+from buildbot.process import metrics
+
+class RetentionPolicy(object):
+    """
+    What to keep of a builder's history: the builds from C{earliest_build}
+    and the logfiles from C{earliest_log} (as computed from c['buildHorizon']
+    and c['logHorizon']), never touching the builds in C{keep}.
+
+    If C{maxAge} is given, the builds finished more than C{maxAge} seconds
+    ago are removed too, along with any builds older than them.  If
+    C{maxSize} is given, the oldest builds are removed until the history,
+    logfiles included, fits in C{maxSize} bytes.
+    """
+
+    def __init__(self, earliest_build, earliest_log, keep=(), maxAge=None,
+                 maxSize=None):
+        self.earliest_build = earliest_build
+        self.earliest_log = earliest_log
+        self.keep = list(keep)
+        self.maxAge = maxAge
+        self.maxSize = maxSize
+
+    def hasQuotas(self):
+        return self.maxAge is not None or self.maxSize is not None
+
+    def isEmpty(self):
+        return self.earliest_build <= 0 and not self.hasQuotas()
+
+    def getEarliestBuild(self, usage, now):
+        """
+        Return the number of the oldest build to keep, given the C{usage} of
+        the history as returned by its C{getUsage} method.
+        """
+        earliest = self.earliest_build
+        if self.maxAge is not None:
+            horizon = now - self.maxAge
+            for number, finished, size in reversed(usage):
+                if finished is not None and finished < horizon:
+                    earliest = max(earliest, number + 1)
+                    break
+        if self.maxSize is not None:
+            total = 0
+            for number, finished, size in reversed(usage):
+                total += size
+                if total > self.maxSize:
+                    earliest = max(earliest, number + 1)
+                    break
+        return earliest
+
+    def apply(self, history, now):
+        """
+        Prune C{history}.  This is a blocking method.
+
+        @returns: the number of bytes reclaimed
+        """
+        earliest_build = self.earliest_build
+        if self.hasQuotas():
+            earliest_build = self.getEarliestBuild(history.getUsage(), now)
+        earliest_log = max(self.earliest_log, earliest_build)
+        if earliest_build <= 0 and earliest_log <= 0:
+            return 0
+        return history.prune(earliest_build, earliest_log, keep=self.keep)
+
+class RetentionEngine(object):
+    """
+    Prune the builders' build histories in a bounded pool of threads, so
+    that the filesystem work never blocks the reactor.
+
+    Each builder is pruned by one thread at a time; a prune requested while
+    one is running for the same builder is queued, and replaced by any later
+    request, so a burst of finished builds costs at most two passes.
+
+    The bytes reclaimed and the duration of each pass are reported as the
+    C{RetentionEngine.reclaimed} count and the C{RetentionEngine.prune}
+    timer metrics.
+    """
+
+    maxWorkers = 4
+
+    def __init__(self):
+        self.pool = threadpool.ThreadPool(minthreads=0,
+                                          maxthreads=self.maxWorkers,
+                                          name='RetentionEngine')
+        self._shutdownTrigger = None
+        # builder name -> Deferred of the prune running for it
+        self.running = {}
+        # builder name -> (history, policy, waiting Deferreds)
+        self.queued = {}
+
+    def _startPool(self):
+        if self.pool.started:
+            return
+        self.pool.start()
+        self._shutdownTrigger = reactor.addSystemEventTrigger(
+                'during', 'shutdown', self._stopPool)
+
+    def _stopPool(self):
+        self._shutdownTrigger = None
+        self.pool.stop()
+
+    def stop(self):
+        """
+        Drop the queued prunes and stop the threads once the running ones
+        have finished.
+
+        @returns: Deferred
+        """
+        queued, self.queued = self.queued, {}
+        for history, policy, waiters in queued.itervalues():
+            for d in waiters:
+                d.callback(0)
+
+        d = defer.DeferredList(self.running.values())
+        @d.addCallback
+        def stopPool(_):
+            if self._shutdownTrigger is not None:
+                reactor.removeSystemEventTrigger(self._shutdownTrigger)
+                self._stopPool()
+        return d
+
+    def prune(self, name, history, policy):
+        """
+        Prune the build history C{history} of the builder C{name} according
+        to C{policy}.
+
+        @returns: Deferred firing with the number of bytes reclaimed
+        """
+        d = defer.Deferred()
+        if name in self.running:
+            waiters = []
+            if name in self.queued:
+                waiters = self.queued[name][2]
+            waiters.append(d)
+            self.queued[name] = (history, policy, waiters)
+        else:
+            self._run(name, history, policy, [d])
+        return d
+
+    def wait(self, name):
+        """
+        Wait for the running and queued prunes of the builder C{name}.
+
+        @returns: Deferred
+        """
+        d = defer.Deferred()
+        if name in self.queued:
+            self.queued[name][2].append(d)
+        elif name in self.running:
+            def fire(res):
+                d.callback(None)
+                return res
+            self.running[name].addBoth(fire)
+        else:
+            d.callback(None)
+        d.addCallback(lambda _ : None)
+        return d
+
+    def _pruneThd(self, history, policy):
+        start = time.time()
+        reclaimed = policy.apply(history, start)
+        return reclaimed, time.time() - start
+
+    def _run(self, name, history, policy, waiters):
+        self._startPool()
+        d = threads.deferToThreadPool(reactor, self.pool,
+                                      self._pruneThd, history, policy)
+        self.running[name] = d
+
+        def done(res):
+            del self.running[name]
+            reclaimed = 0
+            if isinstance(res, tuple):
+                reclaimed, elapsed = res
+                metrics.MetricCountEvent.log('RetentionEngine.reclaimed',
+                                             reclaimed)
+                metrics.MetricTimeEvent.log('RetentionEngine.prune', elapsed)
+            else:
+                log.err(res, "while pruning the build history of %s" % name)
+            for w in waiters:
+                w.callback(reclaimed)
+            if name in self.queued:
+                self._run(name, *self.queued.pop(name))
+        d.addBoth(done)
@@ -14,7 +14,9 @@
 # Copyright Buildbot Team Members
 
 import time
+from collections import deque
 from zope.interface import implements
+from twisted.python import log
 from buildbot import interfaces
 from buildbot.status.results import WARNINGS, EXCEPTION, FAILURE
 from buildbot.util.eventual import eventually
@@ -29,6 +31,8 @@ class SlaveStatus:
     connected = False
     graceful_shutdown = False
     friendly_name = None
+    # the number of finished builds the health is computed from
+    numRecentBuilds = 15
 
     def __init__(self, name):
         self.name = name
@@ -39,6 +43,10 @@ class SlaveStatus:
         self.master = None
         self.health = 0
         self.eid = -1
+        # (buildername, number, results, finish time) of the latest finished
+        # builds, newest first
+        self.recentBuilds = deque(maxlen=self.numRecentBuilds)
+        self._seeded = False
 
     def getName(self):
         return self.name
@@ -88,8 +96,10 @@ class SlaveStatus:
     def buildStarted(self, build):
         self.runningBuilds.append(build)
     def buildFinished(self, build):
-        self.updateHealth()
         self.runningBuilds.remove(build)
+        self.addRecentBuild(build.getBuilder().getName(), build.getNumber(),
+                            build.getResults(), build.getTimes()[1])
+        self.updateHealth()
 
     def getGraceful(self):
         """Return the graceful shutdown flag"""
@@ -112,34 +122,47 @@ class SlaveStatus:
 
     def getBuilders(self):
         status = self.master.status
-        my_builders = []
-        for bname in status.getBuilderNames():
-            b = status.getBuilder(bname)
-            for bs in b.getSlaves():
-                if bs.getName() == self.name:
-                    my_builders.append(b)
-
-        return my_builders
-
-    def getRecentBuilds(self, num_builds=15):
-        status = self.master.status
-        n = 0
-        my_builders = self.getBuilders()
-        recent_builds = []
-
-        for rb in status.generateFinishedBuilds(builders=[b.getName() for b in my_builders]):
-            if rb.getSlavename() == self.name:
-                n += 1
-                recent_builds.append(rb)
-                if n > num_builds:
-                    return recent_builds
-
-        return recent_builds
+        return [ status.getBuilder(bname)
+                 for bname in status.getBuilderNamesForSlave(self.name) ]
+
+    def addRecentBuild(self, buildername, number, results, finished):
+        self.recentBuilds.appendleft((buildername, number, results, finished))
+
+    def seedRecentBuilds(self):
+        """
+        Fill the recent builds from the database, once; the builds that
+        finish in the meantime are kept in front of those found there.
+        """
+        if self._seeded or self.master is None:
+            return
+        self._seeded = True
+
+        d = self.master.db.builds.getRecentBuildsBySlave(self.name,
+                                                         self.numRecentBuilds)
+        def seed(rows):
+            known = set((b[0], b[1]) for b in self.recentBuilds)
+            for row in rows:
+                if len(self.recentBuilds) == self.numRecentBuilds:
+                    break
+                if (row['buildername'], row['number']) not in known:
+                    self.recentBuilds.append((row['buildername'],
+                            row['number'], row['results'], row['finish_time']))
+            self.updateHealth()
+        d.addCallback(seed)
+        d.addErrback(log.err, 'while reading the recent builds of %s'
+                                % self.name)
+
+    def getRecentBuilds(self):
+        """
+        Return the latest finished builds as (buildername, number, results,
+        finish time) tuples, newest first.
+        """
+        self.seedRecentBuilds()
+        return list(self.recentBuilds)
 
     def updateHealth(self):
-        num_builds = 15
         health = 0
-        builds = self.getRecentBuilds(num_builds)
+        builds = self.recentBuilds
 
         if len(builds) == 0:
             self.health = 0
@@ -148,7 +171,8 @@ class SlaveStatus:
         build_weight = 1.0 / len(builds)
 
         for b in builds:
-            if b.getResults() != FAILURE and b.getResults() != WARNINGS and b.getResults() != EXCEPTION:
+            results = b[2]
+            if results != FAILURE and results != WARNINGS and results != EXCEPTION:
                 health += build_weight
 
         if health >= 0.8:
@@ -175,6 +199,7 @@ class SlaveStatus:
         builds = sorted(builds, key=lambda b: b['isWaiting'])
         result['runningBuilds'] = builds
         result['lastMessage'] = self.lastMessageReceived()
+        self.seedRecentBuilds()
         result['health'] = self.health
         result['eid'] = self.eid
         return result
@@ -31,6 +31,7 @@ Implements the HTTP receiver."""
 
 import datetime
 import os
+import time
 import urllib
 import urlparse
 
@@ -545,7 +546,10 @@ class AutobahnStatusPush(StatusPush):
 
         while True:
             items = self.queue.popChunk(chunkSize)
-            item_data = {"cmd": "krtPushData", "data": items, "server": self.status.getBuildbotURL()}
+            # 'sent' lets the autobahn server measure its fan-out latency
+            item_data = {"cmd": "krtPushData", "data": items,
+                         "server": self.status.getBuildbotURL(),
+                         "sent": time.time()}
 
             if self.debug:
                 packets = json.dumps(item_data, indent=2, sort_keys=True)
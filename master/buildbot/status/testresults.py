@@ -0,0 +1,408 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Summaries of the NUnit, nose and JUnit XML test reports that steps attach as
+HTML logs.
+
+A report is parsed once, with iterparse, so that only the test case being
+read is ever held as a tree.  The results are written next to the log: each
+normalised test case is pickled in turn to C{<log>.results.dat}, and
+C{<log>.results} holds the summary, the per-suite counts and the offsets of
+the test cases in the order they are displayed, so that a page of results
+can be read without loading the others.
+"""
+
+from __future__ import with_statement
+
+import os
+from cPickle import dump, load, HIGHEST_PROTOCOL
+from cStringIO import StringIO
+from xml.etree import cElementTree as ElementTree
+
+from twisted.internet import defer, threads
+from twisted.python import log
+
+NUNIT, NOSE, JUNIT = range(3)
+
+INDEX_SUFFIX = ".results"
+DATA_SUFFIX = ".results.dat"
+
+INDEX_VERSION = 1
+
+def isTestResults(text):
+    """
+    Return true if the contents of an HTML log look like an XML test report.
+    """
+    return 'xml-stylesheet' in text or 'nosetests' in text
+
+def indexFilename(logfile):
+    return logfile.getFilename() + INDEX_SUFFIX
+
+def hasIndex(logfile):
+    return os.path.exists(indexFilename(logfile))
+
+def etree_to_dict(t):
+    d = {t.tag: map(etree_to_dict, list(t))}
+    d.update((k, v) for k, v in t.attrib.iteritems())
+    d['text'] = t.text
+    return d
+
+def test_result_to_status(test, xml_type):
+    if xml_type is NUNIT:
+        if test['executed'].lower() == "true" and ('success' in test and test['success'].lower() == "true"):
+            return ("passed", "Pass")
+        if test['executed'].lower() == "true" and ('result' in test and test['result'].lower() == "inconclusive"):
+            return "inconclusive", "Inconclusive"
+        elif ('ignored' in test and test['ignored'].lower() == "true") \
+                or ('result' in test and test['result'].lower() == "ignored"):
+            return "ignored", "Ignored"
+        elif test['executed'].lower() == "false":
+            return "skipped", "Skipped"
+        else:
+            return "failed", "Failure"
+    elif xml_type is NOSE:
+        if test.has_key("testcase") and len(test["testcase"]) > 0 and test["testcase"][0].has_key("error"):
+            return "failed", "Failure"
+        return "passed", "Pass"
+    elif xml_type is JUNIT:
+        if test.has_key("testcase") and len(test["testcase"]) > 0 and test["testcase"][0].has_key("failure"):
+            return "failed", "Failure"
+        return "passed", "Pass"
+
+def test_result_xml_to_dict(test, xml_type):
+    result = {'result': test_result_to_status(test, xml_type)[1]}
+
+    if test.has_key('time'):
+        result['time'] = float(test['time'])
+    if test.has_key('name'):
+        result['name'] = test['name']
+    if test.has_key('success'):
+        result['success'] = test['success']
+
+    failure_text = []
+    if test.has_key("test-case"):
+        for ft in test['test-case']:
+            if ft.has_key('reason'):
+                failure_text = ft['reason']
+            if ft.has_key('failure'):
+                failure_text = ft['failure']
+
+    if xml_type is NOSE:
+        if test.has_key("testcase") and len(test["testcase"]) > 0 and test["testcase"][0].has_key("error"):
+            result["success"] = "false"
+            failure_text = [{"text": test["testcase"][0]["message"]}]
+        else:
+            result["success"] = "true"
+
+    if xml_type is JUNIT:
+        if test.has_key("testcase") and len(test["testcase"]) > 0 and test["testcase"][0].has_key("failure"):
+            result["success"] = "false"
+            failure_text = [{"text": test["testcase"][0]["text"]}]
+        else:
+            result["success"] = "true"
+
+    result['failure_text'] = failure_text
+
+    return result
+
+def test_dict():
+    return {'time': 0,
+            'tests': 0,
+            'passed': 0,
+            'failed': 0,
+            'ignored': 0,
+            'inconclusive': 0,
+            'skipped': 0,
+            'results': [],
+            'name': "???"}
+
+def summarize(attrs, total, time_count):
+    """
+    Return the summary of a report from the counts in the attributes of its
+    root suite, the number of test cases and their total time.
+    """
+    def count(name):
+        return int(attrs.get(name, 0))
+
+    failed = count('failures') + count('errors')
+    ignored = count('ignored')
+    skipped = count('skipped')
+    inconclusive = count('inconclusive')
+
+    if skipped == 0 and 'skipped' not in attrs:
+        skipped = count('not-run')
+
+    success = (total - failed - inconclusive - skipped - ignored)
+
+    success_per = 0
+    if success != 0 and total != 0:
+        success_per = (float(success) / float(total)) * 100.0
+
+    return {
+        'total': total,
+        'success': success,
+        'success_rate': success_per,
+        'failed': failed,
+        'ignored': ignored,
+        'skipped': skipped,
+        'inconclusive': inconclusive,
+        'time': time_count
+    }
+
+class _DeclarationFixer(object):
+    """
+    Report producers write the XML declaration of the document they would
+    have written to a file, but the log holds it as utf-8.  Correct the
+    declaration in the first block read from C{fp}.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.first = True
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        if self.first:
+            self.first = False
+            data = data.replace("utf-16", "utf-8")
+        return data
+
+def parseTestResults(fp, write):
+    """
+    Parse the XML report read from C{fp}, calling C{write(key, result,
+    failed)} with each normalised test case in document order, where C{key}
+    identifies the suite the test case belongs to.  This is a blocking
+    function.
+
+    @returns: tuple (summary, list of (key, suite)), the suites in the order
+    of their first test case and without their results
+    """
+    events = ElementTree.iterparse(_DeclarationFixer(fp),
+                                   events=('start', 'end'))
+    xml_type = None
+    summary_attrs = {}
+    first_junit_suite = False
+    suites = {}
+    suite_keys = []
+    # [name, suite key] of the enclosing NUnit test-suite elements
+    nunit_suites = []
+    # the open elements; each one is removed from its parent once it has
+    # been read, so the tree never grows beyond the current test case
+    stack = []
+    in_test = 0
+    total = 0
+    time_count = 0
+
+    for event, elem in events:
+        if event == 'start':
+            if not stack:
+                if elem.tag == 'testsuite' and elem.get('name') == 'nosetests':
+                    xml_type = NOSE
+                elif 'testsuite' in elem.tag:
+                    xml_type = JUNIT
+                    first_junit_suite = elem.tag == 'testsuites'
+                else:
+                    xml_type = NUNIT
+                summary_attrs = dict(elem.attrib)
+            elif xml_type is JUNIT and elem.tag == 'testsuite' \
+                    and first_junit_suite:
+                # the counts of a junit report are those of its first suite
+                summary_attrs = dict(elem.attrib)
+                first_junit_suite = False
+            elif xml_type is NUNIT and elem.tag == 'test-suite':
+                nunit_suites.append([elem.get('name', "???"), None])
+            if elem.tag in ('test-case', 'testcase'):
+                in_test += 1
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag in ('test-case', 'testcase'):
+            in_test -= 1
+        if in_test:
+            # part of a test case, converted along with it
+            continue
+        if stack:
+            stack[-1].remove(elem)
+
+        if xml_type is NUNIT:
+            if elem.tag == 'test-suite':
+                nunit_suites.pop()
+                continue
+            if elem.tag != 'test-case' or not nunit_suites:
+                continue
+            enclosing = nunit_suites[-1]
+            if enclosing[1] is None:
+                enclosing[1] = len(suite_keys)
+                suite = test_dict()
+                suite['name'] = enclosing[0]
+                suite_keys.append(enclosing[1])
+                suites[enclosing[1]] = suite
+            key = enclosing[1]
+            test = etree_to_dict(elem)
+        else:
+            if elem.tag != 'testcase':
+                continue
+            test = etree_to_dict(elem)
+            key = test.get('classname')
+            if key not in suites:
+                suite = test_dict()
+                suite['name'] = key
+                suite_keys.append(key)
+                suites[key] = suite
+
+        status = test_result_to_status(test, xml_type)[0]
+        result = test_result_xml_to_dict(test, xml_type)
+        suite = suites[key]
+        suite[status] += 1
+        suite['tests'] += 1
+        t = result.get('time', 0)
+        suite['time'] += t
+        time_count += t
+        total += 1
+        write(key, result, status == 'failed')
+
+    for suite in suites.itervalues():
+        del suite['results']
+        suite['tests_length'] = suite['tests']
+    summary = summarize(summary_attrs, total, time_count)
+    return summary, [ (k, suites[k]) for k in suite_keys ]
+
+def writeIndex(fp, filename):
+    """
+    Parse the XML report read from C{fp} and write its index to C{filename}
+    and its results to the data file next to it.  This is a blocking
+    function.
+    """
+    datafilename = filename[:-len(INDEX_SUFFIX)] + DATA_SUFFIX
+    offsets = {}
+    failed = set()
+    error = None
+    with open(datafilename + ".tmp", "wb") as data:
+        def write(key, result, isFailure):
+            offset = data.tell()
+            offsets.setdefault(key, []).append(offset)
+            if isFailure:
+                failed.add(offset)
+            dump(result, data, HIGHEST_PROTOCOL)
+        try:
+            summary, suites = parseTestResults(fp, write)
+        except (ElementTree.ParseError, SyntaxError), e:
+            log.msg("Error with parsing XML: %s" % (e,))
+            summary, suites = None, []
+            error = str(e)
+
+    order = []
+    suite_list = []
+    for i, (key, suite) in enumerate(suites):
+        suite_list.append(suite)
+        order.extend((i, offset) for offset in offsets[key])
+    index = {
+        'version': INDEX_VERSION,
+        'summary': summary,
+        'suites': suite_list,
+        'order': order,
+        'failed': [ (i, offset) for i, offset in order if offset in failed ],
+        'error': error,
+    }
+    os.rename(datafilename + ".tmp", datafilename)
+    with open(filename + ".tmp", "wb") as f:
+        dump(index, f, HIGHEST_PROTOCOL)
+    os.rename(filename + ".tmp", filename)
+
+class TestResultsIndex(object):
+    """
+    The precomputed summary of a test report.
+
+    @ivar summary: the totals of the report, or None if it could not be
+    parsed
+    @ivar suites: list of suite dictionaries, without their results
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.datafilename = filename[:-len(INDEX_SUFFIX)] + DATA_SUFFIX
+        with open(filename, "rb") as f:
+            index = load(f)
+        self.summary = index['summary']
+        self.suites = index['suites']
+        self.error = index['error']
+        self._order = index['order']
+        self._failed = index['failed']
+
+    def countResults(self, failedOnly=False):
+        if failedOnly:
+            return len(self._failed)
+        return len(self._order)
+
+    def getSuites(self, start=0, count=None, failedOnly=False):
+        """
+        Return the suites of the C{count} test cases from C{start}, in
+        display order, each with the results of those test cases only.
+        """
+        entries = self._failed if failedOnly else self._order
+        if count is None:
+            entries = entries[start:]
+        else:
+            entries = entries[start:start + count]
+        suites = []
+        if not entries:
+            return suites
+        with open(self.datafilename, "rb") as f:
+            for i, offset in entries:
+                if not suites or suites[-1][0] != i:
+                    suite = self.suites[i].copy()
+                    suite['results'] = []
+                    suites.append((i, suite))
+                f.seek(offset)
+                suites[-1][1]['results'].append(load(f))
+        return [ s for i, s in suites ]
+
+_indexing = {}
+
+def indexLog(logfile, text=None):
+    """
+    Write the index of the XML report in C{logfile} in a thread, unless it
+    has already been written.  If C{text} is not given, the contents of the
+    log are read.
+
+    @returns: Deferred firing with a L{TestResultsIndex}
+    """
+    filename = indexFilename(logfile)
+    if filename in _indexing:
+        d = defer.Deferred()
+        _indexing[filename].append(d)
+        return d
+    if os.path.exists(filename):
+        return threads.deferToThread(TestResultsIndex, filename)
+
+    if text is None:
+        text = logfile.getText()
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+
+    def build():
+        writeIndex(StringIO(text), filename)
+        return TestResultsIndex(filename)
+    waiters = _indexing[filename] = []
+    d = threads.deferToThread(build)
+    def notify(res):
+        del _indexing[filename]
+        for w in waiters:
+            w.callback(res)
+        return res
+    d.addBoth(notify)
+    return d
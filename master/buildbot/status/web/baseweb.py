@@ -39,7 +39,7 @@ from buildbot.status.web.buildqueue import BuildQueueResource
 from buildbot.status.web.buildstatus import BuildStatusStatusResource
 from buildbot.status.web.slaves import BuildSlavesResource
 from buildbot.status.web.loginkatana import LoginKatanaResource, LogoutKatanaResource
-from buildbot.status.web.status_json import JsonStatusResource
+from buildbot.status.web.status_json import JsonStatusResource, JsonResponseCache
 from buildbot.status.web.about import AboutBuildbot
 from buildbot.status.web.projects import ProjectsResource
 from buildbot.status.web.authz import Authz
@@ -175,7 +175,8 @@ class WebStatus(service.MultiService):
                  num_events=200, num_events_max=None, auth=None,
                  order_console_by_time=False, changecommentlink=None, projects=None, repositories=None,
                  authz=None, logRotateLength=None, maxRotatedFiles=None,
-                 change_hook_dialects = {}, provide_feeds=None, jinja_loaders=None):
+                 change_hook_dialects = {}, provide_feeds=None, jinja_loaders=None,
+                 json_cache_size=100):
         """Run a web server that provides Buildbot status.
 
         @type  http_port: int or L{twisted.application.strports} string
@@ -293,6 +294,11 @@ class WebStatus(service.MultiService):
         @type  jinja_loaders: None or list
         @param jinja_loaders: If not empty, a list of additional Jinja2 loader
                               objects to search for templates.
+
+        @type  json_cache_size: int
+        @param json_cache_size: number of responses of the json feed to keep
+                                and serve until a status event invalidates
+                                them; 0 disables the cache.
         """
 
         service.MultiService.__init__(self)
@@ -372,6 +378,12 @@ class WebStatus(service.MultiService):
 
         self.jinja_loaders = jinja_loaders
 
+        # serialized responses of the json feed, kept up to date by
+        # subscribing to status events
+        self.jsonCache = None
+        if "json" in self.provide_feeds and json_cache_size:
+            self.jsonCache = JsonResponseCache(json_cache_size)
+
     def setupUsualPages(self, numbuilds, num_events, num_events_max):
         #self.putChild("", IndexOrWaterfallRedirection())
         self.putChild("waterfall", WaterfallStatusResource(num_events=num_events,
@@ -473,6 +485,17 @@ class WebStatus(service.MultiService):
 
         service.MultiService.setServiceParent(self, parent)
 
+        if self.jsonCache:
+            parent.subscribe(self.jsonCache)
+
+    def disownServiceParent(self):
+        if self.jsonCache:
+            self.parent.unsubscribe(self.jsonCache)
+            for builder_status in self.jsonCache.watched:
+                builder_status.unsubscribe(self.jsonCache)
+            self.jsonCache.watched = []
+        return service.MultiService.disownServiceParent(self)
+
     def setupSite(self):
         # this is responsible for creating the root resource. It isn't done
         # at __init__ time because we need to reference the parent's basedir.
@@ -14,6 +14,8 @@
 # Copyright Buildbot Team Members
 
 
+import urllib
+
 from zope.interface import implements
 from twisted.python import components
 from twisted.spread import pb
@@ -21,7 +23,7 @@ from twisted.web import server
 from twisted.web.resource import Resource, NoResource
 
 from buildbot import interfaces, version
-from buildbot.status import logfile
+from buildbot.status import logfile, testresults
 from buildbot.status.logfile import HTMLLogFile
 from buildbot.status.web.base import IHTMLLog, HtmlResource, getCodebasesArg, ContextMixin, \
     path_to_codebases, path_to_build, path_to_builder, path_to_builders
@@ -107,6 +109,38 @@ class TextLog(Resource, ContextMixin):
         req.setHeader("content-length", self.original.length)
         return ''
 
+    def getLineRange(self, req):
+        """
+        Return the line range asked for with the C{start}, C{end} and C{tail}
+        arguments, as a dictionary of the valid ones.
+        """
+        lineRange = {}
+        for arg in ('start', 'end', 'tail'):
+            try:
+                value = int(req.args[arg][0])
+            except (KeyError, IndexError, ValueError):
+                continue
+            if value >= 0:
+                lineRange[arg] = value
+        return lineRange
+
+    def getRangeChunks(self, lineRange):
+        if 'tail' in lineRange:
+            return self.original.getTail(lineRange['tail'])
+        return self.original.getChunks(startLine=lineRange.get('start', 0),
+                                       endLine=lineRange.get('end'))
+
+    def writeRange(self, req, lineRange):
+        # a bounded range is served from what is on disk now, without
+        # following the log; block-compressed logs seek straight to it
+        for chunk in self.getRangeChunks(lineRange):
+            formatted = self.content([chunk])
+            if isinstance(formatted, unicode):
+                formatted = formatted.encode('utf-8')
+            if formatted:
+                req.write(formatted)
+        self.finished()
+
     def render_GET(self, req):
         self._setContentType(req)
         self.req = req
@@ -116,6 +150,12 @@ class TextLog(Resource, ContextMixin):
         else:
             req.setHeader("Cache-Control", "no-cache")
 
+        lineRange = self.getLineRange(req)
+
+        if self.asText and lineRange:
+            self.writeRange(req, lineRange)
+            return server.NOT_DONE_YET
+
         if not self.asText:
             self.template = req.site.buildbot_service.templates.get_template("logs.html")
             self.chunk_template = req.site.buildbot_service.templates.get_template("log_chunk.html")
@@ -127,7 +167,10 @@ class TextLog(Resource, ContextMixin):
                 data = self.chunk_template.module.page_header(version)
                 data = data.encode('utf-8')
                 req.write(data)
-                self.original.subscribeConsumer(ChunkConsumer(req, self))
+                if lineRange:
+                    self.writeRange(req, lineRange)
+                else:
+                    self.original.subscribeConsumer(ChunkConsumer(req, self))
                 return server.NOT_DONE_YET
 
 
@@ -137,6 +180,9 @@ class TextLog(Resource, ContextMixin):
             project = builder_status.getProject()
             cxt["pageTitle"] = "Log File Contents"
             cxt["iframe_url"] = req.path + "/iframe"
+            if lineRange:
+                cxt["iframe_url"] += "?" + urllib.urlencode(
+                        sorted(lineRange.items()))
             cxt["builder_name"] = builder.getFriendlyName()
             cxt['path_to_builder'] = path_to_builder(req, builder_status)
             cxt['path_to_builders'] = path_to_builders(req, project)
@@ -209,8 +255,9 @@ class LogsResource(HtmlResource):
         for log in self.step_status.getLogs():
             if path == log.getName():
                 if log.hasContents():
-                    content = log.getText()
-                    if isinstance(log, HTMLLogFile) and ('xml-stylesheet' in content or 'nosetests' in content):
+                    if isinstance(log, HTMLLogFile) and \
+                            (testresults.hasIndex(log) or
+                             testresults.isTestResults(log.getText())):
                         return XMLTestResource(log, self.step_status)
                     else:
                         return IHTMLLog(interfaces.IStatusLog(log))
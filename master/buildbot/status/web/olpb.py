@@ -14,6 +14,7 @@
 # Copyright Buildbot Team Members
 
 
+from twisted.internet import defer
 from buildbot.status.web.base import HtmlResource, BuildLineMixin, map_branches
 
 # /one_line_per_build
@@ -48,14 +49,15 @@ class OneLinePerBuild(HtmlResource, BuildLineMixin):
                 pass
         return None
 
+    @defer.inlineCallbacks
     def content(self, req, cxt):
         status = self.getStatus(req)
         numbuilds = int(req.args.get("numbuilds", [self.numbuilds])[0])
         builders = req.args.get("builder", [])
         branches = [b for b in req.args.get("branch", []) if b]
 
-        g = status.generateFinishedBuilds(builders, map_branches(branches),
-                                          numbuilds, max_search=numbuilds)
+        g = status.iterFinishedBuildsAsync(builders, map_branches(branches),
+                                           numbuilds, max_search=numbuilds)
 
         cxt['refresh'] = self.get_reload_time(req)
         cxt['num_builds'] = numbuilds
@@ -63,7 +65,10 @@ class OneLinePerBuild(HtmlResource, BuildLineMixin):
         cxt['builders'] = builders
 
         builds = cxt['builds'] = []
-        for build in g:
+        while True:
+            build = yield g.next()
+            if build is None:
+                break
             builds.append(self.get_line_values(req, build))
 
         cxt['authz'] = self.getAuthz(req)
@@ -84,7 +89,7 @@ class OneLinePerBuild(HtmlResource, BuildLineMixin):
         cxt['num_building'] = building
 
         template = req.site.buildbot_service.templates.get_template('onelineperbuild.html')
-        return template.render(**cxt)
+        defer.returnValue(template.render(**cxt))
 
 
 
@@ -99,20 +104,26 @@ class OneLinePerBuildOneBuilder(HtmlResource, BuildLineMixin):
         self.numbuilds = numbuilds
         self.pageTitle = "Recent Builds of %s" % self.builder_name
 
+    @defer.inlineCallbacks
     def content(self, req, cxt):
         numbuilds = int(req.args.get("numbuilds", [self.numbuilds])[0])
         branches = [b for b in req.args.get("branch", []) if b]
 
         # walk backwards through all builds of a single builder
-        g = self.builder.generateFinishedBuilds(map_branches(branches),
-                                                numbuilds)
+        g = self.builder.iterFinishedBuildsAsync(map_branches(branches),
+                                                 max_search=max(2000, numbuilds))
 
-        cxt['builds'] = map(lambda b: self.get_line_values(req, b), g)
+        builds = cxt['builds'] = []
+        while len(builds) < numbuilds:
+            build = yield g.next()
+            if build is None:
+                break
+            builds.append(self.get_line_values(req, build))
         cxt.update(dict(num_builds=numbuilds,
                         builder_name=self.builder_name,
                         branches=branches))    
 
         template = req.site.buildbot_service.templates.get_template('onelineperbuildonebuilder.html')
-        return template.render(**cxt)
+        defer.returnValue(template.render(**cxt))
 
 
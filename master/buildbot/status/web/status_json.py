@@ -18,11 +18,15 @@
 
 import datetime
 import re
+from collections import OrderedDict
+from hashlib import md5
 from twisted.python import log
 
-from twisted.internet import defer
-from twisted.web import html, resource, server
+from twisted.internet import defer, reactor
+from twisted.web import html, resource, server, http
 
+from buildbot.process import metrics
+from buildbot.status.base import StatusReceiverBase
 from buildbot.status.buildrequest import BuildRequestStatus
 from buildbot.status.web.base import HtmlResource, path_to_root, map_branches, getCodebasesArg, getRequestCharset, getResultsArg
 import json
@@ -145,6 +149,143 @@ def FilterOut(data):
         return data
 
 
+class JsonResponseCache(StatusReceiverBase):
+    """
+    I keep the serialized responses of recently requested json resources, so
+    that many clients polling the same URL do not each have the whole
+    response recomputed.
+
+    Entries are keyed by path and query arguments, and are invalidated by the
+    status events I receive as a status receiver: an event about a builder
+    invalidates the responses that describe that builder and every response
+    that is not specific to a builder, while any other event invalidates
+    everything.  As some of the data comes straight from the database,
+    entries also expire after C{max_age} seconds.
+
+    @ivar max_size: maximum number of responses kept
+    @ivar max_age: seconds after which a response is recomputed regardless
+    """
+
+    max_age = 10
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        # builders we have subscribed to, so that we can unsubscribe
+        self.watched = []
+        # bumped by every event
+        self.generation = 0
+        # bumped by events that are not about a particular builder
+        self.master_generation = 0
+        # bumped by events about each builder
+        self.builder_generations = {}
+
+    def makeKey(self, request):
+        args = tuple(sorted((k, tuple(v)) for k, v in request.args.iteritems()))
+        return (tuple(request.prepath), args)
+
+    def getStamp(self, scope):
+        """Return the current state of the events a response for the given
+        scope (a builder name, or None) depends upon; store it along with the
+        response."""
+        if scope is None:
+            return (self.generation,)
+        return (self.master_generation, self.builder_generations.get(scope, 0))
+
+    def get(self, key, scope):
+        """Return (etag, data) for a valid entry, or None"""
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            stamp, created, etag, data = entry
+            if (stamp == self.getStamp(scope) and
+                    reactor.seconds() - created < self.max_age):
+                # move to the most-recently-used end
+                self.entries[key] = entry
+                metrics.MetricCountEvent.log('JsonResponseCache.hits')
+                return etag, data
+        metrics.MetricCountEvent.log('JsonResponseCache.misses')
+        return None
+
+    def put(self, key, stamp, data):
+        """Store a response computed when the state was C{stamp}, returning
+        its etag"""
+        etag = '"%s"' % md5(data).hexdigest()
+        self.entries.pop(key, None)
+        self.entries[key] = (stamp, reactor.seconds(), etag, data)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            metrics.MetricCountEvent.log('JsonResponseCache.evictions')
+        return etag
+
+    def invalidate(self, buildername=None):
+        self.generation += 1
+        if buildername is None:
+            self.master_generation += 1
+        else:
+            self.builder_generations[buildername] = \
+                    self.builder_generations.get(buildername, 0) + 1
+
+    # IStatusReceiver
+
+    def requestSubmitted(self, request):
+        self.invalidate(request.getBuilderName())
+
+    def requestCancelled(self, builder, request):
+        self.invalidate(request.getBuilderName())
+
+    def buildsetSubmitted(self, buildset):
+        self.invalidate()
+
+    def builderAdded(self, builderName, builder, friendly_name=None):
+        self.invalidate()
+        self.watched.append(builder)
+        return self
+
+    def builderChangedState(self, builderName, state):
+        self.invalidate(builderName)
+
+    def buildStarted(self, builderName, build):
+        self.invalidate(builderName)
+        return self
+
+    def changeAdded(self, change):
+        self.invalidate()
+
+    def stepStarted(self, build, step):
+        self.invalidate(build.getBuilder().getName())
+        # subscribe to the step, for its text and log events
+        return self
+
+    def stepTextChanged(self, build, step, text):
+        self.invalidate(build.getBuilder().getName())
+
+    def stepText2Changed(self, build, step, text2):
+        self.invalidate(build.getBuilder().getName())
+
+    def logStarted(self, build, step, log):
+        self.invalidate(build.getBuilder().getName())
+
+    def logFinished(self, build, step, log):
+        self.invalidate(build.getBuilder().getName())
+
+    def stepFinished(self, build, step, results):
+        self.invalidate(build.getBuilder().getName())
+
+    def buildFinished(self, builderName, build, results):
+        self.invalidate(builderName)
+
+    def builderRemoved(self, builderName):
+        self.watched = [ b for b in self.watched
+                         if b.getName() != builderName ]
+        self.invalidate()
+
+    def slaveConnected(self, slaveName):
+        self.invalidate()
+
+    def slaveDisconnected(self, slaveName):
+        self.invalidate()
+
+
 class JsonResource(resource.Resource):
     """Base class for json data."""
 
@@ -153,6 +294,9 @@ class JsonResource(resource.Resource):
     help = None
     pageTitle = None
     level = 0
+    # set to False for resources whose responses must not be kept in the
+    # JsonResponseCache
+    cacheable = True
 
     def __init__(self, status):
         """Adds transparent lazy-child initialization."""
@@ -187,13 +331,50 @@ class JsonResource(resource.Resource):
         RecurseFix(res, self.level)
         resource.Resource.putChild(self, name, res)
 
+    def getCacheScope(self):
+        """Return the name of the builder this resource describes, or None if
+        its response may depend on any builder."""
+        return None
+
+    def getResponseCache(self, request):
+        if not self.cacheable:
+            return None
+        try:
+            cache = request.site.buildbot_service.jsonCache
+        except AttributeError:
+            return None
+        if not isinstance(cache, JsonResponseCache):
+            return None
+        return cache
+
+    @defer.inlineCallbacks
+    def cachedContent(self, request):
+        """Returns (etag, data) for the request, with data encoded.  The etag
+        is None if the response cache is not in use."""
+        cache = self.getResponseCache(request)
+        if cache:
+            # content() modifies the request, so compute the key first
+            key = cache.makeKey(request)
+            scope = self.getCacheScope()
+            cached = cache.get(key, scope)
+            if cached:
+                defer.returnValue(cached)
+            stamp = cache.getStamp(scope)
+
+        data = yield defer.maybeDeferred(lambda: self.content(request))
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+
+        etag = None
+        if cache:
+            etag = cache.put(key, stamp, data)
+        defer.returnValue((etag, data))
+
     def render_GET(self, request):
         """Renders a HTTP GET at the http request level."""
-        d = defer.maybeDeferred(lambda: self.content(request))
+        d = self.cachedContent(request)
 
-        def handle(data):
-            if isinstance(data, unicode):
-                data = data.encode("utf-8")
+        def handle((etag, data)):
             request.setHeader("Access-Control-Allow-Origin", "*")
             if RequestArgToBool(request, 'as_text', False):
                 request.setHeader("content-type", 'text/plain')
@@ -206,6 +387,9 @@ class JsonResource(resource.Resource):
                 request.setHeader("Expires",
                                   expires.strftime("%a, %d %b %Y %H:%M:%S GMT"))
                 request.setHeader("Pragma", "no-cache")
+            # answer conditional requests with 304 Not Modified
+            if etag and request.setETag(etag) == http.CACHED:
+                return ''
             return data
 
         d.addCallback(handle)
@@ -397,6 +581,9 @@ class BuilderPendingBuildsJsonResource(JsonResource):
         JsonResource.__init__(self, status)
         self.builder_status = builder_status
 
+    def getCacheScope(self):
+        return self.builder_status.getName()
+
     def asDict(self, request):
         # buildbot.status.builder.BuilderStatus
         d = self.builder_status.getPendingBuildRequestStatuses()
@@ -424,6 +611,9 @@ class BuilderJsonResource(JsonResource):
             'pendingBuilds',
             BuilderPendingBuildsJsonResource(status, builder_status))
 
+    def getCacheScope(self):
+        return self.builder_status.getName()
+
     def asDict(self, request):
         # buildbot.status.builder.BuilderStatus
         return self.builder_status.asDict_async()
@@ -455,6 +645,9 @@ class BuilderSlavesJsonResources(JsonResource):
                           SlaveJsonResource(status,
                                             self.status.getSlave(slave_name)))
 
+    def getCacheScope(self):
+        return self.builder_status.getName()
+
 
 class BuildJsonResource(JsonResource):
     help = """Describe a single build.
@@ -470,6 +663,9 @@ class BuildJsonResource(JsonResource):
                       SourceStampJsonResource(status, sourcestamp))
         self.putChild('steps', BuildStepsJsonResource(status, build_status))
 
+    def getCacheScope(self):
+        return self.build_status.getBuilder().getName()
+
     def asDict(self, request):
         return self.build_status.asDict(request)
 
@@ -483,6 +679,9 @@ class AllBuildsJsonResource(JsonResource):
         JsonResource.__init__(self, status)
         self.builder_status = builder_status
 
+    def getCacheScope(self):
+        return self.builder_status.getName()
+
     def getChild(self, path, request):
         # Dynamic childs.
         if isinstance(path, int) or _IS_INT.match(path):
@@ -607,6 +806,9 @@ class BuildStepsJsonResource(JsonResource):
         # The build steps are constantly changing until the build is done so
         # keep a reference to build_status instead
 
+    def getCacheScope(self):
+        return self.build_status.getBuilder().getName()
+
     def getChild(self, path, request):
         # Dynamic childs.
         build_step_status = None
@@ -776,10 +978,18 @@ class SingleProjectJsonResource(LatestRevisionResource):
 
         result['comparisonURL'] = path_to_comparison(request, self.project_status.name, codebases)
 
+        children = [self.getChildWithDefault(name, request) for name in self.children]
+
+        # look up the latest build of every builder at once
+        latestBuilds = yield self.status.generateLatestBuildsAsync(
+            [child.builder for child in children],
+            branches=map_branches(branches), codebases=codebases,
+            num_builds=1, useCache=True)
+
         defers = []
-        for name in self.children:
-            child = self.getChildWithDefault(name, request)
-            d = child.asDict(request, codebases, branches, True)
+        for child in children:
+            d = child.asDict(request, codebases, branches, True,
+                             latestBuilds=latestBuilds[child.builder.getName()])
             defers.append(d)
 
         for d in defers:
@@ -804,14 +1014,19 @@ class SingleProjectBuilderJsonResource(LatestRevisionResource):
         self.latest_rev = latest_rev
 
 
+    def getCacheScope(self):
+        return self.builder.getName()
+
     @defer.inlineCallbacks
-    def builder_dict(self, builder, codebases, request, branches, base_build_dict):
+    def builder_dict(self, builder, codebases, request, branches, base_build_dict, latestBuilds=None):
         d = yield builder.asDict_async(codebases, request, base_build_dict)
 
         #Get latest build
-        builds = yield builder.generateFinishedBuildsAsync(branches=map_branches(branches),
-                                                     codebases=codebases,
-                                                     num_builds=1, useCache=True)
+        builds = latestBuilds
+        if builds is None:
+            builds = yield builder.generateFinishedBuildsAsync(branches=map_branches(branches),
+                                                         codebases=codebases,
+                                                         num_builds=1, useCache=True)
 
         if len(builds) > 0:
             d['latestBuild'] = builds[0].asBaseDict(request, include_artifacts=True, include_failure_url=True)
@@ -819,7 +1034,7 @@ class SingleProjectBuilderJsonResource(LatestRevisionResource):
         defer.returnValue(d)
 
     @defer.inlineCallbacks
-    def asDict(self, request, codebases=None, branches=None, base_build_dict=False):
+    def asDict(self, request, codebases=None, branches=None, base_build_dict=False, latestBuilds=None):
         if codebases is None or branches is None:
             #Get codebases
             codebases = {}
@@ -828,7 +1043,8 @@ class SingleProjectBuilderJsonResource(LatestRevisionResource):
             branches = [branch.decode(encoding) for branch in request.args.get("branch", []) if branch]
 
 
-        builder_dict = yield self.builder_dict(self.builder, codebases, request, branches, base_build_dict)
+        builder_dict = yield self.builder_dict(self.builder, codebases, request, branches, base_build_dict,
+                                               latestBuilds)
 
         if self.latest_rev:
             builder_dict['latestRevisions'] = yield self.getLatestRevision(codebases)
@@ -886,6 +1102,9 @@ class SinglePendingBuildsJsonResource(JsonResource):
         self.status = status
         self.builder = builder
 
+    def getCacheScope(self):
+        return self.builder.getName()
+
     @defer.inlineCallbacks
     def asDict(self, request):
         builds = yield self.builder.getPendingBuildRequestStatuses()
@@ -978,12 +1197,11 @@ class SlaveJsonResource(JsonResource):
         if self.builders is None:
             # Figure out all the builders to which it's attached
             self.builders = []
-            for builderName in self.status.getBuilderNames():
-                if self.name in self.status.getBuilder(builderName).slavenames:
-                    builder_status = self.status.getBuilder(builderName)
-                    builderDict = {'name': builderName, 'friendly_name': builder_status.getFriendlyName(),
-                           'url': self.status.getURLForThing(builder_status)}
-                    self.builders.append(builderDict)
+            for builderName in self.status.getBuilderNamesForSlave(self.name):
+                builder_status = self.status.getBuilder(builderName)
+                builderDict = {'name': builderName, 'friendly_name': builder_status.getFriendlyName(),
+                       'url': self.status.getURLForThing(builder_status)}
+                self.builders.append(builderDict)
         return self.builders
 
     def asDict(self, request):
@@ -1029,6 +1247,8 @@ class MetricsJsonResource(JsonResource):
     help = """Master metrics.
 """
     title = "Metrics"
+    # metrics change without any status event
+    cacheable = False
 
     def asDict(self, request):
         metrics = self.status.getMetrics()
@@ -1042,36 +1262,14 @@ class MetricsJsonResource(JsonResource):
 class GlobalJsonResource(JsonResource):
     help = """Gives information that can be used on all realtime pages"""
     pageTitle = 'Global Info'
+    # includes the current time
+    cacheable = False
 
-    def __init__(self, status):
-        JsonResource.__init__(self, status)
-        self.slaves = status.getSlaveNames()
-
-    @defer.inlineCallbacks
     def asDict(self, request):
         import time
-        connected_slaves = []
-        slave_busy = []
-        for s in self.slaves:
-            ss = self.status.getSlave(s)
-            if ss and ss.isConnected:
-                connected_slaves.append(s)
-            if ss and len(ss.getRunningBuilds()) > 0:
-                slave_busy.append(s)
-
-        current_builds = set()
-        for b_name in self.status.getBuilderNames():
-            b = self.status.getBuilder(b_name)
-            current_builds |= set(b.getCurrentBuilds())
-
-        queue = yield self.status.master.db.buildrequests.getUnclaimedBuildRequest(sorted=False)
-        result = {"slaves_count": len(connected_slaves),
-                  "slaves_busy": len(slave_busy),
-                  "running_builds": len(current_builds),
-                  "build_load": len(queue) + len(current_builds),
-                  "utc": time.time() * 1000}
-
-        defer.returnValue(result)
+        result = self.status.globalStatus.asDict()
+        result["utc"] = time.time() * 1000
+        return result
 
 
 class JsonStatusResource(JsonResource):
@@ -15,6 +15,7 @@
 
 
 import re
+import sys
 from twisted.python import log, failure
 from twisted.spread import pb
 from buildbot.process import buildstep
@@ -310,14 +311,27 @@ class SetProperty(ShellCommand):
     name = "setproperty"
     renderables = [ 'property' ]
 
-    def __init__(self, property=None, extract_fn=None, strip=True, **kwargs):
+    def __init__(self, property=None, extract_fn=None, strip=True,
+                 head=None, tail=None, stream=False, **kwargs):
         self.property = property
         self.extract_fn = extract_fn
         self.strip = strip
+        self.windowed = head is not None or tail is not None
+        self.stream = stream
 
         if not ((property is not None) ^ (extract_fn is not None)):
             config.error(
                 "Exactly one of property and extract_fn must be set")
+        if self.windowed and extract_fn is not None:
+            config.error("head and tail cannot be used with extract_fn")
+        if stream and extract_fn is None:
+            config.error("stream can only be used with extract_fn")
+
+        if self.windowed:
+            # collect only the window of stdout as it arrives, rather than
+            # reading the whole log back afterward
+            kwargs.update(collectStdout=True, collectHead=head,
+                          collectTail=tail)
 
         ShellCommand.__init__(self, timestamp_stdio=False, **kwargs)
 
@@ -327,16 +341,21 @@ class SetProperty(ShellCommand):
         if self.property:
             if cmd.didFail():
                 return
-            result = cmd.logs['stdio'].getText()
+            if self.windowed:
+                result = cmd.stdout
+            else:
+                result = cmd.logs['stdio'].getText()
             if self.strip: result = result.strip()
             propname = self.property
             self.setProperty(propname, result, "SetProperty Step")
             self.property_changes[propname] = result
         else:
             log = cmd.logs['stdio']
-            new_props = self.extract_fn(cmd.rc,
-                    ''.join(log.getChunks([STDOUT], onlyText=True)),
-                    ''.join(log.getChunks([STDERR], onlyText=True)))
+            stdout = log.getChunks([STDOUT], onlyText=True)
+            stderr = log.getChunks([STDERR], onlyText=True)
+            if not self.stream:
+                stdout, stderr = ''.join(stdout), ''.join(stderr)
+            new_props = self.extract_fn(cmd.rc, stdout, stderr)
             for k,v in new_props.items():
                 self.setProperty(k, v, "SetProperty Step")
             self.property_changes = new_props
@@ -381,6 +400,84 @@ class StringFileWriter(pb.Referenceable):
     def remote_close(self):
         pass
 
+class WarningLogLineObserver(buildstep.LogLineObserver):
+    """
+    Match the lines of a L{WarningCountingShellCommand}'s stdio log against
+    its warningPattern as they arrive, so the log never has to be read back
+    as a whole.  Only the current partial lines and the warnings found are
+    kept in memory.
+    """
+
+    def __init__(self, step):
+        buildstep.LogLineObserver.__init__(self)
+        # every line is matched, however long it is
+        self.setMaxLineLength(sys.maxint)
+        self.step = step
+        self.warnings = []
+        self.failure = None
+
+        wre = step.warningPattern
+        if isinstance(wre, str):
+            wre = re.compile(wre)
+        self.warningRe = wre
+
+        directoryEnterRe = step.directoryEnterPattern
+        if (directoryEnterRe != None
+                and isinstance(directoryEnterRe, basestring)):
+            directoryEnterRe = re.compile(directoryEnterRe)
+        self.directoryEnterRe = directoryEnterRe
+
+        directoryLeaveRe = step.directoryLeavePattern
+        if (directoryLeaveRe != None
+                and isinstance(directoryLeaveRe, basestring)):
+            directoryLeaveRe = re.compile(directoryLeaveRe)
+        self.directoryLeaveRe = directoryLeaveRe
+
+    def outLineReceived(self, line):
+        self.checkLine(line)
+
+    def errLineReceived(self, line):
+        self.checkLine(line)
+
+    def checkLine(self, line):
+        # an error here would otherwise be raised into whatever is adding
+        # data to the log; keep it for finish() instead
+        if self.failure is not None:
+            return
+        try:
+            self._checkLine(line)
+        except:
+            self.failure = failure.Failure()
+
+    def _checkLine(self, line):
+        step = self.step
+        if self.directoryEnterRe:
+            match = self.directoryEnterRe.search(line)
+            if match:
+                step.directoryStack.append(match.group(1))
+                return
+        if (self.directoryLeaveRe and
+            step.directoryStack and
+            self.directoryLeaveRe.search(line)):
+                step.directoryStack.pop()
+                return
+
+        match = self.warningRe.match(line)
+        if match:
+            step.maybeAddWarning(self.warnings, line, match)
+
+    def finish(self):
+        """
+        Check the last lines, if they were not terminated, and re-raise any
+        error raised while checking lines.
+        """
+        for parser in self.stdoutParser, self.stderrParser:
+            line, parser._buffer = parser._buffer, ''
+            if line:
+                self.checkLine(line)
+        if self.failure is not None:
+            self.failure.raiseException()
+
 class WarningCountingShellCommand(ShellCommand):
     renderables = [ 'suppressionFile' ]
 
@@ -421,6 +518,7 @@ class WarningCountingShellCommand(ShellCommand):
 
         self.suppressions = []
         self.directoryStack = []
+        self.warningObserver = None
 
     def addSuppression(self, suppressionList):
         """
@@ -531,52 +629,29 @@ class WarningCountingShellCommand(ShellCommand):
         self.addSuppression(list)
         return ShellCommand.start(self)
 
+    def setupLogfiles(self, cmd, logfiles):
+        # match the output as it arrives, rather than reading the whole log
+        # back in createSummary
+        self.warnCount = 0
+        self.warningObserver = WarningLogLineObserver(self)
+        self.addLogObserver('stdio', self.warningObserver)
+        ShellCommand.setupLogfiles(self, cmd, logfiles)
+
     def createSummary(self, log):
         """
-        Match log lines against warningPattern.
+        Report the log lines that matched warningPattern.
 
         Warnings are collected into another log for this step, and the
         build-wide 'warnings-count' is updated."""
 
-        self.warnCount = 0
-
-        # Now compile a regular expression from whichever warning pattern we're
-        # using
-        wre = self.warningPattern
-        if isinstance(wre, str):
-            wre = re.compile(wre)
-
-        directoryEnterRe = self.directoryEnterPattern
-        if (directoryEnterRe != None
-                and isinstance(directoryEnterRe, basestring)):
-            directoryEnterRe = re.compile(directoryEnterRe)
-
-        directoryLeaveRe = self.directoryLeavePattern
-        if (directoryLeaveRe != None
-                and isinstance(directoryLeaveRe, basestring)):
-            directoryLeaveRe = re.compile(directoryLeaveRe)
-
-        # Check if each line in the output from this command matched our
-        # warnings regular expressions. If did, bump the warnings count and
-        # add the line to the collection of lines with warnings
-        warnings = []
-        # TODO: use log.readlines(), except we need to decide about stdout vs
-        # stderr
-        for line in log.getText().split("\n"):
-            if directoryEnterRe:
-                match = directoryEnterRe.search(line)
-                if match:
-                    self.directoryStack.append(match.group(1))
-                    continue
-            if (directoryLeaveRe and
-                self.directoryStack and
-                directoryLeaveRe.search(line)):
-                    self.directoryStack.pop()
-                    continue
-
-            match = wre.match(line)
-            if match:
-                self.maybeAddWarning(warnings, line, match)
+        observer = self.warningObserver
+        if observer is None:
+            # the output was not observed as it arrived
+            self.warnCount = 0
+            observer = WarningLogLineObserver(self)
+            observer.outReceived(log.getText())
+        observer.finish()
+        warnings = observer.warnings
 
         # If there were any warnings, make the log if lines with warnings
         # available
@@ -16,13 +16,13 @@
 from __future__ import with_statement
 
 
-import os.path, tarfile, tempfile
+import os.path, tarfile, tempfile, zlib, hashlib
 try:
     from cStringIO import StringIO
     assert StringIO
 except ImportError:
     from StringIO import StringIO
-from twisted.internet import reactor
+from twisted.internet import reactor, threads, defer
 from twisted.spread import pb
 from twisted.python import log
 from buildbot.process import buildstep
@@ -33,12 +33,32 @@ from buildbot.util import json
 from buildbot import config
 
 
+def _fileChecksum(path, blocksize=64*1024):
+    """
+    Return the sha1 hexdigest of the file at C{path}.  This blocks, so call
+    it in a thread.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(blocksize)
+            if not data:
+                break
+            sha1.update(data)
+    return sha1.hexdigest()
+
+class TransferChecksumError(pb.Error):
+    """
+    The data received does not match the checksum of the file sent.
+    """
+
 class _FileWriter(pb.Referenceable):
     """
     Helper class that acts as a file-object with write access
     """
 
-    def __init__(self, destfile, maxsize, mode):
+    def __init__(self, destfile, maxsize, mode, deflate=False,
+                 checksum=False):
         # Create missing directories.
         destfile = os.path.abspath(destfile)
         dirname = os.path.dirname(destfile)
@@ -50,6 +70,12 @@ class _FileWriter(pb.Referenceable):
         fd, self.tmpname = tempfile.mkstemp(dir=dirname)
         self.fp = os.fdopen(fd, 'wb')
         self.remaining = maxsize
+        self.decompressor = None
+        if deflate:
+            self.decompressor = zlib.decompressobj()
+        self.checksum = None
+        if checksum:
+            self.checksum = hashlib.sha1()
 
     def remote_write(self, data):
         """
@@ -59,6 +85,10 @@ class _FileWriter(pb.Referenceable):
         @type  data: C{string}
         @param data: String of data to write
         """
+        if self.decompressor is not None:
+            data = self.decompressor.decompress(data)
+        if self.checksum is not None:
+            self.checksum.update(data)
         if self.remaining is not None:
             if len(data) > self.remaining:
                 data = data[:self.remaining]
@@ -70,12 +100,22 @@ class _FileWriter(pb.Referenceable):
     def remote_utime(self, accessed_modified):
         os.utime(self.destfile,accessed_modified)
 
-    def remote_close(self):
+    def remote_close(self, checksum=None):
         """
         Called by remote slave to state that no more data will be transfered
+
+        @type  checksum: C{string}
+        @param checksum: sha1 hexdigest of the file the slave sent, if the
+        writer was created with C{checksum=True}
         """
         self.fp.close()
         self.fp = None
+        if checksum is not None and self.checksum is not None:
+            if checksum != self.checksum.hexdigest():
+                os.unlink(self.tmpname)
+                self.tmpname = None
+                raise TransferChecksumError("checksum mismatch for '%s'"
+                                            % self.destfile)
         # on windows, os.rename does not automatically unlink, so do it manually
         if os.path.exists(self.destfile):
             os.unlink(self.destfile)
@@ -136,21 +176,23 @@ class _DirectoryWriter(_FileWriter):
     step to unpack the archive, once the transfer has completed.
     """
 
-    def __init__(self, destroot, maxsize, compress, mode):
+    def __init__(self, destroot, maxsize, compress, mode, deflate=False,
+                 checksum=False):
         self.destroot = destroot
         self.compress = compress
 
         self.fd, self.tarname = tempfile.mkstemp()
         os.close(self.fd)
 
-        _FileWriter.__init__(self, self.tarname, maxsize, mode)
+        _FileWriter.__init__(self, self.tarname, maxsize, mode,
+                             deflate=deflate, checksum=checksum)
 
-    def remote_unpack(self):
+    def remote_unpack(self, checksum=None):
         """
         Called by remote slave to state that no more data will be transfered
         """
         # Make sure remote_close is called, otherwise atomic rename wont happen
-        self.remote_close()
+        self.remote_close(checksum)
 
         # Map configured compression to a TarFile setting
         if self.compress == 'bz2':
@@ -189,6 +231,8 @@ class _TransferBuildStep(BuildStep):
     haltOnFailure = True
     flunkOnFailure = True
 
+    cmd = None
+
     def setDefaultWorkdir(self, workdir):
         if self.workdir is None:
             self.workdir = workdir
@@ -200,6 +244,19 @@ class _TransferBuildStep(BuildStep):
             workdir = self.workdir
         return workdir
 
+    def _pipelineArgs(self, command):
+        """
+        Get the windowing, compression and checksum arguments for
+        C{command}, or none if the slave is too old for them.
+        """
+        if self.slaveVersionIsOlderThan(command, "2.16"):
+            return {}
+        return {
+            'window': self.window,
+            'deflate': self.deflate,
+            'checksum': self.checksum,
+            }
+
     def interrupt(self, reason):
         self.addCompleteLog('interrupt', str(reason))
         if self.cmd:
@@ -226,8 +283,8 @@ class FileUpload(_TransferBuildStep):
 
     def __init__(self, slavesrc, masterdest,
                  workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 keepstamp=False, url=None,
-                 **buildstep_kwargs):
+                 keepstamp=False, url=None, window=8, deflate=False,
+                 checksum=False, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
 
         self.slavesrc = slavesrc
@@ -235,6 +292,9 @@ class FileUpload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
+        self.deflate = deflate
+        self.checksum = checksum
         if not isinstance(mode, (int, type(None))):
             config.error(
                 'mode must be an integer or None')
@@ -263,14 +323,18 @@ class FileUpload(_TransferBuildStep):
         if self.url is not None:
             self.addURL(os.path.basename(masterdest), self.url)
 
-        # we use maxsize to limit the amount of data on both sides
-        fileWriter = _FileWriter(masterdest, self.maxsize, self.mode)
-
         if self.keepstamp and self.slaveVersionIsOlderThan("uploadFile","2.13"):
             m = ("This buildslave (%s) does not support preserving timestamps. "
                  "Please upgrade the buildslave." % self.build.slavename )
             raise BuildSlaveTooOldError(m)
 
+        pipelineArgs = self._pipelineArgs("uploadFile")
+
+        # we use maxsize to limit the amount of data on both sides
+        fileWriter = _FileWriter(masterdest, self.maxsize, self.mode,
+                                 deflate=pipelineArgs.get('deflate'),
+                                 checksum=pipelineArgs.get('checksum'))
+
         # default arguments
         args = {
             'slavesrc': source,
@@ -280,6 +344,7 @@ class FileUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'keepstamp': self.keepstamp,
             }
+        args.update(pipelineArgs)
 
         self.cmd = makeStatusRemoteCommand(self, 'uploadFile', args)
         d = self.runCommand(self.cmd)
@@ -298,7 +363,8 @@ class DirectoryUpload(_TransferBuildStep):
 
     def __init__(self, slavesrc, masterdest,
                  workdir=None, maxsize=None, blocksize=16*1024,
-                 compress=None, url=None, **buildstep_kwargs):
+                 compress=None, url=None, window=8, deflate=False,
+                 checksum=False, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
 
         self.slavesrc = slavesrc
@@ -306,6 +372,9 @@ class DirectoryUpload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
+        self.deflate = deflate
+        self.checksum = checksum
         if compress not in (None, 'gz', 'bz2'):
             config.error(
                 "'compress' must be one of None, 'gz', or 'bz2'")
@@ -333,8 +402,12 @@ class DirectoryUpload(_TransferBuildStep):
         if self.url is not None:
             self.addURL(os.path.basename(masterdest), self.url)
         
+        pipelineArgs = self._pipelineArgs("uploadDirectory")
+
         # we use maxsize to limit the amount of data on both sides
-        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress, 0600)
+        dirWriter = _DirectoryWriter(masterdest, self.maxsize, self.compress,
+                                     0600, deflate=pipelineArgs.get('deflate'),
+                                     checksum=pipelineArgs.get('checksum'))
 
         # default arguments
         args = {
@@ -345,6 +418,7 @@ class DirectoryUpload(_TransferBuildStep):
             'blocksize': self.blocksize,
             'compress': self.compress
             }
+        args.update(pipelineArgs)
 
         self.cmd = makeStatusRemoteCommand(self, 'uploadDirectory', args)
         d = self.runCommand(self.cmd)
@@ -371,8 +445,14 @@ class _FileReader(pb.Referenceable):
     Helper class that acts as a file-object with read access
     """
 
-    def __init__(self, fp):
+    def __init__(self, fp, deflate=False, checksum=False):
         self.fp = fp
+        self.compressor = None
+        if deflate:
+            self.compressor = zlib.compressobj()
+        self.checksum = None
+        if checksum:
+            self.checksum = hashlib.sha1()
 
     def remote_read(self, maxlength):
         """
@@ -388,8 +468,30 @@ class _FileReader(pb.Referenceable):
             return ''
 
         data = self.fp.read(maxlength)
+        if self.checksum is not None:
+            self.checksum.update(data)
+        if self.compressor is not None and data:
+            data = self.compressor.compress(data) + \
+                    self.compressor.flush(zlib.Z_SYNC_FLUSH)
         return data
 
+    def remote_checksum(self):
+        """
+        Called by remote slave to get the sha1 hexdigest of the data read, if
+        the reader was created with C{checksum=True}
+        """
+        if self.checksum is None:
+            return None
+        return self.checksum.hexdigest()
+
+    def remote_seek(self, offset):
+        """
+        Called by remote slave to resume a transfer at C{offset}, before
+        reading any data
+        """
+        if self.fp is not None:
+            self.fp.seek(offset)
+
     def remote_close(self):
         """
         Called by remote slave to state that no more data will be transfered
@@ -407,7 +509,8 @@ class FileDownload(_TransferBuildStep):
 
     def __init__(self, mastersrc, slavedest,
                  workdir=None, maxsize=None, blocksize=16*1024, mode=None,
-                 **buildstep_kwargs):
+                 window=8, deflate=False, checksum=False, cache=False,
+                 cachesize=None, **buildstep_kwargs):
         BuildStep.__init__(self, **buildstep_kwargs)
 
         self.mastersrc = mastersrc
@@ -415,6 +518,11 @@ class FileDownload(_TransferBuildStep):
         self.workdir = workdir
         self.maxsize = maxsize
         self.blocksize = blocksize
+        self.window = window
+        self.deflate = deflate
+        self.checksum = checksum
+        self.cache = cache
+        self.cachesize = cachesize
         if not isinstance(mode, (int, type(None))):
             config.error(
                 'mode must be an integer or None')
@@ -447,7 +555,9 @@ class FileDownload(_TransferBuildStep):
             # maybeDeferred, just re-raise the exception here.
             reactor.callLater(0, BuildStep.finished, self, FAILURE)
             return
-        fileReader = _FileReader(fp)
+        pipelineArgs = self._pipelineArgs("downloadFile")
+        fileReader = _FileReader(fp, deflate=pipelineArgs.get('deflate'),
+                                 checksum=pipelineArgs.get('checksum'))
 
         # default arguments
         args = {
@@ -458,11 +568,31 @@ class FileDownload(_TransferBuildStep):
             'workdir': self._getWorkdir(),
             'mode': self.mode,
             }
-
-        self.cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
-        d = self.runCommand(self.cmd)
+        args.update(pipelineArgs)
+
+        if self.cache and not self.slaveVersionIsOlderThan("downloadFile",
+                                                            "2.17"):
+            d = threads.deferToThread(_fileChecksum, source)
+            @d.addCallback
+            def addCacheArgs(cachekey):
+                args['cachekey'] = cachekey
+                if self.cachesize is not None:
+                    args['cachesize'] = self.cachesize
+        else:
+            d = defer.succeed(None)
+        @d.addCallback
+        def download(_):
+            self.cmd = makeStatusRemoteCommand(self, 'downloadFile', args)
+            return self.runCommand(self.cmd)
         d.addCallback(self.finished).addErrback(self.failed)
 
+    def finished(self, result):
+        if self.cmd is not None:
+            cache = self.cmd.updates.get('cache')
+            if cache and cache[-1] in ('hit', 'current'):
+                self.step_status.setText2(['cached'])
+        return _TransferBuildStep.finished(self, result)
+
 class StringDownload(_TransferBuildStep):
 
     name = 'string_download'
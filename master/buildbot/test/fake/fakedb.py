@@ -23,7 +23,7 @@ import base64
 from buildbot.util import json, epoch2datetime, datetime2epoch
 from twisted.python import failure
 from twisted.internet import defer, reactor
-from buildbot.db import buildrequests
+from buildbot.db import buildrequests, builds
 
 # Fake DB Rows
 
@@ -195,6 +195,7 @@ class SourceStampSet(Row):
     table = "sourcestampsets"
     defaults = dict(
         id = None,
+        fingerprint = None,
     )
     id_column = 'id'
 
@@ -330,6 +331,18 @@ class Build(Row):
 
     id_column = 'id'
 
+class LatestBuild(Row):
+    table = "latestbuilds"
+
+    defaults = dict(
+        id = None,
+        buildername = 'bldr',
+        sourcekeyhash = builds.latestBuildKeyHash(u''),
+        results = 0,
+        number = 29)
+
+    id_column = 'id'
+
 # Fake DB Components
 
 # TODO: test these using the same test methods as are used against the real
@@ -393,9 +406,17 @@ class FakeChangesComponent(FakeDBComponent):
             codebase=codebase)
         ch.files = files
         ch.properties = properties
+        ch.uid = uid
 
         return defer.succeed(changeid)
 
+    def addChanges(self, changes):
+        changeids = []
+        for change in changes:
+            d = self.addChange(**change)
+            d.addCallback(changeids.append)
+        return defer.succeed(changeids)
+
     def getLatestChangeid(self):
         if self.changes:
             return defer.succeed(max(self.changes.iterkeys()))
@@ -618,6 +639,14 @@ class FakeSourceStampsComponent(FakeDBComponent):
                 sslist.append(ssdictcpy)
         return defer.succeed(sslist)
 
+    def getSourceStampsForSets(self, sourcestampsetids):
+        rv = dict((setid, []) for setid in sourcestampsetids)
+        for ssdict in self.sourcestamps.itervalues():
+            if ssdict['sourcestampsetid'] in rv:
+                rv[ssdict['sourcestampsetid']].append(
+                        self._getSourceStamp(ssdict['id']))
+        return defer.succeed(rv)
+
 class FakeBuildsetsComponent(FakeDBComponent):
 
     def setUp(self):
@@ -708,6 +737,17 @@ class FakeBuildsetsComponent(FakeDBComponent):
         else:
             return defer.succeed({})
 
+    def getBuildsetsByIds(self, bsids):
+        return defer.succeed(dict(
+            (bsid, self._row2dict(self.buildsets[bsid]))
+            for bsid in bsids if bsid in self.buildsets))
+
+    def getBuildsetsProperties(self, bsids):
+        return defer.succeed(dict(
+            (bsid, self.buildsets[bsid]['properties']
+                   if bsid in self.buildsets else {})
+            for bsid in bsids))
+
     # fake methods
 
     def fakeBuildsetCompletion(self, bsid, result):
@@ -906,11 +946,15 @@ class FakeBuildRequestsComponent(FakeDBComponent):
             return defer.succeed(None)
 
     def getBuildRequests(self, buildername=None, complete=None, claimed=None,
-                         bsid=None):
+                         bsid=None, brids=None, after_brid=None):
         rv = []
         for br in self.reqs.itervalues():
             if buildername and br.buildername != buildername:
                 continue
+            if brids is not None and br.id not in brids:
+                continue
+            if after_brid is not None and br.id <= after_brid:
+                continue
             if complete is not None:
                 if complete and not br.complete:
                     continue
@@ -1049,6 +1093,11 @@ class FakeBuildRequestsComponent(FakeDBComponent):
 
         return rv
 
+    def countUnclaimedBuildRequests(self):
+        return defer.succeed(len([ br for br in self.reqs.values()
+                                   if br.id not in self.claims
+                                   and not br.complete ]))
+
     # Code copied from buildrequests.BuildRequestConnectorComponent
     def _brdictFromRow(self, row):
         claimed = mine = False
@@ -1092,11 +1141,14 @@ class FakeBuildsComponent(FakeDBComponent):
 
     def setUp(self):
         self.builds = {}
+        self.latestbuilds = {}
 
     def insertTestData(self, rows):
         for row in rows:
             if isinstance(row, Build):
                 self.builds[row.id] = row
+            if isinstance(row, LatestBuild):
+                self.latestbuilds[row.id] = row
 
     # component methods
 
@@ -1120,7 +1172,33 @@ class FakeBuildsComponent(FakeDBComponent):
 
     def getLastBuildsNumbers(self, buildername=None, slavename=None, results=None, sourcestamps=None, num_builds=1):
         return defer.succeed([])
+
+    def getLastBuildsNumbersForBuilders(self, buildernames, sourcestamps=None, results=None, num_builds=1):
+        return defer.succeed(dict((name, []) for name in buildernames))
+
+    def getLatestBuildNumbers(self, buildernames, key, results=None):
+        keyhash = builds.latestBuildKeyHash(key)
+        latest = {}
+        for row in self.latestbuilds.itervalues():
+            if row.buildername not in buildernames or row.sourcekeyhash != keyhash:
+                continue
+            if results and row.results not in results:
+                continue
+            latest[row.buildername] = max(latest.get(row.buildername, row.number), row.number)
+        return defer.succeed(latest)
     
+    def getRecentBuildsBySlave(self, slavename, num_builds=15):
+        reqs = self.db.buildrequests.reqs
+        rows = [ row for row in self.builds.values()
+                 if row.slavename == slavename and row.finish_time is not None
+                 and row.brid in reqs and reqs[row.brid].mergebrid is None ]
+        rows.sort(key=lambda row: (row.finish_time, row.id), reverse=True)
+        return defer.succeed([ dict(buildername=reqs[row.brid].buildername,
+                                    number=row.number,
+                                    results=reqs[row.brid].results,
+                                    finish_time=row.finish_time)
+                               for row in rows[:num_builds] ])
+
     def getBuildsForRequest(self, brid):
         ret = []
  
@@ -39,6 +39,12 @@ class FakeCache(object):
         d.addCallback(mkref)
         return d
 
+    def __contains__(self, key):
+        return False
+
+    def remove(self, key):
+        pass
+
 
 class FakeCaches(object):
 
@@ -48,7 +54,7 @@ class FakeCaches(object):
 
 class FakeBotMaster(object):
     builders = {}
-    pass
+    builderNames = []
 
 
 class FakeStatus(object):
@@ -88,6 +94,9 @@ class FakeBuilderStatus(object):
     def setTags(self, tags):
         pass
 
+    def closeBuildHistory(self):
+        return defer.succeed(None)
+
     def newBuild(self):
         bs = fakebuild.FakeBuildStatus(self, self.master, 1)
         bs.number = 1
@@ -18,6 +18,7 @@ from twisted.python import failure
 from buildbot.status.logfile import STDOUT, STDERR, HEADER
 from cStringIO import StringIO
 from buildbot.status.results import SUCCESS, FAILURE
+from buildbot.process.buildstep import OutputBuffer
 
 
 class FakeRemoteCommand(object):
@@ -28,7 +29,8 @@ class FakeRemoteCommand(object):
     active = False
 
     def __init__(self, remote_command, args,
-            ignore_updates=False, collectStdout=False, decodeRC={0:SUCCESS}):
+            ignore_updates=False, collectStdout=False, decodeRC={0:SUCCESS},
+            collectHead=None, collectTail=None):
         # copy the args and set a few defaults
         self.remote_command = remote_command
         self.args = args.copy()
@@ -38,8 +40,15 @@ class FakeRemoteCommand(object):
         self.collectStdout = collectStdout
         self.updates = {}
         self.decodeRC = decodeRC
-        if collectStdout:
-            self.stdout = ''
+        self.collectHead = collectHead
+        self.collectTail = collectTail
+        self.stdoutBuffer = OutputBuffer(head=collectHead, tail=collectTail)
+
+    @property
+    def stdout(self):
+        if self.collectStdout:
+            return self.stdoutBuffer.getvalue()
+        raise AttributeError("stdout")
 
     def run(self, step, remote):
         # delegate back to the test case
@@ -76,14 +85,16 @@ class FakeRemoteShellCommand(FakeRemoteCommand):
                  want_stdout=1, want_stderr=1,
                  timeout=20*60, maxTime=None, logfiles={},
                  usePTY="slave-config", logEnviron=True, collectStdout=False,
-                 interruptSignal=None, initialStdin=None, decodeRC={0:SUCCESS}):
+                 interruptSignal=None, initialStdin=None, decodeRC={0:SUCCESS},
+                 collectHead=None, collectTail=None):
         args = dict(workdir=workdir, command=command, env=env or {},
                 want_stdout=want_stdout, want_stderr=want_stderr,
                 initial_stdin=initialStdin,
                 timeout=timeout, maxTime=maxTime, logfiles=logfiles,
                 usePTY=usePTY, logEnviron=logEnviron)
         FakeRemoteCommand.__init__(self, "shell", args,
-                collectStdout=collectStdout, decodeRC=decodeRC)
+                collectStdout=collectStdout, decodeRC=decodeRC,
+                collectHead=collectHead, collectTail=collectTail)
 
 
 class FakeLogFile(object):
@@ -125,14 +136,25 @@ class FakeLogFile(object):
         return ''.join([ c for str,c in self.chunks
                            if str in (STDOUT, STDERR)])
 
-    def getChunks(self, channels=[], onlyText=False):
+    def getChunks(self, channels=[], onlyText=False, startLine=0,
+                  endLine=None):
+        chunks = self.chunks
+        if startLine or endLine is not None:
+            chunks = []
+            line = 0
+            for ch, data in self.chunks:
+                for piece in data.splitlines(True):
+                    if line >= startLine and (endLine is None or line < endLine):
+                        chunks.append((ch, piece))
+                    if piece.endswith('\n'):
+                        line += 1
         if onlyText:
             return [ data
-                        for (ch, data) in self.chunks
+                        for (ch, data) in chunks
                         if not channels or ch in channels ]
         else:
             return [ (ch, data)
-                        for (ch, data) in self.chunks
+                        for (ch, data) in chunks
                         if not channels or ch in channels ]
 
     def setTimestampsMode(self, prepend_timestamps):
@@ -247,7 +269,7 @@ class Expect(object):
             if 'stdout' in streams:
                 command.logs[name].addStdout(streams['stdout'])
                 if command.collectStdout:
-                    command.stdout += streams['stdout']
+                    command.stdoutBuffer.append(streams['stdout'])
             if 'stderr' in streams:
                 command.logs[name].addStderr(streams['stderr'])
         elif behavior == 'callable':
@@ -21,8 +21,8 @@ from twisted.web import server
 class FakeRequest(Mock):
     """
     A fake Twisted Web Request object, including some pointers to the
-    buildmaster and an addChange method on that master which will append its
-    arguments to self.addedChanges.
+    buildmaster and addChange and addChanges methods on that master which will
+    append their arguments to self.addedChanges.
     """
 
     written = ''
@@ -43,6 +43,10 @@ class FakeRequest(Mock):
             self.addedChanges.append(kwargs)
             return defer.succeed(Mock())
         master.addChange = addChange
+        def addChanges(changes):
+            return defer.gatherResults([ addChange(**kwargs)
+                                         for kwargs in changes ])
+        master.addChanges = addChanges
 
         self.deferred = defer.Deferred()
 
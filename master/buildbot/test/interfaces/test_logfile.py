@@ -15,6 +15,7 @@
 
 import mock
 import textwrap
+from buildbot import config
 from buildbot.status import logfile
 from buildbot.test.util import interfaces, dirs
 from buildbot.test.fake import remotecommand
@@ -78,7 +79,8 @@ class Tests(interfaces.InterfaceTests):
     def test_signature_getChunks(self):
         log = self.makeLogFile()
         @self.assertArgSpecMatches(log.getChunks)
-        def getChunks(self, channels=[], onlyText=False):
+        def getChunks(self, channels=[], onlyText=False, startLine=0,
+                      endLine=None):
             pass
 
     def test_signature_finish(self):
@@ -92,6 +94,13 @@ class Tests(interfaces.InterfaceTests):
         self.addLogData(log)
         self.assertIn('some text with', log.readlines()[0])
 
+    def test_getChunks_lines(self):
+        log = self.makeLogFile()
+        self.addLogData(log)
+        self.assertEqual(''.join(log.getChunks([logfile.STDOUT], onlyText=True,
+                                               startLine=1, endLine=3)),
+                         'embedded newlines\nno newlines - ')
+
     def test_getText(self):
         log = self.makeLogFile()
         self.addLogData(log)
@@ -119,6 +128,7 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin, RealTests):
         # this is one reason this interface sucks:
         parent = mock.Mock(name='fake StepStatus')
         parent.build.builder.basedir = 'basedir'
+        parent.build.builder.master.config = config.MasterConfig()
         return logfile.LogFile(parent, name, logfilename)
 
 
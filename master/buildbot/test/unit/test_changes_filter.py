@@ -127,3 +127,14 @@ class ChangeFilter(unittest.TestCase):
         self.yes(Change(project='p', repository='r', branch='b', category='c', ff=True),
                 "all match and fn returns True -> False")
         self.check()
+
+    def test_getExactMatchChecks(self):
+        self.setfilter(project='p', repository=['r1', 'r2'],
+                       branch_re='b.*', category_fn=lambda c : True)
+        self.assertEqual(self.filt.getExactMatchChecks(),
+                [('project', ['p']), ('repository', ['r1', 'r2'])])
+
+    def test_getExactMatchChecks_branch_None(self):
+        self.setfilter(branch=None)
+        self.assertEqual(self.filt.getExactMatchChecks(),
+                [('branch', [None])])
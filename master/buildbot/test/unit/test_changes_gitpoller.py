@@ -25,6 +25,11 @@ from buildbot.util import epoch2datetime
 # Test that environment variables get propagated to subprocesses (See #2116)
 os.environ['TEST_THAT_ENVIRONMENT_GETS_PASSED_TO_SUBPROCESSES'] = 'TRUE'
 
+def gitLogOutput(*revs):
+    # output of the git log run by GitPoller._get_commits, oldest first
+    return ''.join([ '\x1e%s\x1f1273258009\x1fby:%s\x1fhello!\n\n\x1f\n\n/etc/%s\n'
+                     % (rev, rev[:8], rev[:3]) for rev in revs ])
+
 class GitOutputParsing(gpo.GetProcessOutputMixin, unittest.TestCase):
     """Test GitPoller methods for parsing git output"""
     def setUp(self):
@@ -114,7 +119,44 @@ class GitOutputParsing(gpo.GetProcessOutputMixin, unittest.TestCase):
                 ['log', '--no-walk', '--format=%ct', self.dummyRevStr, '--'],
                 stampStr, float(stampStr))
 
-    # _get_changes is tested in TestGitPoller, below
+    def test_get_commits(self):
+        self.expectCommands(
+                gpo.Expect('git', 'log', '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT, 'aaa..bbb', '--')
+                    .path('gitpoller-work')
+                    .stdout('\x1eaaa1\x1f1273258009\x1f'
+                            'Sammy Jankis <email@example.com>\x1f'
+                            'this is a commit message\n\nthat is multiline\n'
+                            '\x1f\n\nfile1\nfile2\n'
+                            '\x1ebbb1\x1f1273258010\x1f'
+                            'Sammy Jankis <email@example.com>\x1f'
+                            'merge\n\n\x1f\n'),
+                )
+        d = self.poller._get_commits('aaa..bbb')
+        @d.addCallback
+        def check(commits):
+            self.assertEqual(list(commits), [
+                ('aaa1', 1273258009.0, u'Sammy Jankis <email@example.com>',
+                 ['file1', 'file2'],
+                 u'this is a commit message\n\nthat is multiline'),
+                ('bbb1', 1273258010.0, u'Sammy Jankis <email@example.com>',
+                 [], u'merge'),
+                ])
+            self.assertAllCommandsRan()
+        return d
+
+    def test_get_commits_noComments(self):
+        self.expectCommands(
+                gpo.Expect('git', 'log', '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT, 'aaa..bbb', '--')
+                    .path('gitpoller-work')
+                    .stdout('\x1eaaa1\x1f1273258009\x1fby:aaa\x1f\n\x1f\n'),
+                )
+        d = self.poller._get_commits('aaa..bbb')
+        d.addCallback(list)
+        return self.assertFailure(d, EnvironmentError)
+
+    # _process_changes is tested in TestGitPoller, below
 
 class TestGitPoller(gpo.GetProcessOutputMixin,
                     changesource.ChangeSourceMixin,
@@ -218,7 +260,8 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                     .path('gitpoller-work')
                     .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
                 gpo.Expect('git', 'log',
-                    '--format=%H',
+                    '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT,
                     'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
                     '--')
                     .path('gitpoller-work')
@@ -257,7 +300,8 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                     .path('gitpoller-work')
                     .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
                 gpo.Expect('git', 'log',
-                    '--format=%H',
+                    '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT,
                     '4423cdbcbb89c14e50dd5f4152415afd686c5241..4423cdbcbb89c14e50dd5f4152415afd686c5241',
                     '--')
                     .path('gitpoller-work')
@@ -321,42 +365,28 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                     .path('gitpoller-work')
                     .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
                 gpo.Expect('git', 'log',
-                    '--format=%H',
+                    '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT,
                     'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
                     '--')
                     .path('gitpoller-work')
-                    .stdout('\n'.join([
-                        '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                        '4423cdbcbb89c14e50dd5f4152415afd686c5241'])),
+                    .stdout(gitLogOutput(
+                        '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                        '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a')),
                 gpo.Expect('git', 'rev-parse',
                     'refs/buildbot/%s/release' % self.REPOURL_QUOTED)
                     .path('gitpoller-work')
                     .stdout('9118f4ab71963d23d02d4bdc54876ac8bf05acf2'),
                 gpo.Expect('git', 'log',
-                    '--format=%H',
+                    '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT,
                     'bf0b01df6d00ae8d1ffa0b2e2acbe642a6cd35d5..9118f4ab71963d23d02d4bdc54876ac8bf05acf2',
                     '--')
                     .path('gitpoller-work')
-                    .stdout( '\n'.join([
-                        '9118f4ab71963d23d02d4bdc54876ac8bf05acf2'
-                        ])),
+                    .stdout(gitLogOutput(
+                        '9118f4ab71963d23d02d4bdc54876ac8bf05acf2')),
                 )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009.0)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-        def author(rev):
-            return defer.succeed('by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-        def files(rev):
-            return defer.succeed(['/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-        def comments(rev):
-            return defer.succeed('hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         self.poller.branches = ['master', 'release']
         self.poller.lastRev = {
@@ -417,7 +447,8 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                     .path('gitpoller-work')
                     .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
                 gpo.Expect('git', 'log',
-                    '--format=%H',
+                    '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT,
                     '4423cdbcbb89c14e50dd5f4152415afd686c5241..4423cdbcbb89c14e50dd5f4152415afd686c5241',
                     '--')
                     .path('gitpoller-work')
@@ -455,31 +486,16 @@ class TestGitPoller(gpo.GetProcessOutputMixin,
                     .path('gitpoller-work')
                     .stdout('4423cdbcbb89c14e50dd5f4152415afd686c5241\n'),
                 gpo.Expect('git', 'log',
-                    '--format=%H',
+                    '--reverse', '--name-only',
+                    '--format=' + gitpoller.COMMITS_FORMAT,
                     'fa3ae8ed68e664d4db24798611b352e3c6509930..4423cdbcbb89c14e50dd5f4152415afd686c5241',
                     '--')
                     .path('gitpoller-work')
-                    .stdout('\n'.join([
-                        '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a',
-                        '4423cdbcbb89c14e50dd5f4152415afd686c5241'
-                        ])),
+                    .stdout(gitLogOutput(
+                        '4423cdbcbb89c14e50dd5f4152415afd686c5241',
+                        '64a5dc2a4bd4f558b5dd193d47c83c7d7abc9a1a')),
                 )
 
-        # and patch out the _get_commit_foo methods which were already tested
-        # above
-        def timestamp(rev):
-            return defer.succeed(1273258009.0)
-        self.patch(self.poller, '_get_commit_timestamp', timestamp)
-        def author(rev):
-            return defer.succeed('by:' + rev[:8])
-        self.patch(self.poller, '_get_commit_author', author)
-        def files(rev):
-            return defer.succeed(['/etc/' + rev[:3]])
-        self.patch(self.poller, '_get_commit_files', files)
-        def comments(rev):
-            return defer.succeed('hello!')
-        self.patch(self.poller, '_get_commit_comments', comments)
-
         # do the poll
         self.poller.lastRev = {
                 'master': 'fa3ae8ed68e664d4db24798611b352e3c6509930'
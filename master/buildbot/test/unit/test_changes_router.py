@@ -0,0 +1,129 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from twisted.trial import unittest
+from buildbot.changes import router
+from buildbot.process import metrics
+from buildbot.test.fake.state import State
+
+class Change(State):
+    project = ''
+    repository = ''
+    branch = None
+    codebase = ''
+
+class ChangeRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = router.ChangeRouter()
+        self.offered = []
+        self.metrics = []
+        self.patch(metrics.MetricCountEvent, 'log', classmethod(
+                lambda cls, name, count : self.metrics.append((name, count))))
+
+    def subscribe(self, name, conditions=(), accept=True):
+        def callback(change):
+            self.offered.append(name)
+            return accept
+        return self.router.subscribe(callback, conditions)
+
+    def deliver(self, **kwargs):
+        self.offered = []
+        self.metrics = []
+        self.router.deliver(Change(**kwargs))
+        return sorted(self.offered)
+
+    def test_unconditional(self):
+        self.subscribe('a')
+        self.subscribe('b', [('category', ['c'])])
+        self.assertEqual(self.deliver(), ['a', 'b'])
+
+    def test_indexed(self):
+        self.subscribe('a', [('repository', ['r1'])])
+        self.subscribe('b', [('repository', ['r1', 'r2'])])
+        self.subscribe('c', [('branch', [None])])
+        self.assertEqual(self.deliver(repository='r1', branch='x'),
+                         ['a', 'b'])
+        self.assertEqual(self.deliver(repository='r2', branch=None),
+                         ['b', 'c'])
+        self.assertEqual(self.deliver(repository='r3', branch='x'), [])
+
+    def test_fewest_values(self):
+        route = self.subscribe('a', [('codebase', ['', 'lib']),
+                                     ('project', ['p']),
+                                     ('branch', ['master', 'release'])])
+        self.assertEqual(route.key, ('project', frozenset(['p'])))
+        # only the index decides; the callback checks the rest
+        self.assertEqual(self.deliver(project='p', codebase='x'), ['a'])
+        self.assertEqual(self.deliver(project='q', codebase=''), [])
+
+    def test_codebase_last(self):
+        route = self.subscribe('a', [('codebase', ['']),
+                                     ('branch', ['master', 'release'])])
+        self.assertEqual(route.key,
+                         ('branch', frozenset(['master', 'release'])))
+        route = self.subscribe('b', [('codebase', [''])])
+        self.assertEqual(route.key, ('codebase', frozenset([''])))
+
+    def test_default_codebase_narrowed(self):
+        # schedulers with the default codebase and distinct filters
+        for i in range(800):
+            self.subscribe('p%d' % i, [('codebase', ['']),
+                                       ('project', ['p%d' % i])])
+        for i in range(5):
+            self.subscribe('b%d' % i, [('codebase', ['']),
+                                       ('branch', ['b%d' % i])])
+        self.assertEqual(self.deliver(project='p5', branch='x'), ['p5'])
+        self.assertEqual(dict(self.metrics)['ChangeRouter.candidates'], 1)
+        self.assertEqual(self.deliver(project='q', branch='b3'), ['b3'])
+        self.assertEqual(dict(self.metrics)['ChangeRouter.candidates'], 1)
+
+    def test_no_values(self):
+        self.subscribe('a', [('project', [])])
+        self.assertEqual(self.deliver(), [])
+
+    def test_unhashable_values(self):
+        route = self.subscribe('a', [('project', [['p']])])
+        self.assertEqual(route.key, None)
+        self.assertEqual(self.deliver(project='q'), ['a'])
+
+    def test_unsubscribe(self):
+        route = self.subscribe('a', [('repository', ['r1', 'r2'])])
+        other = self.subscribe('b')
+        route.unsubscribe()
+        route.unsubscribe()
+        other.unsubscribe()
+        self.assertEqual(self.router.index['repository'], {})
+        self.assertEqual(self.router.routes, set())
+        self.assertEqual(self.deliver(repository='r1'), [])
+
+    def test_metrics(self):
+        self.subscribe('a', [('repository', ['r1'])])
+        self.subscribe('b', [('repository', ['r1'])], accept=False)
+        self.subscribe('c', [('repository', ['r2'])])
+        self.deliver(repository='r1')
+        self.assertEqual(sorted(self.metrics), [
+            ('ChangeRouter.candidates', 2),
+            ('ChangeRouter.matches', 1),
+            ('ChangeRouter.skipped', 1),
+            ])
+
+    def test_callback_exception(self):
+        def callback(change):
+            raise RuntimeError('oh noes')
+        self.router.subscribe(callback, [])
+        self.subscribe('a')
+        self.assertEqual(self.deliver(), ['a'])
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
@@ -43,9 +43,14 @@ global_defaults = dict(
     logCompressionMethod='bz2',
     logMaxTailSize=None,
     logMaxSize=None,
+    logWriterBufferSize=None,
+    buildHistoryBackend='pickle',
+    buildHistoryMaxAge=None,
+    buildHistoryMaxSize=None,
     properties=properties.Properties(),
     mergeRequests=None,
     prioritizeBuilders=None,
+    builderDispatchConcurrency=1,
     slavePortnum=None,
     multiMaster=False,
     debugPassword=None,
@@ -64,9 +69,14 @@ load_global_defaults = dict(
     logCompressionMethod='bz2',
     logMaxTailSize=None,
     logMaxSize=None,
+    logWriterBufferSize=None,
+    buildHistoryBackend='pickle',
+    buildHistoryMaxAge=None,
+    buildHistoryMaxSize=None,
     properties=properties.Properties(),
     mergeRequests=False,
     prioritizeBuilders=None,
+    builderDispatchConcurrency=1,
     slavePortnum=None,
     multiMaster=False,
     debugPassword=None,
@@ -384,10 +394,49 @@ class MasterConfig_loaders(ConfigErrorsMixin, unittest.TestCase):
         self.do_test_load_global(dict(logCompressionMethod='gz'),
                                  logCompressionMethod='gz')
 
+    def test_load_global_logCompressionMethod_blocks(self):
+        self.do_test_load_global(dict(logCompressionMethod='blocks'),
+                                 logCompressionMethod='blocks')
+
     def test_load_global_logCompressionMethod_invalid(self):
         self.cfg.load_global(self.filename,
                 dict(logCompressionMethod='foo'), self.errors)
-        self.assertConfigError(self.errors, "must be 'bz2' or 'gz'")
+        self.assertConfigError(self.errors, "must be 'bz2', 'gz' or 'blocks'")
+
+    def test_load_global_buildHistoryBackend(self):
+        self.do_test_load_global(dict(buildHistoryBackend='sqlite'),
+                                 buildHistoryBackend='sqlite')
+
+    def test_load_global_buildHistoryBackend_invalid(self):
+        self.cfg.load_global(self.filename,
+                dict(buildHistoryBackend='foo'), self.errors)
+        self.assertConfigError(self.errors, "must be 'pickle' or 'sqlite'")
+
+    def test_load_global_buildHistoryMaxAge(self):
+        self.do_test_load_global(dict(buildHistoryMaxAge=86400),
+                                 buildHistoryMaxAge=86400)
+
+    def test_load_global_buildHistoryMaxSize(self):
+        self.do_test_load_global(dict(buildHistoryMaxSize=2**30),
+                                 buildHistoryMaxSize=2**30)
+
+    def test_load_global_builderDispatchConcurrency(self):
+        self.do_test_load_global(dict(builderDispatchConcurrency=8),
+                                 builderDispatchConcurrency=8)
+
+    def test_load_global_builderDispatchConcurrency_invalid(self):
+        self.cfg.load_global(self.filename,
+                dict(builderDispatchConcurrency=0), self.errors)
+        self.assertConfigError(self.errors, "must be a positive int")
+
+    def test_load_global_logWriterBufferSize(self):
+        self.do_test_load_global(dict(logWriterBufferSize=1024),
+                                 logWriterBufferSize=1024)
+
+    def test_load_global_logWriterBufferSize_invalid(self):
+        self.cfg.load_global(self.filename,
+                dict(logWriterBufferSize=-1), self.errors)
+        self.assertConfigError(self.errors, "must be None or a positive int")
 
     def test_load_global_logMaxSize(self):
         self.do_test_load_global(dict(logMaxSize=123), logMaxSize=123)
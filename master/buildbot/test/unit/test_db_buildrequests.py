@@ -17,7 +17,7 @@ import datetime
 import sqlalchemy as sa
 from twisted.trial import unittest
 from twisted.internet import task, defer
-from buildbot.db import buildrequests, builds
+from buildbot.db import buildrequests, builds, sourcestamps
 from buildbot.test.util import connector_component, db
 from buildbot.test.fake import fakedb
 from buildbot.util import UTC, epoch2datetime
@@ -49,7 +49,8 @@ class TestBuildsetsConnectorComponent(
         d = self.setUpConnectorComponent(
             table_names=[ 'patches', 'changes', 'sourcestamp_changes',
                 'buildsets', 'buildset_properties', 'buildrequests',
-                'objects', 'buildrequest_claims', 'sourcestamps', 'sourcestampsets', 'builds' ])
+                'objects', 'buildrequest_claims', 'sourcestamps', 'sourcestampsets', 'builds',
+                'latestbuilds' ])
 
         def finish_setup(_):
             self.db.buildrequests = \
@@ -153,6 +154,22 @@ class TestBuildsetsConnectorComponent(
                 claimed=False,
                 expected=[52])
 
+    def test_countUnclaimedBuildRequests(self):
+        d = self.insertTestData([
+            fakedb.BuildRequest(id=50, buildsetid=self.BSID),
+            fakedb.BuildRequestClaim(brid=50, objectid=self.MASTER_ID,
+                    claimed_at=self.CLAIMED_AT_EPOCH),
+            fakedb.BuildRequest(id=52, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=53, buildsetid=self.BSID, complete=1),
+            fakedb.BuildRequest(id=54, buildsetid=self.BSID),
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildrequests.countUnclaimedBuildRequests())
+        def check(count):
+            self.assertEqual(count, 2)
+        d.addCallback(check)
+        return d
+
     def do_test_getBuildRequests_buildername_arg(self, **kwargs):
         expected = kwargs.pop('expected')
         d = self.insertTestData([
@@ -246,6 +263,20 @@ class TestBuildsetsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def test_getBuildRequests_after_brid(self):
+        d = self.insertTestData([
+            fakedb.BuildRequest(id=70, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=71, buildsetid=self.BSID),
+            fakedb.BuildRequest(id=72, buildsetid=self.BSID),
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getBuildRequests(after_brid=70))
+        def check(brlist):
+            self.assertEqual(sorted([ br['brid'] for br in brlist ]),
+                             [71, 72])
+        d.addCallback(check)
+        return d
+
     def test_getBuildRequests_combo(self):
         d = self.insertTestData([
             # 44: everything we want
@@ -585,6 +616,26 @@ class TestBuildsetsConnectorComponent(
               (46, 1, 7, 1300305712), ],
             brids=[44, 45, 46])
 
+    @defer.inlineCallbacks
+    def test_completeBuildRequests_updatesLatestBuilds(self):
+        yield self.insertTestData([
+            fakedb.SourceStampSet(id=300),
+            fakedb.SourceStamp(id=300, sourcestampsetid=300,
+                               codebase='cb', branch='master'),
+            fakedb.Buildset(id=300, sourcestampsetid=300),
+            fakedb.BuildRequest(id=44, buildsetid=300, buildername='bldr'),
+            fakedb.Build(id=50, brid=44, number=5, finish_time=1300305700),
+            # not finished yet, so not recorded
+            fakedb.BuildRequest(id=45, buildsetid=300, buildername='other'),
+            fakedb.Build(id=51, brid=45, number=9),
+        ])
+
+        yield self.db.buildrequests.completeBuildRequests(brids=[44, 45], results=7)
+
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr', 'other'],
+                                                           u'cb=master;')
+        self.assertEqual(latest, {'bldr': 5})
+
     def test_completeBuildRequests_already_completed(self):
         return self.do_test_completeBuildRequests([
             fakedb.BuildRequest(id=44, buildsetid=self.BSID,
@@ -683,7 +734,9 @@ class TestBuildsetsConnectorComponent(
                                 submitted_at=self.SUBMITTED_AT_EPOCH,
                                 complete_at=self.COMPLETE_AT_EPOCH),
             fakedb.Buildset(id=1, sourcestampsetid=1),
-            fakedb.SourceStampSet(id=1),
+            fakedb.SourceStampSet(id=1,
+                fingerprint=sourcestamps.sourceStampSetFingerprint([
+                    ('1', 'master', 'a'), ('2', 'staging', 'b')])),
             fakedb.SourceStamp(id=1, revision='a', codebase='1',
                                sourcestampsetid=1, branch='master', repository='z'),
             fakedb.SourceStamp(id=2, revision='b', codebase='2', sourcestampsetid=1,
@@ -749,6 +802,35 @@ class TestBuildsetsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def test_previousSuccessFullBuildRequestFoundAnyOrder(self):
+        d = self.buildRequestWithSources()
+
+        sources = [
+                {'b_codebase': '2', 'b_revision': 'b', 'b_sourcestampsetid': 2, 'b_branch': 'staging'},
+                {'b_codebase': '1', 'b_revision': 'a', 'b_sourcestampsetid': 2, 'b_branch': 'master'}
+                ]
+
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getBuildRequestBySourcestamps(buildername='builder', sourcestamps = sources))
+        def check(brdict):
+            self.assertEqual(brdict['brid'], 1)
+        d.addCallback(check)
+        return d
+
+    def test_previousSuccessFullBuildRequestSubsetNotFound(self):
+        d = self.buildRequestWithSources()
+
+        sources = [
+                {'b_codebase': '1', 'b_revision': 'a', 'b_sourcestampsetid': 2, 'b_branch': 'master'}
+                ]
+
+        d.addCallback(lambda _ :
+                self.db.buildrequests.getBuildRequestBySourcestamps(buildername='builder', sourcestamps = sources))
+        def check(brdict):
+            self.assertEqual(brdict, None)
+        d.addCallback(check)
+        return d
+
     def test_previousSuccessFullBuildRequestNotFound(self):
         # add build request
         d = self.buildRequestWithSources()
@@ -13,6 +13,7 @@
 #
 # Copyright Buildbot Team Members
 
+import sqlalchemy as sa
 from twisted.trial import unittest
 from twisted.internet import defer, task
 from buildbot.db import builds
@@ -30,7 +31,7 @@ class TestBuildsConnectorComponent(
     def setUp(self):
         d = self.setUpConnectorComponent(
             table_names=['builds', 'buildrequests', 'buildsets',
-                'sourcestamps', 'sourcestampsets', 'patches' ])
+                'sourcestamps', 'sourcestampsets', 'patches', 'latestbuilds' ])
 
         def finish_setup(_):
             self.db.builds = builds.BuildsConnectorComponent(self.db)
@@ -173,6 +174,94 @@ class TestBuildsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def latest_builds_data(self):
+        rows = [fakedb.SourceStampSet(id=60),
+                fakedb.SourceStamp(id=60, sourcestampsetid=60,
+                                   codebase='cb1', branch='master'),
+                fakedb.SourceStamp(id=61, sourcestampsetid=60,
+                                   codebase='cb2', branch='qa'),
+                fakedb.Buildset(id=60, sourcestampsetid=60)]
+        for brid, number, results in [(61, 3, 0), (62, 4, 2), (63, 2, 0)]:
+            rows += [fakedb.BuildRequest(id=brid, buildsetid=60, buildername='bldr',
+                                         complete=1, results=results),
+                     fakedb.Build(id=brid, brid=brid, number=number,
+                                  start_time=1304262222)]
+        return rows
+
+    @defer.inlineCallbacks
+    def test_finishBuilds_updatesLatestBuilds(self):
+        clock = task.Clock()
+        clock.advance(1305555555)
+        yield self.insertTestData(self.latest_builds_data())
+
+        yield self.db.builds.finishBuilds([61, 62, 63], _reactor=clock)
+
+        key = builds.latestBuildKey({'cb2': 'qa', 'cb1': 'master'})
+        self.assertEqual(key, u'cb1=master;cb2=qa;')
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr'], key)
+        self.assertEqual(latest, {'bldr': 4})
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr'], key, results=[0, 1])
+        self.assertEqual(latest, {'bldr': 3})
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr'], u'cb1=master;')
+        self.assertEqual(latest, {})
+
+    @defer.inlineCallbacks
+    def test_finishBuilds_keepsNewerLatestBuild(self):
+        clock = task.Clock()
+        clock.advance(1305555555)
+        key = u'cb1=master;cb2=qa;'
+        yield self.insertTestData(self.latest_builds_data() + [
+            fakedb.LatestBuild(id=1, buildername='bldr',
+                               sourcekeyhash=builds.latestBuildKeyHash(key),
+                               results=2, number=10),
+        ])
+
+        yield self.db.builds.finishBuilds([61], _reactor=clock)
+        yield self.db.builds.finishBuilds([62], _reactor=clock)
+
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr'], key, results=[2])
+        self.assertEqual(latest, {'bldr': 10})
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr'], key, results=[0])
+        self.assertEqual(latest, {'bldr': 3})
+
+    @defer.inlineCallbacks
+    def test_updateLatestBuilds_insertRace(self):
+        key = u'cb1=master;cb2=qa;'
+        yield self.insertTestData(self.latest_builds_data())
+
+        def thd(conn):
+            latest_tbl = self.db.model.latestbuilds
+            class Result(object):
+                def __init__(self, rows):
+                    self.rows = rows
+                def fetchone(self):
+                    return self.rows[0] if self.rows else None
+                def close(self):
+                    pass
+            class RacingConnection(object):
+                # another master inserts the row after we looked for it
+                def execute(self, q, *args, **kw):
+                    res = conn.execute(q, *args, **kw)
+                    if isinstance(q, sa.sql.expression.Select) and \
+                            latest_tbl in q.froms:
+                        rows = res.fetchall()
+                        res.close()
+                        conn.execute(latest_tbl.insert(), buildername='bldr',
+                                     sourcekeyhash=builds.latestBuildKeyHash(key),
+                                     results=0, number=1)
+                        return Result(rows)
+                    return res
+                def __getattr__(self, name):
+                    return getattr(conn, name)
+            transaction = conn.begin()
+            conn.execute(self.db.model.builds.update(), finish_time=1304262223)
+            self.db.builds._updateLatestBuilds(RacingConnection(), [61])
+            transaction.commit()
+        yield self.db.pool.do(thd)
+
+        latest = yield self.db.builds.getLatestBuildNumbers(['bldr'], key, results=[0])
+        self.assertEqual(latest, {'bldr': 3})
+
     @defer.inlineCallbacks
     def test_getLastBuildsNumbersCodeBasesFound(self):
         yield  self.insertTestData(self.last_builds)
@@ -264,6 +353,49 @@ class TestBuildsConnectorComponent(
 
         self.assertEqual(lastBuildNumber, [4, 3])
 
+    def other_builder_builds(self):
+        rows = [fakedb.Buildset(id=2, sourcestampsetid=2),
+                fakedb.SourceStampSet(id=2),
+                fakedb.SourceStamp(id=3, revision='a', codebase='1',
+                                   sourcestampsetid=2, branch='master', repository='z')]
+        for brid, number, results in [(2, 7, 0), (3, 8, 2), (4, 9, 0)]:
+            rows += [fakedb.BuildRequest(id=brid, buildsetid=2, buildername="builder2",
+                                         complete=1, results=results,
+                                         submitted_at=self.SUBMITTED_AT_EPOCH,
+                                         complete_at=self.COMPLETE_AT_EPOCH),
+                     fakedb.Build(id=brid, number=number, brid=brid,
+                                  start_time=self.SUBMITTED_AT_EPOCH,
+                                  finish_time=self.COMPLETE_AT_EPOCH)]
+        return rows
+
+    @defer.inlineCallbacks
+    def do_test_getLastBuildsNumbersForBuilders(self):
+        yield self.insertTestData(self.last_builds + self.other_builder_builds())
+
+        lastBuilds = yield self.db.builds.getLastBuildsNumbersForBuilders(
+            buildernames=["builder", "builder2", "builder3"], num_builds=2)
+        self.assertEqual(lastBuilds, {"builder": [4], "builder2": [9, 8], "builder3": []})
+
+        lastBuilds = yield self.db.builds.getLastBuildsNumbersForBuilders(
+            buildernames=["builder", "builder2"],
+            sourcestamps=[{'b_codebase': '1', 'b_branch': 'master'}],
+            results=[0], num_builds=5)
+        self.assertEqual(lastBuilds, {"builder": [4], "builder2": [9, 7]})
+
+        lastBuilds = yield self.db.builds.getLastBuildsNumbersForBuilders(
+            buildernames=["builder", "builder2"],
+            sourcestamps=[{'b_codebase': '1', 'b_branch': 'master'},
+                          {'b_codebase': '2', 'b_branch': 'staging'}],
+            num_builds=1)
+        self.assertEqual(lastBuilds, {"builder": [4], "builder2": [9]})
+
+    def test_getLastBuildsNumbersForBuilders(self):
+        return self.do_test_getLastBuildsNumbersForBuilders()
+
+    def test_getLastBuildsNumbersForBuilders_noWindowFunctions(self):
+        self.db.builds._hasWindowFunctions = lambda conn: False
+        return self.do_test_getLastBuildsNumbersForBuilders()
+
     @defer.inlineCallbacks
     def test_getLastsBuildsNumbersBySlave(self):
         builds = [fakedb.BuildRequest(id=2, buildsetid=2, buildername="builder1",
@@ -292,6 +424,33 @@ class TestBuildsConnectorComponent(
         lastBuildNumber = yield self.db.builds.getLastsBuildsNumbersBySlave(slavename='slave-02')
         self.assertEqual(lastBuildNumber, {'builder2': [5]})
 
+    @defer.inlineCallbacks
+    def test_getRecentBuildsBySlave(self):
+        builds = [fakedb.BuildRequest(id=2, buildsetid=1, buildername="builder1",
+                                      complete=1, results=2),
+                  fakedb.Build(id=2, number=3, brid=2, start_time=self.SUBMITTED_AT_EPOCH,
+                               finish_time=self.COMPLETE_AT_EPOCH + 10, slavename='slave-01'),
+                  # merged into request 2
+                  fakedb.BuildRequest(id=3, buildsetid=1, buildername="builder1",
+                                      complete=1, results=2, mergebrid=2),
+                  fakedb.Build(id=3, number=3, brid=3, start_time=self.SUBMITTED_AT_EPOCH,
+                               finish_time=self.COMPLETE_AT_EPOCH + 10, slavename='slave-01'),
+                  # still running
+                  fakedb.BuildRequest(id=4, buildsetid=1, buildername="builder1"),
+                  fakedb.Build(id=4, number=4, brid=4, start_time=self.SUBMITTED_AT_EPOCH,
+                               slavename='slave-01')]
+        yield self.insertTestData(self.last_builds + builds)
+
+        recent = yield self.db.builds.getRecentBuildsBySlave('slave-01')
+        self.assertEqual(recent, [
+            dict(buildername='builder1', number=3, results=2,
+                 finish_time=self.COMPLETE_AT_EPOCH + 10),
+            dict(buildername='builder', number=4, results=0,
+                 finish_time=self.COMPLETE_AT_EPOCH)])
+
+        recent = yield self.db.builds.getRecentBuildsBySlave('slave-01', num_builds=1)
+        self.assertEqual([ b['number'] for b in recent ], [3])
+
     @defer.inlineCallbacks
     def test_getLastsBuildsNumbersBySlaveFilterResults(self):
         builds = [fakedb.BuildRequest(id=2, buildsetid=2, buildername="builder1",
@@ -202,6 +202,44 @@ class TestBuildsetsConnectorComponent(
         "returns an empty dict even if no such buildset exists"
         return self.do_test_getBuildsetProperties(91, [], dict())
 
+    def test_getBuildsetsProperties(self):
+        d = self.insertTestData([
+            fakedb.Buildset(id=91, sourcestampsetid=234, complete=0,
+                    results=-1, submitted_at=0),
+            fakedb.Buildset(id=92, sourcestampsetid=234, complete=0,
+                    results=-1, submitted_at=0),
+            fakedb.BuildsetProperty(buildsetid=91, property_name='prop1',
+                    property_value='["one", "fake1"]'),
+            fakedb.BuildsetProperty(buildsetid=92, property_name='prop2',
+                    property_value='["two", "fake2"]'),
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildsets.getBuildsetsProperties([91, 92, 93]))
+        def check(props):
+            self.assertEqual(props, {
+                91 : dict(prop1=("one", "fake1")),
+                92 : dict(prop2=("two", "fake2")),
+                93 : dict() })
+        d.addCallback(check)
+        return d
+
+    def test_getBuildsetsByIds(self):
+        d = self.insertTestData([
+            fakedb.Buildset(id=91, sourcestampsetid=234, complete=0,
+                    results=-1, submitted_at=266761875, reason='rsn1'),
+            fakedb.Buildset(id=92, sourcestampsetid=234, complete=0,
+                    results=-1, submitted_at=266761875, reason='rsn2'),
+        ])
+        d.addCallback(lambda _ :
+                self.db.buildsets.getBuildsetsByIds([91, 92, 93]))
+        def check(bsdicts):
+            self.assertEqual(sorted(bsdicts.keys()), [91, 92])
+            self.assertEqual(bsdicts[91]['reason'], 'rsn1')
+            self.assertEqual(bsdicts[92]['reason'], 'rsn2')
+            self.assertEqual(bsdicts[92]['bsid'], 92)
+        d.addCallback(check)
+        return d
+
     def test_getBuildset_incomplete_None(self):
         d = self.insertTestData([
             fakedb.Buildset(id=91, sourcestampsetid=234, complete=0,
@@ -301,6 +301,66 @@ class TestChangesConnectorComponent(
         d.addCallback(check_change_users)
         return d
 
+    def test_addChanges(self):
+        d = self.insertTestData([
+                fakedb.User(uid=1, identifier="one"),
+            ])
+        d.addCallback(lambda _ :
+            self.db.changes.addChanges([
+                dict(author=u'dustin',
+                     files=[u'a.txt', u'b.txt'],
+                     comments=u'first',
+                     revision=u'2d6caa52',
+                     when_timestamp=epoch2datetime(266738400),
+                     branch=u'master',
+                     properties={u'platform': (u'linux', 'Change')},
+                     uid=1),
+                dict(author=u'tom',
+                     files=[],
+                     comments=u'second',
+                     revision=u'1e6de4a5',
+                     when_timestamp=epoch2datetime(266738401),
+                     branch=u'master'),
+                dict(author=u'dustin',
+                     files=[u'c.txt'],
+                     comments=u'third',
+                     revision=u'9f3bc21a',
+                     when_timestamp=epoch2datetime(266738402),
+                     branch=u'master',
+                     uid=1),
+            ]))
+        def check(changeids):
+            self.assertEqual(changeids, [1, 2, 3])
+            def thd(conn):
+                r = conn.execute(sa.select([self.db.model.changes.c.changeid,
+                                            self.db.model.changes.c.revision],
+                            order_by=[self.db.model.changes.c.changeid]))
+                self.assertEqual([ tuple(row) for row in r ],
+                    [(1, '2d6caa52'), (2, '1e6de4a5'), (3, '9f3bc21a')])
+                tbl = self.db.model.change_files
+                r = conn.execute(sa.select([tbl.c.changeid, tbl.c.filename],
+                            order_by=[tbl.c.filename]))
+                self.assertEqual([ tuple(row) for row in r ],
+                    [(1, 'a.txt'), (1, 'b.txt'), (3, 'c.txt')])
+                tbl = self.db.model.change_properties
+                r = conn.execute(sa.select([tbl.c.changeid,
+                                            tbl.c.property_name]))
+                self.assertEqual([ tuple(row) for row in r ],
+                    [(1, 'platform')])
+                tbl = self.db.model.change_users
+                r = conn.execute(sa.select([tbl.c.changeid, tbl.c.uid],
+                            order_by=[tbl.c.changeid]))
+                self.assertEqual([ tuple(row) for row in r ],
+                    [(1, 1), (3, 1)])
+            return self.db.pool.do(thd)
+        d.addCallback(check)
+        return d
+
+    def test_addChanges_empty(self):
+        d = self.db.changes.addChanges([])
+        d.addCallback(self.assertEqual, [])
+        return d
+
     def test_addChange_with_uid(self):
         d = self.insertTestData([
                 fakedb.User(uid=1, identifier="one"),
@@ -0,0 +1,58 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+from twisted.trial import unittest
+from buildbot.test.util import migration
+
+class Migration(migration.MigrateTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        return self.setUpMigrateTest()
+
+    def tearDown(self):
+        return self.tearDownMigrateTest()
+
+    # create tables as they are before migrating to version 031
+    def create_tables_thd(self, conn):
+        metadata = sa.MetaData()
+        metadata.bind = conn
+
+        buildrequests = sa.Table('buildrequests', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('buildsetid', sa.Integer, nullable=False),
+            sa.Column('buildername', sa.String(length=255), nullable=False),
+            sa.Column('priority', sa.Integer, nullable=False,
+                server_default=sa.DefaultClause("0")),
+            sa.Column('complete', sa.Integer,
+                server_default=sa.DefaultClause("0")),
+            sa.Column('results', sa.SmallInteger),
+            sa.Column('submitted_at', sa.Integer, nullable=False),
+            sa.Column('complete_at', sa.Integer),
+        )
+        buildrequests.create(bind=conn)
+
+    def test_index_added(self):
+        def setup_thd(conn):
+            self.create_tables_thd(conn)
+
+        def verify_thd(conn):
+            insp = sa.engine.reflection.Inspector.from_engine(conn)
+            indexes = dict((idx['name'], idx['column_names'])
+                           for idx in insp.get_indexes('buildrequests'))
+            self.assertEqual(indexes.get('buildrequests_complete_id'),
+                             ['complete', 'id'])
+
+        return self.do_test_migration(30, 31, setup_thd, verify_thd)
@@ -0,0 +1,115 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import hashlib
+import sqlalchemy as sa
+from twisted.trial import unittest
+from buildbot.test.util import migration
+
+class Migration(migration.MigrateTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        return self.setUpMigrateTest()
+
+    def tearDown(self):
+        return self.tearDownMigrateTest()
+
+    # create tables as they are before migrating to version 032
+    def create_tables_thd(self, conn):
+        metadata = sa.MetaData()
+        metadata.bind = conn
+
+        self.buildrequests = sa.Table('buildrequests', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('buildsetid', sa.Integer, nullable=False),
+            sa.Column('buildername', sa.String(length=255), nullable=False),
+            sa.Column('complete', sa.Integer,
+                server_default=sa.DefaultClause("0")),
+            sa.Column('results', sa.SmallInteger),
+            sa.Column('mergebrid', sa.Integer),
+        )
+        self.buildrequests.create(bind=conn)
+
+        self.buildsets = sa.Table('buildsets', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('sourcestampsetid', sa.Integer),
+        )
+        self.buildsets.create(bind=conn)
+
+        self.sourcestamps = sa.Table('sourcestamps', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('branch', sa.String(256)),
+            sa.Column('codebase', sa.String(256), nullable=False,
+                server_default=sa.DefaultClause("")),
+            sa.Column('sourcestampsetid', sa.Integer),
+        )
+        self.sourcestamps.create(bind=conn)
+
+        self.builds = sa.Table('builds', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('number', sa.Integer, nullable=False),
+            sa.Column('brid', sa.Integer, nullable=False),
+            sa.Column('start_time', sa.Integer, nullable=False),
+            sa.Column('finish_time', sa.Integer),
+        )
+        self.builds.create(bind=conn)
+
+    def test_table_added_and_filled(self):
+        def setup_thd(conn):
+            self.create_tables_thd(conn)
+            conn.execute(self.buildsets.insert(), [
+                dict(id=1, sourcestampsetid=1),
+                dict(id=2, sourcestampsetid=2),
+            ])
+            conn.execute(self.sourcestamps.insert(), [
+                dict(id=1, sourcestampsetid=1, codebase='cb', branch='master'),
+                dict(id=2, sourcestampsetid=2, codebase='', branch='master'),
+            ])
+            def br(id, buildsetid=1, complete=1, results=0, mergebrid=None):
+                return dict(id=id, buildsetid=buildsetid, buildername='b',
+                            complete=complete, results=results,
+                            mergebrid=mergebrid)
+            conn.execute(self.buildrequests.insert(), [
+                br(1), br(2), br(3, results=2),
+                # merged, incomplete, or without codebases: not recorded
+                br(4, mergebrid=2),
+                br(5, complete=0, results=None),
+                br(6, buildsetid=2),
+            ])
+            conn.execute(self.builds.insert(), [
+                dict(id=n, number=n, brid=n, start_time=0, finish_time=10)
+                for n in range(1, 7)
+            ])
+
+        def verify_thd(conn):
+            metadata = sa.MetaData()
+            metadata.bind = conn
+            latestbuilds = sa.Table('latestbuilds', metadata, autoload=True)
+            keyhash = hashlib.sha1('cb=master;').hexdigest()
+            rows = conn.execute(sa.select([latestbuilds.c.buildername,
+                latestbuilds.c.sourcekeyhash, latestbuilds.c.results,
+                latestbuilds.c.number])).fetchall()
+            self.assertEqual(sorted(map(tuple, rows)), [
+                ('b', keyhash, 0, 2),
+                ('b', keyhash, 2, 3),
+            ])
+
+            insp = sa.engine.reflection.Inspector.from_engine(conn)
+            indexes = dict((idx['name'], idx['column_names'])
+                           for idx in insp.get_indexes('latestbuilds'))
+            self.assertEqual(indexes.get('latestbuilds_identity'),
+                             ['buildername', 'sourcekeyhash', 'results'])
+
+        return self.do_test_migration(31, 32, setup_thd, verify_thd)
@@ -0,0 +1,94 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import sqlalchemy as sa
+from twisted.trial import unittest
+from buildbot.db import sourcestamps
+from buildbot.test.util import migration
+
+class Migration(migration.MigrateTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        return self.setUpMigrateTest()
+
+    def tearDown(self):
+        return self.tearDownMigrateTest()
+
+    # create tables as they are before migrating to version 033
+    def create_tables_thd(self, conn):
+        metadata = sa.MetaData()
+        metadata.bind = conn
+
+        self.sourcestampsets = sa.Table('sourcestampsets', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+        )
+        self.sourcestampsets.create(bind=conn)
+
+        self.sourcestamps = sa.Table('sourcestamps', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('branch', sa.String(256)),
+            sa.Column('revision', sa.String(256)),
+            sa.Column('codebase', sa.String(256), nullable=False,
+                server_default=sa.DefaultClause("")),
+            sa.Column('sourcestampsetid', sa.Integer),
+        )
+        self.sourcestamps.create(bind=conn)
+
+        self.buildsets = sa.Table('buildsets', metadata,
+            sa.Column('id', sa.Integer,  primary_key=True),
+            sa.Column('sourcestampsetid', sa.Integer),
+        )
+        self.buildsets.create(bind=conn)
+
+    def test_fingerprints_added(self):
+        def setup_thd(conn):
+            self.create_tables_thd(conn)
+            conn.execute(self.sourcestampsets.insert(), [
+                dict(id=1), dict(id=2), dict(id=3),
+            ])
+            conn.execute(self.sourcestamps.insert(), [
+                dict(id=1, sourcestampsetid=1, codebase='c1', branch='b1',
+                     revision='r1'),
+                dict(id=2, sourcestampsetid=1, codebase='c2', branch='b2',
+                     revision=None),
+                dict(id=3, sourcestampsetid=2, codebase='c1', branch='b1',
+                     revision='r1'),
+            ])
+
+        def verify_thd(conn):
+            metadata = sa.MetaData()
+            metadata.bind = conn
+            sourcestampsets = sa.Table('sourcestampsets', metadata,
+                                       autoload=True)
+            rows = conn.execute(sa.select([sourcestampsets.c.id,
+                sourcestampsets.c.fingerprint])).fetchall()
+            fp = sourcestamps.sourceStampSetFingerprint
+            self.assertEqual(sorted(map(tuple, rows)), [
+                (1, fp([('c1', 'b1', 'r1'), ('c2', 'b2', None)])),
+                (2, fp([('c1', 'b1', 'r1')])),
+                (3, None),
+            ])
+
+            insp = sa.engine.reflection.Inspector.from_engine(conn)
+            indexes = dict((idx['name'], idx['column_names'])
+                           for idx in insp.get_indexes('sourcestampsets'))
+            self.assertEqual(indexes.get('sourcestampsets_fingerprint'),
+                             ['fingerprint'])
+            indexes = dict((idx['name'], idx['column_names'])
+                           for idx in insp.get_indexes('buildsets'))
+            self.assertEqual(indexes.get('buildsets_sourcestampsetid'),
+                             ['sourcestampsetid'])
+
+        return self.do_test_migration(32, 33, setup_thd, verify_thd)
@@ -14,10 +14,13 @@
 # Copyright Buildbot Team Members
 
 from twisted.trial import unittest
+from twisted.internet import defer
 from buildbot.db import sourcestamps
 from buildbot.test.util import connector_component
 from buildbot.test.fake import fakedb
 
+sourceStampSetFingerprint = sourcestamps.sourceStampSetFingerprint
+
 class TestSourceStampsConnectorComponent(
             connector_component.ConnectorComponentMixin,
             unittest.TestCase):
@@ -68,6 +71,39 @@ class TestSourceStampsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def getFingerprint(self, sourcestampsetid):
+        def thd(conn):
+            tbl = self.db.model.sourcestampsets
+            r = conn.execute(tbl.select(whereclause=(tbl.c.id == sourcestampsetid)))
+            return r.fetchone().fingerprint
+        return self.db.pool.do(thd)
+
+    @defer.inlineCallbacks
+    def test_addSourceStamp_fingerprint(self):
+        yield self.insertTestData([
+              fakedb.SourceStampSet(id=1),
+        ])
+        yield self.db.sourcestamps.addSourceStamp(branch='b1', revision='r1',
+            repository='rep', codebase='c1', project='p', sourcestampsetid=1)
+        fingerprint = yield self.getFingerprint(1)
+        self.assertEqual(fingerprint,
+            sourcestamps.sourceStampSetFingerprint([('c1', 'b1', 'r1')]))
+
+        yield self.db.sourcestamps.addSourceStamp(branch='b2', revision=None,
+            repository='rep2', codebase='c2', project='p', sourcestampsetid=1)
+        fingerprint = yield self.getFingerprint(1)
+        self.assertEqual(fingerprint,
+            sourcestamps.sourceStampSetFingerprint([('c2', 'b2', None), ('c1', 'b1', 'r1')]))
+
+    def test_sourceStampSetFingerprint(self):
+        fp = sourcestamps.sourceStampSetFingerprint
+        self.assertEqual(fp([('c1', 'b1', 'r1'), ('c2', 'b2', None)]),
+                         fp([('c2', 'b2', None), (u'c1', u'b1', u'r1')]))
+        self.assertNotEqual(fp([('c1', 'b1', 'r1')]),
+                            fp([('c1', 'b1', 'r1'), ('c2', 'b2', 'r2')]))
+        self.assertNotEqual(fp([('c1', 'b1', 'r1')]), fp([('c1', 'b1', None)]))
+        self.assertNotEqual(fp([('c1', 'b1', 'r1')]), fp([('c1', 'b2', 'r1')]))
+
     def test_addSourceStamp_changes(self):
         # add some sample changes and a sourcestampset for referential integrity
         d = self.insertTestData([
@@ -205,6 +241,37 @@ class TestSourceStampsConnectorComponent(
         d.addCallback(check)
         return d
 
+    def test_getSourceStampsForSets(self):
+        d = self.insertTestData([
+            fakedb.Change(changeid=16),
+            fakedb.Patch(id=99, patch_base64='aGVsbG8sIHdvcmxk',
+                patch_author='bar', patch_comment='foo', subdir='/foo',
+                patchlevel=3),
+            fakedb.SourceStampSet(id=234),
+            fakedb.SourceStampSet(id=235),
+            fakedb.SourceStamp(id=234, sourcestampsetid=234, codebase='a'),
+            fakedb.SourceStamp(id=235, sourcestampsetid=234, codebase='b',
+                patchid=99),
+            fakedb.SourceStamp(id=236, sourcestampsetid=235, codebase='a'),
+            fakedb.SourceStampChange(sourcestampid=234, changeid=16),
+        ])
+        d.addCallback(lambda _ :
+                self.db.sourcestamps.getSourceStampsForSets([234, 235, 236]))
+        def check(sssets):
+            self.assertEqual(sorted(sssets.keys()), [234, 235, 236])
+            self.assertEqual(sorted(ss['ssid'] for ss in sssets[234]),
+                             [234, 235])
+            self.assertEqual([ ss['ssid'] for ss in sssets[235] ], [236])
+            self.assertEqual(sssets[236], [])
+            ssdicts = dict((ss['ssid'], ss) for ss in sssets[234])
+            self.assertEqual(ssdicts[234]['changeids'], set([16]))
+            self.assertEqual(ssdicts[234]['patch_body'], None)
+            self.assertEqual(ssdicts[235]['changeids'], set())
+            self.assertEqual(ssdicts[235]['patch_body'], 'hello, world')
+            self.assertEqual(ssdicts[235]['patch_subdir'], '/foo')
+        d.addCallback(check)
+        return d
+
     def test_getSourceStamp_nosuch(self):
         d = self.db.sourcestamps.getSourceStamp(234)
         def check(ssdict):
@@ -245,6 +312,10 @@ class TestSourceStampsConnectorComponent(
         d.addCallback(lambda _: self.db.sourcestamps.getSourceStamp(2))
         d.addCallback(checkRevision, codebase='c2', revision='r2')
 
+        d.addCallback(lambda _: self.getFingerprint(1))
+        d.addCallback(self.assertEqual,
+            sourceStampSetFingerprint([('c1', 'b1', 'r1'), ('c2', 'b2', 'r2')]))
+
         return d
 
     def test_findLastBuildRev(self):
@@ -93,6 +93,34 @@ class Subscriptions(dirs.DirsMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_addChanges(self):
+        self.master.db = fakedb.FakeDBConnector(self)
+        self.patch(users, 'createUserObject',
+                lambda master, author, src : defer.succeed(7))
+
+        cb = mock.Mock()
+        self.master.subscribeToChanges(cb)
+
+        d = self.master.addChanges([
+                dict(who=u'me', revision=u'abc', comments=u'one', files=[],
+                     src='git'),
+                dict(author=u'you', revision=u'def', comments=u'two', files=[],
+                     when=266738404, properties={'a' : 'b'}),
+            ])
+        def check(added):
+            self.assertEqual([ ch.revision for ch in added ],
+                             [u'abc', u'def'])
+            self.assertEqual([ ch.who for ch in added ], [u'me', u'you'])
+            self.assertEqual(added[1].when, 266738404)
+            self.assertEqual(added[1].properties.getProperty('a'), 'b')
+            self.assertEqual(self.master.db.changes.changes[500].uid, 7)
+            self.assertEqual(self.master.db.changes.changes[501].uid, None)
+            # notifications are delivered in order
+            self.assertEqual(cb.call_args_list,
+                             [ ((ch,), {}) for ch in added ])
+        d.addCallback(check)
+        return d
+
     def do_test_addChange_args(self, args=(), kwargs={}, exp_db_kwargs={}):
         # add default arguments
         default_db_kwargs = dict(files=None, comments=None, author=None,
@@ -542,6 +570,74 @@ class Polling(dirs.DirsMixin, misc.PatcherMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_pollDatabaseBuildRequests_high_water_mark(self):
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=19, buildsetid=99, buildername='9teen'),
+        ])
+        d = self.master.pollDatabaseBuildRequests()
+        def insert(_):
+            self.db.insertTestData([
+                fakedb.BuildRequest(id=20, buildsetid=99,
+                                    buildername='twenty'),
+            ])
+            self.db.buildrequests.fakeClaimBuildRequest(19)
+            self.gotten_buildrequest_additions.append('MARK')
+            self.getBuildRequests_calls = []
+            real_getBuildRequests = self.db.buildrequests.getBuildRequests
+            def getBuildRequests(**kwargs):
+                self.getBuildRequests_calls.append(kwargs)
+                return real_getBuildRequests(**kwargs)
+            self.patch(self.db.buildrequests, 'getBuildRequests',
+                       getBuildRequests)
+        d.addCallback(insert)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def check(_):
+            self.assertEqual(self.getBuildRequests_calls,
+                    [ dict(complete=False, after_brid=19) ])
+            self.assertEqual(self.gotten_buildrequest_additions, [
+                dict(bsid=99, brid=19, buildername='9teen'),
+                'MARK',
+                dict(bsid=99, brid=20, buildername='twenty'),
+            ])
+            self.assertEqual(self.master._max_seen_brid, 20)
+        d.addCallback(check)
+        return d
+
+    def test_pollDatabaseBuildRequests_claimed_then_unclaimed(self):
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=11, buildsetid=9, buildername='eleventy'),
+            fakedb.BuildRequest(id=12, buildsetid=9, buildername='twelve'),
+        ])
+        # both requests are claimed by another master before this one looks
+        self.db.buildrequests.fakeClaimBuildRequest(11)
+        self.db.buildrequests.fakeClaimBuildRequest(12)
+        d = self.master.pollDatabaseBuildRequests()
+        def unclaim(_):
+            self.assertEqual(self.gotten_buildrequest_additions, [])
+            # one is released for a retry, and the other completes
+            self.db.buildrequests.fakeUnclaimBuildRequest(11)
+            self.db.buildrequests.completeBuildRequests([12], 0)
+            self.getBuildRequests_calls = []
+            real_getBuildRequests = self.db.buildrequests.getBuildRequests
+            def getBuildRequests(**kwargs):
+                self.getBuildRequests_calls.append(kwargs)
+                return real_getBuildRequests(**kwargs)
+            self.patch(self.db.buildrequests, 'getBuildRequests',
+                       getBuildRequests)
+        d.addCallback(unclaim)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def check(_):
+            # no full sweep is needed to notice the released request
+            self.assertEqual(self.getBuildRequests_calls, [
+                dict(complete=False, after_brid=12),
+                dict(complete=False, brids=[11, 12]),
+            ])
+            self.assertEqual(self.gotten_buildrequest_additions,
+                    [ dict(bsid=9, brid=11, buildername='eleventy') ])
+            self.assertEqual(self.master._claimed_brids_set, set())
+        d.addCallback(check)
+        return d
+
     def test_pollDatabaseBuildRequests_incremental(self):
         d = defer.succeed(None)
         def insert1(_):
@@ -569,14 +665,28 @@ class Polling(dirs.DirsMixin, misc.PatcherMixin, unittest.TestCase):
             # not get a new notification about it
         d.addCallback(unclaim)
         d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
+        def sweep(_):
+            # the request was unclaimed when this master saw it, so it is only
+            # noticed by the next full sweep, which cannot tell it
+            # from a request that stayed unclaimed; rather than announcing it
+            # again, the sweep has the botmaster retry all builders with
+            # unclaimed requests
+            self.gotten_buildrequest_additions.append('MARK')
+            self.master._polls_since_sweep = \
+                    self.master.UNCLAIMED_SWEEP_POLLS
+            self.patch(self.master.botmaster, 'maybeStartBuildsForBuilder',
+                       self.gotten_buildrequest_additions.append)
+        d.addCallback(sweep)
+        d.addCallback(lambda _ : self.master.pollDatabaseBuildRequests())
         def check(_):
-            self.assertEqual(self.gotten_buildrequest_additions, [
+            self.assertEqual(self.gotten_buildrequest_additions[:4], [
                 dict(bsid=9, brid=11, buildername='eleventy'),
                 'MARK',
                 dict(bsid=9, brid=20, buildername='twenty'),
                 'MARK',
-                dict(bsid=9, brid=11, buildername='eleventy'),
             ])
+            self.assertEqual(sorted(self.gotten_buildrequest_additions[4:]),
+                             [ 'MARK', 'eleventy', 'twenty' ])
         d.addCallback(check)
         return d
 
@@ -18,7 +18,7 @@ from twisted.trial import unittest
 from twisted.internet import defer, reactor
 from twisted.python import failure
 from buildbot.test.util import compat
-from buildbot.process import botmaster
+from buildbot.process import botmaster, metrics
 from buildbot.util import epoch2datetime
 
 class Test(unittest.TestCase):
@@ -31,6 +31,7 @@ class Test(unittest.TestCase):
             return sorted(builders, lambda b1,b2 : cmp(b1.name, b2.name))
         self.master = self.botmaster.master = mock.Mock(name='master')
         self.master.config.prioritizeBuilders = prioritizeBuilders
+        self.master.config.builderDispatchConcurrency = 1
         self.brd = botmaster.BuildRequestDistributor(self.botmaster)
         self.brd.startService()
 
@@ -253,3 +254,85 @@ class Test(unittest.TestCase):
                     ['A', 'A-finished', '(stopped)'])
         self.quiet_deferred.addCallback(check)
         return self.quiet_deferred
+
+    # concurrent dispatch
+
+    def addSlowBuilders(self, slavenames, locks={}):
+        # builders whose maybeStartBuild takes two reactor turns, logging its
+        # start and finish
+        for name, slaves in slavenames.iteritems():
+            bldr = mock.Mock(name=name)
+            bldr.name = name
+            bldr.config.slavenames = slaves
+            bldr.config.locks = locks.get(name, [])
+            def maybeStartBuild(n=name):
+                self.maybeStartBuild_calls.append(n)
+                d = defer.Deferred()
+                def finish():
+                    self.maybeStartBuild_calls.append(n + '-done')
+                    d.callback(None)
+                reactor.callLater(0, reactor.callLater, 0, finish)
+                return d
+            bldr.maybeStartBuild = maybeStartBuild
+            self.botmaster.builders[name] = bldr
+            self.builders[name] = bldr
+
+    def do_test_concurrent(self, concurrency, slavenames, expected, locks={}):
+        self.master.config.builderDispatchConcurrency = concurrency
+        self.addSlowBuilders(slavenames, locks)
+        self.brd.maybeStartBuildsOn(sorted(slavenames))
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls, expected)
+        self.quiet_deferred.addCallback(check)
+        return self.quiet_deferred
+
+    def test_concurrent_independent(self):
+        return self.do_test_concurrent(3,
+                dict(A=['s1'], B=['s2'], C=['s3']),
+                ['A', 'B', 'C', 'A-done', 'B-done', 'C-done'])
+
+    def test_concurrent_bound(self):
+        return self.do_test_concurrent(2,
+                dict(A=['s1'], B=['s2'], C=['s3']),
+                ['A', 'B', 'A-done', 'C', 'B-done', 'C-done'])
+
+    def test_concurrent_shared_slave(self):
+        # B shares a slave with A, so it waits for A even though C, which is
+        # lower priority, can start immediately
+        return self.do_test_concurrent(3,
+                dict(A=['s1', 's2'], B=['s2'], C=['s3']),
+                ['A', 'C', 'A-done', 'B', 'C-done', 'B-done'])
+
+    def test_concurrent_shared_lock(self):
+        lock = mock.Mock(name='lock')
+        return self.do_test_concurrent(3,
+                dict(A=['s1'], B=['s2'], C=['s3']),
+                ['A', 'C', 'A-done', 'B', 'C-done', 'B-done'],
+                locks=dict(A=[lock], B=[lock]))
+
+    def test_concurrent_same_builder(self):
+        # a builder that is queued again while it is being dispatched waits
+        # for the first call to finish
+        self.master.config.builderDispatchConcurrency = 2
+        self.addSlowBuilders(dict(A=['s1']))
+        self.brd.maybeStartBuildsOn(['A'])
+        reactor.callLater(0, self.brd.maybeStartBuildsOn, ['A'])
+        def check(_):
+            self.assertEqual(self.maybeStartBuild_calls,
+                    ['A', 'A-done', 'A', 'A-done'])
+        self.quiet_deferred.addCallback(check)
+        return self.quiet_deferred
+
+    def test_dispatch_latency_metrics(self):
+        events = []
+        self.patch(metrics.MetricTimeEvent, 'log',
+                classmethod(lambda cls, timer, elapsed : events.append(timer)))
+        self.addBuilders(['bldr1'])
+        self.brd.maybeStartBuildsOn(['bldr1'])
+        def check(_):
+            self.assertIn('BuildRequestDistributor.dispatch_latency(bldr1)',
+                          events)
+            self.assertIn('BuildRequestDistributor.maybeStartBuild(bldr1)',
+                          events)
+        self.quiet_deferred.addCallback(check)
+        return self.quiet_deferred
@@ -124,6 +124,15 @@ class TestBuilderBuildCreation(unittest.TestCase):
         # and then check that things happened in the right order
         self.assertEqual(events, [ 'long_d', 'stop_d' ])
 
+    @defer.inlineCallbacks
+    def test_stopService_closes_build_history(self):
+        yield self.makeBuilder()
+        self.bldr.builder_status = mock.Mock()
+
+        yield self.bldr.stopService()
+
+        self.bldr.builder_status.closeBuildHistory.assert_called_with()
+
     # maybeStartBuild
 
     def assertBuildingRequets(self, exp):
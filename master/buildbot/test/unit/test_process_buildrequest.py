@@ -14,8 +14,10 @@
 # Copyright Buildbot Team Members
 
 from twisted.trial import unittest
+from twisted.internet import defer
 from buildbot.test.fake import fakedb, fakemaster
 from buildbot.process import buildrequest
+from buildbot.util import lru
 from buildbot.status.results import CANCELED
 
 class FakeSource:
@@ -170,6 +172,83 @@ class TestBuildRequest(unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_fromBrdicts(self):
+        master = fakemaster.make_master()
+        master.db = fakedb.FakeDBConnector(self)
+        master.db.insertTestData([
+            fakedb.Change(changeid=13, branch='trunk', revision='9283',
+                        repository='svn://...', project='world-domination'),
+            fakedb.SourceStampSet(id=234),
+            fakedb.SourceStamp(id=234, sourcestampsetid=234, branch='trunk',
+                        revision='9284', repository='svn://...',
+                        project='world-domination'),
+            fakedb.SourceStampChange(sourcestampid=234, changeid=13),
+            fakedb.SourceStampSet(id=235),
+            fakedb.SourceStamp(id=235, sourcestampsetid=235, branch='dev',
+                        revision='9285', repository='svn://...',
+                        project='world-domination'),
+            fakedb.Buildset(id=539, reason='triggered', sourcestampsetid=234),
+            fakedb.BuildsetProperty(buildsetid=539, property_name='x',
+                        property_value='[1, "X"]'),
+            fakedb.Buildset(id=540, reason='forced', sourcestampsetid=235),
+            fakedb.BuildRequest(id=288, buildsetid=539, buildername='bldr',
+                        priority=13, submitted_at=1200000000),
+            fakedb.BuildRequest(id=289, buildsetid=540, buildername='bldr',
+                        priority=0, submitted_at=1200000001),
+        ])
+        # the per-request queries must not be used
+        def fail(*args):
+            self.fail("unexpected per-request query")
+        master.db.buildsets.getBuildset = fail
+        master.db.buildsets.getBuildsetProperties = fail
+        master.db.sourcestamps.getSourceStamps = fail
+
+        d = defer.gatherResults([ master.db.buildrequests.getBuildRequest(brid)
+                                  for brid in (288, 289) ])
+        d.addCallback(lambda brdicts :
+                    buildrequest.BuildRequest.fromBrdicts(master, brdicts))
+        def check(brs):
+            self.assertEqual([ br.id for br in brs ], [288, 289])
+            self.assertEqual([ br.reason for br in brs ],
+                             ['triggered', 'forced'])
+            self.assertEqual(brs[0].properties.getProperty('x'), 1)
+            self.assertFalse(brs[1].properties.hasProperty('x'))
+            self.assertEqual([ ch.number for ch in brs[0].source.changes],
+                             [13])
+            self.assertEqual(brs[1].source.branch, 'dev')
+        d.addCallback(check)
+        return d
+
+    def makeCachedBuildRequest(self, master, brid):
+        brobj = buildrequest.BuildRequest()
+        cache = lru.AsyncLRUCache(lambda brid, **kw : defer.succeed(brobj), 10)
+        master.caches.get_cache = lambda name, miss_fn : cache
+        cache.get(brid)
+        return cache, brobj
+
+    def test_fromBrdicts_cached(self):
+        master = fakemaster.make_master()
+        master.db = fakedb.FakeDBConnector(self)
+        cache, brobj = self.makeCachedBuildRequest(master, 288)
+
+        def fail(*args):
+            self.fail("unexpected bulk query")
+        master.db.buildsets.getBuildsetsByIds = fail
+
+        d = buildrequest.BuildRequest.fromBrdicts(master,
+                [ dict(brid=288, buildsetid=539) ])
+        def check(brs):
+            self.assertEqual(brs, [brobj])
+        d.addCallback(check)
+        return d
+
+    def test_invalidate(self):
+        master = fakemaster.make_master()
+        cache, brobj = self.makeCachedBuildRequest(master, 288)
+        self.assertTrue(288 in cache)
+        buildrequest.BuildRequest.invalidate(master, [288, 289])
+        self.assertFalse(288 in cache)
+
     def test_mergeSourceStampsWith_common_codebases(self):
         """ This testcase has two buildrequests
             Request Change Codebase Revision Comment
@@ -81,6 +81,38 @@ class TestRegexLogEvaluator(unittest.TestCase):
                 % (new_status, WARNINGS))
 
 
+class TestOutputBuffer(unittest.TestCase):
+
+    def test_all(self):
+        buf = buildstep.OutputBuffer()
+        for chunk in ['abc', 'def', 'g']:
+            buf.append(chunk)
+        self.assertEqual(buf.getvalue(), 'abcdefg')
+        self.assertEqual(buf.chunks, ['abcdefg'])
+        self.assertEqual(buf.getTruncated(), 0)
+
+    def test_window(self):
+        buf = buildstep.OutputBuffer(head=4, tail=3)
+        for chunk in ['abc', 'defgh', 'ij', 'k', 'lm']:
+            buf.append(chunk)
+        self.assertEqual(buf.getvalue(), 'abcdklm')
+        self.assertEqual(buf.getTruncated(), 6)
+        # chunks which are entirely before the tail are dropped
+        self.assertEqual(list(buf.tailChunks), ['k', 'lm'])
+
+    def test_tail_only(self):
+        buf = buildstep.OutputBuffer(tail=5)
+        buf.append('abcdefgh')
+        buf.append('ij')
+        self.assertEqual(buf.getvalue(), 'fghij')
+
+    def test_remote_command(self):
+        cmd = buildstep.RemoteCommand('shell', {}, collectStdout=True,
+                                      collectHead=2)
+        cmd.addStdout('abc')
+        cmd.addStdout('def')
+        self.assertEqual(cmd.stdout, 'ab')
+
 class TestBuildStep(steps.BuildStepMixin, unittest.TestCase):
 
     class FakeBuildStep(buildstep.BuildStep):
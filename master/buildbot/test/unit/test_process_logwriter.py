@@ -0,0 +1,154 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os
+import threading
+from twisted.trial import unittest
+from twisted.internet import defer
+from buildbot import config
+from buildbot.process import logwriter, metrics
+
+class FakeLogFile(object):
+    filename = 'fake'
+
+    def __init__(self, expected):
+        self.flushed = []
+        self.expected = expected
+        self.d = defer.Deferred()
+
+    def _flushed(self, nbytes, nitems):
+        self.flushed.append((nbytes, nitems))
+        self.expected -= nitems
+        if not self.expected:
+            self.d.callback(None)
+
+class BlockingFile(object):
+    "a file whose first write blocks until released"
+
+    def __init__(self):
+        self.data = []
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def seek(self, offset, whence=0):
+        pass
+
+    def write(self, data):
+        if not self.data:
+            self.writing.set()
+            self.release.wait()
+        self.data.append(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class LogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.writer = logwriter.LogWriter()
+        self.filename = os.path.abspath(self.mktemp())
+        self.fd = open(self.filename, "w+")
+        self.counts = {}
+        self.times = []
+        def count(cls, name, value, absolute=False):
+            self.counts.setdefault(name, []).append(value)
+        self.patch(metrics.MetricCountEvent, 'log', classmethod(count))
+        self.patch(metrics.MetricTimeEvent, 'log',
+                classmethod(lambda cls, timer, elapsed :
+                                self.times.append(timer)))
+
+    def tearDown(self):
+        if self.writer.running:
+            return self.writer.stopService()
+
+    def contents(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def start(self, size=1000):
+        new_config = config.MasterConfig()
+        new_config.logWriterBufferSize = size
+        self.writer.reconfigService(new_config)
+        self.writer.startService()
+
+    def test_not_running(self):
+        lf = FakeLogFile(2)
+        self.writer.write(lf, self.fd, "abc")
+        self.writer.write(lf, self.fd, "de")
+        # written right away, but reported through the reactor
+        self.assertEqual(self.contents(), "abcde")
+        self.assertEqual(lf.flushed, [])
+        def check(_):
+            self.assertEqual(lf.flushed, [(3, 1), (2, 1)])
+        lf.d.addCallback(check)
+        return lf.d
+
+    def test_disabled(self):
+        self.writer.startService()
+        self.assertEqual(self.writer.thread, None)
+
+    @defer.inlineCallbacks
+    def test_write_threaded(self):
+        self.start()
+        self.assertNotEqual(self.writer.thread, None)
+        lf = FakeLogFile(3)
+        for data in ("abc", "de", "f"):
+            self.writer.write(lf, self.fd, data)
+        self.writer.close(lf, self.fd)
+        yield lf.d
+        self.assertEqual(self.contents(), "abcdef")
+        self.assertEqual(sum(n for n, _ in lf.flushed), 6)
+        yield self.writer.stopService()
+        self.assertEqual(self.writer.thread, None)
+        self.assertTrue(self.fd.closed)
+        self.assertIn('LogWriter.flush_latency', self.times)
+        self.assertEqual(self.counts['LogWriter.queue_depth'][-1], 0)
+        self.assertEqual(self.counts['LogWriter.queued_bytes'][-1], 0)
+
+    @defer.inlineCallbacks
+    def test_stop_drains(self):
+        self.start()
+        lf = FakeLogFile(2)
+        self.writer.write(lf, self.fd, "abc")
+        self.writer.write(lf, self.fd, "de")
+        yield self.writer.stopService()
+        self.assertEqual(self.contents(), "abcde")
+        # once stopped, writes happen synchronously again
+        self.writer.write(lf, self.fd, "f")
+        self.assertEqual(self.contents(), "abcdef")
+
+    def test_backpressure(self):
+        self.start(size=10)
+        fd = BlockingFile()
+        lf = FakeLogFile(3)
+        self.writer.write(lf, fd, "x" * 6)
+        fd.writing.wait()
+        # the writer thread is stuck on the first write, so this one fits..
+        self.writer.write(lf, fd, "y" * 4)
+        self.assertEqual(self.counts.get('LogWriter.stalls'), None)
+        # ..but this one must wait for it
+        threading.Timer(0.1, fd.release.set).start()
+        self.writer.write(lf, fd, "z" * 4)
+        self.assertEqual(self.counts['LogWriter.stalls'], [1])
+        self.assertTrue(self.writer.queuedBytes <= 10)
+        def check(_):
+            self.assertEqual("".join(fd.data), "x" * 6 + "y" * 4 + "z" * 4)
+        lf.d.addCallback(check)
+        return lf.d
@@ -19,6 +19,7 @@ import twisted
 from twisted.trial import unittest
 from twisted.internet import defer
 from buildbot import config
+from buildbot.changes import filter
 from buildbot.schedulers import base
 from buildbot.process import properties
 from buildbot.test.util import scheduler
@@ -179,6 +180,28 @@ class BaseScheduler(scheduler.SchedulerMixin, unittest.TestCase):
                 self.makeFakeChange(),
                 True)
 
+    def test_change_consumption_conditions(self):
+        sched = self.makeScheduler(codebases={'a': {'repository': 'A'},
+                                              'b': {'repository': 'B'}})
+        cf = filter.ChangeFilter(project='p', branch_re='rel.*')
+        d = sched.startConsumingChanges(change_filter=cf)
+        def check(_):
+            conditions = self.master.changes_subscr_conditions
+            self.assertEqual(sorted(conditions[0][1]), ['a', 'b'])
+            self.assertEqual(conditions[1:], [('project', ['p'])])
+        d.addCallback(check)
+        return d
+
+    def test_change_consumption_conditions_duckTypedFilter(self):
+        sched = self.makeScheduler()
+        cf = mock.Mock()
+        d = sched.startConsumingChanges(change_filter=cf)
+        def check(_):
+            self.assertEqual(self.master.changes_subscr_conditions,
+                             [('codebase', [''])])
+        d.addCallback(check)
+        return d
+
     def test_addBuilsetForLatest_args(self):
         sched = self.makeScheduler(name='xyz', builderNames=['y', 'z'])
         d = sched.addBuildsetForLatest(reason='cuz', branch='default',
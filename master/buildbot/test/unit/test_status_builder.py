@@ -91,6 +91,44 @@ class TestBuilderStatus(unittest.TestCase):
         self.assertEqual(builds[0].number, 38)
 
 
+    @defer.inlineCallbacks
+    def test_generateFinishedBuildsUseLatestBuildsTable(self):
+        codebases = {'katana-buildbot': 'katana'}
+
+        lookups = []
+        def getLatestBuildNumbers(buildernames, key, results=None):
+            lookups.append((buildernames, key, results))
+            return defer.succeed({'builder-01': 37})
+        self.master.db.builds.getLatestBuildNumbers = getLatestBuildNumbers
+        self.master.db.builds.getLastBuildsNumbers = lambda **kw: \
+            self.fail("should not search the builds")
+
+        builds = yield self.builder_status.generateFinishedBuildsAsync(branches=[],
+                                                                       codebases=codebases,
+                                                                       num_builds=1,
+                                                                       useCache=True)
+
+        self.assertEqual(lookups, [(['builder-01'], 'katana-buildbot=katana;', [])])
+        self.assertEqual([b.number for b in builds], [37])
+        self.assertEqual(self.builder_status.latestBuildCache['katana-buildbot=katana;']['build'], 37)
+
+    @defer.inlineCallbacks
+    def test_generateFinishedBuildsLatestBuildsTableMissingBuild(self):
+        codebases = {'katana-buildbot': 'katana'}
+
+        self.master.db.builds.getLatestBuildNumbers = lambda buildernames, key, results=None: \
+            defer.succeed({'builder-01': 37})
+        getCachedBuild = self.builder_status.buildCache.get
+        self.builder_status.buildCache.get = lambda number: \
+            None if number == 37 else getCachedBuild(number)
+
+        builds = yield self.builder_status.generateFinishedBuildsAsync(branches=[],
+                                                                       codebases=codebases,
+                                                                       num_builds=1,
+                                                                       useCache=True)
+
+        self.assertEqual([b.number for b in builds], [38])
+
     @defer.inlineCallbacks
     def test_emptyCodebaseSelectionShouldSkipLatestBuildCache(self):
         codebases = {}
@@ -162,3 +200,84 @@ class TestBuilderStatus(unittest.TestCase):
                                                      num_builds=1, useCache=True)
 
         self.assertEqual(self.builder_status.latestBuildCache['codebase1=branch1;codebase2=branch2;']['build'], 38)
+
+    @defer.inlineCallbacks
+    def test_closeBuildHistory(self):
+        # nothing to close before the history is used
+        yield self.builder_status.closeBuildHistory()
+
+        history = self.builder_status.buildHistory = Mock()
+        prune_d = defer.Deferred()
+        self.builder_status.status = Mock()
+        self.builder_status.status.retention.wait.return_value = prune_d
+        d = self.builder_status.closeBuildHistory()
+        self.assertEqual(self.builder_status.buildHistory, None)
+        self.builder_status.status.retention.wait.assert_called_with(
+                'builder-01')
+        # the history is only closed once its prunes have finished
+        self.assertFalse(history.close.called)
+        prune_d.callback(None)
+        yield d
+        history.close.assert_called_with()
+
+    @defer.inlineCallbacks
+    def test_iterFinishedBuildsAsync(self):
+        self.builder_status.nextBuildNumber = 10
+        loads = []
+        def deferToThread(number):
+            loads.append(number)
+            build = Mock(name='build %d' % number)
+            build.getNumber.return_value = number
+            # build 9 is still running
+            build.isFinished.return_value = number != 9
+            build.getTimes.return_value = (0, number)
+            return defer.succeed(build)
+        self.builder_status.deferToThread = deferToThread
+
+        g = self.builder_status.iterFinishedBuildsAsync(finished_before=7,
+                                                        max_search=8,
+                                                        prefetch=3)
+        build = yield g.next()
+        self.assertEqual(build.getNumber(), 6)
+        # the builds are loaded one at a time until the first is taken, and
+        # then up to prefetch builds ahead
+        self.assertEqual(loads, [9, 8, 7, 6, 5, 4, 3])
+
+        numbers = []
+        while True:
+            build = yield g.next()
+            if build is None:
+                break
+            numbers.append(build.getNumber())
+        self.assertEqual(numbers, [5, 4, 3, 2])
+        self.assertEqual(loads, [9, 8, 7, 6, 5, 4, 3, 2])
+
+    @defer.inlineCallbacks
+    def test_iterFinishedBuildsAsync_codebases(self):
+        self.builder_status.nextBuildNumber = 4
+        def deferToThread(number):
+            build = Mock(name='build %d' % number)
+            build.getNumber.return_value = number
+            build.isFinished.return_value = True
+            # odd builds are on branch2 of codebase1
+            ss = Mock(codebase='codebase1',
+                      branch='branch%d' % (number % 2 + 1))
+            build.getSourceStamps.return_value = [ss]
+            return defer.succeed(build)
+        self.builder_status.deferToThread = deferToThread
+
+        for kwargs, expected in [
+                (dict(codebases={'codebase1': 'branch2'}), [3, 1]),
+                # codebases takes precedence over branches
+                (dict(codebases={'codebase1': 'branch1'},
+                      branches=['branch2']), [2, 0]),
+                (dict(branches=['branch2']), [3, 1]),
+                ]:
+            g = self.builder_status.iterFinishedBuildsAsync(**kwargs)
+            numbers = []
+            while True:
+                build = yield g.next()
+                if build is None:
+                    break
+                numbers.append(build.getNumber())
+            self.assertEqual(numbers, expected)
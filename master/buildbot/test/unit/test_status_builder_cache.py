@@ -24,8 +24,9 @@ class TestBuildStatus(unittest.TestCase):
     # that buildstep.BuildStepStatus is never instantiated here should tell you
     # that these classes are not well isolated!
 
-    def setupBuilder(self, buildername, category=None):
+    def setupBuilder(self, buildername, category=None, backend='pickle'):
         m = fakemaster.make_master()
+        m.config.buildHistoryBackend = backend
         b = builder.BuilderStatus(buildername=buildername, category=category,
                                     master=m)
         # Awkwardly, Status sets this member variable.
@@ -47,7 +48,13 @@ class TestBuildStatus(unittest.TestCase):
         return s
 
     def testBuildCache(self):
-        b = self.setupBuilder('builder_1')
+        self.do_testBuildCache('pickle')
+
+    def testBuildCacheSqlite(self):
+        self.do_testBuildCache('sqlite')
+
+    def do_testBuildCache(self, backend):
+        b = self.setupBuilder('builder_1', backend=backend)
         builds = []
         for i in xrange(5):
             build = b.newBuild()
@@ -0,0 +1,187 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import os
+from cPickle import dumps
+from twisted.trial import unittest
+from buildbot.status import buildhistory
+
+class FakeLog(object):
+    def __init__(self, filename):
+        self.filename = filename
+
+class FakeStep(object):
+    def __init__(self, logs):
+        self.logs = logs
+
+    def getLogs(self):
+        return self.logs
+
+class FakeBuild(object):
+    persistenceVersion = 4
+    results = 0
+    finished = 1234.0
+
+    def __init__(self, number, logfiles=()):
+        self.number = number
+        self.steps = [ FakeStep([ FakeLog(f) for f in logfiles ]) ]
+
+    def getSteps(self):
+        return self.steps
+
+class BuildHistoryMixin(object):
+
+    def setUp(self):
+        self.basedir = os.path.abspath(self.mktemp())
+        os.makedirs(self.basedir)
+
+    def touch(self, filename, contents=''):
+        with open(os.path.join(self.basedir, filename), "wb") as f:
+            f.write(contents)
+
+    def exists(self, filename):
+        return os.path.exists(os.path.join(self.basedir, filename))
+
+    def saveBuild(self, history, number):
+        logfile = "%d-log-compile-stdio" % number
+        self.touch(logfile)
+        history.saveBuild(FakeBuild(number, [logfile]))
+
+    def test_empty(self):
+        history = self.makeHistory()
+        self.assertEqual(history.getNextBuildNumber(), 0)
+        self.assertEqual(history.loadBuild(0), None)
+        self.assertFalse(history.hasBuild(0))
+
+    def test_save_load(self):
+        history = self.makeHistory()
+        self.saveBuild(history, 0)
+        self.saveBuild(history, 1)
+        self.assertEqual(history.getNextBuildNumber(), 2)
+        self.assertTrue(history.hasBuild(1))
+        self.assertEqual(history.loadBuild(1).number, 1)
+        self.assertEqual(history.loadBuild(2), None)
+
+    def test_prune(self):
+        history = self.makeHistory()
+        for number in range(6):
+            self.saveBuild(history, number)
+        self.touch("1-log-compile-stdio.bz2")
+
+        history.prune(earliest_build=2, earliest_log=4, keep=[0])
+
+        self.assertTrue(history.hasBuild(0))
+        self.assertFalse(history.hasBuild(1))
+        self.assertFalse(self.exists("1-log-compile-stdio"))
+        self.assertFalse(self.exists("1-log-compile-stdio.bz2"))
+        self.assertTrue(history.hasBuild(3))
+        self.assertFalse(self.exists("3-log-compile-stdio"))
+        self.assertTrue(history.hasBuild(4))
+        self.assertTrue(self.exists("4-log-compile-stdio"))
+
+    def test_prune_reclaimed(self):
+        history = self.makeHistory()
+        self.saveBuild(history, 0)
+        self.touch("0-log-compile-stdio.bz2", "x" * 100)
+        self.saveBuild(history, 1)
+        self.assertEqual(history.prune(earliest_build=0, earliest_log=1), 100)
+
+    def test_getUsage(self):
+        history = self.makeHistory()
+        self.touch("0-log-compile-stdio.gz", "x" * 1000)
+        history.saveBuild(FakeBuild(0, ["0-log-compile-stdio"]))
+        self.saveBuild(history, 1)
+        usage = history.getUsage()
+        self.assertEqual([ number for number, finished, size in usage ],
+                         [0, 1])
+        # the logfile is counted, whatever its suffix
+        self.assertTrue(usage[0][2] > 1000)
+        self.assertTrue(usage[1][2] < 1000)
+
+        history.prune(earliest_build=1, earliest_log=1)
+        self.assertEqual([ number for number, finished, size
+                           in history.getUsage() ], [1])
+
+class TestPickleBuildHistory(BuildHistoryMixin, unittest.TestCase):
+
+    def makeHistory(self):
+        return buildhistory.PickleBuildHistory(self.basedir)
+
+    def test_next_build_number_counts_logfiles(self):
+        self.touch("7-log-compile-stdio")
+        history = self.makeHistory()
+        self.assertEqual(history.getNextBuildNumber(), 8)
+
+    def test_prune_without_scan(self):
+        history = self.makeHistory()
+        self.assertEqual(history.getNextBuildNumber(), 0)
+        self.saveBuild(history, 0)
+        self.saveBuild(history, 1)
+        def listdir(path):
+            raise AssertionError("directory scanned")
+        self.patch(os, 'listdir', listdir)
+        history.prune(earliest_build=1, earliest_log=1)
+        self.assertFalse(history.hasBuild(0))
+        self.assertFalse(self.exists("0-log-compile-stdio"))
+        self.assertTrue(history.hasBuild(1))
+        self.assertEqual(history.getNextBuildNumber(), 2)
+
+class TestSqliteBuildHistory(BuildHistoryMixin, unittest.TestCase):
+
+    def makeHistory(self):
+        return buildhistory.SqliteBuildHistory(self.basedir)
+
+    def test_buildNumberAllocated(self):
+        history = self.makeHistory()
+        self.saveBuild(history, 0)
+        history.buildNumberAllocated(5)
+        self.assertEqual(history.getNextBuildNumber(), 6)
+        history.buildNumberAllocated(2)
+        self.assertEqual(history.getNextBuildNumber(), 6)
+
+    def test_reopen(self):
+        history = self.makeHistory()
+        self.saveBuild(history, 3)
+        history.close()
+        history = self.makeHistory()
+        self.assertEqual(history.getNextBuildNumber(), 4)
+        self.assertEqual(history.loadBuild(3).number, 3)
+
+    def test_migrate(self):
+        self.touch("builder", "builder pickle")
+        self.touch("3", dumps(FakeBuild(3), -1))
+        self.touch("3-log-compile-stdio.bz2")
+        # an interrupted build leaves logfiles but no pickle
+        self.touch("9-log-compile-stdio")
+
+        history = self.makeHistory()
+
+        self.assertFalse(self.exists("3"))
+        self.assertTrue(self.exists("builder"))
+        self.assertEqual(history.loadBuild(3).number, 3)
+        self.assertEqual(history.getNextBuildNumber(), 10)
+
+        # logfiles of migrated builds are pruned without a directory scan
+        history.prune(earliest_build=5, earliest_log=5)
+        self.assertFalse(history.hasBuild(3))
+        self.assertFalse(self.exists("3-log-compile-stdio.bz2"))
+        self.assertTrue(self.exists("9-log-compile-stdio"))
+
+    def test_migrate_only_once(self):
+        self.makeHistory().close()
+        self.touch("3", dumps(FakeBuild(3), -1))
+        history = self.makeHistory()
+        self.assertTrue(self.exists("3"))
+        self.assertFalse(history.hasBuild(3))
@@ -0,0 +1,95 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+from twisted.internet import defer, task
+from buildbot.status import globalstatus
+from buildbot.test.fake import fakedb
+
+class TestGlobalStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.status = mock.Mock(name='status')
+        self.db = self.status.master.db = fakedb.FakeDBConnector(self)
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=1, buildsetid=1),
+            fakedb.BuildRequest(id=2, buildsetid=1),
+            fakedb.BuildRequest(id=3, buildsetid=1),
+            fakedb.BuildRequestClaim(brid=3, objectid=1, claimed_at=1),
+        ])
+        self.gs = globalstatus.GlobalStatus(self.status, _reactor=self.clock)
+
+    def makeBuild(self, slavename):
+        build = mock.Mock(name='build')
+        build.getSlavename.return_value = slavename
+        return build
+
+    def test_counters(self):
+        builder = mock.Mock(name='builder')
+        running = self.makeBuild('s1')
+        builder.getCurrentBuilds.return_value = [ running ]
+        self.assertIdentical(self.gs.builderAdded('b', builder), self.gs)
+
+        self.gs.slaveConnected('s1')
+        self.gs.slaveConnected('s2')
+        self.gs.slaveConnected('s3')
+        self.gs.slaveDisconnected('s3')
+        build1 = self.makeBuild('s1')
+        build2 = self.makeBuild('s2')
+        self.gs.buildStarted('b', build1)
+        self.gs.buildStarted('b', build2)
+        self.gs.buildFinished('b', running, 0)
+        self.gs.buildFinished('b', build2, 0)
+
+        self.assertEqual(self.gs.asDict(), {"slaves_count": 2,
+                                            "slaves_busy": 1,
+                                            "running_builds": 1,
+                                            "build_load": 3})
+
+    def test_queue_counted_on_events(self):
+        self.gs.asDict()
+        self.assertEqual(self.gs.unclaimedRequests, 2)
+        self.db.insertTestData([ fakedb.BuildRequest(id=4, buildsetid=1) ])
+        self.gs.requestSubmitted(mock.Mock())
+        self.assertEqual(self.gs.asDict()["build_load"], 3)
+
+    def test_queue_counted_when_stale(self):
+        self.gs.asDict()
+        self.db.insertTestData([ fakedb.BuildRequest(id=4, buildsetid=1) ])
+        self.assertEqual(self.gs.asDict()["build_load"], 2)
+        self.clock.advance(self.gs.maxQueueAge + 1)
+        self.gs.asDict()
+        self.assertEqual(self.gs.asDict()["build_load"], 3)
+
+    def test_queue_counts_coalesced(self):
+        counts = []
+        def countUnclaimedBuildRequests():
+            d = defer.Deferred()
+            counts.append(d)
+            return d
+        self.db.buildrequests.countUnclaimedBuildRequests = \
+                countUnclaimedBuildRequests
+        self.gs.requestSubmitted(mock.Mock())
+        self.gs.requestSubmitted(mock.Mock())
+        self.gs.requestCancelled(mock.Mock(), mock.Mock())
+        self.assertEqual(len(counts), 1)
+        counts[0].callback(5)
+        # one more count for the events received while counting
+        self.assertEqual(len(counts), 2)
+        counts[1].callback(4)
+        self.assertEqual(len(counts), 2)
+        self.assertEqual(self.gs.unclaimedRequests, 4)
@@ -22,6 +22,7 @@ import time
 from twisted.trial import unittest
 from twisted.internet import defer
 from buildbot.status import logfile
+from buildbot.util.blockfile import BlockFileWriter
 from buildbot.test.util import dirs
 from buildbot import config
 
@@ -55,9 +56,9 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         step = self.build_step_status = mock.Mock(name='build_step_status')
         self.basedir = step.build.builder.basedir = os.path.abspath('basedir')
         self.setUpDirs(self.basedir)
+        self.master = step.build.builder.master = mock.Mock()
+        self.config = self.master.config = config.MasterConfig()
         self.logfile = logfile.LogFile(step, 'testlf', '123-stdio')
-        self.master = self.logfile.master = mock.Mock()
-        self.config = self.logfile.master.config = config.MasterConfig()
 
     def tearDown(self):
         if self.logfile.openfile:
@@ -339,3 +340,194 @@ class TestLogFile(unittest.TestCase, dirs.DirsMixin):
         self.config.logCompressionMethod = None
         return self.do_test_compressLog('', expect_comp=False)
 
+
+    def test_compressLog_blocks(self):
+        self.config.logCompressionMethod = 'blocks'
+        self.logfile.chunkSize = 100
+        for i in range(100):
+            self.logfile.addEntry(i % 2, 'line %d\n' % i)
+        self.logfile.finish()
+        expected = list(self.logfile.getChunks())
+        self.patch(BlockFileWriter, 'frameSize', 64)
+        d = self.logfile.compressLog()
+        def check(_):
+            fn = self.logfile.getFilename()
+            self.assertFalse(os.path.exists(fn))
+            self.assertTrue(os.path.exists(fn + '.blk'))
+            self.assertTrue(os.path.exists(fn + '.blk.idx'))
+            self.assertTrue(self.logfile.hasContents())
+            fp = self.logfile.getFile()
+            self.assertTrue(len(fp.frames) > 1)
+            self.assertEqual(list(self.logfile.getChunks()), expected)
+            self.assertEqual(self.logfile.getLineCount(), 100)
+        d.addCallback(check)
+        return d
+
+    def test_compressLog_blocks_malformed(self):
+        self.config.logCompressionMethod = 'blocks'
+        return self.do_test_compressLog('.blk')
+
+    def add_lines(self, count):
+        for i in range(count):
+            # split lines across chunks and channels
+            self.logfile.addEntry(0, 'line')
+            self.logfile.addEntry(1, ' %d\n' % i)
+        self.logfile.addEntry(logfile.HEADER, 'end')
+
+    def do_test_line_ranges(self):
+        self.assertEqual(self.logfile.getLineCount(), 20)
+        self.assertEqual(
+                "".join(self.logfile.getChunks(onlyText=True,
+                                               startLine=3, endLine=5)),
+                "line 3\nline 4\n")
+        self.assertEqual(
+                list(self.logfile.getChunks(startLine=18)),
+                [(0, 'line'), (1, ' 18\n'), (0, 'line'), (1, ' 19\n'),
+                 (logfile.HEADER, 'end')])
+        self.assertEqual(
+                "".join(self.logfile.getChunks([logfile.STDERR],
+                                               onlyText=True, endLine=2)),
+                " 0\n 1\n")
+        self.assertEqual(
+                "".join(self.logfile.getTail(2, onlyText=True)),
+                "line 18\nline 19\nend")
+        self.assertEqual(
+                "".join(self.logfile.getTail(100, onlyText=True)),
+                "".join(self.logfile.getChunks(onlyText=True)))
+
+    def test_line_ranges_unfinished(self):
+        self.add_lines(20)
+        self.do_test_line_ranges()
+
+    def test_line_ranges_finished(self):
+        self.add_lines(20)
+        self.logfile.finish()
+        self.do_test_line_ranges()
+
+    def test_line_ranges_blocks(self):
+        self.config.logCompressionMethod = 'blocks'
+        self.patch(BlockFileWriter, 'frameSize', 32)
+        self.add_lines(20)
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        d.addCallback(lambda _ : self.do_test_line_ranges())
+        return d
+
+    def test_line_ranges_bz2(self):
+        self.config.logCompressionMethod = 'bz2'
+        self.add_lines(20)
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        d.addCallback(lambda _ : self.do_test_line_ranges())
+        return d
+
+class FakeLogWriter(object):
+    "holds writes until told to flush them"
+
+    def __init__(self):
+        self.queue = []
+
+    def write(self, logfile, fd, data):
+        self.queue.append((logfile, fd, data))
+
+    def close(self, logfile, fd):
+        self.queue.append((logfile, fd, None))
+
+    def flush(self, count=None):
+        if count is None:
+            count = len(self.queue)
+        batch, self.queue = self.queue[:count], self.queue[count:]
+        for lf, fd, data in batch:
+            if data is None:
+                fd.close()
+                continue
+            fd.seek(0, 2)
+            fd.write(data)
+            fd.flush()
+            lf._flushed(len(data), 1)
+
+class TestWriteBehindLogFile(unittest.TestCase, dirs.DirsMixin):
+
+    def setUp(self):
+        step = self.build_step_status = mock.Mock(name='build_step_status')
+        self.basedir = step.build.builder.basedir = os.path.abspath('basedir')
+        self.setUpDirs(self.basedir)
+        self.master = step.build.builder.master = mock.Mock()
+        self.config = self.master.config = config.MasterConfig()
+        self.config.logWriterBufferSize = 1024
+        self.writer = self.master.logwriter = FakeLogWriter()
+        self.logfile = logfile.LogFile(step, 'testlf', '123-stdio')
+        self.logfile.chunkSize = 4
+
+    def tearDown(self):
+        self.writer.flush()
+        self.tearDownDirs()
+
+    def onDisk(self):
+        with open(self.logfile.getFilename()) as f:
+            return f.read()
+
+    def test_merge_queues(self):
+        self.logfile.addStdout('abcdef')
+        self.assertEqual(self.onDisk(), '')
+        self.assertEqual(len(self.writer.queue), 1)
+        self.assertEqual(self.logfile.getEncodedSize(), 14)
+        self.writer.flush()
+        self.assertEqual(self.onDisk(), '5:0abcd,3:0ef,')
+        self.assertEqual(self.logfile.getEncodedSize(), 14)
+        self.assertEqual(self.logfile.unflushed, [])
+
+    def test_getChunks_unflushed(self):
+        self.logfile.addStdout('abcdef')
+        self.logfile.addStderr('gh')
+        self.writer.flush(1)
+        self.logfile.addStdout('ij')
+        # on disk, queued, and not merged yet
+        expected = [(0, 'abcd'), (0, 'ef'), (1, 'gh'), (0, 'ij')]
+        self.assertEqual(list(self.logfile.getChunks()), expected)
+        chunks = self.logfile.getChunks()
+        self.assertEqual(chunks.next(), (0, 'abcd'))
+        # flushing while a reader is part-way through does not disturb it
+        self.writer.flush()
+        self.assertEqual(list(chunks), expected[1:])
+
+    def test_producer_unflushed(self):
+        self.logfile.addStdout('abcdef')
+        self.logfile.addStderr('gh')
+        consumer = mock.Mock()
+        producer = logfile.LogFileProducer(self.logfile, consumer)
+        self.assertEqual(list(producer.getChunks()),
+                         [(0, 'abcd'), (0, 'ef'), (1, 'gh')])
+
+    def test_finish_flushed(self):
+        self.logfile.addStdout('abcdef')
+        self.logfile.finish()
+        self.assertTrue(self.logfile.isFinished())
+        self.assertEqual(self.logfile.getText(), 'abcdef')
+        d = self.logfile.waitUntilFlushed()
+        self.assertFalse(d.called)
+        self.writer.flush()
+        self.assertTrue(d.called)
+        self.assertEqual(self.logfile.writer, None)
+        self.assertEqual(self.logfile.getText(), 'abcdef')
+
+    def test_compressLog_waits(self):
+        self.config.logCompressionMethod = 'gz'
+        self.logfile.addStdout('abcdef')
+        self.logfile.finish()
+        d = self.logfile.compressLog()
+        def check(_):
+            self.assertTrue(os.path.exists(self.logfile.getFilename() + '.gz'))
+            self.assertEqual(self.logfile.getText(), 'abcdef')
+        d.addCallback(check)
+        self.writer.flush()
+        return d
+
+    def test_pickle_unflushed(self):
+        self.logfile.addStdout('abcdef')
+        self.logfile.finish()
+        restored = cPickle.loads(cPickle.dumps(self.logfile))
+        self.writer.flush()
+        restored.step = self.build_step_status
+        self.assertEqual(restored.writer, None)
+        self.assertEqual(restored.getText(), 'abcdef')
@@ -16,6 +16,7 @@
 import mock
 from twisted.trial import unittest
 from twisted.internet import defer
+from buildbot.db import builds
 from buildbot.status import master, base
 from buildbot.test.fake import fakedb
 
@@ -48,6 +49,86 @@ class TestStatus(unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_getBuilderNamesForSlave(self):
+        s = self.makeStatus()
+        builders = {'b1': mock.Mock(slavenames=['s1', 's2']),
+                    'b2': mock.Mock(slavenames=['s2'])}
+        s.botmaster.builderNames = ['b1', 'b2']
+        s.getBuilder = builders.get
+        self.assertEqual(s.getBuilderNamesForSlave('s2'), ['b1', 'b2'])
+        self.assertEqual(s.getBuilderNamesForSlave('s3'), [])
+
+        # the index is rebuilt when the slavenames or builders change
+        builders['b2'].slavenames = ['s3']
+        s.slavenamesChanged()
+        self.assertEqual(s.getBuilderNamesForSlave('s3'), ['b2'])
+        builders['b3'] = mock.Mock(slavenames=['s3'])
+        s.botmaster.builderNames = ['b1', 'b2', 'b3']
+        self.assertEqual(s.getBuilderNamesForSlave('s3'), ['b2', 'b3'])
+
+    def makeFinishedBuild(self, name, finished):
+        build = mock.Mock(name='%s@%d' % (name, finished))
+        build.getTimes.return_value = (finished - 10, finished)
+        return build
+
+    def test_generateFinishedBuilds(self):
+        s = self.makeStatus()
+        advanced = []
+        def builds(name, times):
+            for t in times:
+                advanced.append(name)
+                yield self.makeFinishedBuild(name, t)
+        builders = {'b1': [50, 30, 10], 'b2': [40, 20], 'b3': []}
+        s.getBuildersConfigured = lambda builders: ['b1', 'b2', 'b3']
+        s.getBuilder = lambda name: mock.Mock(
+                generateFinishedBuilds=lambda *a, **kw:
+                    builds(name, builders[name]))
+
+        finished = [b.getTimes()[1] for b in s.generateFinishedBuilds()]
+        self.assertEqual(finished, [50, 40, 30, 20, 10])
+
+        # only the generators whose builds were produced are advanced
+        del advanced[:]
+        finished = [b.getTimes()[1]
+                    for b in s.generateFinishedBuilds(num_builds=2)]
+        self.assertEqual(finished, [50, 40])
+        self.assertEqual(advanced, ['b1', 'b2', 'b1'])
+
+    @defer.inlineCallbacks
+    def test_iterFinishedBuildsAsync(self):
+        s = self.makeStatus()
+        loads = []
+        class Source(object):
+            def __init__(self, name, builds):
+                self.name = name
+                self.builds = list(builds)
+            def next(self):
+                loads.append(self.name)
+                if self.builds:
+                    return defer.succeed(self.builds.pop(0))
+                return defer.succeed(None)
+        sources = {
+            'b1': Source('b1', [self.makeFinishedBuild('b1', 50),
+                                self.makeFinishedBuild('b1', 30)]),
+            'b2': Source('b2', [self.makeFinishedBuild('b2', 40)]),
+            'b3': Source('b3', []),
+        }
+        s.getBuildersConfigured = lambda builders: ['b1', 'b2', 'b3']
+        s.getBuilder = lambda name: mock.Mock(
+                iterFinishedBuildsAsync=lambda *a, **kw: sources[name])
+
+        g = s.iterFinishedBuildsAsync(num_builds=3)
+        finished = []
+        while True:
+            build = yield g.next()
+            if build is None:
+                break
+            finished.append(build.getTimes()[1])
+        self.assertEqual(finished, [50, 40, 30])
+        # every source is asked for its first build, then only the source
+        # of the build produced last
+        self.assertEqual(loads, ['b1', 'b2', 'b3', 'b1', 'b2'])
+
     @defer.inlineCallbacks
     def test_reconfigService(self):
         m = mock.Mock(name='master')
@@ -108,3 +189,43 @@ class TestStatus(unittest.TestCase):
 
         self.assertEqual(url['text'], 'buildername #1')
         self.assertEqual(url['path'], 'baseurl/builders/buildername/builds/1?c1_branch=b1&c2_branch=b2')
+
+    @defer.inlineCallbacks
+    def test_generateLatestBuildsAsync(self):
+        s = self.makeStatus()
+
+        def makeBuilder(name, cached):
+            b = mock.Mock(name=name)
+            b.getName.return_value = name
+            b.getLatestBuildKey.return_value = u'cb=branch;'
+            b.shouldUseLatestBuildCache.return_value = cached
+            b.shouldUseLatestBuildTable.return_value = True
+            b.generateFinishedBuildsAsync.side_effect = \
+                lambda buildNumbers=None, latestBuildNumber=None, **kw: \
+                    defer.succeed([(name, buildNumbers, latestBuildNumber)])
+            return b
+        builders = [makeBuilder('b1', False), makeBuilder('b2', True),
+                    makeBuilder('b3', False), makeBuilder('b4', False)]
+
+        self.db.insertTestData([
+            fakedb.LatestBuild(id=1, buildername='b4', results=0, number=12,
+                sourcekeyhash=builds.latestBuildKeyHash(u'cb=branch;')),
+        ])
+
+        calls = []
+        def getLastBuildsNumbersForBuilders(**kw):
+            calls.append(kw)
+            return defer.succeed({'b1': [5, 4], 'b3': []})
+        self.db.builds.getLastBuildsNumbersForBuilders = getLastBuildsNumbersForBuilders
+
+        latest = yield s.generateLatestBuildsAsync(builders,
+                                                   codebases={'cb': 'branch'},
+                                                   num_builds=1, useCache=True)
+
+        self.assertEqual(calls, [dict(buildernames=['b1', 'b3'],
+                                      sourcestamps=[{'b_codebase': 'cb', 'b_branch': 'branch'}],
+                                      results=[], num_builds=10)])
+        self.assertEqual(latest, {'b1': [('b1', [5, 4], None)],
+                                  'b2': [('b2', None, None)],
+                                  'b3': [('b3', [], None)],
+                                  'b4': [('b4', None, 12)]})
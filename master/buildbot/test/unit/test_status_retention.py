@@ -0,0 +1,133 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import threading
+import mock
+from twisted.trial import unittest
+from twisted.internet import defer
+from buildbot.process import metrics
+from buildbot.status import retention
+
+class FakeHistory(object):
+
+    def __init__(self, usage=()):
+        self.usage = list(usage)
+        self.pruned = []
+        self.threads = set()
+
+    def getUsage(self):
+        return self.usage
+
+    def prune(self, earliest_build, earliest_log, keep=()):
+        self.threads.add(threading.currentThread())
+        self.pruned.append((earliest_build, earliest_log, list(keep)))
+        return 10
+
+class TestRetentionPolicy(unittest.TestCase):
+
+    # (number, finished, bytes)
+    usage = [ (3, 100.0, 50), (4, 200.0, 50), (5, 300.0, 50), (6, None, 50) ]
+
+    def test_horizons(self):
+        history = FakeHistory()
+        policy = retention.RetentionPolicy(5, 7, keep=[1])
+        self.assertEqual(policy.apply(history, 1000), 10)
+        self.assertEqual(history.pruned, [(5, 7, [1])])
+
+    def test_isEmpty(self):
+        self.assertTrue(retention.RetentionPolicy(0, 0).isEmpty())
+        self.assertFalse(retention.RetentionPolicy(0, 0, maxSize=1).isEmpty())
+        self.assertFalse(retention.RetentionPolicy(3, 5).isEmpty())
+
+    def test_maxAge(self):
+        policy = retention.RetentionPolicy(0, 0, maxAge=150)
+        # build 4 finished more than 150 seconds before 360
+        self.assertEqual(policy.getEarliestBuild(self.usage, 360), 5)
+        self.assertEqual(policy.getEarliestBuild(self.usage, 150), 0)
+
+    def test_maxSize(self):
+        policy = retention.RetentionPolicy(0, 0, maxSize=120)
+        self.assertEqual(policy.getEarliestBuild(self.usage, 0), 5)
+
+    def test_quotas_and_horizons(self):
+        history = FakeHistory(self.usage)
+        policy = retention.RetentionPolicy(2, 6, maxSize=160)
+        policy.apply(history, 0)
+        # the logs are kept from the logHorizon, but never for fewer builds
+        self.assertEqual(history.pruned, [(4, 6, [])])
+        history.pruned = []
+        policy = retention.RetentionPolicy(2, 3, maxSize=120)
+        policy.apply(history, 0)
+        self.assertEqual(history.pruned, [(5, 5, [])])
+
+class TestRetentionEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = retention.RetentionEngine()
+        self.counts = []
+        self.times = []
+        self.patch(metrics.MetricCountEvent, 'log', classmethod(
+                lambda cls, name, count: self.counts.append((name, count))))
+        self.patch(metrics.MetricTimeEvent, 'log', classmethod(
+                lambda cls, name, elapsed: self.times.append(name)))
+
+    def tearDown(self):
+        return self.engine.stop()
+
+    @defer.inlineCallbacks
+    def test_prune(self):
+        history = FakeHistory()
+        reclaimed = yield self.engine.prune('b', history,
+                                            retention.RetentionPolicy(5, 5))
+        self.assertEqual(reclaimed, 10)
+        self.assertEqual(history.pruned, [(5, 5, [])])
+        self.assertNotIn(threading.currentThread(), history.threads)
+        self.assertEqual(self.counts, [('RetentionEngine.reclaimed', 10)])
+        self.assertEqual(self.times, ['RetentionEngine.prune'])
+
+    @defer.inlineCallbacks
+    def test_coalesce(self):
+        history = FakeHistory()
+        d1 = self.engine.prune('b', history, retention.RetentionPolicy(1, 1))
+        d2 = self.engine.prune('b', history, retention.RetentionPolicy(2, 2))
+        d3 = self.engine.prune('b', history, retention.RetentionPolicy(3, 3))
+        yield defer.gatherResults([d1, d2, d3])
+        # the queued prunes are replaced by the latest one
+        self.assertEqual(history.pruned, [(1, 1, []), (3, 3, [])])
+
+    @defer.inlineCallbacks
+    def test_wait(self):
+        history = FakeHistory()
+        yield self.engine.wait('b')
+        d1 = self.engine.prune('b', history, retention.RetentionPolicy(1, 1))
+        waited = self.engine.wait('b')
+        d2 = self.engine.prune('b', history, retention.RetentionPolicy(2, 2))
+        queued = self.engine.wait('b')
+        res = yield waited
+        self.assertEqual(res, None)
+        self.assertEqual(history.pruned[0], (1, 1, []))
+        yield queued
+        # a wait on a queued prune fires once that prune has run
+        self.assertEqual(history.pruned, [(1, 1, []), (2, 2, [])])
+        yield defer.gatherResults([d1, d2])
+
+    @defer.inlineCallbacks
+    def test_failure(self):
+        history = mock.Mock()
+        history.prune.side_effect = OSError("no such directory")
+        reclaimed = yield self.engine.prune('b', history,
+                                            retention.RetentionPolicy(1, 1))
+        self.assertEqual(reclaimed, 0)
+        self.assertEqual(len(self.flushLoggedErrors(OSError)), 1)
@@ -0,0 +1,103 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+from buildbot.status.slave import SlaveStatus
+from buildbot.status.results import SUCCESS, FAILURE, WARNINGS
+from buildbot.test.fake import fakedb
+
+class TestSlaveStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.master = mock.Mock(name='master')
+        self.db = self.master.db = fakedb.FakeDBConnector(self)
+        self.slave = SlaveStatus('slave-01')
+        self.slave.setMaster(self.master)
+
+    def makeBuild(self, buildername, number, results, finished):
+        build = mock.Mock(name='build')
+        build.getBuilder.return_value.getName.return_value = buildername
+        build.getNumber.return_value = number
+        build.getResults.return_value = results
+        build.getTimes.return_value = (finished - 10, finished)
+        return build
+
+    def finishBuild(self, *args):
+        build = self.makeBuild(*args)
+        self.slave.buildStarted(build)
+        self.slave.buildFinished(build)
+
+    def test_buildFinished(self):
+        self.slave.seedRecentBuilds()
+        self.finishBuild('b1', 1, SUCCESS, 100)
+        self.finishBuild('b2', 7, FAILURE, 200)
+        self.assertEqual(self.slave.getRecentBuilds(),
+                         [ ('b2', 7, FAILURE, 200), ('b1', 1, SUCCESS, 100) ])
+        self.assertEqual(self.slave.getRunningBuilds(), [])
+        self.assertEqual(self.slave.health, -1)
+
+    def test_ring_buffer(self):
+        self.slave.seedRecentBuilds()
+        for i in range(20):
+            self.finishBuild('b', i, SUCCESS, i)
+        builds = self.slave.getRecentBuilds()
+        self.assertEqual(len(builds), self.slave.numRecentBuilds)
+        self.assertEqual(builds[0][1], 19)
+
+    def test_health(self):
+        self.slave.seedRecentBuilds()
+        for i in range(3):
+            self.finishBuild('b', i, WARNINGS, i)
+        self.assertEqual(self.slave.health, -2)
+        for i in range(3, 10):
+            self.finishBuild('b', i, SUCCESS, i)
+        self.assertEqual(self.slave.health, -1)
+        # the builds with warnings have left the buffer
+        for i in range(10, 18):
+            self.finishBuild('b', i, SUCCESS, i)
+        self.assertEqual(self.slave.health, 0)
+
+    def test_seed(self):
+        self.db.insertTestData([
+            fakedb.BuildRequest(id=1, buildsetid=1, buildername='b1',
+                                results=SUCCESS),
+            fakedb.Build(id=1, number=3, brid=1, finish_time=100,
+                         slavename='slave-01'),
+            fakedb.BuildRequest(id=2, buildsetid=1, buildername='b1',
+                                results=FAILURE),
+            fakedb.Build(id=2, number=4, brid=2, finish_time=200,
+                         slavename='slave-01'),
+            fakedb.BuildRequest(id=3, buildsetid=1, buildername='b1',
+                                results=FAILURE),
+            fakedb.Build(id=3, number=5, brid=3, finish_time=300,
+                         slavename='slave-02'),
+        ])
+        # a build finishing before the recent builds are read comes first,
+        # and is not repeated
+        self.finishBuild('b1', 4, FAILURE, 200)
+        self.finishBuild('b2', 1, FAILURE, 400)
+        self.assertEqual(self.slave.asDict()['health'], -2)
+        self.assertEqual(self.slave.getRecentBuilds(),
+                         [ ('b2', 1, FAILURE, 400), ('b1', 4, FAILURE, 200),
+                           ('b1', 3, SUCCESS, 100) ])
+
+    def test_getBuilders(self):
+        status = self.master.status
+        status.getBuilderNamesForSlave.return_value = ['b1', 'b2']
+        status.getBuilder.side_effect = lambda name: 'status of %s' % name
+        self.assertEqual(self.slave.getBuilders(),
+                         ['status of b1', 'status of b2'])
+        status.getBuilderNamesForSlave.assert_called_with('slave-01')
@@ -0,0 +1,180 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import os
+import shutil
+import mock
+from cStringIO import StringIO
+from twisted.trial import unittest
+from twisted.internet import defer
+from buildbot.status import testresults
+
+NUNIT_REPORT = """<?xml version="1.0" encoding="utf-16"?>
+<?xml-stylesheet type="text/xsl" href="nunit.xslt"?>
+<test-results name="all" total="4" errors="0" failures="1" not-run="1"
+              inconclusive="0" ignored="0">
+  <test-suite name="Assembly" executed="True">
+    <results>
+      <test-suite name="FixtureA" executed="True">
+        <results>
+          <test-case name="A.passes" executed="True" success="True"
+                     time="0.5" result="Success" />
+          <test-case name="A.fails" executed="True" success="False"
+                     time="0.25" result="Failure">
+            <failure>
+              <message>expected 1</message>
+              <stack-trace>at A.fails()</stack-trace>
+            </failure>
+          </test-case>
+        </results>
+      </test-suite>
+      <test-suite name="FixtureB" executed="True">
+        <results>
+          <test-case name="B.passes" executed="True" success="True"
+                     time="1.0" result="Success" />
+          <test-case name="B.notrun" executed="False" result="NotRunnable">
+            <reason><message>no reason</message></reason>
+          </test-case>
+        </results>
+      </test-suite>
+    </results>
+  </test-suite>
+</test-results>
+"""
+
+NOSE_REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="nosetests" tests="3" errors="1" failures="0" skip="0">
+<testcase classname="test.A" name="test_one" time="0.1"></testcase>
+<testcase classname="test.B" name="test_two" time="0.2">
+<error type="Exception" message="boom">Traceback</error></testcase>
+<testcase classname="test.A" name="test_three" time="0.3"></testcase>
+</testsuite>
+"""
+
+JUNIT_REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+<testsuite name="suite" tests="2" failures="1" errors="0">
+<testcase classname="com.A" name="ok" time="1"/>
+<testcase classname="com.A" name="bad" time="2">
+<failure message="oops">stack</failure></testcase>
+</testsuite>
+</testsuites>
+"""
+
+class TestParse(unittest.TestCase):
+
+    def parse(self, report):
+        written = []
+        def write(key, result, failed):
+            written.append((key, result['name'], failed))
+        summary, suites = testresults.parseTestResults(StringIO(report),
+                                                       write)
+        return summary, suites, written
+
+    def test_nunit(self):
+        summary, suites, written = self.parse(NUNIT_REPORT)
+        self.assertEqual(summary['total'], 4)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['success'], 2)
+        self.assertEqual(summary['time'], 1.75)
+        self.assertEqual([ s['name'] for k, s in suites ],
+                         ['FixtureA', 'FixtureB'])
+        self.assertEqual(suites[0][1]['passed'], 1)
+        self.assertEqual(suites[0][1]['failed'], 1)
+        self.assertEqual(suites[1][1]['skipped'], 1)
+        self.assertEqual(written, [(0, 'A.passes', False),
+                                   (0, 'A.fails', True),
+                                   (1, 'B.passes', False),
+                                   (1, 'B.notrun', False)])
+
+    def test_nose(self):
+        summary, suites, written = self.parse(NOSE_REPORT)
+        self.assertEqual(summary['total'], 3)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual([ k for k, s in suites ], ['test.A', 'test.B'])
+        self.assertEqual(suites[0][1]['tests'], 2)
+        self.assertEqual(written[1], ('test.B', 'test_two', True))
+
+    def test_junit(self):
+        summary, suites, written = self.parse(JUNIT_REPORT)
+        self.assertEqual(summary['total'], 2)
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['time'], 3.0)
+        self.assertEqual(written, [('com.A', 'ok', False),
+                                   ('com.A', 'bad', True)])
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = os.path.abspath('test_status_testresults')
+        if os.path.exists(self.basedir):
+            shutil.rmtree(self.basedir)
+        os.makedirs(self.basedir)
+        self.log = mock.Mock()
+        self.log.getFilename.return_value = os.path.join(self.basedir,
+                                                         '1-log-tests')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_pages(self):
+        d = testresults.indexLog(self.log, NOSE_REPORT)
+        @d.addCallback
+        def check(index):
+            self.assertTrue(testresults.hasIndex(self.log))
+            self.assertEqual(index.countResults(), 3)
+            self.assertEqual(index.countResults(failedOnly=True), 1)
+            # results are grouped by suite
+            suites = index.getSuites(0, 2)
+            self.assertEqual([ s['name'] for s in suites ], ['test.A'])
+            self.assertEqual([ r['name'] for r in suites[0]['results'] ],
+                             ['test_one', 'test_three'])
+            # the suite counts are those of the whole report
+            self.assertEqual(suites[0]['tests'], 2)
+            suites = index.getSuites(2, 2)
+            self.assertEqual([ s['name'] for s in suites ], ['test.B'])
+            suites = index.getSuites(failedOnly=True)
+            self.assertEqual([ r['name'] for s in suites
+                                         for r in s['results'] ],
+                             ['test_two'])
+            self.assertEqual(suites[0]['results'][0]['failure_text'],
+                             [{'text': 'boom'}])
+        return d
+
+    @defer.inlineCallbacks
+    def test_indexed_once(self):
+        yield testresults.indexLog(self.log, JUNIT_REPORT)
+        index = yield testresults.indexLog(self.log)
+        self.assertFalse(self.log.getText.called)
+        self.assertEqual(index.summary['total'], 2)
+
+    @defer.inlineCallbacks
+    def test_concurrent(self):
+        self.log.getText.return_value = JUNIT_REPORT
+        d1 = testresults.indexLog(self.log)
+        d2 = testresults.indexLog(self.log)
+        index1 = yield d1
+        index2 = yield d2
+        self.assertEqual(self.log.getText.call_count, 1)
+        self.assertIdentical(index1, index2)
+
+    @defer.inlineCallbacks
+    def test_parse_error(self):
+        index = yield testresults.indexLog(self.log,
+                '<?xml-stylesheet?><test-results><test')
+        self.assertEqual(index.summary, None)
+        self.assertNotEqual(index.error, None)
+        self.assertEqual(index.getSuites(), [])
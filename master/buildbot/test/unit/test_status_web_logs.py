@@ -0,0 +1,87 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import mock
+from twisted.trial import unittest
+from twisted.web import server
+from buildbot.status import logfile
+from buildbot.status.web import logs, xmltestresults
+from buildbot.test.fake.web import FakeRequest
+
+class TestTextLog(unittest.TestCase):
+
+    def setUp(self):
+        self.log = mock.Mock()
+        self.log.isFinished.return_value = True
+        self.chunks = [(logfile.STDOUT, 'a\nb\n'), (logfile.HEADER, 'hdr\n'),
+                       (logfile.STDERR, 'c\n')]
+        self.log.getTail.return_value = self.chunks
+        self.log.getChunks.return_value = self.chunks
+        self.textlog = logs.TextLog(self.log)
+        self.textlog.asText = True
+
+    def render(self, args):
+        req = FakeRequest(args)
+        self.assertEqual(self.textlog.render_GET(req), server.NOT_DONE_YET)
+        self.assertTrue(req.finished)
+        return req
+
+    def test_getLineRange(self):
+        req = FakeRequest(dict(start=['10'], end=['x'], tail=['-1']))
+        self.assertEqual(self.textlog.getLineRange(req), dict(start=10))
+
+    def test_render_tail(self):
+        req = self.render(dict(tail=['3']))
+        self.log.getTail.assert_called_with(3)
+        # headers are not part of the text view
+        self.assertEqual(req.written, 'a\nb\nc\n')
+
+    def test_render_range(self):
+        self.render(dict(start=['5'], end=['8']))
+        self.log.getChunks.assert_called_with(startLine=5, endLine=8)
+
+    def test_render_range_open_ended(self):
+        self.render(dict(start=['5']))
+        self.log.getChunks.assert_called_with(startLine=5, endLine=None)
+
+class TestXMLTestResource(unittest.TestCase):
+
+    def test_getPage(self):
+        resource = xmltestresults.XMLTestResource(mock.Mock(), mock.Mock())
+        req = FakeRequest(dict(start=['1000'], count=['x'], failed=['1']))
+        self.assertEqual(resource.getPage(req), (1000, 500, True))
+        req = FakeRequest(dict(count=['20000']))
+        self.assertEqual(resource.getPage(req), (0, 500, False))
+        req = FakeRequest(dict(count=['20']))
+        self.assertEqual(resource.getPage(req), (0, 20, False))
+
+    def test_getPageLinks(self):
+        resource = xmltestresults.XMLTestResource(mock.Mock(), mock.Mock())
+        req = FakeRequest(dict(start=['500'], count=['500'],
+                               cb_branch=['trunk']))
+        page = resource.getPageLinks(req, 500, 500, 1200, False)
+        self.assertEqual((page['first'], page['last']), (501, 1000))
+        self.assertEqual(page['prev_url'],
+                         '?cb_branch=trunk&count=500&start=0')
+        self.assertEqual(page['next_url'],
+                         '?cb_branch=trunk&count=500&start=1000')
+        self.assertEqual(page['toggle_url'],
+                         '?cb_branch=trunk&count=500&failed=1&start=0')
+
+        page = resource.getPageLinks(req, 0, 500, 3, True)
+        self.assertEqual((page['first'], page['last']), (1, 3))
+        self.assertEqual((page['prev_url'], page['next_url']), (None, None))
+        self.assertEqual(page['toggle_url'],
+                         '?cb_branch=trunk&count=500&start=0')
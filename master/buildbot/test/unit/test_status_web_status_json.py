@@ -22,7 +22,9 @@ from buildbot.test.fake import fakemaster
 from buildbot.status.builder import BuilderStatus, PendingBuildsCache
 from buildbot.status.build import BuildStatus
 from buildbot.status.slave import SlaveStatus
-from twisted.internet import defer
+from twisted.internet import defer, task
+from twisted.web import http
+from buildbot.test.fake import web as fakeweb
 from buildbot.status.results import SUCCESS
 from buildbot.config import BuilderConfig
 from buildbot.process.factory import BuildFactory
@@ -359,7 +361,9 @@ class TestSingleProjectJsonResource(unittest.TestCase):
                                finished_before=None,
                                results=None,
                                max_search=2000,
-                               useCache=False):
+                               useCache=False,
+                               buildNumbers=None,
+                               latestBuildNumber=None):
             return defer.succeed([fakeBuildStatus(self.master, builder, 1)])
 
         builder.builder_status.generateFinishedBuildsAsync = mockFinishedBuildsAsync
@@ -520,3 +524,154 @@ class TestSinglePendingBuildsJsonResource(unittest.TestCase):
         self.assertEqual(pending_dict, [pendingBuildRequestDict(1),
                                         pendingBuildRequestDict(2),
                                         pendingBuildRequestDict(3)])
+
+
+class CountingJsonResource(status_json.JsonResource):
+    def __init__(self, scope=None):
+        status_json.JsonResource.__init__(self, None)
+        self.scope = scope
+        self.calls = 0
+
+    def getCacheScope(self):
+        return self.scope
+
+    def asDict(self, request):
+        self.calls += 1
+        return {'calls': self.calls}
+
+
+class TestJsonResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.patch(status_json, 'reactor', self.clock)
+        self.cache = status_json.JsonResponseCache(2)
+
+    def makeRequest(self, path='thing', args={}, if_none_match=None):
+        request = fakeweb.FakeRequest(args=dict(args))
+        request.method = 'GET'
+        request.prepath = ['json', path]
+        request.site.buildbot_service.jsonCache = self.cache
+        request.getHeader = lambda name: \
+                if_none_match if name == 'if-none-match' else None
+        request.etag = None
+        request.code = 200
+        def setETag(etag):
+            request.etag = etag
+            if etag == if_none_match:
+                request.code = http.NOT_MODIFIED
+                return http.CACHED
+        request.setETag = setETag
+        return request
+
+    @defer.inlineCallbacks
+    def render(self, resource, **kwargs):
+        request = self.makeRequest(**kwargs)
+        yield request.test_render(resource)
+        defer.returnValue(request)
+
+    def fakeBuild(self, buildername):
+        build = mock.Mock()
+        build.getBuilder.return_value.getName.return_value = buildername
+        return build
+
+    @defer.inlineCallbacks
+    def test_hit(self):
+        res = CountingJsonResource()
+        first = yield self.render(res)
+        second = yield self.render(res)
+        self.assertEqual(res.calls, 1)
+        self.assertEqual(first.written, '{"calls":1}')
+        self.assertEqual(second.written, first.written)
+        self.assertEqual(second.etag, first.etag)
+
+    @defer.inlineCallbacks
+    def test_query_args_in_key(self):
+        res = CountingJsonResource()
+        yield self.render(res)
+        request = yield self.render(res, args={'as_text': ['1']})
+        self.assertEqual(res.calls, 2)
+        self.assertEqual(request.written, '{\n  "calls": 2\n}')
+
+    @defer.inlineCallbacks
+    def test_conditional_get(self):
+        res = CountingJsonResource()
+        first = yield self.render(res)
+        second = yield self.render(res, if_none_match=first.etag)
+        self.assertEqual(second.code, http.NOT_MODIFIED)
+        self.assertEqual(second.written, '')
+        self.assertEqual(res.calls, 1)
+
+    @defer.inlineCallbacks
+    def test_invalidate_builder(self):
+        res_a = CountingJsonResource('a')
+        res_b = CountingJsonResource('b')
+        res_all = CountingJsonResource()
+        self.cache.max_size = 10
+        for res in res_a, res_b, res_all:
+            yield self.render(res, path=str(res.scope))
+
+        self.cache.stepFinished(self.fakeBuild('a'), None, None)
+
+        for res in res_a, res_b, res_all:
+            yield self.render(res, path=str(res.scope))
+        self.assertEqual([ r.calls for r in (res_a, res_b, res_all) ],
+                         [2, 1, 2])
+
+    @defer.inlineCallbacks
+    def test_invalidate_step_text(self):
+        res = CountingJsonResource('a')
+        build = self.fakeBuild('a')
+        # the cache subscribes to the steps, to hear of their text changes
+        self.assertIdentical(self.cache.stepStarted(build, None), self.cache)
+        yield self.render(res)
+        self.cache.stepTextChanged(build, None, ['compiling'])
+        yield self.render(res)
+        self.assertEqual(res.calls, 2)
+
+    @defer.inlineCallbacks
+    def test_invalidate_all(self):
+        res_a = CountingJsonResource('a')
+        yield self.render(res_a)
+        self.cache.slaveConnected('slave')
+        yield self.render(res_a)
+        self.assertEqual(res_a.calls, 2)
+
+    @defer.inlineCallbacks
+    def test_event_while_rendering(self):
+        d = defer.Deferred()
+        res = CountingJsonResource()
+        res.asDict = lambda request: d
+        rendered = self.render(res)
+        # the response is computed from the state before this event
+        self.cache.buildStarted('a', self.fakeBuild('a'))
+        d.callback({})
+        yield rendered
+        self.assertEqual(self.cache.get(self.cache.makeKey(
+            self.makeRequest()), None), None)
+
+    @defer.inlineCallbacks
+    def test_max_age(self):
+        res = CountingJsonResource()
+        yield self.render(res)
+        self.clock.advance(self.cache.max_age)
+        yield self.render(res)
+        self.assertEqual(res.calls, 2)
+
+    @defer.inlineCallbacks
+    def test_max_size(self):
+        resources = [ CountingJsonResource() for i in range(3) ]
+        for i, res in enumerate(resources):
+            yield self.render(res, path=str(i))
+        self.assertEqual(len(self.cache.entries), 2)
+        # the least recently used entry was evicted
+        yield self.render(resources[0], path='0')
+        self.assertEqual(resources[0].calls, 2)
+
+    @defer.inlineCallbacks
+    def test_not_cacheable(self):
+        res = CountingJsonResource()
+        res.cacheable = False
+        yield self.render(res)
+        request = yield self.render(res)
+        self.assertEqual(res.calls, 2)
+        self.assertEqual(request.etag, None)
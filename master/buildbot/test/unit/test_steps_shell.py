@@ -22,6 +22,7 @@ from buildbot.status.results import EXCEPTION
 from buildbot.test.util import steps, compat
 from buildbot.test.fake.remotecommand import ExpectShell, Expect
 from buildbot.test.fake.remotecommand import ExpectRemoteRef
+from buildbot.test.fake import remotecommand
 from buildbot import config
 from buildbot.process import properties
 
@@ -374,6 +375,29 @@ class SetProperty(steps.BuildStepMixin, unittest.TestCase):
         self.expectLogfile('property changes', r"res: 'abcdef'")
         return self.runStep()
 
+    def test_constructor_window_extract_fn(self):
+        self.assertRaises(config.ConfigErrors, lambda :
+                shell.SetProperty(extract_fn=lambda : None, head=10))
+
+    def test_constructor_stream_property(self):
+        self.assertRaises(config.ConfigErrors, lambda :
+                shell.SetProperty(property='foo', stream=True))
+
+    def test_run_property_window(self):
+        self.setupStep(shell.SetProperty(property="res", command="cmd",
+                                         head=4, tail=3))
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command="cmd")
+            + ExpectShell.log('stdio', stdout='\nabc')
+            + ExpectShell.log('stdio', stdout='defghijk\n')
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS,
+                status_text=["property 'res' set"])
+        self.expectProperty("res", "abcjk") # the head and tail, stripped
+        return self.runStep()
+
     def test_run_property_no_strip(self):
         self.setupStep(shell.SetProperty(property="res", command="cmd",
                                          strip=False))
@@ -422,6 +446,26 @@ class SetProperty(steps.BuildStepMixin, unittest.TestCase):
         self.expectProperty("b", 2)
         return self.runStep()
 
+    def test_run_extract_fn_stream(self):
+        def extract_fn(rc, stdout, stderr):
+            self.assertEqual(list(stdout), ['start', 'end'])
+            self.assertEqual(''.join(stderr), 'STARTEND')
+            return dict(a=1)
+        self.setupStep(shell.SetProperty(extract_fn=extract_fn, command="cmd",
+                                         stream=True))
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command="cmd")
+            + ExpectShell.log('stdio', stdout='start', stderr='START')
+            + ExpectShell.log('stdio', stdout='end')
+            + ExpectShell.log('stdio', stderr='END')
+            + 0
+        )
+        self.expectOutcome(result=SUCCESS,
+                status_text=["property 'a' set"])
+        self.expectProperty("a", 1)
+        return self.runStep()
+
     def test_run_extract_fn_cmdfail(self):
         def extract_fn(rc, stdout, stderr):
             self.assertEqual((rc, stdout, stderr), (3, '', ''))
@@ -528,6 +572,27 @@ class WarningCountingShellCommand(steps.BuildStepMixin, unittest.TestCase):
         self.expectLogfile("warnings (2)", "scary: foo\nscary: bar\n")
         return self.runStep()
 
+    def test_streaming(self):
+        self.setupStep(shell.WarningCountingShellCommand(command=['make']))
+        # the stdio log is never read back as a whole
+        self.patch(remotecommand.FakeLogFile, 'getText',
+                   lambda log: self.fail("getText called"))
+        self.expectCommands(
+            ExpectShell(workdir='wkdir', usePTY='slave-config',
+                        command=["make"])
+            + ExpectShell.log('stdio', stdout='normal\nwarn')
+            + ExpectShell.log('stdio', stderr='warning: on stderr\n')
+            + ExpectShell.log('stdio', stdout='ing: split\n')
+            + ExpectShell.log('stdio',
+                    stdout='warning: long ' + 'x' * 20000 + '\nnormal')
+            + 0
+        )
+        self.expectOutcome(result=WARNINGS, status_text=["'make'", "warnings"])
+        self.expectProperty("warnings-count", 3)
+        self.expectLogfile("warnings (3)", "warning: on stderr\n"
+                "warning: split\nwarning: long " + 'x' * 20000 + "\n")
+        return self.runStep()
+
     def test_maxWarnCount(self):
         self.setupStep(shell.WarningCountingShellCommand(command=['make'],
             maxWarnCount=9))
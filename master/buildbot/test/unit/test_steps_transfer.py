@@ -18,6 +18,8 @@ from __future__ import with_statement
 import tempfile, os
 import shutil
 import tarfile
+import zlib
+import hashlib
 from twisted.trial import unittest
 
 from mock import Mock
@@ -25,7 +27,7 @@ from mock import Mock
 from buildbot.process.properties import Properties
 from buildbot.util import json
 from buildbot.steps import transfer
-from buildbot.status.results import SUCCESS
+from buildbot.status.results import SUCCESS, FAILURE
 from buildbot import config
 from buildbot.test.util import steps
 from buildbot.test.fake.remotecommand import Expect, ExpectRemoteRef
@@ -174,6 +176,7 @@ class TestDirectoryUpload(steps.BuildStepMixin, unittest.TestCase):
             Expect('uploadDirectory', dict(
                 slavesrc="srcdir", workdir='wkdir',
                 blocksize=16384, compress=None, maxsize=None,
+                window=8, deflate=False, checksum=False,
                 writer=ExpectRemoteRef(transfer._DirectoryWriter)))
             + Expect.behavior(upload_behavior)
             + 0)
@@ -182,6 +185,137 @@ class TestDirectoryUpload(steps.BuildStepMixin, unittest.TestCase):
         d = self.runStep()
         return d
 
+    def testOldSlave(self):
+        self.setupStep(
+            transfer.DirectoryUpload(slavesrc="srcdir", masterdest=self.destdir,
+                                     deflate=True, checksum=True),
+            slave_version={'*': '2.15'})
+
+        self.expectCommands(
+            Expect('uploadDirectory', dict(
+                slavesrc="srcdir", workdir='wkdir',
+                blocksize=16384, compress=None, maxsize=None,
+                writer=ExpectRemoteRef(transfer._DirectoryWriter)))
+            + 1)
+
+        self.expectOutcome(result=FAILURE, status_text=["uploading", "srcdir"])
+        return self.runStep()
+
+class TestFileDownload(steps.BuildStepMixin, unittest.TestCase):
+
+    def setUp(self):
+        fd, self.srcfile = tempfile.mkstemp()
+        os.write(fd, 'some data')
+        os.close(fd)
+        return self.setUpBuildStep()
+
+    def tearDown(self):
+        os.unlink(self.srcfile)
+        return self.tearDownBuildStep()
+
+    def test_cached(self):
+        self.setupStep(
+            transfer.FileDownload(mastersrc=self.srcfile, slavedest="dest",
+                                  cache=True, cachesize=1000))
+
+        self.expectCommands(
+            Expect('downloadFile', dict(
+                slavedest="dest", workdir='wkdir',
+                blocksize=16384, maxsize=None, mode=None,
+                window=8, deflate=False, checksum=False,
+                cachekey=hashlib.sha1('some data').hexdigest(),
+                cachesize=1000,
+                reader=ExpectRemoteRef(transfer._FileReader)))
+            + Expect.update('cache', 'hit')
+            + 0)
+
+        self.expectOutcome(result=SUCCESS,
+                status_text=["downloading", "to", "dest"])
+        d = self.runStep()
+        @d.addCallback
+        def check(_):
+            self.step_status.setText2.assert_called_with(['cached'])
+        return d
+
+    def test_cached_oldSlave(self):
+        self.setupStep(
+            transfer.FileDownload(mastersrc=self.srcfile, slavedest="dest",
+                                  cache=True),
+            slave_version={'*': '2.16'})
+
+        self.expectCommands(
+            Expect('downloadFile', dict(
+                slavedest="dest", workdir='wkdir',
+                blocksize=16384, maxsize=None, mode=None,
+                window=8, deflate=False, checksum=False,
+                reader=ExpectRemoteRef(transfer._FileReader)))
+            + 0)
+
+        self.expectOutcome(result=SUCCESS,
+                status_text=["downloading", "to", "dest"])
+        return self.runStep()
+
+class TestFileWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.destdir = os.path.abspath('destdir')
+        if os.path.exists(self.destdir):
+            shutil.rmtree(self.destdir)
+        os.mkdir(self.destdir)
+        self.destfile = os.path.join(self.destdir, 'dest')
+
+    def tearDown(self):
+        shutil.rmtree(self.destdir)
+
+    def test_deflate_checksum(self):
+        data = 'x' * 1000 + 'y' * 1000
+        compressor = zlib.compressobj()
+        writer = transfer._FileWriter(self.destfile, None, None,
+                                      deflate=True, checksum=True)
+        for block in data[:1000], data[1000:]:
+            writer.remote_write(compressor.compress(block) +
+                                compressor.flush(zlib.Z_SYNC_FLUSH))
+        writer.remote_close(hashlib.sha1(data).hexdigest())
+        self.assertEqual(open(self.destfile).read(), data)
+
+    def test_checksum_mismatch(self):
+        writer = transfer._FileWriter(self.destfile, None, None,
+                                      checksum=True)
+        writer.remote_write('data')
+        self.assertRaises(transfer.TransferChecksumError,
+                writer.remote_close, hashlib.sha1('other').hexdigest())
+        self.assertEqual(os.listdir(self.destdir), [])
+
+class TestFileReader(unittest.TestCase):
+
+    def test_deflate_checksum(self):
+        from cStringIO import StringIO
+        data = 'abc' * 1000
+        reader = transfer._FileReader(StringIO(data), deflate=True,
+                                      checksum=True)
+        decompressor = zlib.decompressobj()
+        got = []
+        while True:
+            block = reader.remote_read(1024)
+            if not block:
+                break
+            got.append(decompressor.decompress(block))
+        self.assertEqual(''.join(got), data)
+        self.assertEqual(reader.remote_checksum(),
+                         hashlib.sha1(data).hexdigest())
+
+    def test_seek(self):
+        from cStringIO import StringIO
+        reader = transfer._FileReader(StringIO('abcdef'))
+        reader.remote_seek(4)
+        self.assertEqual(reader.remote_read(10), 'ef')
+
+    def test_no_checksum(self):
+        from cStringIO import StringIO
+        reader = transfer._FileReader(StringIO('abc'))
+        self.assertEqual(reader.remote_read(10), 'abc')
+        self.assertEqual(reader.remote_checksum(), None)
+
 class TestStringDownload(unittest.TestCase):
     def testBasic(self):
         s = transfer.StringDownload("Hello World", "hello.txt")
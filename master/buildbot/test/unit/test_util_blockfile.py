@@ -0,0 +1,89 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+from __future__ import with_statement
+
+import os
+from twisted.trial import unittest
+from buildbot.util import blockfile
+
+class BlockFile(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = os.path.abspath(self.mktemp())
+
+    def write(self, records, frameSize=10):
+        w = blockfile.BlockFileWriter(self.filename, frameSize=frameSize)
+        for r in records:
+            w.write(r)
+        w.close()
+        return blockfile.BlockFile(self.filename)
+
+    def test_missing(self):
+        self.assertRaises(IOError, lambda : blockfile.BlockFile(self.filename))
+
+    def test_missing_index(self):
+        self.write(['abc'])
+        os.unlink(self.filename + blockfile.INDEX_SUFFIX)
+        self.assertRaises(IOError, lambda : blockfile.BlockFile(self.filename))
+
+    def test_empty(self):
+        f = self.write([])
+        self.assertEqual((f.size, f.lineCount), (0, 0))
+        self.assertEqual(f.read(), '')
+        self.assertEqual(f.findLine(3), (0, 0))
+
+    def test_read(self):
+        f = self.write(['abcdef', 'ghij', 'klmnopqrstu', 'vwxyz'])
+        self.assertEqual(f.size, 26)
+        self.assertEqual(f.read(), 'abcdefghijklmnopqrstuvwxyz')
+        self.assertEqual(f.read(), '')
+        self.assertEqual(f.tell(), 26)
+
+    def test_frames(self):
+        f = self.write(['abcdef', 'ghij', 'klmnopqrstu', 'vwxyz'])
+        # records never straddle frames
+        self.assertEqual([ frame[:2] for frame in f.frames ],
+                         [ (0, 10), (10, 11), (21, 5) ])
+
+    def test_seek_read(self):
+        f = self.write(['abcdef', 'ghij', 'klmnopqrstu', 'vwxyz'])
+        f.seek(8)
+        self.assertEqual(f.read(5), 'ijklm')
+        self.assertEqual(f.tell(), 13)
+        f.seek(-3, 2)
+        self.assertEqual(f.read(100), 'xyz')
+        f.seek(-6, 1)
+        self.assertEqual(f.read(2), 'uv')
+        f.seek(0, 2)
+        self.assertEqual(f.tell(), 26)
+
+    def test_lines(self):
+        f = self.write(['a\nb\n', 'c', 'd', 'e\nf\n', 'g\n'], frameSize=4)
+        self.assertEqual(f.lineCount, 5)
+        # frames: 'a\nb\n' (0), 'cd' (2), 'e\nf\n' (2), 'g\n' (4)
+        self.assertEqual(f.findLine(0), (0, 0))
+        self.assertEqual(f.findLine(1), (0, 0))
+        self.assertEqual(f.findLine(2), (0, 0))
+        self.assertEqual(f.findLine(3), (6, 2))
+        self.assertEqual(f.findLine(4), (6, 2))
+        self.assertEqual(f.findLine(5), (10, 4))
+        self.assertEqual(f.findLine(99), (10, 4))
+
+    def test_corrupt_index(self):
+        self.write(['abc'])
+        with open(self.filename + blockfile.INDEX_SUFFIX, "wb") as f:
+            f.write("garbage")
+        self.assertRaises(IOError, lambda : blockfile.BlockFile(self.filename))
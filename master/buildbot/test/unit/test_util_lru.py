@@ -246,6 +246,36 @@ class LRUCacheTest(unittest.TestCase):
         self.assertEqual(self.lru.get('p'), set(['PPP']))
         self.assertEqual(self.lru.get('q'), set(['QQQ'])) # not updated
 
+    def test_contains(self):
+        self.assertFalse('a' in self.lru)
+        self.lru.get('a')
+        self.assertTrue('a' in self.lru)
+
+    def test_remove(self):
+        self.lru.get('a')
+        self.lru.get('b')
+        self.lru.get('a')
+        self.lru.remove('a')
+        self.lru.remove('x')
+        self.assertFalse('a' in self.lru)
+        self.lru.inv()
+        self.lru.miss_fn = long
+        self.check_result(self.lru.get('a'), long('a'), 1, 3)
+        self.check_result(self.lru.get('b'), short('b'), 2, 3)
+
+    def test_remove_lazily(self):
+        for k in 'abc':
+            self.lru.get(k)
+        self.lru.remove('a')
+        # the removed key stays queued until it comes up for eviction
+        self.assertEqual(list(self.lru.queue), ['a', 'b', 'c'])
+        self.lru.get('a')
+        self.lru.get('d')
+        self.lru.get('e')
+        self.lru.inv()
+        # 'a' was used again after 'b' and 'c', so it is evicted last
+        self.assertEqual(sorted(self.lru.keys()), ['a', 'd', 'e'])
+
 
 class AsyncLRUCacheTest(unittest.TestCase):
 
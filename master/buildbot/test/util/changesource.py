@@ -23,8 +23,8 @@ class ChangeSourceMixin(object):
     This class is used for testing change sources, and handles a few things:
 
      - starting and stopping a ChangeSource service
-     - a fake C{self.master.addChange}, which adds its args
-       to the list C{self.changes_added}
+     - a fake C{self.master.addChange} and C{self.master.addChanges}, which
+       add their args to the list C{self.changes_added}
     """
 
     changesource = None
@@ -46,6 +46,10 @@ class ChangeSourceMixin(object):
             return defer.succeed(mock.Mock())
         self.master = make_master(testcase=self, wantDb=True)
         self.master.addChange = addChange
+        def addChanges(changes):
+            return defer.gatherResults([ addChange(**kwargs)
+                                         for kwargs in changes ])
+        self.master.addChanges = addChanges
         return defer.succeed(None)
 
     def tearDownChangeSource(self):
@@ -29,6 +29,7 @@ class FakeMaster(object):
         self.basedir = basedir
         self.db = db
         self.changes_subscr_cb = None
+        self.changes_subscr_conditions = None
         self.bset_subscr_cb = None
         self.bset_completion_subscr_cb = None
         self.caches = mock.Mock(name="caches")
@@ -49,9 +50,10 @@ class FakeMaster(object):
         sub.unsubscribe = unsub
         return sub
 
-    def subscribeToChanges(self, callback):
+    def subscribeToChanges(self, callback, conditions=None):
         assert not self.changes_subscr_cb
         self.changes_subscr_cb = callback
+        self.changes_subscr_conditions = conditions
         return self._makeSubscription('changes_subscr_cb')
 
     def subscribeToBuildsets(self, callback):
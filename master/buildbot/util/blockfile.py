@@ -0,0 +1,183 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Block-compressed files with a random-access index.
+
+The data file is a sequence of independently zlib-compressed frames.  Next to
+it lives an index file (the data filename plus C{.idx}) with one fixed-size
+record per frame giving the frame's uncompressed offset and length, its
+compressed offset and length, and the number of newlines it contains.  A
+reader can therefore reach any uncompressed byte or line offset by
+decompressing a single frame.
+
+Writers decide where frames end: data passed to a single L{BlockFileWriter.write}
+call never straddles two frames, so callers that write whole records (such as
+the netstrings of a logfile) can start parsing at any frame boundary.
+"""
+
+from __future__ import with_statement
+
+import bisect
+import struct
+import zlib
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = "BBBLKIDX1\n"
+INDEX_RECORD = struct.Struct("!QQQQQ")
+
+class BlockFileWriter(object):
+    """
+    Write a block-compressed file and its index.
+
+    @ivar frameSize: uncompressed size at which a frame is closed
+    """
+
+    frameSize = 256*1024
+    compressLevel = 6
+
+    def __init__(self, filename, indexfilename=None, frameSize=None):
+        if frameSize is not None:
+            self.frameSize = frameSize
+        if indexfilename is None:
+            indexfilename = filename + INDEX_SUFFIX
+        self.datafile = open(filename, "wb")
+        self.indexfile = open(indexfilename, "wb")
+        self.indexfile.write(INDEX_MAGIC)
+        self.buffer = []
+        self.bufferLength = 0
+        self.rawOffset = 0
+        self.compOffset = 0
+
+    def write(self, data):
+        if self.bufferLength and self.bufferLength + len(data) > self.frameSize:
+            self._endFrame()
+        self.buffer.append(data)
+        self.bufferLength += len(data)
+        if self.bufferLength >= self.frameSize:
+            self._endFrame()
+
+    def _endFrame(self):
+        if not self.bufferLength:
+            return
+        raw = "".join(self.buffer)
+        comp = zlib.compress(raw, self.compressLevel)
+        self.datafile.write(comp)
+        self.indexfile.write(INDEX_RECORD.pack(self.rawOffset, len(raw),
+                                               self.compOffset, len(comp),
+                                               raw.count("\n")))
+        self.rawOffset += len(raw)
+        self.compOffset += len(comp)
+        self.buffer = []
+        self.bufferLength = 0
+
+    def close(self):
+        self._endFrame()
+        self.datafile.close()
+        self.indexfile.close()
+
+class BlockFile(object):
+    """
+    A read-only, seekable file object over a block-compressed file.  Opening
+    a file whose data or index is missing raises C{IOError}, like C{open}.
+
+    @ivar size: uncompressed size of the file
+    @ivar lineCount: number of newlines in the file
+    """
+
+    def __init__(self, filename, indexfilename=None):
+        if indexfilename is None:
+            indexfilename = filename + INDEX_SUFFIX
+        with open(indexfilename, "rb") as f:
+            index = f.read()
+        if not index.startswith(INDEX_MAGIC):
+            raise IOError("%s is not a block file index" % indexfilename)
+        self.datafile = open(filename, "rb")
+
+        self.frames = []
+        self.rawOffsets = []
+        self.firstLines = []
+        lines = 0
+        pos = len(INDEX_MAGIC)
+        while pos + INDEX_RECORD.size <= len(index):
+            frame = INDEX_RECORD.unpack_from(index, pos)
+            pos += INDEX_RECORD.size
+            self.frames.append(frame)
+            self.rawOffsets.append(frame[0])
+            self.firstLines.append(lines)
+            lines += frame[4]
+        self.lineCount = lines
+        if self.frames:
+            self.size = self.frames[-1][0] + self.frames[-1][1]
+        else:
+            self.size = 0
+
+        self.pos = 0
+        self.cachedFrame = None
+        self.cachedData = None
+
+    def close(self):
+        self.datafile.close()
+        self.cachedData = None
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(0, offset)
+
+    def _frameData(self, i):
+        if self.cachedFrame != i:
+            _, _, comp_offset, comp_len, _ = self.frames[i]
+            self.datafile.seek(comp_offset)
+            self.cachedData = zlib.decompress(self.datafile.read(comp_len))
+            self.cachedFrame = i
+        return self.cachedData
+
+    def _frameForOffset(self, offset):
+        return bisect.bisect_right(self.rawOffsets, offset) - 1
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        result = []
+        while size > 0 and self.pos < self.size:
+            i = self._frameForOffset(self.pos)
+            data = self._frameData(i)
+            start = self.pos - self.frames[i][0]
+            piece = data[start:start+size]
+            result.append(piece)
+            self.pos += len(piece)
+            size -= len(piece)
+        return "".join(result)
+
+    def findLine(self, lineno):
+        """
+        Find the frame holding line C{lineno} (counting from zero).
+
+        @returns: tuple (offset, line) where C{offset} is the uncompressed
+        offset of the start of that frame, and C{line} is the number of the
+        line in progress at that offset
+        """
+        # line N begins just after the Nth newline, which is in the last
+        # frame with fewer than N newlines before it
+        i = bisect.bisect_left(self.firstLines, lineno) - 1
+        if i < 0:
+            return (0, 0)
+        return (self.frames[i][0], self.firstLines[i])
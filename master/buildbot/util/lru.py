@@ -70,6 +70,17 @@ class LRUCache(object):
     def keys(self):
         return self.cache.keys()
 
+    def __contains__(self, key):
+        """True if C{get(key)} would not call the miss function"""
+        return key in self.cache or key in self.weakrefs
+
+    def remove(self, key):
+        """Forget any cached value for C{key}"""
+        # the key is left in the queue, and skipped when it comes up for
+        # eviction or compaction
+        self.weakrefs.pop(key, None)
+        self.cache.pop(key, None)
+
     def set_max_size(self, max_size):
         if self.max_size == max_size:
             return
@@ -81,12 +92,10 @@ class LRUCache(object):
     def inv(self):
         global inv_failed
 
-        # the keys of the queue and cache should be identical
+        # every cached key should be in the queue; the queue may also hold
+        # removed keys
         cache_keys = set(self.cache.keys())
         queue_keys = set(self.queue)
-        if queue_keys - cache_keys:
-            log.msg("INV: uncached keys in queue:", queue_keys - cache_keys)
-            inv_failed = True
         if cache_keys - queue_keys:
             log.msg("INV: unqueued keys in cache:", cache_keys - queue_keys)
             inv_failed = True
@@ -118,8 +127,12 @@ class LRUCache(object):
             refcount.clear()
             queue_appendleft = queue.appendleft
             queue_appendleft(self.sentinel)
+            cache = self.cache
             for k in ifilterfalse(refcount.__contains__,
                                     iter(queue.pop, self.sentinel)):
+                if k not in cache:
+                    # removed
+                    continue
                 queue_appendleft(k)
                 refcount[k] = 1
 
@@ -159,7 +172,8 @@ class LRUCache(object):
             while refc:
                 k = queue.popleft()
                 refc = refcount[k] = refcount[k] - 1
-            del cache[k]
+            # removed keys are no longer cached
+            cache.pop(k, None)
             del refcount[k]
 
 
@@ -175,6 +189,9 @@ class AsyncLRUCache(LRUCache):
         LRUCache.__init__(self, miss_fn, max_size=max_size)
         self.concurrent = {}
 
+    def __contains__(self, key):
+        return LRUCache.__contains__(self, key) or key in self.concurrent
+
     def get(self, key, **miss_fn_kwargs):
         try:
             result = self._get_hit(key)
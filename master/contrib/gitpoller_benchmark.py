@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Compare the time GitPoller takes to read new commits one git process per
+field per commit (the old way) against a single git log for the whole range.
+
+A repository with the requested number of commits is generated with
+'git fast-import' in a temporary directory.
+
+    python gitpoller_benchmark.py [--commits 2000] [--files 3]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from twisted.internet import defer, task
+
+from buildbot.changes import gitpoller
+
+def generate_repo(path, commits, files):
+    subprocess.check_call(['git', 'init', '--quiet', '--bare', path])
+    stream = []
+    for i in range(commits):
+        message = 'commit %d\n\nbody of commit %d\n' % (i, i)
+        stream.append('commit refs/heads/master\n')
+        stream.append('committer Bench Mark <bench@example.com> %d +0000\n'
+                      % (1273258009 + i))
+        stream.append('data %d\n%s' % (len(message), message))
+        for f in range(files):
+            content = '%d\n' % i
+            stream.append('M 644 inline dir%d/file%d\ndata %d\n%s'
+                          % (f, (i + f) % 50, len(content), content))
+        stream.append('\n')
+    p = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=path,
+                         stdin=subprocess.PIPE)
+    p.communicate(''.join(stream))
+    if p.returncode != 0:
+        raise RuntimeError('git fast-import failed')
+
+class FakeMaster(object):
+
+    def __init__(self):
+        self.changes = 0
+
+    def addChange(self, **kwargs):
+        self.changes += 1
+        return defer.succeed(None)
+
+@defer.inlineCallbacks
+def per_commit(poller, revRange):
+    # GitPoller._process_changes before commits were read with one git log
+    revs = yield poller._dovccmd('log', ['--format=%H', revRange, '--'],
+                                 path=poller.workdir)
+    revs = revs.split()
+    revs.reverse()
+    for rev in revs:
+        results = yield defer.DeferredList([
+            poller._get_commit_timestamp(rev),
+            poller._get_commit_author(rev),
+            poller._get_commit_files(rev),
+            poller._get_commit_comments(rev),
+        ], fireOnOneErrback=True, consumeErrors=True)
+        timestamp, author, files, comments = [ r[1] for r in results ]
+        yield poller.master.addChange(author=author, revision=rev,
+                files=files, comments=comments, branch='master')
+
+@defer.inlineCallbacks
+def single_log(poller, revRange):
+    first, last = revRange.split('..')
+    poller.lastRev = {'master': first}
+    yield poller._process_changes(last, 'master')
+
+@defer.inlineCallbacks
+def run(reactor, opts):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        repo = os.path.join(tmpdir, 'repo.git')
+        generate_repo(repo, opts.commits + 1, opts.files)
+        poller = gitpoller.GitPoller('file://' + repo, workdir=repo)
+        first = yield poller._dovccmd('rev-list',
+                ['--max-parents=0', 'master'], path=repo)
+        revRange = '%s..master' % first
+
+        for name, method in [('per-commit processes', per_commit),
+                             ('single git log', single_log)]:
+            poller.master = FakeMaster()
+            start = time.time()
+            yield method(poller, revRange)
+            elapsed = time.time() - start
+            print '%-22s %6d changes in %8.3fs (%.0f changes/s)' % (name,
+                    poller.master.changes, elapsed,
+                    poller.master.changes / elapsed)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--commits', type='int', default=2000,
+                      help='number of new commits to read')
+    parser.add_option('--files', type='int', default=3,
+                      help='files changed by each commit')
+    opts, args = parser.parse_args()
+    task.react(run, [opts])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Measure the throughput of file uploads and downloads between the slave
+transfer commands and the master's file writer and reader, over a real PB
+connection on the loopback interface.  Each remote call is delayed by half
+the given round-trip time on the way out and half on the way back, to
+simulate a distant slave.
+
+Both the master and the slave must be importable:
+
+    PYTHONPATH=.:../slave python contrib/transfer_benchmark.py \\
+        [--size 4] [--rtt 20] [--blocksize 16384] [--windows 1,4,16]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+from twisted.internet import defer, reactor, task
+from twisted.spread import pb
+
+from buildbot.steps import transfer
+from buildslave.commands.transfer import SlaveFileUploadCommand, \
+        SlaveFileDownloadCommand
+
+class Root(pb.Root):
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+
+    def remote_writer(self, deflate, checksum):
+        return transfer._FileWriter(os.path.join(self.tmpdir, 'uploaded'),
+                                    None, None, deflate=deflate,
+                                    checksum=checksum)
+
+    def remote_reader(self, path, deflate, checksum):
+        return transfer._FileReader(open(path, 'rb'), deflate=deflate,
+                                    checksum=checksum)
+
+class DelayedRemote(object):
+    """
+    Wrap a RemoteReference, delaying each call and its answer by half of
+    C{rtt} seconds.
+    """
+
+    def __init__(self, remote, rtt):
+        self.remote = remote
+        self.rtt = rtt
+
+    def _delay(self, result):
+        d = defer.Deferred()
+        reactor.callLater(self.rtt / 2.0, d.callback, result)
+        return d
+
+    def callRemote(self, meth, *args, **kwargs):
+        d = self._delay(None)
+        d.addCallback(lambda _ : self.remote.callRemote(meth, *args, **kwargs))
+        d.addCallback(self._delay)
+        return d
+
+    def notifyOnDisconnect(self, what):
+        pass
+
+    def dontNotifyOnDisconnect(self, what):
+        pass
+
+class FakeBuilder(object):
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.updates = []
+
+    def sendUpdate(self, status):
+        self.updates.append(status)
+
+@defer.inlineCallbacks
+def transfer_once(root, builder, opts, kind, window, deflate, checksum):
+    if kind == 'upload':
+        writer = yield root.callRemote('writer', deflate, checksum)
+        cmd = SlaveFileUploadCommand(builder, 'bench', dict(
+            workdir='.', slavesrc='data', writer=DelayedRemote(writer, opts.rtt),
+            maxsize=None, blocksize=opts.blocksize, keepstamp=False,
+            window=window, deflate=deflate, checksum=checksum))
+    else:
+        reader = yield root.callRemote('reader',
+                os.path.join(builder.basedir, 'data'), deflate, checksum)
+        cmd = SlaveFileDownloadCommand(builder, 'bench', dict(
+            workdir='.', slavedest='downloaded',
+            reader=DelayedRemote(reader, opts.rtt), maxsize=None,
+            blocksize=opts.blocksize, mode=None, window=window,
+            deflate=deflate, checksum=checksum))
+    start = time.time()
+    yield cmd.doStart()
+    elapsed = time.time() - start
+    rc = [ u['rc'] for u in builder.updates if 'rc' in u ]
+    if rc != [0]:
+        raise RuntimeError('%s failed: %r' % (kind, builder.updates))
+    defer.returnValue(elapsed)
+
+@defer.inlineCallbacks
+def run(reactor_, opts):
+    tmpdir = tempfile.mkdtemp()
+    port = None
+    try:
+        size = opts.size * 1024 * 1024
+        # half compressible text, half random bytes
+        data = ('log line of a build %d\n' * 1000 % tuple(range(1000)))
+        data = (data * (size / 2 / len(data) + 1))[:size / 2]
+        data += os.urandom(size - len(data))
+        builder = FakeBuilder(tmpdir)
+        open(os.path.join(tmpdir, 'data'), 'wb').write(data)
+
+        port = reactor.listenTCP(0, pb.PBServerFactory(Root(tmpdir)),
+                                 interface='127.0.0.1')
+        factory = pb.PBClientFactory()
+        reactor.connectTCP('127.0.0.1', port.getHost().port, factory)
+        root = yield factory.getRootObject()
+
+        print '%d MiB, %d byte blocks, %.0fms round trip' % (opts.size,
+                opts.blocksize, opts.rtt * 1000)
+        for kind in 'upload', 'download':
+            for window in opts.windows:
+                for deflate, checksum in (False, False), (True, True):
+                    builder.updates = []
+                    elapsed = yield transfer_once(root, builder, opts, kind,
+                                                  window, deflate, checksum)
+                    print '%-8s window=%-3d deflate+checksum=%-5s %7.3fs' \
+                          ' (%.2f MiB/s)' % (kind, window, deflate, elapsed,
+                                             opts.size / elapsed)
+        factory.disconnect()
+    finally:
+        if port is not None:
+            yield port.stopListening()
+        shutil.rmtree(tmpdir)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--size', type='int', default=4,
+                      help='MiB to transfer')
+    parser.add_option('--rtt', type='float', default=20,
+                      help='simulated round-trip time, in milliseconds')
+    parser.add_option('--blocksize', type='int', default=16*1024,
+                      help='bytes per block')
+    parser.add_option('--windows', default='1,4,16',
+                      help='comma-separated window sizes to compare')
+    opts, args = parser.parse_args()
+    opts.rtt = opts.rtt / 1000.0
+    opts.windows = [ int(w) for w in opts.windows.split(',') ]
+    task.react(run, [opts])
+
+if __name__ == '__main__':
+    sys.exit(main())
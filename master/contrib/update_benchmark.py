@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+"""
+Count the messages the slave's RunProcess sends to the master for a stream
+of interleaved stdout, stderr and logfile output, such as a parallel compile
+produces.  Each run of output for the same log is one update; before updates
+were sent several to a message, each update was a message of its own.
+
+The sizes are those of the 'update' calls as encoded by PB.
+
+    PYTHONPATH=../slave python contrib/update_benchmark.py \\
+        [--megabytes 8] [--line-length 80] [--stderr 0.3] [--logfile 0.1]
+"""
+
+import random
+import sys
+from optparse import OptionParser
+
+from twisted.spread import banana, jelly
+
+from buildslave import runprocess
+
+class CountingBuilder(object):
+
+    usePTY = False
+    unicode_encoding = 'utf-8'
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+        self.messages = 0
+        self.updates = 0
+        self.encoded = 0
+        self.unbatched_encoded = 0
+
+    def _encode(self, updates):
+        call = ['update', [ [u, 0] for u in updates ]]
+        return len(banana.encode(jelly.jelly(call)))
+
+    def sendUpdate(self, data):
+        self.sendUpdates([data])
+
+    def sendUpdates(self, datas):
+        self.messages += 1
+        self.updates += len(datas)
+        self.encoded += self._encode(datas)
+        self.unbatched_encoded += sum(self._encode([d]) for d in datas)
+
+def generate(opts):
+    rnd = random.Random(opts.seed)
+    total = 0
+    size = opts.megabytes * 1024 * 1024
+    while total < size:
+        line = 'x' * rnd.randint(opts.line_length / 2,
+                                 opts.line_length * 3 / 2) + '\n'
+        r = rnd.random()
+        if r < opts.stderr:
+            yield 'stderr', line
+        elif r < opts.stderr + opts.logfile:
+            yield ('log', 'build.log'), line
+        else:
+            yield 'stdout', line
+        total += len(line)
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--megabytes', type='int', default=8,
+                      help='MiB of output to send')
+    parser.add_option('--line-length', type='int', default=80,
+                      help='average line length')
+    parser.add_option('--stderr', type='float', default=0.3,
+                      help='fraction of lines written to stderr')
+    parser.add_option('--logfile', type='float', default=0.1,
+                      help='fraction of lines written to a logfile')
+    parser.add_option('--seed', type='int', default=0)
+    opts, args = parser.parse_args()
+
+    builder = CountingBuilder('.')
+    rp = runprocess.RunProcess(builder, ['true'], '.')
+    add = {
+        'stdout': rp.addStdout,
+        'stderr': rp.addStderr,
+    }
+    for logname, line in generate(opts):
+        if isinstance(logname, tuple):
+            rp.addLogfile(logname[1], line)
+        else:
+            add[logname](line)
+    rp._sendBuffers()
+
+    mb = float(opts.megabytes)
+    print '%d MiB of mixed output in %d updates' % (opts.megabytes,
+                                                    builder.updates)
+    print '%-26s %8.0f messages/MiB %10.0f encoded bytes/MiB' % (
+            'one update per message', builder.updates / mb,
+            builder.unbatched_encoded / mb)
+    print '%-26s %8.0f messages/MiB %10.0f encoded bytes/MiB' % (
+            'batched updates', builder.messages / mb, builder.encoded / mb)
+
+if __name__ == '__main__':
+    sys.exit(main())
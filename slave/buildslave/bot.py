@@ -26,7 +26,7 @@ from twisted.cred import credentials
 
 import buildslave
 from buildslave.pbutil import ReconnectingPBClientFactory
-from buildslave.commands import registry, base
+from buildslave.commands import registry, base, artifactcache
 from buildslave import monkeypatches
 
 class UnknownCommand(pb.Error):
@@ -173,6 +173,11 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         number in the process. It adds the update to a queue, and asks the
         master to acknowledge the update so it can be removed from that
         queue."""
+        self.sendUpdates([data])
+
+    def sendUpdates(self, datas):
+        """Like L{sendUpdate}, but send several status updates in a single
+        message.  The master handles them in order."""
 
         if not self.running:
             # .running comes from service.Service, and says whether the
@@ -183,8 +188,7 @@ class SlaveBuilder(pb.Referenceable, service.Service):
         # master still expects to receive. Provide it to avoid significant
         # interoperability issues between new slaves and old masters.
         if self.remoteStep:
-            update = [data, 0]
-            updates = [update]
+            updates = [ [data, 0] for data in datas ]
             d = self.remoteStep.callRemote("update", updates)
             d.addCallback(self.ackUpdate)
             d.addErrback(self._ackFailed, "SlaveBuilder.sendUpdate")
@@ -291,7 +295,7 @@ class Bot(pb.Referenceable, service.MultiService):
         # finally warn about any leftover dirs
         for dir in os.listdir(self.basedir):
             if os.path.isdir(os.path.join(self.basedir, dir)):
-                if dir not in wanted_dirs:
+                if dir not in wanted_dirs and dir != artifactcache.CACHE_DIR:
                     log.msg("I have a leftover directory '%s' that is not "
                             "being used by the buildmaster: you can delete "
                             "it now" % dir)
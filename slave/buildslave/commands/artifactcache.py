@@ -0,0 +1,201 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from twisted.python import log
+
+from buildslave.commands import checksum
+
+# name of the cache directory, in the buildslave's basedir
+CACHE_DIR = "artifact-cache"
+
+# default bound on the total size of the cache, in bytes
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+PARTIAL_SUFFIX = ".part"
+
+_key_re = re.compile(r"^[0-9a-f]{40}$")
+
+# the partial files being written, by path.  The downloads of all of the
+# builders run in threads of this process, so this is enough to keep two of
+# them from writing to the same file.
+_partialsInUse = set()
+_partialsLock = threading.Lock()
+
+class ArtifactCache(object):
+    """
+    A content-addressed store of downloaded files, shared by all of the
+    builders on a buildslave.  Each file is stored under the sha1 hexdigest of
+    its contents.  A download in progress is kept in a partial file, so that
+    it can be resumed if the connection to the master is lost.
+
+    Once the files in the cache exceed C{maxsize} bytes, the least recently
+    used ones are evicted; using a file updates its modification time.
+
+    Only one download at a time resumes the partial file of a key; another
+    download of the same key writes to a partial file of its own, which is
+    removed if it is not completed.
+
+    All of the methods do blocking I/O, and should be called in a thread.
+    """
+
+    def __init__(self, cachedir, maxsize=None):
+        self.cachedir = cachedir
+        if maxsize is None:
+            maxsize = DEFAULT_CACHE_SIZE
+        self.maxsize = maxsize
+
+    @staticmethod
+    def isValidKey(key):
+        return bool(_key_re.match(key or ''))
+
+    def entryPath(self, key):
+        return os.path.join(self.cachedir, key)
+
+    def partialPath(self, key):
+        return os.path.join(self.cachedir, key + PARTIAL_SUFFIX)
+
+    def isCurrent(self, key, path):
+        """
+        Return true if C{path} already exists with the contents C{key}.
+        """
+        dirname, basename = os.path.split(path)
+        try:
+            sums = checksum._calc_checksum(dirname, [basename], "sha1")
+        except checksum._CheckSumException:
+            return False
+        return sums[basename] == key
+
+    def fetch(self, key, path):
+        """
+        Copy the entry C{key} to C{path}, if it is in the cache.
+
+        @returns: true if the entry was copied
+        """
+        entry = self.entryPath(key)
+        if not os.path.exists(entry):
+            return False
+        os.utime(entry, None)
+        tmppath = path + PARTIAL_SUFFIX
+        shutil.copyfile(entry, tmppath)
+        os.rename(tmppath, path)
+        return True
+
+    def openPartial(self, key):
+        """
+        Open the partial file for C{key} for appending, creating it if
+        necessary, or a new partial file if another download is using it.
+        The partial file must be passed to L{commit}, L{discardPartial} or
+        L{releasePartial} once the download is over.
+
+        @returns: tuple (file, offset, sha1 of the data already there); the
+        partial file is the file's C{name}
+        """
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        partial = self.partialPath(key)
+        with _partialsLock:
+            if partial in _partialsInUse:
+                fd, partial = tempfile.mkstemp(dir=self.cachedir,
+                                               prefix=key + ".",
+                                               suffix=PARTIAL_SUFFIX)
+                os.close(fd)
+            _partialsInUse.add(partial)
+        sha1 = hashlib.sha1()
+        offset = 0
+        if os.path.exists(partial):
+            fp = open(partial, "rb")
+            try:
+                while True:
+                    chunk = fp.read(checksum.READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha1.update(chunk)
+                    offset += len(chunk)
+            finally:
+                fp.close()
+        return open(partial, "ab"), offset, sha1
+
+    def _release(self, partial):
+        with _partialsLock:
+            _partialsInUse.discard(partial)
+
+    def releasePartial(self, key, partial):
+        """
+        Stop using C{partial}, keeping it to be resumed if it is the partial
+        file of C{key}.
+        """
+        try:
+            if partial != self.partialPath(key) and os.path.exists(partial):
+                os.unlink(partial)
+        finally:
+            self._release(partial)
+
+    def discardPartial(self, key, partial):
+        try:
+            if os.path.exists(partial):
+                os.unlink(partial)
+        finally:
+            self._release(partial)
+
+    def commit(self, key, partial, path):
+        """
+        Move the completed C{partial} file for C{key} into the cache, copy it
+        to C{path}, and evict old entries to bring the cache back under its
+        size bound.
+        """
+        entry = self.entryPath(key)
+        try:
+            os.rename(partial, entry)
+        finally:
+            self._release(partial)
+        self.fetch(key, path)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used files, including stale partial files,
+        until the cache fits in C{maxsize}.  The entry C{keep} and the
+        partial files being written are never removed.
+        """
+        with _partialsLock:
+            inUse = set(_partialsInUse)
+        files = []
+        total = 0
+        for name in os.listdir(self.cachedir):
+            path = os.path.join(self.cachedir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            total += st.st_size
+            if name != keep and path not in inUse:
+                files.append((st.st_mtime, name, st.st_size))
+        files.sort()
+        for mtime, name, size in files:
+            if total <= self.maxsize:
+                break
+            try:
+                os.unlink(os.path.join(self.cachedir, name))
+            except OSError:
+                log.msg("could not evict '%s' from the artifact cache" % name)
+                continue
+            total -= size
@@ -13,12 +13,13 @@
 #
 # Copyright Buildbot Team Members
 
-import os, tarfile, tempfile
+import os, tarfile, tempfile, zlib, hashlib
 
-from twisted.python import log
-from twisted.internet import defer
+from twisted.python import log, failure
+from twisted.internet import defer, threads
 
 from buildslave.commands.base import Command
+from buildslave.commands import artifactcache
 
 class TransferCommand(Command):
 
@@ -44,6 +45,76 @@ class TransferCommand(Command):
         # now we wait for the next trip around the loop.  It abandon the file
         # when it sees self.interrupted set.
 
+    def setupPipelining(self, args):
+        """
+        Read the arguments that masters since slave command version 2.16 may
+        add to a transfer: C{window} blocks may be in flight at once, blocks
+        are compressed with zlib if C{deflate} is true, and the sha1 of the
+        whole file is compared at the end if C{checksum} is true.
+        """
+        self.window = max(args.get('window', 1) or 1, 1)
+        self.deflate = args.get('deflate', False)
+        if self.deflate:
+            self.compressor = zlib.compressobj()
+        self.checksum = None
+        if args.get('checksum', False):
+            self.checksum = hashlib.sha1()
+
+    def _loop(self, fire_when_done):
+        """
+        Call C{self._transferBlock} until it returns true, directly or
+        through a Deferred, keeping up to C{self.window} of its Deferreds
+        outstanding at once; then fire C{fire_when_done}.  PB delivers the
+        calls and their answers in order, so the blocks stay in order.
+        """
+        state = dict(inflight=0, finished=False, filling=False, fired=False)
+
+        def fire(result):
+            if not state['fired']:
+                state['fired'] = True
+                if isinstance(result, failure.Failure):
+                    fire_when_done.errback(result)
+                else:
+                    fire_when_done.callback(None)
+
+        def fill():
+            # blocks answered while we are still sending are picked up by
+            # this loop rather than by recursing
+            if state['filling']:
+                return
+            state['filling'] = True
+            try:
+                while not state['finished'] and state['inflight'] < self.window:
+                    try:
+                        res = self._transferBlock()
+                    except:
+                        state['finished'] = True
+                        fire(failure.Failure())
+                        break
+                    if isinstance(res, defer.Deferred):
+                        state['inflight'] += 1
+                        res.addCallbacks(done, failed)
+                    elif res:
+                        state['finished'] = True
+            finally:
+                state['filling'] = False
+            if state['finished'] and not state['inflight']:
+                fire(None)
+
+        def done(finished):
+            state['inflight'] -= 1
+            if finished:
+                state['finished'] = True
+            fill()
+
+        def failed(why):
+            state['inflight'] -= 1
+            state['finished'] = True
+            fire(why)
+
+        fill()
+        return None
+
 
 class SlaveFileUploadCommand(TransferCommand):
     """
@@ -56,6 +127,9 @@ class SlaveFileUploadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['keepstamp']: whether to preserve file modified and accessed times
+        - ['window']:    number of blocks to send before waiting for acks
+        - ['deflate']:   whether to compress the blocks with zlib
+        - ['checksum']:  whether to have the master verify the file's sha1
     """
     debug = False
 
@@ -66,6 +140,7 @@ class SlaveFileUploadCommand(TransferCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.keepstamp = args.get('keepstamp', False)
+        self.setupPipelining(args)
         self.stderr = None
         self.rc = 0
 
@@ -99,11 +174,14 @@ class SlaveFileUploadCommand(TransferCommand):
         self._reactor.callLater(0, self._loop, d)
         def _close_ok(res):
             self.fp = None
-            d1 = self.writer.callRemote("close")
+            d1 = self.writer.callRemote("close", *self._closeArgs())
             def _utime_ok(res):
                 return self.writer.callRemote("utime", accessed_modified)
+            # a file the master refused is not there to be stamped
             if self.keepstamp:
-                d1.addCallback(_utime_ok)
+                d1.addCallbacks(_utime_ok, self._checksumFailed)
+            else:
+                d1.addErrback(self._checksumFailed)
             return d1
         def _close_err(f):
             self.rc = 1
@@ -121,17 +199,21 @@ class SlaveFileUploadCommand(TransferCommand):
         d.addBoth(self.finished)
         return d
 
-    def _loop(self, fire_when_done):
-        d = defer.maybeDeferred(self._writeBlock)
-        def _done(finished):
-            if finished:
-                fire_when_done.callback(None)
-            else:
-                self._loop(fire_when_done)
-        def _err(why):
-            fire_when_done.errback(why)
-        d.addCallbacks(_done, _err)
-        return None
+    def _closeArgs(self):
+        if self.checksum is not None:
+            return (self.checksum.hexdigest(),)
+        return ()
+
+    def _checksumFailed(self, why):
+        # the master refuses a file whose checksum does not match
+        if self.checksum is None:
+            return why
+        self.rc = 1
+        self.stderr = "Upload of '%s' failed: %s" % (self.path,
+                                                     why.getErrorMessage())
+
+    def _transferBlock(self):
+        return self._writeBlock()
 
     def _writeBlock(self):
         """Write a block of data to the remote writer"""
@@ -164,6 +246,11 @@ class SlaveFileUploadCommand(TransferCommand):
         if self.remaining is not None:
             self.remaining = self.remaining - len(data)
             assert self.remaining >= 0
+        if self.checksum is not None:
+            self.checksum.update(data)
+        if self.deflate:
+            data = self.compressor.compress(data) + \
+                    self.compressor.flush(zlib.Z_SYNC_FLUSH)
         d = self.writer.callRemote('write', data)
         d.addCallback(lambda res: False)
         return d
@@ -179,6 +266,7 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         self.remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.compress = args['compress']
+        self.setupPipelining(args)
         self.stderr = None
         self.rc = 0
 
@@ -214,11 +302,13 @@ class SlaveDirectoryUploadCommand(SlaveFileUploadCommand):
         d = defer.Deferred()
         self._reactor.callLater(0, self._loop, d)
         def unpack(res):
-            d1 = self.writer.callRemote("unpack")
+            d1 = self.writer.callRemote("unpack", *self._closeArgs())
             def unpack_err(f):
                 self.rc = 1
                 return f
             d1.addErrback(unpack_err)
+            if self.checksum is not None:
+                d1.addErrback(self._checksumFailed)
             d1.addCallback(lambda ignored: res)
             return d1
         d.addCallback(unpack)
@@ -242,6 +332,12 @@ class SlaveFileDownloadCommand(TransferCommand):
         - ['maxsize']:   max size (in bytes) of file to write
         - ['blocksize']: max size for each data block
         - ['mode']:      access mode for the new file
+        - ['window']:    number of blocks to request before waiting for data
+        - ['deflate']:   whether the blocks are compressed with zlib
+        - ['checksum']:  whether to verify the file's sha1 with the master
+        - ['cachekey']:  sha1 of the file, to look it up in and add it to the
+                         slave's artifact cache
+        - ['cachesize']: size bound of the artifact cache, in bytes
     """
     debug = False
 
@@ -252,6 +348,21 @@ class SlaveFileDownloadCommand(TransferCommand):
         self.bytes_remaining = args['maxsize']
         self.blocksize = args['blocksize']
         self.mode = args['mode']
+        self.setupPipelining(args)
+        if self.deflate:
+            self.decompressor = zlib.decompressobj()
+        self.cachekey = args.get('cachekey')
+        self.cache = None
+        if self.cachekey is not None:
+            assert artifactcache.ArtifactCache.isValidKey(self.cachekey)
+            cachedir = os.path.join(os.path.dirname(self.builder.basedir),
+                                    artifactcache.CACHE_DIR)
+            self.cache = artifactcache.ArtifactCache(cachedir,
+                                                     args.get('cachesize'))
+        self.fp = None
+        # the artifact cache's partial file being written
+        self.partial = None
+        self.eof = False
         self.stderr = None
         self.rc = 0
 
@@ -259,7 +370,6 @@ class SlaveFileDownloadCommand(TransferCommand):
         if self.debug:
             log.msg('SlaveFileDownloadCommand starting')
 
-        # Open file
         self.path = os.path.join(self.builder.basedir,
                                  self.workdir,
                                  os.path.expanduser(self.filename))
@@ -268,6 +378,71 @@ class SlaveFileDownloadCommand(TransferCommand):
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
+        if self.cache is not None:
+            d = threads.deferToThread(self._fetchFromCache)
+            d.addCallback(self._cacheResult)
+            d.addErrback(self._cacheFailed)
+        else:
+            self._openFile()
+            d = defer.succeed(False)
+        def _download(cached):
+            if cached:
+                return
+            d = defer.Deferred()
+            self._reactor.callLater(0, self._loop, d)
+            d.addCallback(self._checkDownload)
+            return d
+        d.addCallback(_download)
+        def _close(res):
+            # close the file, but pass through any errors from _loop
+            d1 = self.reader.callRemote('close')
+            d1.addErrback(log.err, 'while trying to close reader')
+            d1.addCallback(lambda ignored: res)
+            return d1
+        d.addBoth(_close)
+        d.addBoth(self.finished)
+        return d
+
+    def _fetchFromCache(self):
+        # runs in a thread; returns 'current' or 'hit' if the file is now in
+        # place, or a partial download to resume otherwise
+        if self.cache.isCurrent(self.cachekey, self.path):
+            return 'current'
+        if self.cache.fetch(self.cachekey, self.path):
+            return 'hit'
+        return self.cache.openPartial(self.cachekey)
+
+    def _cacheResult(self, res):
+        if res in ('current', 'hit'):
+            self.sendStatus({'cache': res})
+            self._setMode()
+            return True
+
+        self.fp, offset, self.checksum = res
+        self.partial = self.fp.name
+        if not offset:
+            self.sendStatus({'cache': 'miss'})
+            return False
+
+        self.sendStatus({'cache': 'resumed', 'offset': offset})
+        if self.bytes_remaining is not None:
+            self.bytes_remaining = max(self.bytes_remaining - offset, 0)
+        d = self.reader.callRemote('seek', offset)
+        d.addCallback(lambda _ : False)
+        return d
+
+    def _cacheFailed(self, why):
+        log.err(why, 'while using the artifact cache')
+        self.stderr = "Cannot download '%s' through the artifact cache: %s" \
+                        % (self.path, why.getErrorMessage())
+        self.rc = 1
+        return True
+
+    def _setMode(self):
+        if self.mode is not None:
+            os.chmod(self.path, self.mode)
+
+    def _openFile(self):
         try:
             self.fp = open(self.path, 'wb')
             if self.debug:
@@ -289,34 +464,13 @@ class SlaveFileDownloadCommand(TransferCommand):
             if self.debug:
                 log.msg("Cannot open file '%s' for download" % self.path)
 
-        d = defer.Deferred()
-        self._reactor.callLater(0, self._loop, d)
-        def _close(res):
-            # close the file, but pass through any errors from _loop
-            d1 = self.reader.callRemote('close')
-            d1.addErrback(log.err, 'while trying to close reader')
-            d1.addCallback(lambda ignored: res)
-            return d1
-        d.addBoth(_close)
-        d.addBoth(self.finished)
-        return d
-
-    def _loop(self, fire_when_done):
-        d = defer.maybeDeferred(self._readBlock)
-        def _done(finished):
-            if finished:
-                fire_when_done.callback(None)
-            else:
-                self._loop(fire_when_done)
-        def _err(why):
-            fire_when_done.errback(why)
-        d.addCallbacks(_done, _err)
-        return None
+    def _transferBlock(self):
+        return self._readBlock()
 
     def _readBlock(self):
         """Read a block of data from the remote reader."""
 
-        if self.interrupted or self.fp is None:
+        if self.interrupted or self.fp is None or self.eof:
             if self.debug:
                 log.msg('SlaveFileDownloadCommand._readBlock(): end')
             return True
@@ -326,12 +480,14 @@ class SlaveFileDownloadCommand(TransferCommand):
             length = self.bytes_remaining
 
         if length <= 0:
-            if self.stderr is None:
-                self.stderr = "Maximum filesize reached, truncating file '%s'" \
-                                % self.path
-                self.rc = 1
+            # all of maxsize has been requested; _checkDownload decides
+            # whether that truncated the file
             return True
         else:
+            # bytes_remaining counts the bytes requested, so that the blocks
+            # in flight never add up to more than maxsize
+            if self.bytes_remaining is not None:
+                self.bytes_remaining = self.bytes_remaining - length
             d = self.reader.callRemote('read', length)
             d.addCallback(self._writeData)
             return d
@@ -340,17 +496,73 @@ class SlaveFileDownloadCommand(TransferCommand):
         if self.debug:
             log.msg('SlaveFileDownloadCommand._readBlock(): readlen=%d' %
                     len(data))
+        if self.eof or self.fp is None:
+            return True
         if len(data) == 0:
+            self.eof = True
             return True
 
-        if self.bytes_remaining is not None:
-            self.bytes_remaining = self.bytes_remaining - len(data)
-            assert self.bytes_remaining >= 0
+        if self.deflate:
+            data = self.decompressor.decompress(data)
+        if self.checksum is not None:
+            self.checksum.update(data)
         self.fp.write(data)
         return False
 
+    def _checkDownload(self, res):
+        if self.interrupted or self.fp is None:
+            return res
+        if self.bytes_remaining is not None and self.bytes_remaining <= 0 \
+                and not self.eof:
+            if self.stderr is None:
+                self.stderr = "Maximum filesize reached, truncating file '%s'" \
+                                % self.path
+                self.rc = 1
+            if self.cache is not None:
+                # a truncated file is not worth resuming
+                self.fp.close()
+                self.fp = None
+                self.cache.discardPartial(self.cachekey, self.partial)
+                self.partial = None
+            return res
+        if self.cache is not None:
+            return self._addToCache(res)
+        if self.checksum is None:
+            return res
+        d = self.reader.callRemote('checksum')
+        def compare(checksum):
+            if checksum != self.checksum.hexdigest():
+                self.stderr = "Checksum mismatch downloading file '%s'" \
+                                % self.path
+                self.rc = 1
+        d.addCallback(compare)
+        return d
+
+    def _addToCache(self, res):
+        self.fp.close()
+        self.fp = None
+        partial, self.partial = self.partial, None
+        if self.checksum.hexdigest() != self.cachekey:
+            self.cache.discardPartial(self.cachekey, partial)
+            self.stderr = "Checksum mismatch downloading file '%s'" \
+                            % self.path
+            self.rc = 1
+            return res
+        d = threads.deferToThread(self.cache.commit, self.cachekey, partial,
+                                  self.path)
+        d.addCallback(lambda _ : self._setMode())
+        d.addCallback(lambda _ : res)
+        return d
+
     def finished(self, res):
         if self.fp is not None:
             self.fp.close()
+        if self.partial is not None:
+            # interrupted; keep what was downloaded to resume it later
+            try:
+                self.cache.releasePartial(self.cachekey, self.partial)
+            except OSError:
+                log.err(None, 'while releasing the artifact cache')
+            self.partial = None
 
         return TransferCommand.finished(self, res)
@@ -203,7 +203,26 @@ class RunProcessPP(protocol.ProcessProtocol):
         self.command.finished(sig, rc)
 
 
-class RunProcess:
+class OutputBuffer(object):
+    """
+    Keep a copy of the output of a process, as a list of chunks that are only
+    joined when the text is asked for, so that keeping a large output costs
+    linear time.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def append(self, data):
+        self.chunks.append(data)
+
+    def getvalue(self):
+        text = ''.join(self.chunks)
+        # keep the joined text, so that it is only joined once
+        self.chunks = [text]
+        return text
+
+class RunProcess(object):
     """
     This is a helper class, used by slave commands to run programs in a child
     shell.
@@ -325,6 +344,8 @@ class RunProcess:
         self.maxTimer = None
         self.keepStdout = keepStdout
         self.keepStderr = keepStderr
+        self.stdoutBuffer = None
+        self.stderrBuffer = None
 
         self.buffered = deque()
         self.buflen = 0
@@ -374,13 +395,28 @@ class RunProcess:
     def sendStatus(self, status):
         self.builder.sendUpdate(status)
 
+    def _getKept(self, buf, name):
+        if buf is None:
+            raise AttributeError(name)
+        return buf.getvalue()
+
+    @property
+    def stdout(self):
+        """The kept stdout text, if keepStdout was given"""
+        return self._getKept(self.stdoutBuffer, 'stdout')
+
+    @property
+    def stderr(self):
+        """The kept stderr text, if keepStderr was given"""
+        return self._getKept(self.stderrBuffer, 'stderr')
+
     def start(self):
         # return a Deferred which fires (with the exit code) when the command
         # completes
         if self.keepStdout:
-            self.stdout = ""
+            self.stdoutBuffer = OutputBuffer()
         if self.keepStderr:
-            self.stderr = ""
+            self.stderrBuffer = OutputBuffer()
         self.deferred = defer.Deferred()
         try:
             self._startCommand()
@@ -593,14 +629,15 @@ class RunProcess:
                 retval[log] = data
         return retval
 
-    def _sendMessage(self, msg):
+    def _sendMessages(self, batch):
         """
-        Collapse and send msg to the master
+        Collapse each (logname, chunks) pair in batch into an update, and send
+        them to the master in a single message
         """
-        if not msg:
-            return
-        msg = self._collapseMsg(msg)
-        self.sendStatus(msg)
+        updates = [ self._collapseMsg({logname: chunks})
+                    for logname, chunks in batch if chunks ]
+        if updates:
+            self.builder.sendUpdates(updates)
 
     def _bufferTimeout(self):
         self.buftimer = None
@@ -609,50 +646,46 @@ class RunProcess:
     def _sendBuffers(self):
         """
         Send all the content in our buffers.
+
+        Each update is a dictionary, so data from different logs cannot be
+        interleaved within one update.  Instead, each run of data for the same
+        log becomes its own update, and the updates are sent in order, as
+        many as fit in CHUNK_LIMIT to a message: the master's remote_update
+        takes an ordered list of updates.
         """
-        msg = {}
-        msg_size = 0
+        batch = []
+        batch_size = 0
         lastlog = None
-        logdata = []
+        logdata = None
         while self.buffered:
             # Grab the next bits from the buffer
             logname, data = self.buffered.popleft()
 
-            # If this log is different than the last one, then we have to send
-            # out the message so far.  This is because the message is
-            # transferred as a dictionary, which makes the ordering of keys
-            # unspecified, and makes it impossible to interleave data from
-            # different logs.  A future enhancement could be to change the
-            # master to support a list of (logname, data) tuples instead of a
-            # dictionary.
-            # On our first pass through this loop lastlog is None
-            if lastlog is None:
+            # If this log is different than the last one, start a new update
+            # in the batch.  On our first pass through this loop lastlog is
+            # None
+            if logname != lastlog:
+                logdata = []
+                batch.append((logname, logdata))
                 lastlog = logname
-            elif logname != lastlog:
-                self._sendMessage(msg)
-                msg = {}
-                msg_size = 0
-            lastlog = logname
-
-            logdata = msg.setdefault(logname, [])
 
             # Chunkify the log data to make sure we're not sending more than
             # CHUNK_LIMIT at a time
             for chunk in self._chunkForSend(data):
                 if len(chunk) == 0: continue
                 logdata.append(chunk)
-                msg_size += len(chunk)
-                if msg_size >= self.CHUNK_LIMIT:
+                batch_size += len(chunk)
+                if batch_size >= self.CHUNK_LIMIT:
                     # We've gone beyond the chunk limit, so send out our
-                    # message.  At worst this results in a message slightly
+                    # batch.  At worst this results in a message slightly
                     # larger than (2*CHUNK_LIMIT)-1
-                    self._sendMessage(msg)
-                    msg = {}
-                    logdata = msg.setdefault(logname, [])
-                    msg_size = 0
+                    self._sendMessages(batch)
+                    logdata = []
+                    batch = [(logname, logdata)]
+                    batch_size = 0
         self.buflen = 0
-        if logdata:
-            self._sendMessage(msg)
+        if batch_size:
+            self._sendMessages(batch)
         if self.buftimer:
             if self.buftimer.active():
                 self.buftimer.cancel()
@@ -679,7 +712,7 @@ class RunProcess:
             self._addToBuffers('stdout', data)
 
         if self.keepStdout:
-            self.stdout += data
+            self.stdoutBuffer.append(data)
         if self.timer:
             self.timer.reset(self.timeout)
 
@@ -688,7 +721,7 @@ class RunProcess:
             self._addToBuffers('stderr', data)
 
         if self.keepStderr:
-            self.stderr += data
+            self.stderrBuffer.append(data)
         if self.timer:
             self.timer.reset(self.timeout)
 
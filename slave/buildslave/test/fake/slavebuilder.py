@@ -18,12 +18,15 @@ import pprint
 class FakeSlaveBuilder:
     """
     Simulates a SlaveBuilder, but just records the updates from sendUpdate
-    in its updates attribute.  Call show() to get a pretty-printed string
-    showing the updates.  Set debug to True to show updates as they happen.
+    and sendUpdates in its updates attribute, and the number of messages they
+    would take in its messages attribute.  Call show() to get a
+    pretty-printed string showing the updates.  Set debug to True to show
+    updates as they happen.
     """
     debug = False
     def __init__(self, usePTY=False, basedir="/slavebuilder/basedir"):
         self.updates = []
+        self.messages = 0
         self.basedir = basedir
         self.usePTY = usePTY
         self.unicode_encoding = 'utf-8'
@@ -32,6 +35,13 @@ class FakeSlaveBuilder:
         if self.debug:
             print "FakeSlaveBuilder.sendUpdate", data
         self.updates.append(data)
+        self.messages += 1
+
+    def sendUpdates(self, datas):
+        if self.debug:
+            print "FakeSlaveBuilder.sendUpdates", datas
+        self.updates.extend(datas)
+        self.messages += 1
 
     def show(self):
         return pprint.pformat(self.updates)
@@ -237,6 +237,15 @@ class TestSlaveBuilder(command.CommandTestMixin, unittest.TestCase):
     def test_startBuild(self):
         return self.sb.callRemote("startBuild")
 
+    def test_sendUpdates(self):
+        st = FakeStep()
+        sb = self.sb.original
+        sb.remoteStep = FakeRemote(st)
+        sb.sendUpdates([ {'stdout': 'out'}, {'stderr': 'err'} ])
+        self.assertEqual(st.actions, [
+                ['update', [[{'stdout': 'out'}, 0], [{'stderr': 'err'}, 0]]],
+            ])
+
     def test_startCommand(self):
         # set up a fake step to receive updates
         st = FakeStep()
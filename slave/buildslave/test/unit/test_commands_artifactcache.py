@@ -0,0 +1,131 @@
+# This file is part of Buildbot.  Buildbot is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation, version 2.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright Buildbot Team Members
+
+import os
+import shutil
+import hashlib
+
+from twisted.trial import unittest
+
+from buildslave.commands import artifactcache
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cachedir = os.path.abspath('cache')
+        if os.path.exists(self.cachedir):
+            shutil.rmtree(self.cachedir)
+        os.makedirs(self.cachedir)
+        self.cache = artifactcache.ArtifactCache(self.cachedir, maxsize=30)
+        self.dest = os.path.abspath('dest')
+
+    def tearDown(self):
+        if os.path.exists(self.cachedir):
+            shutil.rmtree(self.cachedir)
+        if os.path.exists(self.dest):
+            os.unlink(self.dest)
+
+    def addEntry(self, data, mtime):
+        key = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.cachedir, key)
+        open(path, 'wb').write(data)
+        os.utime(path, (mtime, mtime))
+        return key
+
+    def test_isValidKey(self):
+        self.assertTrue(artifactcache.ArtifactCache.isValidKey('a' * 40))
+        self.assertFalse(artifactcache.ArtifactCache.isValidKey('../' * 20))
+        self.assertFalse(artifactcache.ArtifactCache.isValidKey(None))
+
+    def test_fetch(self):
+        key = self.addEntry('x' * 10, 100)
+        self.assertTrue(self.cache.fetch(key, self.dest))
+        self.assertEqual(open(self.dest).read(), 'x' * 10)
+        # using the entry makes it the most recently used
+        self.assertTrue(os.stat(os.path.join(self.cachedir, key)).st_mtime
+                        > 100)
+        self.assertTrue(self.cache.isCurrent(key, self.dest))
+
+    def test_fetch_missing(self):
+        self.assertFalse(self.cache.fetch('a' * 40, self.dest))
+        self.assertFalse(self.cache.isCurrent('a' * 40, self.dest))
+
+    def test_openPartial(self):
+        key = 'a' * 40
+        open(self.cache.partialPath(key), 'wb').write('abc')
+        fp, offset, sha1 = self.cache.openPartial(key)
+        fp.write('def')
+        fp.close()
+        self.assertEqual(offset, 3)
+        self.assertEqual(sha1.hexdigest(), hashlib.sha1('abc').hexdigest())
+        self.assertEqual(open(self.cache.partialPath(key)).read(), 'abcdef')
+        self.cache.releasePartial(key, fp.name)
+        # released, it can be resumed again
+        fp, offset, sha1 = self.cache.openPartial(key)
+        fp.close()
+        self.assertEqual(offset, 6)
+        self.cache.releasePartial(key, fp.name)
+
+    def test_openPartial_inUse(self):
+        key = 'a' * 40
+        open(self.cache.partialPath(key), 'wb').write('abc')
+        fp1, offset1, sha1 = self.cache.openPartial(key)
+        fp2, offset2, sha1 = self.cache.openPartial(key)
+        fp1.close()
+        fp2.close()
+        # the second download of the key gets a partial file of its own
+        self.assertEqual(fp1.name, self.cache.partialPath(key))
+        self.assertNotEqual(fp2.name, fp1.name)
+        self.assertEqual((offset1, offset2), (3, 0))
+
+        # which is removed if it is not completed, unlike the key's
+        self.cache.releasePartial(key, fp2.name)
+        self.cache.releasePartial(key, fp1.name)
+        self.assertEqual(os.listdir(self.cachedir), [ key + '.part' ])
+
+    def test_evict_skipsPartialInUse(self):
+        key = 'a' * 40
+        fp, offset, sha1 = self.cache.openPartial(key)
+        fp.write('p' * 10)
+        fp.close()
+        os.utime(fp.name, (10, 10))
+        new = self.addEntry('n' * 25, 300)
+        self.cache.evict()
+        self.assertEqual(sorted(os.listdir(self.cachedir)),
+                         sorted([ key + '.part' ]))
+        self.assertFalse(os.path.exists(os.path.join(self.cachedir, new)))
+        self.cache.discardPartial(key, fp.name)
+        self.assertEqual(os.listdir(self.cachedir), [])
+
+    def test_evict_lru(self):
+        old = self.addEntry('o' * 10, 100)
+        mid = self.addEntry('m' * 10, 200)
+        new = self.addEntry('n' * 10, 300)
+        keep = self.addEntry('k' * 10, 50)
+        self.cache.evict(keep=keep)
+        self.assertEqual(sorted(os.listdir(self.cachedir)),
+                         sorted([ mid, new, keep ]))
+        self.assertFalse(os.path.exists(os.path.join(self.cachedir, old)))
+
+    def test_commit(self):
+        data = 'd' * 25
+        key = hashlib.sha1(data).hexdigest()
+        old = self.addEntry('o' * 10, 100)
+        fp, offset, sha1 = self.cache.openPartial(key)
+        fp.write(data)
+        fp.close()
+        self.cache.commit(key, fp.name, self.dest)
+        self.assertEqual(open(self.dest).read(), data)
+        self.assertFalse(os.path.exists(os.path.join(self.cachedir, old)))
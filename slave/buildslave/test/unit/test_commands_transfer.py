@@ -18,6 +18,8 @@ import sys
 import shutil
 import tarfile
 import StringIO
+import zlib
+import hashlib
 
 from twisted.trial import unittest
 from twisted.internet import defer, reactor
@@ -25,7 +27,7 @@ from twisted.python import runtime, failure
 
 from buildslave.test.fake.remote import FakeRemote
 from buildslave.test.util.command import CommandTestMixin
-from buildslave.commands import transfer
+from buildslave.commands import transfer, artifactcache
 
 class FakeMasterMethods(object):
     # a fake to represent any of:
@@ -44,6 +46,8 @@ class FakeMasterMethods(object):
         self.count_reads = False
 
         self.unpack_fail = False
+        self.close_fail = False
+        self.checksum = None
 
         self.written = False
         self.read = False
@@ -76,9 +80,6 @@ class FakeMasterMethods(object):
             self.add_update('read(s)')
             self.read = True
 
-        if not self.data:
-            return ''
-
         slice, self.data = self.data[:length], self.data[length:]
         if self.delay_read:
             d = defer.Deferred()
@@ -87,7 +88,7 @@ class FakeMasterMethods(object):
         else:
             return slice
 
-    def remote_unpack(self):
+    def remote_unpack(self, checksum=None):
         self.add_update('unpack')
         if self.unpack_fail:
             return defer.fail(failure.Failure(RuntimeError("out of space")))
@@ -95,8 +96,21 @@ class FakeMasterMethods(object):
     def remote_utime(self,accessed_modified):
         self.add_update('utime - %s' % accessed_modified[0])
         
-    def remote_close(self):
-        self.add_update('close')
+    def remote_close(self, checksum=None):
+        if checksum is not None:
+            self.add_update('close %s' % checksum)
+        else:
+            self.add_update('close')
+        if self.close_fail:
+            return defer.fail(failure.Failure(
+                RuntimeError("checksum mismatch")))
+
+    def remote_checksum(self):
+        return self.checksum
+
+    def remote_seek(self, offset):
+        self.add_update('seek %d' % offset)
+        self.data = self.data[offset:]
 
 class TestUploadFile(CommandTestMixin, unittest.TestCase):
 
@@ -144,6 +158,62 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_window(self):
+        self.fakemaster.count_writes = True    # get actual byte counts
+        self.fakemaster.delay_write = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=16,
+            keepstamp=False,
+            window=4,
+            deflate=False,
+            checksum=False,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile} ] +
+                    ['write 16'] * 11 + [ 'write 4', 'close',
+                    {'rc': 0}
+                ])
+        d.addCallback(check)
+        return d
+
+    def test_deflate_checksum(self):
+        self.fakemaster.keep_data = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=False,
+            window=4,
+            deflate=True,
+            checksum=True,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            data = open(self.datafile, 'rb').read()
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'write(s)', 'close %s' % hashlib.sha1(data).hexdigest(),
+                    {'rc': 0}
+                ])
+            self.assertEqual(zlib.decompressobj().decompress(
+                                self.fakemaster.data), data)
+        d.addCallback(check)
+        return d
+
     def test_truncated(self):
         self.fakemaster.count_writes = True    # get actual byte counts
 
@@ -273,6 +343,34 @@ class TestUploadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_timestamp_checksum_mismatch(self):
+        self.fakemaster.close_fail = True
+
+        self.make_command(transfer.SlaveFileUploadCommand, dict(
+            workdir='workdir',
+            slavesrc='data',
+            writer=FakeRemote(self.fakemaster),
+            maxsize=1000,
+            blocksize=64,
+            keepstamp=True,
+            checksum=True,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            data = open(self.datafile, 'rb').read()
+            # the refused file is not stamped
+            self.assertUpdates([
+                    {'header': 'sending %s' % self.datafile},
+                    'write(s)', 'close %s' % hashlib.sha1(data).hexdigest(),
+                    {'rc': 1,
+                     'stderr': "Upload of '%s' failed: checksum mismatch"
+                                % self.datafile}
+                ])
+        d.addCallback(check)
+        return d
+
 class TestSlaveDirectoryUpload(CommandTestMixin, unittest.TestCase):
 
     def setUp(self):
@@ -415,6 +513,61 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
         d.addCallback(check)
         return d
 
+    def test_window_checksum(self):
+        self.fakemaster.count_reads = True    # get actual byte counts
+        self.fakemaster.delay_read = True
+        self.fakemaster.data = test_data = '1234' * 13
+        self.fakemaster.checksum = hashlib.sha1(test_data).hexdigest()
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=16,
+            mode=None,
+            window=3,
+            deflate=False,
+            checksum=True,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            # the blocks requested before the end of the file was seen are
+            # still answered
+            self.assertUpdates(['read 16'] * 7 + [ 'close', {'rc': 0} ])
+            datafile = os.path.join(self.basedir, 'data')
+            self.assertEqual(open(datafile).read(), test_data)
+        d.addCallback(check)
+        return d
+
+    def test_checksum_mismatch(self):
+        self.fakemaster.data = 'hi'
+        self.fakemaster.checksum = hashlib.sha1('ho').hexdigest()
+
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=32,
+            mode=None,
+            checksum=True,
+        ))
+
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    'read(s)', 'close',
+                    {'rc': 1,
+                     'stderr': "Checksum mismatch downloading file '%s'"
+                                % os.path.join(self.basedir, '.', 'data')}
+                ])
+        d.addCallback(check)
+        return d
+
     def test_mkdir(self):
         self.fakemaster.data = test_data = 'hi'
 
@@ -525,3 +678,131 @@ class TestDownloadFile(CommandTestMixin, unittest.TestCase):
         dl.addCallback(check)
         return dl
 
+class TestDownloadFileCached(CommandTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.setUpCommand()
+
+        self.fakemaster = FakeMasterMethods(self.add_update)
+        self.fakemaster.data = self.test_data = '1234' * 13
+        self.key = hashlib.sha1(self.test_data).hexdigest()
+
+        if os.path.exists(self.basedir):
+            shutil.rmtree(self.basedir)
+        os.makedirs(self.basedir)
+        self.cachedir = os.path.join(os.path.dirname(self.basedir),
+                                     artifactcache.CACHE_DIR)
+        if os.path.exists(self.cachedir):
+            shutil.rmtree(self.cachedir)
+        self.datafile = os.path.join(self.basedir, 'data')
+
+    def tearDown(self):
+        self.tearDownCommand()
+
+        for dir in self.basedir, self.cachedir:
+            if os.path.exists(dir):
+                shutil.rmtree(dir)
+
+    def make_download(self, key=None):
+        self.make_command(transfer.SlaveFileDownloadCommand, dict(
+            workdir='.',
+            slavedest='data',
+            reader=FakeRemote(self.fakemaster),
+            maxsize=None,
+            blocksize=32,
+            mode=None,
+            cachekey=key or self.key,
+        ))
+
+    def test_miss(self):
+        self.make_download()
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'cache': 'miss'}, 'read(s)', 'close', {'rc': 0}
+                ])
+            self.assertEqual(open(self.datafile).read(), self.test_data)
+            self.assertEqual(os.listdir(self.cachedir), [ self.key ])
+        d.addCallback(check)
+        return d
+
+    def test_hit(self):
+        os.makedirs(self.cachedir)
+        open(os.path.join(self.cachedir, self.key), 'wb').write(self.test_data)
+
+        self.make_download()
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([ {'cache': 'hit'}, 'close', {'rc': 0} ])
+            self.assertEqual(open(self.datafile).read(), self.test_data)
+        d.addCallback(check)
+        return d
+
+    def test_current(self):
+        open(self.datafile, 'wb').write(self.test_data)
+
+        self.make_download()
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([ {'cache': 'current'}, 'close', {'rc': 0} ])
+        d.addCallback(check)
+        return d
+
+    def test_resume(self):
+        os.makedirs(self.cachedir)
+        open(os.path.join(self.cachedir, self.key + '.part'),
+             'wb').write(self.test_data[:20])
+
+        self.make_download()
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'cache': 'resumed', 'offset': 20}, 'seek 20',
+                    'read(s)', 'close', {'rc': 0}
+                ])
+            self.assertEqual(open(self.datafile).read(), self.test_data)
+            self.assertEqual(os.listdir(self.cachedir), [ self.key ])
+        d.addCallback(check)
+        return d
+
+    def test_mismatch(self):
+        key = hashlib.sha1('other data').hexdigest()
+        self.make_download(key)
+        d = self.run_command()
+
+        def check(_):
+            self.assertUpdates([
+                    {'cache': 'miss'}, 'read(s)', 'close',
+                    {'rc': 1,
+                     'stderr': "Checksum mismatch downloading file '%s'"
+                                % os.path.join(self.basedir, '.', 'data')}
+                ])
+            self.assertEqual(os.listdir(self.cachedir), [])
+            self.assertFalse(os.path.exists(self.datafile))
+        d.addCallback(check)
+        return d
+
+    def test_interrupted(self):
+        self.fakemaster.delay_read = True
+        self.make_download()
+        d = self.run_command()
+
+        # wait a jiffy..
+        interrupt_d = defer.Deferred()
+        reactor.callLater(0.01, interrupt_d.callback, None)
+
+        def do_interrupt(_):
+            return self.cmd.interrupt()
+        interrupt_d.addCallback(do_interrupt)
+        dl = defer.DeferredList([d, interrupt_d])
+
+        def check(_):
+            # the data received so far is kept, to be resumed later
+            self.assertEqual(os.listdir(self.cachedir),
+                             [ self.key + '.part' ])
+        dl.addCallback(check)
+        return dl
@@ -656,6 +656,22 @@ class TestLogging(BasedirMixin, unittest.TestCase):
             {'stderr': 'DIEEEEEEE'},
             {'stdout': 'world'},
             ])
+        # the updates are sent, in order, in a single message
+        self.failUnlessEqual(b.messages, 1)
+
+    def testSendBufferedLogfiles(self):
+        b = FakeSlaveBuilder(False, self.basedir)
+        s = runprocess.RunProcess(b, stdoutCommand('hello'), self.basedir)
+        s._addToBuffers(('log', 'a'), 'one ')
+        s._addToBuffers(('log', 'b'), 'two')
+        s._addToBuffers(('log', 'a'), 'three')
+        s._sendBuffers()
+        self.failUnlessEqual(b.updates, [
+            {'log': ('a', 'one ')},
+            {'log': ('b', 'two')},
+            {'log': ('a', 'three')},
+            ])
+        self.failUnlessEqual(b.messages, 1)
 
     def testSendChunked(self):
         b = FakeSlaveBuilder(False, self.basedir)
@@ -664,6 +680,7 @@ class TestLogging(BasedirMixin, unittest.TestCase):
         s._addToBuffers('stdout', data)
         s._sendBuffers()
         self.failUnlessEqual(len(b.updates), 2)
+        self.failUnlessEqual(b.messages, 2)
 
     def testSendNotimeout(self):
         b = FakeSlaveBuilder(False, self.basedir)
@@ -672,6 +689,17 @@ class TestLogging(BasedirMixin, unittest.TestCase):
         s._addToBuffers('stdout', data)
         self.failUnlessEqual(len(b.updates), 1)
 
+class TestOutputBuffer(unittest.TestCase):
+
+    def test_keep_all(self):
+        buf = runprocess.OutputBuffer()
+        for chunk in 'abc', 'def', 'g':
+            buf.append(chunk)
+        self.assertEqual(buf.getvalue(), 'abcdefg')
+        self.assertEqual(buf.chunks, ['abcdefg'])
+        buf.append('h')
+        self.assertEqual(buf.getvalue(), 'abcdefgh')
+
 class TestLogFileWatcher(BasedirMixin, unittest.TestCase):
     def setUp(self):
         self.setUpBasedir()
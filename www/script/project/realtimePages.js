@@ -7,6 +7,7 @@ define(function (require) {
         sock = null,
         realTimeFunctions = {},
         realtimeURLs = {},
+        realtimeDocs = {},
         realTimeLastUpdated = {};
 
     require('helpers');
@@ -18,6 +19,8 @@ define(function (require) {
     var KRT_JSON_DATA = "krtJSONData";
     var KRT_URL_DROPPED = "krtURLDropped";
     var KRT_REGISTER_URL = "krtRegisterURL";
+    var KRT_JSON_PATCH = "krtJSONPatch";
+    var KRT_RESYNC = "krtResync";
 
     //Timeouts
     var iURLDroppedTimeout = 30000,
@@ -48,7 +51,8 @@ define(function (require) {
                         $.each(realtimeURLs, function (name, url) {
                             if (url !== undefined) {
                                 var data = {
-                                    url: url
+                                    url: url,
+                                    patches: true
                                 };
 
                                 if (json !== undefined) {
@@ -128,12 +132,25 @@ define(function (require) {
         },
         parseRealtimeCommand: function (data) {
             if (data.cmd === KRT_JSON_DATA) {
-                realtimePages.updateRealTimeData(data.data, false);
+                realtimeDocs[data.data.url] = {version: data.data.version, data: data.data.data};
+                realtimePages.updateRealTimeData(realtimePages.copyDoc(data.data.url), false);
+            }
+            if (data.cmd === KRT_JSON_PATCH) {
+                var doc = realtimeDocs[data.data.url];
+                if (doc === undefined || doc.version !== data.data.base) {
+                    // We missed an update, ask for the whole document
+                    console.log("Resyncing {0}...".format(data.data.url));
+                    realtimePages.sendCommand(KRT_RESYNC, data.data.url);
+                    return;
+                }
+                doc.data = realtimePages.applyPatch(doc.data, data.data.patch);
+                doc.version = data.data.version;
+                realtimePages.updateRealTimeData(realtimePages.copyDoc(data.data.url), false);
             }
             if (data.cmd === KRT_URL_DROPPED) {
                 console.log("URL Dropped by server will retry in {0} seconds... ({1})".format((iURLDroppedTimeout / 1000), data.data));
                 setTimeout(function () {
-                    realtimePages.sendCommand(KRT_REGISTER_URL, data.data);
+                    realtimePages.sendCommand(KRT_REGISTER_URL, {url: data.data, patches: true});
                 }, iURLDroppedTimeout);
             }
         },
@@ -152,6 +169,79 @@ define(function (require) {
                 realtimePages.updateSingleRealTimeData(name, json.data);
             }
         },
+        copyDoc: function (url) {
+            // The realtime functions are given their own copy, so that the
+            // next patch is applied to the document as the server sent it
+            return {url: url, data: JSON.parse(JSON.stringify(realtimeDocs[url].data))};
+        },
+        findPatchSegment: function (container, segment) {
+            var index;
+            if (segment !== null && typeof segment === "object") {
+                $.each(container, function (i, item) {
+                    if (item[segment.key] === segment.id) {
+                        index = i;
+                        return false;
+                    }
+                    return true;
+                });
+                return index;
+            }
+            return container.hasOwnProperty(segment) ? segment : undefined;
+        },
+        applyPatch: function (doc, patch) {
+            // Applies a patch made by autobahn/jsondelta.py
+            $.each(patch, function (i, op) {
+                var path = op.path,
+                    parent = doc,
+                    last,
+                    index,
+                    items = {},
+                    j;
+
+                for (j = 0; j < path.length - 1; j += 1) {
+                    parent = parent[realtimePages.findPatchSegment(parent, path[j])];
+                }
+
+                if (op.op === "order") {
+                    if (path.length > 0) {
+                        parent = parent[realtimePages.findPatchSegment(parent, path[path.length - 1])];
+                    }
+                    $.each(parent, function (k, item) {
+                        items[JSON.stringify(item[op.key])] = item;
+                    });
+                    parent.length = 0;
+                    $.each(op.ids, function (k, id) {
+                        parent.push(items[JSON.stringify(id)]);
+                    });
+                    return;
+                }
+
+                if (path.length === 0) {
+                    if (op.op === "set") {
+                        doc = op.value;
+                    }
+                    return;
+                }
+
+                last = path[path.length - 1];
+                index = realtimePages.findPatchSegment(parent, last);
+                if (op.op === "remove") {
+                    if (index !== undefined) {
+                        if ($.isArray(parent)) {
+                            parent.splice(index, 1);
+                        } else {
+                            delete parent[index];
+                        }
+                    }
+                } else if (index === undefined && typeof last === "object") {
+                    parent.push(op.value);
+                } else {
+                    parent[index === undefined ? last : index] = op.value;
+                }
+            });
+
+            return doc;
+        },
         getRealtimeNameFromURL: function (url) {
             var name = "";
             $.each(realtimeURLs, function (n, u) {
@@ -162,6 +162,35 @@ define(["jquery", "realtimePages", "rtGlobal"], function ($, rt, rtGlobal) {
             expect(realtimeFunctions.test.calls.count()).toEqual(1);
         });
 
+        it("applies a patch to the last document", function () {
+            spyOn(realtimeFunctions, 'test');
+
+            sock = rt.initRealtime(realtimeFunctions);
+            sock.onmessage({data: {"cmd": "krtJSONData", "data": {"url": "http://test.com", "version": 1,
+                "data": {"builds": [{"number": 1}, {"number": 2, "results": null}]}}}});
+            sock.onmessage({data: {"cmd": "krtJSONPatch", "data": {"url": "http://test.com", "version": 2, "base": 1,
+                "patch": [
+                    {"op": "remove", "path": ["builds", {"key": "number", "id": 1}]},
+                    {"op": "set", "path": ["builds", {"key": "number", "id": 2}, "results"], "value": 0},
+                    {"op": "set", "path": ["builds", {"key": "number", "id": 3}], "value": {"number": 3}},
+                    {"op": "order", "path": ["builds"], "key": "number", "ids": [3, 2]}
+                ]}}});
+
+            expect(realtimeFunctions.test).toHaveBeenCalledWith({"builds": [{"number": 3}, {"number": 2, "results": 0}]});
+        });
+
+        it("asks for the whole document when an update is missed", function () {
+            sock = rt.initRealtime(realtimeFunctions);
+            sock.onmessage({data: {"cmd": "krtJSONData", "data": {"url": "http://test.com", "version": 1, "data": {}}}});
+            spyOn(realtimeFunctions, 'test');
+            spyOn(sock, 'send');
+            sock.onmessage({data: {"cmd": "krtJSONPatch", "data": {"url": "http://test.com", "version": 3, "base": 2,
+                "patch": [{"op": "set", "path": ["a"], "value": 1}]}}});
+
+            expect(realtimeFunctions.test).not.toHaveBeenCalled();
+            expect(sock.send).toHaveBeenCalledWith(JSON.stringify({cmd: "krtResync", data: "http://test.com"}));
+        });
+
         it("sends data to the realtime server", function () {
             sock = rt.initRealtime(realtimeFunctions);
             spyOn(sock, 'send');